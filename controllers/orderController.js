@@ -2,6 +2,7 @@ const asyncHandler = require('express-async-handler');
 const Order = require('../models/Order');
 const Cart = require('../models/Cart');
 const Product = require('../models/Product');
+const recommenderService = require('../services/recommender.service');
 
 const createOrder = asyncHandler(async (req, res) => {
   const { shippingAddress, paymentMethod, note } = req.body;
@@ -25,7 +26,7 @@ const createOrder = asyncHandler(async (req, res) => {
 
   const cart = await Cart.findOne({ user: userId }).populate({
     path: 'items.product',
-    select: 'name price images countInStock _id'
+    select: 'name price images countInStock _id original_id'
   });
 
   if (!cart || !cart.items || cart.items.length === 0) {
@@ -95,6 +96,15 @@ const createOrder = asyncHandler(async (req, res) => {
   cart.items = [];
   await cart.save();
 
+  // Cập nhật hồ sơ gợi ý của user (không chờ, lỗi recommender không ảnh hưởng việc đặt hàng)
+  const orderedOriginalIds = orderItems
+    .map(item => item.original_id)
+    .filter(id => id !== null && id !== undefined);
+  if (orderedOriginalIds.length > 0) {
+    recommenderService.updateUserProfile(userId.toString(), orderedOriginalIds)
+      .catch(err => console.warn(`[OrderController] Could not update recommender profile for ${userId}:`, err.error || err.message));
+  }
+
   res.status(201).json(createdOrder);
 });
 
@@ -2,6 +2,60 @@
 
 const asyncHandler = require('express-async-handler');
 const Product = require('../models/Product');
+const recommenderService = require('../services/recommender.service');
+
+// Thứ tự liên quan: số original_id (theo thứ hạng BM25) hỏi Mongo mỗi lần khi dựng một trang
+const KEYWORD_RANK_WINDOW = 500;
+
+// Escape ký tự đặc biệt để dùng chuỗi người dùng nhập trong RegExp
+function escapeRegex(str = '') {
+  return String(str).replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+}
+
+// Tìm original_id theo từ khóa qua chỉ mục BM25 của recommender (mọi kết quả, đã xếp hạng, một lần gọi).
+// Trả về null nếu recommender lỗi hoặc không có kết quả, khi đó controller chỉ dùng regex trên Mongo như trước.
+async function searchOriginalIds(keyword) {
+  try {
+    const result = await recommenderService.searchProductIds(keyword);
+    if (!result || result.error) {
+      console.warn('[ProductController] Keyword search via recommender failed:', result && result.error);
+      return null;
+    }
+    const ids = (result.product_ids || []).filter(id => id !== null && id !== undefined);
+    return ids.length > 0 ? ids : null;
+  } catch (e) {
+    console.warn('[ProductController] Keyword search via recommender failed:', e.error || e.message);
+    return null;
+  }
+}
+
+// Một trang theo thứ tự liên quan: đi theo danh sách BM25 từng cửa sổ KEYWORD_RANK_WINDOW id, chỉ hỏi Mongo các
+// original_id trong cửa sổ và dừng khi đủ skip + limit; sau đó là sản phẩm chỉ có trên Mongo (original_id null)
+// khớp regex, theo sortOption. limit null: mọi sản phẩm khớp. Trả về _id của trang theo đúng thứ tự.
+async function findRelevancePageIds(baseFilters, rankedOriginalIds, regexConditions, sortOption, skip, limit) {
+  const wanted = limit === null ? Infinity : skip + limit;
+  const rankedMatches = [];
+  for (let start = 0; start < rankedOriginalIds.length && rankedMatches.length < wanted; start += KEYWORD_RANK_WINDOW) {
+    const window = rankedOriginalIds.slice(start, start + KEYWORD_RANK_WINDOW);
+    const found = await Product.find({ ...baseFilters, original_id: { $in: window } }).select('_id original_id').lean();
+    const byOriginalId = new Map(found.map(p => [p.original_id, p._id]));
+    for (const id of window) {
+      if (byOriginalId.has(id)) rankedMatches.push(byOriginalId.get(id));
+    }
+  }
+  const pageIds = rankedMatches.slice(skip, wanted);
+  if (pageIds.length >= wanted - skip) return pageIds;
+
+  // Đã đi hết danh sách BM25 nên rankedMatches.length là tổng số khớp theo BM25
+  let mongoOnlyQuery = Product.find({ ...baseFilters, original_id: null, $or: regexConditions })
+    .select('_id')
+    .collation({ locale: 'vi', strength: 1 })
+    .sort(sortOption)
+    .skip(Math.max(0, skip - rankedMatches.length));
+  if (limit !== null) mongoOnlyQuery = mongoOnlyQuery.limit(wanted - skip - pageIds.length);
+  const mongoOnly = await mongoOnlyQuery.lean();
+  return pageIds.concat(mongoOnly.map(p => p._id));
+}
 
 // @desc    Lấy tất cả sản phẩm VỚI LỌC, SẮP XẾP, PHÂN TRANG (tiếng Việt, không phân biệt dấu)
 const getProducts = asyncHandler(async (req, res) => {
@@ -28,20 +82,23 @@ const getProducts = asyncHandler(async (req, res) => {
     console.log("Backend localPerPage from query (per_page):", localPerPage, "(type:", typeof localPerPage, ")");
 
     // --- Build filterConditions ---
-    const filterConditions = {};
+    const baseFilters = {}; // Mọi điều kiện trừ từ khóa
+    let rankedOriginalIds = null; // Kết quả tìm kiếm đã xếp hạng (nếu recommender trả về được)
+    let regexConditions = null;
     if (keyword && keyword.trim() !== '') {
-      const regex = new RegExp(keyword, 'i'); // 'i' for case-insensitive
-      filterConditions.$or = [
+      const regex = new RegExp(escapeRegex(keyword.trim()), 'i'); // 'i' for case-insensitive
+      regexConditions = [
         { name: regex },
         { description: regex },
         { category: regex } // Có thể bạn muốn tìm cả trong category nữa
       ];
+      rankedOriginalIds = await searchOriginalIds(keyword.trim());
     }
     if (category) {
-      filterConditions.category = new RegExp(category, 'i');
+      baseFilters.category = new RegExp(category, 'i');
     }
     if (origin) {
-      filterConditions.origin = new RegExp(origin, 'i');
+      baseFilters.origin = new RegExp(origin, 'i');
     }
     const priceFilter = {};
     if (priceMin !== undefined && !isNaN(Number(priceMin)) && Number(priceMin) >= 0) {
@@ -55,10 +112,21 @@ const getProducts = asyncHandler(async (req, res) => {
       }
     }
     if (Object.keys(priceFilter).length > 0) {
-      filterConditions.price = priceFilter;
+      baseFilters.price = priceFilter;
     }
     if (rating !== undefined && !isNaN(Number(rating))) {
-      filterConditions.rating = { $gte: Number(rating) };
+      baseFilters.rating = { $gte: Number(rating) };
+    }
+    const filterConditions = { ...baseFilters };
+    if (rankedOriginalIds) {
+      // Kết quả BM25, cộng sản phẩm chỉ có trên Mongo (chưa có trong CSV của chỉ mục, original_id null) khớp regex:
+      // regex chỉ chạy trên nhánh original_id null (dùng index original_id) thay vì quét cả collection
+      filterConditions.$or = [
+        { original_id: { $in: rankedOriginalIds } },
+        { original_id: null, $or: regexConditions }
+      ];
+    } else if (regexConditions) {
+      filterConditions.$or = regexConditions; // Recommender lỗi: chỉ regex như trước
     }
     console.log("Backend filterConditions:", JSON.stringify(filterConditions));
 
@@ -71,6 +139,8 @@ const getProducts = asyncHandler(async (req, res) => {
     };
     // Mặc định sắp xếp theo newest nếu sort_by không hợp lệ hoặc không được cung cấp
     const sortOption = sortMap[sort_by] || { createdAt: -1, _id: 1 };
+    // Tìm theo từ khóa mà không chọn cách sắp xếp: giữ thứ tự liên quan (BM25) từ recommender
+    const useRelevanceOrder = Boolean(rankedOriginalIds) && !sortMap[sort_by];
     console.log("Backend sortOption:", JSON.stringify(sortOption));
 
     // --- Query DB ---
@@ -84,6 +154,8 @@ const getProducts = asyncHandler(async (req, res) => {
 
     let isPagingEnabled = false;
     let pageNumValueForQuery = 1; // Giá trị mặc định cho số trang sẽ sử dụng trong query
+    let pageSkip = 0;
+    let pageLimit = null;
 
     // Phân trang chỉ được kích hoạt nếu cả 'page' và 'localPerPage' (tức 'per_page') được cung cấp
     if (localPerPage !== undefined && page !== undefined) {
@@ -112,6 +184,8 @@ const getProducts = asyncHandler(async (req, res) => {
         const limitValue = Math.max(1, parsedLimit); // Đảm bảo limit ít nhất là 1
         const skipValue = (pageNumValueForQuery - 1) * limitValue;
         productsQuery = productsQuery.skip(skipValue).limit(limitValue);
+        pageSkip = skipValue;
+        pageLimit = limitValue;
         console.log(`Backend Paging: skip=${skipValue}, limit=${limitValue} for pageNumValueForQuery: ${pageNumValueForQuery}`);
       }
     } else {
@@ -119,7 +193,16 @@ const getProducts = asyncHandler(async (req, res) => {
     }
 
     console.log("Backend: Finding products...");
-    const products = await productsQuery.populate('distributor', 'name'); // Populate thông tin nhà phân phối
+    let products;
+    if (useRelevanceOrder) {
+      // Chỉ lấy _id của trang hiện tại theo thứ hạng tìm kiếm, rồi mới lấy đủ dữ liệu của các sản phẩm đó
+      const pageIds = await findRelevancePageIds(baseFilters, rankedOriginalIds, regexConditions, sortOption, pageSkip, pageLimit);
+      const position = new Map(pageIds.map((id, i) => [String(id), i]));
+      products = await Product.find({ _id: { $in: pageIds } }).populate('distributor', 'name');
+      products.sort((a, b) => position.get(String(a._id)) - position.get(String(b._id)));
+    } else {
+      products = await productsQuery.populate('distributor', 'name'); // Populate thông tin nhà phân phối
+    }
     console.log("Backend products found:", products.length);
 
     // --- Chuẩn bị dữ liệu trả về ---
@@ -348,7 +431,18 @@ const autocomplete = asyncHandler(async (req, res) => {
   const { query } = req.query;
   if (!query) return res.json([]);
 
-  const regex = new RegExp('^' + query, 'i');
+  // Ưu tiên gợi ý từ chỉ mục tìm kiếm của recommender (không dấu, theo tiền tố từ)
+  try {
+    const result = await recommenderService.suggest(query, 10);
+    if (result && !result.error && Array.isArray(result.suggestions)) {
+      return res.json(result.suggestions);
+    }
+    console.warn('[ProductController] Autocomplete via recommender failed:', result && result.error);
+  } catch (e) {
+    console.warn('[ProductController] Autocomplete via recommender failed:', e.error || e.message);
+  }
+
+  const regex = new RegExp('^' + escapeRegex(query), 'i');
   const suggestions = await Product.find(
     { name: regex },
     { name: 1 }
@@ -2,7 +2,6 @@ const recommenderService = require('../services/recommender.service');
 const asyncHandler = require('express-async-handler'); 
 const User = require('../models/User'); 
 const Order = require('../models/Order');
-const Product = require('../models/Product');
 
 // --- Helper Function để lấy lịch sử tương tác (VÍ DỤ - BẠN CẦN THAY THẾ LOGIC THỰC) ---
 async function getUserInteractionHistory(userId) {
@@ -11,33 +10,20 @@ async function getUserInteractionHistory(userId) {
 
         if (!orders || orders.length === 0) return [];
 
+        // Recommender nhận thẳng _id MongoDB (tự tra sang product_id gốc), không cần query Product collection
         const productObjectIds = new Set();
         orders.forEach(order => {
             order.orderItems?.forEach(item => {
-                if (item.product) productObjectIds.add(item.product); // Giữ lại ObjectId
+                if (item.product) productObjectIds.add(String(item.product));
             });
         });
 
-        if (productObjectIds.size === 0) return [];
-
-        // Truy vấn Product collection để lấy original_id tương ứng
-        const productsWithOriginalId = await Product.find({ 
-            '_id': { $in: Array.from(productObjectIds) } 
-        }).select('original_id').lean();
-
-        const interactedOriginalIds = new Set();
-        productsWithOriginalId.forEach(p => {
-            if (p.original_id !== null && p.original_id !== undefined) {
-                interactedOriginalIds.add(String(p.original_id)); // Chuyển original_id sang string
-            }
-        });
-        
-        const uniqueOriginalPids = Array.from(interactedOriginalIds);
-        console.log(`[RecController getUserInteractionHistory] Returning original_ids for ${userId}:`, uniqueOriginalPids);
-        return uniqueOriginalPids;
+        const uniqueProductIds = Array.from(productObjectIds);
+        console.log(`[RecController getUserInteractionHistory] Returning product _ids for ${userId}:`, uniqueProductIds);
+        return uniqueProductIds;
 
     } catch (error) {
-        console.error(`[RecController] Error fetching interaction history (original_ids) for ${userId}:`, error);
+        console.error(`[RecController] Error fetching interaction history for ${userId}:`, error);
         return []; 
     }
 }
@@ -107,7 +93,7 @@ exports.listProducts = async (req, res) => {
         const page = req.query.page ? parseInt(req.query.page, 10) : 1;
         const perPage = req.query.per_page ? parseInt(req.query.per_page, 10) : 20; // Nhận per_page từ FE
         
-        const { category, province, sort_by } = req.query;
+        const { category, province, sort_by, keyword } = req.query;
         const minPrice = req.query.min_price ? parseFloat(req.query.min_price) : undefined;
         const maxPrice = req.query.max_price ? parseFloat(req.query.max_price) : undefined;
 
@@ -123,6 +109,7 @@ exports.listProducts = async (req, res) => {
         if (minPrice !== undefined) options.minPrice = minPrice; // Service dùng minPrice
         if (maxPrice !== undefined) options.maxPrice = maxPrice; // Service dùng maxPrice
         if (sort_by) options.sortBy = sort_by;                   // Service dùng sortBy
+        if (keyword) options.keyword = keyword;                  // Tìm theo chỉ mục BM25 của Python
         
         const result = await recommenderService.getProducts(options);
 
@@ -0,0 +1,345 @@
+# scripts/ann_index.py
+# Chỉ mục láng giềng gần đúng (ANN) kiểu IVF trên các vector TF-IDF đã chuẩn hóa L2, chỉ dùng NumPy/SciPy.
+#   - k-means cầu (spherical k-means) chia N sản phẩm thành n_lists cụm, mỗi sản phẩm thuộc cụm có tâm gần nhất
+#   - truy vấn: chấm điểm n_lists tâm cụm, chỉ so khớp chính xác với sản phẩm trong n_probe cụm gần nhất
+#   - n_probe là núm chỉnh recall / số ứng viên (n_probe = n_lists tương đương vét cạn)
+# Vì các vector đã chuẩn hóa L2, tích vô hướng = cosine; hồ sơ user = trung bình vector TF-IDF đã tương tác
+# (điểm của sản phẩm j = trung bình cosine với các sản phẩm đã tương tác, giống hồ sơ từ ma trận cosine dày).
+#
+#   centroids.npy    float32 [n_lists, dim]  tâm cụm (chuẩn hóa L2)
+#   list_indptr.npy  int64   [n_lists+1]     sản phẩm của cụm l nằm ở list_items[list_indptr[l]:list_indptr[l+1]]
+#   list_items.npy   int32   [N]
+#   vec_*.npy                                ma trận TF-IDF (CSR: data / indices / indptr) để tính điểm chính xác
+#
+# Dùng:
+#   python ann_index.py build --from-tfidf tfidf_matrix_v2_adv.npz --n_lists 64
+#   python ann_index.py recall --n_probe 1 2 4 8 16
+#   python ann_index.py neighbors --top_k 100 --n_probe 8      # dựng chỉ mục hàng xóm (neighbor_index) từ ANN
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+
+import numpy as np
+import scipy.sparse
+
+from neighbor_index import NeighborIndex, quantize_scores, DEFAULT_TOP_K, QUANTIZED_MAX, NEIGHBOR_INDEX_DIR
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+ANN_INDEX_DIR = ARTIFACTS_DIR / 'ann_ivf_v2_adv'
+TFIDF_MATRIX_FILE = ARTIFACTS_DIR / 'tfidf_matrix_v2_adv.npz'
+
+DEFAULT_N_PROBE = 8
+DEFAULT_KMEANS_ITER = 10
+DEFAULT_CHUNK_SIZE = 4096
+BLOCK_BUFFER_CELLS = 2 ** 24 # Số ô float32 tối đa của một khối điểm dày khi dựng chỉ mục hàng xóm
+
+META_FILE = 'meta.json'
+CENTROIDS_FILE = 'centroids.npy'
+LIST_INDPTR_FILE = 'list_indptr.npy'
+LIST_ITEMS_FILE = 'list_items.npy'
+VEC_DATA_FILE = 'vec_data.npy'
+VEC_INDICES_FILE = 'vec_indices.npy'
+VEC_INDPTR_FILE = 'vec_indptr.npy'
+
+
+def default_n_lists(n_items):
+    """Số cụm mặc định ~ sqrt(N): mỗi cụm ~ sqrt(N) sản phẩm."""
+    return max(1, int(round(np.sqrt(n_items))))
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(vectors, centroids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Cụm gần nhất (cosine lớn nhất) của từng hàng vectors."""
+    n_rows = vectors.shape[0]
+    centroids_t = np.ascontiguousarray(centroids.T)
+    assignment = np.zeros(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, chunk_size):
+        sims = np.asarray(vectors[start:start + chunk_size] @ centroids_t)
+        assignment[start:start + chunk_size] = sims.argmax(axis=1)
+    return assignment
+
+
+def _top_lists(query_block, centroids_t, n_probe):
+    """n_probe cụm gần nhất cho mỗi hàng truy vấn (mảng [rows, n_probe], gần nhất trước).
+    centroids_t: tâm cụm chuyển vị [dim, n_lists], C-contiguous (sparse @ mảng không liên tục chậm hơn nhiều)."""
+    sims = np.asarray(query_block @ centroids_t, dtype=np.float32)
+    sims = np.atleast_2d(sims)
+    n_lists = centroids_t.shape[1]
+    n_probe = min(n_probe, n_lists)
+    if n_probe < n_lists:
+        part = np.argpartition(-sims, n_probe - 1, axis=1)[:, :n_probe]
+    else:
+        part = np.tile(np.arange(n_lists), (sims.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _topk_desc(scores, k):
+    """(vị trí, điểm) top-k giảm dần của mảng 1 chiều."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    part = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    part = part[np.argsort(-scores[part], kind='stable')]
+    return part, scores[part]
+
+
+class IVFIndex:
+    """Chỉ mục IVF: tâm cụm + danh sách sản phẩm theo cụm + vector gốc để chấm điểm lại chính xác."""
+
+    def __init__(self, centroids, list_indptr, list_items, vectors, n_probe=DEFAULT_N_PROBE):
+        self.centroids = centroids
+        self.centroids_t = np.ascontiguousarray(np.asarray(centroids, dtype=np.float32).T)
+        self.list_indptr = list_indptr
+        self.list_items = list_items
+        self.vectors = vectors # scipy CSR [N, dim]
+        self.n_probe = int(n_probe)
+
+    @property
+    def n_items(self):
+        return self.vectors.shape[0]
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return self.n_items
+
+    # --- Dựng ---
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=DEFAULT_KMEANS_ITER, n_probe=DEFAULT_N_PROBE, seed=42):
+        """Spherical k-means trên các hàng của vectors (CSR, đã chuẩn hóa L2)."""
+        vectors = scipy.sparse.csr_matrix(vectors, dtype=np.float32)
+        n_items = vectors.shape[0]
+        n_lists = min(n_lists or default_n_lists(n_items), n_items)
+        rng = np.random.default_rng(seed)
+        centroids = _normalize_rows(vectors[rng.choice(n_items, size=n_lists, replace=False)].toarray())
+
+        for _ in range(n_iter):
+            assignment = _assign(vectors, centroids)
+            one_hot = scipy.sparse.csr_matrix((np.ones(n_items, dtype=np.float32), (assignment, np.arange(n_items))),
+                                              shape=(n_lists, n_items))
+            sums = np.asarray((one_hot @ vectors).toarray(), dtype=np.float32)
+            empty = np.flatnonzero(np.bincount(assignment, minlength=n_lists) == 0)
+            if len(empty):
+                # Cụm rỗng: khởi tạo lại bằng sản phẩm ngẫu nhiên
+                sums[empty] = vectors[rng.choice(n_items, size=len(empty), replace=False)].toarray()
+            centroids = _normalize_rows(sums)
+
+        return cls.from_assignment(centroids.astype(np.float32), _assign(vectors, centroids), vectors, n_probe)
+
+    @classmethod
+    def from_assignment(cls, centroids, assignment, vectors, n_probe=DEFAULT_N_PROBE):
+        counts = np.bincount(assignment, minlength=centroids.shape[0])
+        list_indptr = np.zeros(centroids.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=list_indptr[1:])
+        list_items = np.argsort(assignment, kind='stable').astype(np.int32)
+        return cls(centroids, list_indptr, list_items, vectors, n_probe)
+
+    def reassign(self, vectors):
+        """Giữ tâm cụm, gán lại toàn bộ sản phẩm cho ma trận TF-IDF mới (sau cập nhật tăng dần)."""
+        vectors = scipy.sparse.csr_matrix(vectors, dtype=np.float32)
+        return IVFIndex.from_assignment(self.centroids, _assign(vectors, self.centroids), vectors, self.n_probe)
+
+    # --- Truy vấn ---
+    def list_members(self, list_id):
+        return self.list_items[self.list_indptr[list_id]:self.list_indptr[list_id + 1]]
+
+    def candidates(self, query, n_probe=None):
+        """Các sản phẩm trong n_probe cụm gần query nhất."""
+        lists = _top_lists(query, self.centroids_t, n_probe or self.n_probe)[0]
+        return np.concatenate([self.list_members(l) for l in lists.tolist()])
+
+    def search(self, query, top_n, n_probe=None, exclude=None, valid_mask=None):
+        """Top-N (indices, scores) gần đúng cho một vector truy vấn (dày [dim] hoặc thưa 1×dim).
+        exclude: các index không được trả về; valid_mask: bool[N], chỉ trả về index có mask True."""
+        if not scipy.sparse.issparse(query):
+            query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        cands = self.candidates(query, n_probe)
+        if valid_mask is not None:
+            cands = cands[valid_mask[cands]]
+        if exclude is not None and len(exclude):
+            cands = cands[~np.isin(cands, exclude)]
+        if len(cands) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = self.vectors[cands] @ query.T
+        scores = np.asarray(scores.toarray() if scipy.sparse.issparse(scores) else scores, dtype=np.float32).ravel()
+        pos, top_scores = _topk_desc(scores, top_n)
+        return cands[pos].astype(np.int64), top_scores
+
+    def profile_vector(self, item_idxs):
+        """Hồ sơ user = trung bình vector TF-IDF của các sản phẩm đã tương tác (1×dim, thưa)."""
+        item_idxs = np.asarray(item_idxs, dtype=np.int64)
+        weights = scipy.sparse.csr_matrix((np.full(len(item_idxs), 1.0 / max(len(item_idxs), 1), dtype=np.float32),
+                                           (np.zeros(len(item_idxs), dtype=np.int64), item_idxs)), shape=(1, self.n_items))
+        return (weights @ self.vectors).tocsr()
+
+    # --- Lưu / load ---
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / CENTROIDS_FILE, np.asarray(self.centroids, dtype=np.float32))
+        np.save(directory / LIST_INDPTR_FILE, np.asarray(self.list_indptr, dtype=np.int64))
+        np.save(directory / LIST_ITEMS_FILE, np.asarray(self.list_items, dtype=np.int32))
+        np.save(directory / VEC_DATA_FILE, np.asarray(self.vectors.data, dtype=np.float32))
+        np.save(directory / VEC_INDICES_FILE, np.asarray(self.vectors.indices, dtype=np.int32))
+        np.save(directory / VEC_INDPTR_FILE, np.asarray(self.vectors.indptr, dtype=np.int64))
+        meta = {"n_items": int(self.n_items), "n_lists": int(self.n_lists), "dim": int(self.vectors.shape[1]),
+                "n_probe": self.n_probe, "nnz": int(self.vectors.nnz)}
+        with open(directory / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True, n_probe=None):
+        directory = pathlib.Path(directory)
+        meta_path = directory / META_FILE
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"ANN index not found: {directory}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        vectors = scipy.sparse.csr_matrix((np.load(directory / VEC_DATA_FILE, mmap_mode=mmap_mode),
+                                           np.load(directory / VEC_INDICES_FILE, mmap_mode=mmap_mode),
+                                           np.load(directory / VEC_INDPTR_FILE, mmap_mode=mmap_mode)),
+                                          shape=(meta["n_items"], meta["dim"]), copy=False)
+        return cls(np.load(directory / CENTROIDS_FILE, mmap_mode=mmap_mode),
+                   np.load(directory / LIST_INDPTR_FILE, mmap_mode=mmap_mode),
+                   np.load(directory / LIST_ITEMS_FILE, mmap_mode=mmap_mode),
+                   vectors, n_probe=n_probe or meta.get("n_probe", DEFAULT_N_PROBE))
+
+
+def build_neighbor_index(ann, top_k=DEFAULT_TOP_K, n_probe=None, quantize=False, min_score=0.0):
+    """Dựng NeighborIndex (top-K hàng xóm, kể cả chính nó) bằng ANN thay vì so từng cặp N×N.
+    Duyệt theo cụm: mọi sản phẩm có probe vào cụm l được chấm với các thành viên của l một lần (một phép nhân
+    thưa), top-K của từng sản phẩm được gộp dần qua các cụm nó probe."""
+    n_items = ann.n_items
+    n_probe = min(n_probe or ann.n_probe, ann.n_lists)
+    vectors = ann.vectors
+    probes = np.concatenate([_top_lists(vectors[start:start + DEFAULT_CHUNK_SIZE], ann.centroids_t, n_probe)
+                             for start in range(0, n_items, DEFAULT_CHUNK_SIZE)])
+
+    best_idx = np.full((n_items, top_k), -1, dtype=np.int32)
+    best_scores = np.full((n_items, top_k), -np.inf, dtype=np.float32)
+    query_rows = np.repeat(np.arange(n_items), probes.shape[1])
+    order = np.argsort(probes.ravel(), kind='stable')
+    query_indptr = np.zeros(ann.n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(probes.ravel(), minlength=ann.n_lists), out=query_indptr[1:])
+
+    for list_id in range(ann.n_lists):
+        members = np.asarray(ann.list_members(list_id), dtype=np.int64)
+        queries = query_rows[order[query_indptr[list_id]:query_indptr[list_id + 1]]]
+        if len(members) == 0 or len(queries) == 0:
+            continue
+        member_vectors_t = vectors[members].T.tocsr()
+        chunk = max(1, BLOCK_BUFFER_CELLS // len(members))
+        for start in range(0, len(queries), chunk):
+            rows = queries[start:start + chunk]
+            block = np.asarray((vectors[rows] @ member_vectors_t).toarray(), dtype=np.float32)
+            merged_scores = np.concatenate([best_scores[rows], block], axis=1)
+            merged_idx = np.concatenate([best_idx[rows], np.broadcast_to(members.astype(np.int32), block.shape)], axis=1)
+            part = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+            part_scores = np.take_along_axis(merged_scores, part, axis=1)
+            sort = np.argsort(-part_scores, axis=1, kind='stable')
+            best_scores[rows] = np.take_along_axis(part_scores, sort, axis=1)
+            best_idx[rows] = np.take_along_axis(np.take_along_axis(merged_idx, part, axis=1), sort, axis=1)
+
+    keep = best_scores > min_score # Bỏ điểm 0 (không có từ chung) và các ô chưa dùng (-inf)
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(keep.sum(axis=1), out=indptr[1:])
+    indices = best_idx[keep].astype(np.int32)
+    scores = best_scores[keep].astype(np.float32)
+    score_scale = 1.0
+    if quantize:
+        scores = quantize_scores(scores)
+        score_scale = 1.0 / QUANTIZED_MAX
+    return NeighborIndex(indptr, indices, scores, n_items, top_k, score_scale=score_scale)
+
+
+def recall_report(ann, k=10, n_probe_values=(1, 2, 4, 8, 16), n_samples=200, basket_size=3, seed=42):
+    """recall@k của ANN so với cosine chính xác, cho truy vấn theo sản phẩm và theo hồ sơ user ngẫu nhiên."""
+    rng = np.random.default_rng(seed)
+    n_items = ann.n_items
+    sample = rng.choice(n_items, size=min(n_samples, n_items), replace=False)
+    baskets = [rng.choice(n_items, size=min(basket_size, n_items), replace=False) for _ in range(len(sample))]
+    vectors_t = ann.vectors.T.tocsr()
+
+    def exact_top(query, exclude):
+        scores = np.asarray((query @ vectors_t).toarray(), dtype=np.float32).ravel()
+        scores[exclude] = -np.inf
+        return set(_topk_desc(scores, k)[0].tolist())
+
+    started = time.perf_counter()
+    item_truth = [exact_top(ann.vectors[idx], [idx]) for idx in sample]
+    user_queries = [ann.profile_vector(basket) for basket in baskets]
+    user_truth = [exact_top(query, basket) for query, basket in zip(user_queries, baskets)]
+    exact_ms = (time.perf_counter() - started) * 1000 / (2 * len(sample))
+
+    report = {"k": k, "samples": int(len(sample)), "n_items": int(n_items), "n_lists": int(ann.n_lists),
+              "exact_ms_per_query": round(exact_ms, 3), "n_probe": []}
+    for n_probe in n_probe_values:
+        item_recalls, user_recalls, n_candidates = [], [], []
+        started = time.perf_counter()
+        for idx, truth in zip(sample, item_truth):
+            found, _ = ann.search(ann.vectors[idx], k, n_probe=n_probe, exclude=np.asarray([idx]))
+            item_recalls.append(len(truth & set(found.tolist())) / max(len(truth), 1))
+            n_candidates.append(len(ann.candidates(ann.vectors[idx], n_probe)))
+        for query, basket, truth in zip(user_queries, baskets, user_truth):
+            found, _ = ann.search(query, k, n_probe=n_probe, exclude=basket)
+            user_recalls.append(len(truth & set(found.tolist())) / max(len(truth), 1))
+        ann_ms = (time.perf_counter() - started) * 1000 / (2 * len(sample))
+        report["n_probe"].append({
+            "n_probe": int(n_probe),
+            "item_recall": round(float(np.mean(item_recalls)), 4),
+            "user_recall": round(float(np.mean(user_recalls)), 4),
+            "candidate_fraction": round(float(np.mean(n_candidates)) / n_items, 4),
+            "ann_ms_per_query": round(ann_ms, 3),
+        })
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="IVF approximate nearest-neighbour index over TF-IDF vectors")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="Build the IVF index from a TF-IDF matrix (.npz)")
+    parser_build.add_argument("--from-tfidf", type=str, default=str(TFIDF_MATRIX_FILE))
+    parser_build.add_argument("--n_lists", type=int, default=None, help="Số cụm (mặc định ~sqrt(N))")
+    parser_build.add_argument("--n_iter", type=int, default=DEFAULT_KMEANS_ITER)
+    parser_build.add_argument("--n_probe", type=int, default=DEFAULT_N_PROBE, help="n_probe mặc định lưu trong meta")
+    parser_build.add_argument("--out", type=str, default=str(ANN_INDEX_DIR))
+
+    parser_recall = subparsers.add_parser("recall", help="recall@k against exact cosine")
+    parser_recall.add_argument("--index", type=str, default=str(ANN_INDEX_DIR))
+    parser_recall.add_argument("--k", type=int, default=10)
+    parser_recall.add_argument("--n_probe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser_recall.add_argument("--samples", type=int, default=200)
+
+    parser_neighbors = subparsers.add_parser("neighbors", help="Build the top-K neighbour index through the ANN index")
+    parser_neighbors.add_argument("--index", type=str, default=str(ANN_INDEX_DIR))
+    parser_neighbors.add_argument("--top_k", type=int, default=DEFAULT_TOP_K)
+    parser_neighbors.add_argument("--n_probe", type=int, default=None)
+    parser_neighbors.add_argument("--quantize", action="store_true")
+    parser_neighbors.add_argument("--out", type=str, default=str(NEIGHBOR_INDEX_DIR))
+
+    args = parser.parse_args()
+    if args.command == "build":
+        ann = IVFIndex.build(scipy.sparse.load_npz(args.from_tfidf).tocsr(), n_lists=args.n_lists, n_iter=args.n_iter,
+                             n_probe=args.n_probe)
+        ann.save(args.out)
+        print(f"Saved ANN index ({ann.n_items} items, {ann.n_lists} lists) to {args.out}", file=sys.stderr)
+    elif args.command == "recall":
+        print(json.dumps(recall_report(IVFIndex.load(args.index), k=args.k, n_probe_values=args.n_probe, n_samples=args.samples), indent=2))
+    elif args.command == "neighbors":
+        index = build_neighbor_index(IVFIndex.load(args.index, mmap=False), top_k=args.top_k, n_probe=args.n_probe, quantize=args.quantize)
+        index.save(args.out)
+        print(f"Saved neighbour index ({index.n_items} items, nnz={len(index.indices)}) to {args.out}", file=sys.stderr)
@@ -0,0 +1,689 @@
+# scripts/artifact_bundle.py
+# Bundle artifact có phiên bản: mọi thứ recommender cần từ CÙNG một lần dựng mô hình, trong một thư mục
+# không bao giờ bị sửa sau khi publish:
+#
+#   bundles/<version>/
+#     manifest.json       phiên bản, số sản phẩm, số hàng ma trận, sha256 + kích thước từng file
+#     products/           bảng sản phẩm dạng cột (mmap được): số -> <cột>.npy; chuỗi -> offsets + bytes UTF-8 + null
+#                         lookup_ids.npy / lookup_rows.npy: product_id (int, tăng dần) -> dòng của bảng
+#     ids/row_product_ids.npy   int64[n_items]: hàng ma trận -> product_id (-1 nếu trống)
+#     ids/mongo_ids.npy + mongo_product_ids.npy   _id MongoDB (hex, tăng dần) -> product_id
+#     neighbors/  precomputed/  ann/ (tùy chọn)  search/   chỉ mục đã dựng, cùng định dạng như thư mục rời
+#     tfidf/              ma trận TF-IDF (CSR, mmap được) của build_model.py: hồ sơ user được chấm điểm chính xác
+#                         (TfidfSimilarity) mà không cần ma trận N×N
+#     dense/cosine.npy    (tùy chọn) ma trận cosine dày, chỉ khi artifact rời cũ chưa có ma trận TF-IDF
+#     records/            bản ghi JSON dựng sẵn cho response (record_store.py); bundle cũ không có thì dựng khi load
+#   bundles/CURRENT       tên phiên bản đang dùng, cập nhật bằng os.replace (đổi nguyên tử)
+#
+# Process đang chạy (serve) đọc CURRENT, load bundle mới ở thread nền rồi thay trạng thái bằng một phép gán.
+#
+# Dùng:
+#   python artifact_bundle.py publish                 # gom artifact rời trong python_recommender_artifacts/
+#   python artifact_bundle.py verify [--version V]
+#   python artifact_bundle.py list
+#   python artifact_bundle.py activate --version V    # quay lại một phiên bản cũ
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import argparse
+import pathlib
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from neighbor_index import NeighborIndex, TfidfSimilarity, build_from_dense
+from precomputed_store import PrecomputedRecs, build_from_neighbor_index, convert_json, store_is_current
+from search_index import SearchIndex
+from record_store import ProductRecordStore
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+BUNDLES_DIR_NAME = 'bundles'
+BUNDLES_DIR = ARTIFACTS_DIR / BUNDLES_DIR_NAME
+
+# Artifact rời (tương đối so với artifacts_dir), khớp với notebook và build_model.py
+PRODUCT_DATA_CSV_FILE = 'buudien_ocop_products_detailed_v2_rerun.csv'
+ENRICHED_PRODUCT_MAP_JSON_FILE = 'product_id_name_map_v2_adv_enriched_with_mongo_id.json'
+PRODUCT_INDICES_MAP_FILE = 'product_indices_map_v2_adv.pkl'
+PRECOMPUTED_RECS_JSON_FILE = 'precomputed_recommendations_v2_raw_adv.json'
+COSINE_SIM_MATRIX_FILE = 'cosine_similarity_matrix_v2_adv.npy'
+TFIDF_MATRIX_FILE = 'tfidf_matrix_v2_adv.npz'
+NEIGHBOR_INDEX_DIR = 'neighbors_v2_adv'
+PRECOMPUTED_RECS_DIR = 'precomputed_recs_v2_adv'
+ANN_INDEX_DIR = 'ann_ivf_v2_adv'
+
+BUNDLE_FORMAT = 1
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+PRODUCTS_DIR = 'products'
+IDS_DIR = 'ids'
+NEIGHBORS_DIR = 'neighbors'
+PRECOMPUTED_DIR = 'precomputed'
+ANN_DIR = 'ann'
+TFIDF_DIR = 'tfidf'
+DENSE_DIR = 'dense'
+DENSE_MATRIX_FILE = 'cosine.npy'
+SEARCH_DIR = 'search'
+RECORDS_DIR = 'records'
+DEFAULT_KEEP = 3 # Số bundle giữ lại (kể cả bản đang dùng) để có thể quay lại
+
+TABLE_META_FILE = 'meta.json'
+LOOKUP_IDS_FILE = 'lookup_ids.npy'
+LOOKUP_ROWS_FILE = 'lookup_rows.npy'
+ROW_PRODUCT_IDS_FILE = 'row_product_ids.npy'
+MONGO_IDS_FILE = 'mongo_ids.npy'
+MONGO_PRODUCT_IDS_FILE = 'mongo_product_ids.npy'
+MONGO_ID_COLUMN = '_id'
+OBJECT_ID_PATTERN = re.compile(r'^[0-9a-fA-F]{24}$')
+HAS_DETAILS_COLUMN = 'has_details' # Sản phẩm có trong product map (được phép xuất hiện trong gợi ý)
+NUMERIC_COLUMNS = ('price', 'ocop_rating', 'num_reviews', 'sold')
+
+
+def _to_int_id(value):
+    """product_id dạng string -> int; None nếu không phải số nguyên viết chuẩn (giữ nguyên ngữ nghĩa so khớp string)."""
+    try:
+        pid = int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return pid if str(pid) == str(value) else None
+
+
+def _column_file_stem(position, name):
+    return f"{position:02d}_{re.sub(r'[^0-9A-Za-z_]', '_', name)}"
+
+
+# --- Bảng sản phẩm dạng cột ---
+class StringColumn:
+    """Cột chuỗi: dòng i = data[offsets[i]:offsets[i+1]] (UTF-8), null[i] = giá trị trống."""
+
+    def __init__(self, offsets, data, null):
+        self.offsets = offsets
+        self.data = data
+        self.null = null
+
+    def __len__(self):
+        return len(self.null)
+
+    def __getitem__(self, row):
+        if self.null[row]:
+            return None
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def tolist(self):
+        buffer = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [None if is_null else buffer[offsets[i]:offsets[i + 1]].decode('utf-8')
+                for i, is_null in enumerate(self.null.tolist())]
+
+    @staticmethod
+    def encode(values):
+        """(offsets, data, null) cho list giá trị (None/NaN -> null)."""
+        null = np.array([v is None or (isinstance(v, float) and v != v) for v in values], dtype=bool)
+        encoded = [b"" if is_null else str(v).encode('utf-8') for v, is_null in zip(values, null.tolist())]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8), null
+
+
+def _column_kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    return 'str'
+
+
+class ProductTable:
+    """Bảng sản phẩm (một dòng / sản phẩm của CSV, giữ thứ tự) lưu theo cột, tra dòng theo product_id."""
+
+    def __init__(self, columns, kinds, lookup_ids, lookup_rows):
+        self.columns = columns # {tên cột: ndarray hoặc StringColumn}
+        self.kinds = kinds # {tên cột: 'int' | 'float' | 'bool' | 'str'}
+        self.lookup_ids = lookup_ids
+        self.lookup_rows = lookup_rows
+        self.n_rows = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def row_of(self, product_id):
+        pid = _to_int_id(product_id)
+        if pid is None or len(self.lookup_ids) == 0:
+            return None
+        pos = int(np.searchsorted(self.lookup_ids, pid))
+        if pos < len(self.lookup_ids) and self.lookup_ids[pos] == pid:
+            return int(self.lookup_rows[pos])
+        return None
+
+    def value(self, column, row):
+        values = self.columns[column][row]
+        return values.item() if isinstance(values, np.generic) else values
+
+    def to_dataframe(self, columns=None):
+        """DataFrame của các cột yêu cầu (mặc định: mọi cột trừ cờ nội bộ) - không phải parse CSV/JSON."""
+        names = [c for c in (columns or self.columns) if c in self.columns and c != HAS_DETAILS_COLUMN]
+        data = {}
+        for name in names:
+            values = self.columns[name]
+            data[name] = pd.Series(values.tolist(), dtype=object) if isinstance(values, StringColumn) else np.asarray(values)
+        return pd.DataFrame(data)
+
+    @classmethod
+    def from_dataframe(cls, df):
+        columns, kinds = {}, {}
+        for name in df.columns:
+            kind = _column_kind(df[name])
+            kinds[name] = kind
+            if kind == 'str':
+                columns[name] = StringColumn(*StringColumn.encode(df[name].astype(object).tolist()))
+            else:
+                columns[name] = df[name].to_numpy(dtype={'int': np.int64, 'float': np.float64, 'bool': bool}[kind])
+        ids = [_to_int_id(pid) for pid in df['product_id'].astype(str).tolist()]
+        rows = [row for row, pid in enumerate(ids) if pid is not None]
+        lookup_ids = np.asarray([ids[row] for row in rows], dtype=np.int64)
+        # Trùng product_id: giữ dòng đầu tiên (như drop_duplicates trước đây)
+        order = np.lexsort((np.asarray(rows, dtype=np.int64), lookup_ids))
+        lookup_ids, lookup_rows = lookup_ids[order], np.asarray(rows, dtype=np.int64)[order]
+        first = np.ones(len(lookup_ids), dtype=bool)
+        first[1:] = lookup_ids[1:] != lookup_ids[:-1]
+        return cls(columns, kinds, lookup_ids[first], lookup_rows[first])
+
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        meta_columns = []
+        for position, (name, values) in enumerate(self.columns.items()):
+            stem = _column_file_stem(position, name)
+            meta_columns.append({"name": name, "kind": self.kinds[name], "file": stem})
+            if isinstance(values, StringColumn):
+                np.save(directory / f"{stem}.offsets.npy", values.offsets)
+                np.save(directory / f"{stem}.utf8.npy", np.asarray(values.data, dtype=np.uint8))
+                np.save(directory / f"{stem}.null.npy", values.null)
+            else:
+                np.save(directory / f"{stem}.npy", values)
+        np.save(directory / LOOKUP_IDS_FILE, self.lookup_ids)
+        np.save(directory / LOOKUP_ROWS_FILE, self.lookup_rows)
+        with open(directory / TABLE_META_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"n_rows": self.n_rows, "columns": meta_columns}, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        with open(directory / TABLE_META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        columns, kinds = {}, {}
+        for column in meta["columns"]:
+            stem = column["file"]
+            kinds[column["name"]] = column["kind"]
+            if column["kind"] == 'str':
+                columns[column["name"]] = StringColumn(np.load(directory / f"{stem}.offsets.npy", mmap_mode=mmap_mode),
+                                                       np.load(directory / f"{stem}.utf8.npy", mmap_mode=mmap_mode),
+                                                       np.load(directory / f"{stem}.null.npy", mmap_mode=mmap_mode))
+            else:
+                columns[column["name"]] = np.load(directory / f"{stem}.npy", mmap_mode=mmap_mode)
+        return cls(columns, kinds, np.load(directory / LOOKUP_IDS_FILE, mmap_mode=mmap_mode),
+                   np.load(directory / LOOKUP_ROWS_FILE, mmap_mode=mmap_mode))
+
+
+class ProductDetails(Mapping):
+    """Dạng dict {product_id: {trường: giá trị}} của bảng sản phẩm, thay cho product map JSON.
+    Chỉ gồm sản phẩm có trong product map; chuỗi trống -> '' như map cũ, _id trống -> None."""
+
+    def __init__(self, table):
+        self.table = table
+        self._fields = [c for c in table.columns if c not in ('product_id', HAS_DETAILS_COLUMN)]
+        flags = table.columns.get(HAS_DETAILS_COLUMN)
+        self._has_details = np.asarray(flags, dtype=bool) if flags is not None else np.ones(len(table), dtype=bool)
+
+    def _row(self, product_id):
+        row = self.table.row_of(product_id)
+        return row if row is not None and self._has_details[row] else None
+
+    def __contains__(self, product_id):
+        return self._row(product_id) is not None
+
+    def __getitem__(self, product_id):
+        row = self._row(product_id)
+        if row is None:
+            raise KeyError(product_id)
+        details = {}
+        for field in self._fields:
+            value = self.table.value(field, row)
+            if value is None and self.table.kinds[field] == 'str' and field != MONGO_ID_COLUMN:
+                value = ''
+            details[field] = value
+        return details
+
+    def contains_ids(self, product_ids):
+        """Vector hóa `in`: bool[len(product_ids)] cho mảng product_id int (-1 = trống)."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        lookup_ids = self.table.lookup_ids
+        if len(lookup_ids) == 0:
+            return np.zeros(len(product_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(lookup_ids, product_ids), len(lookup_ids) - 1)
+        found = (lookup_ids[pos] == product_ids) & (product_ids >= 0)
+        return found & self._has_details[self.table.lookup_rows[pos]]
+
+    def __iter__(self):
+        product_ids = self.table.columns['product_id']
+        for row in np.flatnonzero(self._has_details).tolist():
+            yield product_ids[row]
+
+    def __len__(self):
+        return int(self._has_details.sum())
+
+
+class ProductIdMap:
+    """Hàng ma trận tương đồng <-> product_id (string) dựng từ mảng: row_product_ids[row] = product_id hoặc -1."""
+
+    def __init__(self, row_product_ids):
+        self.row_product_ids = row_product_ids
+        valid_rows = np.flatnonzero(np.asarray(row_product_ids) >= 0)
+        order = np.argsort(np.asarray(row_product_ids)[valid_rows], kind='stable')
+        self._sorted_ids = np.asarray(row_product_ids)[valid_rows][order]
+        self._sorted_rows = valid_rows[order]
+
+    def __len__(self):
+        return len(self._sorted_ids)
+
+    @property
+    def n_rows(self):
+        return len(self.row_product_ids)
+
+    def index_of(self, product_id):
+        """Hàng của product_id (int) hoặc None."""
+        pid = _to_int_id(product_id)
+        if pid is None or len(self._sorted_ids) == 0:
+            return None
+        pos = int(np.searchsorted(self._sorted_ids, pid))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == pid:
+            return int(self._sorted_rows[pos])
+        return None
+
+    def id_of(self, row):
+        """product_id (string) của hàng row hoặc None."""
+        if row is None or not 0 <= row < len(self.row_product_ids):
+            return None
+        pid = int(self.row_product_ids[row])
+        return str(pid) if pid >= 0 else None
+
+    def items(self):
+        for row in self._sorted_rows.tolist():
+            yield self.id_of(row), row
+
+    @classmethod
+    def from_series(cls, indices, n_rows=None):
+        """Từ pd.Series product_id -> hàng (product_indices_map_v2_adv.pkl)."""
+        rows = np.asarray(indices.to_numpy(), dtype=np.int64)
+        pids = [_to_int_id(pid) for pid in indices.index.astype(str).tolist()]
+        n_rows = int(rows.max()) + 1 if n_rows is None and len(rows) else (n_rows or 0)
+        row_product_ids = np.full(n_rows, -1, dtype=np.int64)
+        for row, pid in zip(rows.tolist(), pids):
+            if pid is not None and 0 <= row < n_rows and row_product_ids[row] < 0:
+                row_product_ids[row] = pid
+        return cls(row_product_ids)
+
+
+class MongoIdMap:
+    """_id MongoDB (ObjectId dạng hex) -> product_id (int), dựng từ trường _id của product map enriched.
+    object_ids: 'S24' chữ thường, tăng dần; product_ids: int64 cùng thứ tự. Một _id có thể gắn với nhiều
+    product_id (cùng sản phẩm bị crawl nhiều lần) nên giữ các cặp trùng khóa."""
+
+    def __init__(self, object_ids, product_ids):
+        self.object_ids = object_ids
+        self.product_ids = product_ids
+
+    def __len__(self):
+        return len(self.object_ids)
+
+    @staticmethod
+    def is_object_id(value):
+        return isinstance(value, str) and OBJECT_ID_PATTERN.match(value) is not None
+
+    @classmethod
+    def from_product_map(cls, product_map):
+        """Từ product map (dict JSON hoặc ProductDetails); bỏ mục không có _id hợp lệ."""
+        pairs = []
+        for pid_str in (product_map or {}):
+            pid = _to_int_id(pid_str)
+            object_id = (product_map[pid_str] or {}).get(MONGO_ID_COLUMN)
+            if pid is not None and cls.is_object_id(object_id):
+                pairs.append((object_id.lower().encode('ascii'), pid))
+        pairs.sort()
+        return cls(np.array([oid for oid, _ in pairs], dtype='S24'), np.array([pid for _, pid in pairs], dtype=np.int64))
+
+    def save(self, directory):
+        np.save(pathlib.Path(directory) / MONGO_IDS_FILE, self.object_ids)
+        np.save(pathlib.Path(directory) / MONGO_PRODUCT_IDS_FILE, self.product_ids)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        return cls(np.load(pathlib.Path(directory) / MONGO_IDS_FILE, mmap_mode=mmap_mode),
+                   np.load(pathlib.Path(directory) / MONGO_PRODUCT_IDS_FILE, mmap_mode=mmap_mode))
+
+    def product_ids_of(self, object_id):
+        """Mọi product_id (int) gắn với _id này; [] nếu không có."""
+        if not self.is_object_id(object_id) or len(self.object_ids) == 0:
+            return []
+        key = np.array(object_id.lower().encode('ascii'), dtype='S24')
+        start, end = np.searchsorted(self.object_ids, key, side='left'), np.searchsorted(self.object_ids, key, side='right')
+        return self.product_ids[start:end].tolist()
+
+    def product_id_of(self, object_id):
+        """product_id (string) của _id; _id gắn với nhiều sản phẩm -> product_id nhỏ nhất. None nếu không có."""
+        product_ids = self.product_ids_of(object_id)
+        return str(min(product_ids)) if product_ids else None
+
+
+# --- Manifest và checksum ---
+def _sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_checksums(directory):
+    """{đường dẫn tương đối: {"sha256", "bytes"}} cho mọi file trong bundle (trừ manifest)."""
+    directory = pathlib.Path(directory)
+    checksums = {}
+    for path in sorted(p for p in directory.rglob('*') if p.is_file()):
+        rel = path.relative_to(directory).as_posix()
+        if rel != MANIFEST_FILE:
+            checksums[rel] = {"sha256": _sha256(path), "bytes": path.stat().st_size}
+    return checksums
+
+
+def read_manifest(bundle_dir):
+    manifest_path = pathlib.Path(bundle_dir) / MANIFEST_FILE
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"Bundle manifest not found: {manifest_path}")
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format {manifest.get('format')} in {bundle_dir} (expected {BUNDLE_FORMAT}).")
+    return manifest
+
+
+def verify_bundle(bundle_dir, checksums=True):
+    """Danh sách lỗi (rỗng nếu bundle khớp manifest). checksums=False: chỉ so kích thước file."""
+    bundle_dir = pathlib.Path(bundle_dir)
+    manifest = read_manifest(bundle_dir)
+    problems = []
+    for rel, expected in manifest["files"].items():
+        path = bundle_dir / rel
+        if not path.is_file():
+            problems.append(f"missing file {rel}")
+        elif path.stat().st_size != expected["bytes"]:
+            problems.append(f"size mismatch for {rel}")
+        elif checksums and _sha256(path) != expected["sha256"]:
+            problems.append(f"checksum mismatch for {rel}")
+    return problems
+
+
+# --- Con trỏ CURRENT ---
+def current_version(bundles_dir=BUNDLES_DIR):
+    try:
+        with open(pathlib.Path(bundles_dir) / CURRENT_FILE, 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def current_bundle_dir(bundles_dir=BUNDLES_DIR):
+    """Thư mục bundle CURRENT trỏ tới, None nếu chưa publish bundle nào."""
+    version = current_version(bundles_dir)
+    return pathlib.Path(bundles_dir) / version if version else None
+
+
+def activate(version, bundles_dir=BUNDLES_DIR):
+    """Trỏ CURRENT sang version (ghi file tạm rồi os.replace: người đọc chỉ thấy bản cũ hoặc bản mới)."""
+    bundles_dir = pathlib.Path(bundles_dir)
+    read_manifest(bundles_dir / version) # Không trỏ tới bundle hỏng / chưa publish xong
+    tmp_path = bundles_dir / (CURRENT_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, bundles_dir / CURRENT_FILE)
+
+
+def list_versions(bundles_dir=BUNDLES_DIR):
+    """Các phiên bản đã publish (có manifest), cũ -> mới."""
+    bundles_dir = pathlib.Path(bundles_dir)
+    if not bundles_dir.is_dir():
+        return []
+    return sorted(p.name for p in bundles_dir.iterdir() if p.is_dir() and (p / MANIFEST_FILE).is_file())
+
+
+def prune(bundles_dir=BUNDLES_DIR, keep=DEFAULT_KEEP):
+    """Xóa bundle cũ, giữ keep bản mới nhất và luôn giữ bản CURRENT.
+    (Process còn mmap file của bundle đã xóa vẫn đọc được cho tới khi thả tham chiếu.)"""
+    versions = list_versions(bundles_dir)
+    current = current_version(bundles_dir)
+    removed = []
+    for version in versions[:max(len(versions) - keep, 0)]:
+        if version != current:
+            shutil.rmtree(pathlib.Path(bundles_dir) / version, ignore_errors=True)
+            removed.append(version)
+    return removed
+
+
+# --- Publish: gom artifact rời thành bundle ---
+def _load_product_frame(csv_path, product_map):
+    df = pd.read_csv(csv_path, dtype={'product_id': str})
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    pids = df['product_id'].astype(str)
+    df[MONGO_ID_COLUMN] = [(product_map.get(pid) or {}).get(MONGO_ID_COLUMN) or None for pid in pids.tolist()]
+    df[HAS_DETAILS_COLUMN] = pids.isin(set(product_map)).to_numpy()
+    return df
+
+
+def _neighbor_index_for(artifacts_dir):
+    neighbor_dir = artifacts_dir / NEIGHBOR_INDEX_DIR
+    if os.path.exists(neighbor_dir):
+        return NeighborIndex.load(neighbor_dir, mmap=True)
+    dense_path = artifacts_dir / COSINE_SIM_MATRIX_FILE
+    if os.path.exists(dense_path):
+        return build_from_dense(np.load(dense_path, mmap_mode='r'))
+    raise FileNotFoundError(f"Neither neighbour index ({neighbor_dir}) nor cosine similarity matrix ({dense_path}) found.")
+
+
+def publish_bundle(artifacts_dir=ARTIFACTS_DIR, bundles_dir=None, csv_path=None, keep=DEFAULT_KEEP, activate_bundle=True):
+    """Dựng bundle mới từ artifact rời trong artifacts_dir, ghi manifest, trỏ CURRENT sang nó. Trả về manifest."""
+    artifacts_dir = pathlib.Path(artifacts_dir)
+    bundles_dir = pathlib.Path(bundles_dir) if bundles_dir else artifacts_dir / BUNDLES_DIR_NAME
+    with open(artifacts_dir / ENRICHED_PRODUCT_MAP_JSON_FILE, 'r', encoding='utf-8') as f:
+        product_map = json.load(f)
+    df = _load_product_frame(csv_path or artifacts_dir / PRODUCT_DATA_CSV_FILE, product_map)
+    with open(artifacts_dir / PRODUCT_INDICES_MAP_FILE, 'rb') as f:
+        indices = pickle.load(f)
+    index = _neighbor_index_for(artifacts_dir)
+    id_map = ProductIdMap.from_series(indices, n_rows=index.n_items)
+    if len(id_map) != len(indices):
+        raise ValueError(f"Product indices map has {len(indices)} entries but only {len(id_map)} fit the {index.n_items}-row neighbour index.")
+
+    bundles_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = bundles_dir / f".tmp-{os.getpid()}-{int(time.time())}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        products = ProductTable.from_dataframe(df)
+        products.save(tmp_dir / PRODUCTS_DIR)
+        # Dựng từ chính bảng của bundle (cùng cách đọc như khi serve)
+        ProductRecordStore.build(ProductDetails(products)).save(tmp_dir / RECORDS_DIR)
+        (tmp_dir / IDS_DIR).mkdir(parents=True)
+        np.save(tmp_dir / IDS_DIR / ROW_PRODUCT_IDS_FILE, id_map.row_product_ids)
+        MongoIdMap.from_product_map(ProductDetails(products)).save(tmp_dir / IDS_DIR)
+        index.save(tmp_dir / NEIGHBORS_DIR)
+
+        # Store nhị phân nếu còn khớp file JSON; store cũ hơn JSON thì convert lại từ JSON
+        precomputed_dir = artifacts_dir / PRECOMPUTED_RECS_DIR
+        precomputed_json = artifacts_dir / PRECOMPUTED_RECS_JSON_FILE
+        if store_is_current(precomputed_dir, precomputed_json):
+            shutil.copytree(precomputed_dir, tmp_dir / PRECOMPUTED_DIR)
+        elif os.path.exists(precomputed_json):
+            convert_json(precomputed_json, tmp_dir / PRECOMPUTED_DIR)
+        else:
+            build_from_neighbor_index(index, {row: int(pid) for pid, row in id_map.items()}).save(tmp_dir / PRECOMPUTED_DIR)
+
+        components = [PRODUCTS_DIR, IDS_DIR, NEIGHBORS_DIR, PRECOMPUTED_DIR, SEARCH_DIR, RECORDS_DIR]
+        ann_dir = artifacts_dir / ANN_INDEX_DIR
+        if os.path.exists(ann_dir / 'meta.json'):
+            with open(ann_dir / 'meta.json', 'r', encoding='utf-8') as f:
+                ann_items = json.load(f).get("n_items")
+            if ann_items == index.n_items:
+                shutil.copytree(ann_dir, tmp_dir / ANN_DIR)
+                components.append(ANN_DIR)
+            else:
+                print(f"Warning: ANN index at {ann_dir} has {ann_items} items, neighbour index has {index.n_items}; not bundling it.", file=sys.stderr)
+        tfidf_path = artifacts_dir / TFIDF_MATRIX_FILE
+        dense_path = artifacts_dir / COSINE_SIM_MATRIX_FILE
+        tfidf = TfidfSimilarity.from_npz(tfidf_path) if os.path.exists(tfidf_path) else None
+        if tfidf is not None and tfidf.shape != index.shape:
+            print(f"Warning: TF-IDF matrix ({tfidf.n_items} rows) does not match the neighbour index {index.shape}; not bundling it.", file=sys.stderr)
+            tfidf = None
+        if tfidf is not None:
+            tfidf.save(tmp_dir / TFIDF_DIR)
+            components.append(TFIDF_DIR)
+        elif os.path.exists(dense_path):
+            dense_shape = np.load(dense_path, mmap_mode='r').shape
+            if dense_shape == index.shape:
+                (tmp_dir / DENSE_DIR).mkdir()
+                shutil.copyfile(dense_path, tmp_dir / DENSE_DIR / DENSE_MATRIX_FILE)
+                components.append(DENSE_DIR)
+            else:
+                print(f"Warning: Cosine similarity matrix {dense_shape} does not match the neighbour index {index.shape}; not bundling it.", file=sys.stderr)
+
+        # Chỉ mục tìm kiếm luôn dựng lại từ đúng bảng sản phẩm của bundle
+        SearchIndex.build_from_dataframe(df.drop(columns=[HAS_DETAILS_COLUMN])).save(tmp_dir / SEARCH_DIR)
+
+        files = file_checksums(tmp_dir)
+        content_hash = hashlib.sha256(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+        version = f"{time.strftime('%Y%m%dT%H%M%S')}-{content_hash}"
+        manifest = {
+            "format": BUNDLE_FORMAT, "version": version,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "n_products": int(len(df)), "n_with_details": int(df[HAS_DETAILS_COLUMN].sum()),
+            "n_items": int(index.n_items), "n_mapped_items": len(id_map),
+            "components": components, "files": files,
+        }
+        with open(tmp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        if (bundles_dir / version).exists(): # Cùng nội dung, publish lại trong cùng một giây
+            manifest = read_manifest(bundles_dir / version)
+        else:
+            os.replace(tmp_dir, bundles_dir / version)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if activate_bundle:
+        activate(version, bundles_dir)
+        prune(bundles_dir, keep=keep)
+    return manifest
+
+
+class ArtifactBundle:
+    """Bundle đã load: bảng sản phẩm, map hàng <-> product_id và _id -> product_id, chỉ mục hàng xóm,
+    gợi ý tiền tính toán, bản ghi response, TfidfSimilarity / ma trận cosine dày (None nếu bundle không kèm)."""
+
+    def __init__(self, directory, manifest, products, id_map, neighbor_index, precomputed, records, mongo_id_map, cosine_matrix=None,
+                 tfidf_similarity=None):
+        self.directory = pathlib.Path(directory)
+        self.manifest = manifest
+        self.products = products
+        self.id_map = id_map
+        self.neighbor_index = neighbor_index
+        self.precomputed = precomputed
+        self.records = records
+        self.mongo_id_map = mongo_id_map
+        self.cosine_matrix = cosine_matrix
+        self.tfidf_similarity = tfidf_similarity
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def component_dir(self, name):
+        """Đường dẫn thành phần tùy chọn (ann, search) nếu bundle có, ngược lại None."""
+        return self.directory / name if name in self.manifest.get("components", []) else None
+
+    @classmethod
+    def load(cls, directory, verify=True, mmap=True):
+        """Load bundle; verify=True kiểm tra sha256 mọi file, False chỉ so kích thước. Lỗi -> ValueError."""
+        directory = pathlib.Path(directory)
+        manifest = read_manifest(directory)
+        problems = verify_bundle(directory, checksums=verify)
+        if problems:
+            raise ValueError(f"Bundle {manifest.get('version')} failed verification: {', '.join(problems[:5])}")
+        products = ProductTable.load(directory / PRODUCTS_DIR, mmap=mmap)
+        id_map = ProductIdMap(np.load(directory / IDS_DIR / ROW_PRODUCT_IDS_FILE, mmap_mode='r' if mmap else None))
+        neighbor_index = NeighborIndex.load(directory / NEIGHBORS_DIR, mmap=mmap)
+        if neighbor_index.n_items != id_map.n_rows or len(products) != manifest["n_products"]:
+            raise ValueError(f"Bundle {manifest['version']} is inconsistent: {neighbor_index.n_items} neighbour rows, "
+                             f"{id_map.n_rows} id rows, {len(products)} products (manifest: {manifest['n_products']}).")
+        records_dir = directory / RECORDS_DIR
+        records = (ProductRecordStore.load(records_dir, mmap=mmap) if RECORDS_DIR in manifest.get("components", [])
+                   else ProductRecordStore.build(ProductDetails(products)))
+        mongo_id_map = (MongoIdMap.load(directory / IDS_DIR, mmap=mmap) if (directory / IDS_DIR / MONGO_IDS_FILE).exists()
+                        else MongoIdMap.from_product_map(ProductDetails(products)))
+        cosine_matrix, tfidf_similarity = None, None
+        if TFIDF_DIR in manifest.get("components", []):
+            tfidf_similarity = TfidfSimilarity.load(directory / TFIDF_DIR, mmap=mmap)
+        if DENSE_DIR in manifest.get("components", []):
+            cosine_matrix = np.load(directory / DENSE_DIR / DENSE_MATRIX_FILE, mmap_mode='r' if mmap else None)
+        return cls(directory, manifest, products, id_map, neighbor_index,
+                   PrecomputedRecs.load(directory / PRECOMPUTED_DIR, mmap=mmap), records, mongo_id_map, cosine_matrix,
+                   tfidf_similarity)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Versioned artifact bundles for the recommender")
+    parser.add_argument("--artifacts_dir", type=str, default=str(ARTIFACTS_DIR))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_publish = subparsers.add_parser("publish", help="Build a bundle from the loose artifacts and make it CURRENT")
+    parser_publish.add_argument("--csv", type=str, help="Mặc định: CSV sản phẩm trong artifacts_dir")
+    parser_publish.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="Số bundle giữ lại")
+    parser_publish.add_argument("--no_activate", action="store_true", help="Chỉ dựng, không đổi CURRENT")
+
+    parser_verify = subparsers.add_parser("verify", help="Check a bundle against its manifest checksums")
+    parser_verify.add_argument("--version", type=str, help="Mặc định: bản CURRENT")
+
+    subparsers.add_parser("list", help="List published bundles")
+
+    parser_activate = subparsers.add_parser("activate", help="Point CURRENT at an existing bundle (rollback)")
+    parser_activate.add_argument("--version", type=str, required=True)
+
+    args = parser.parse_args()
+    bundles_dir = pathlib.Path(args.artifacts_dir) / BUNDLES_DIR_NAME
+    try:
+        if args.command == "publish":
+            manifest = publish_bundle(args.artifacts_dir, csv_path=args.csv, keep=args.keep, activate_bundle=not args.no_activate)
+            result = {key: manifest[key] for key in ("version", "n_products", "n_items", "components")}
+        elif args.command == "verify":
+            version = args.version or current_version(bundles_dir)
+            if version is None:
+                raise FileNotFoundError(f"No bundle published in {bundles_dir}")
+            problems = verify_bundle(bundles_dir / version)
+            result = {"version": version, "ok": not problems, "problems": problems}
+        elif args.command == "list":
+            result = {"current": current_version(bundles_dir), "versions": list_versions(bundles_dir)}
+        else:
+            activate(args.version, bundles_dir)
+            result = {"current": args.version}
+        print(json.dumps(result))
+    except Exception as e:
+        print(json.dumps({"error": f"Bundle command failed: {type(e).__name__} - {e}"}), file=sys.stderr)
+        sys.exit(1)
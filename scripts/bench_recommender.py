@@ -0,0 +1,452 @@
+# scripts/bench_recommender.py
+# Benchmark các command của recommender trên catalog tổng hợp nhiều kích thước (mặc định 3k / 30k / 300k sản phẩm).
+#   - generate: tạo artifact rời giả lập (CSV, product map enriched, map index, chỉ mục hàng xóm top-K theo
+#     "chủ đề", ma trận TF-IDF cùng mật độ catalog thật) trong data_dir/<kích thước>/ rồi publish thành bundle như
+#     artifact thật (artifact_bundle.py). Dữ liệu tất định theo seed và được dùng lại ở các lần chạy sau
+#   - run: mỗi kích thước đo trong một process con riêng (RECOMMENDER_BUNDLES_DIR trỏ vào bundle tổng hợp) để
+#     thời gian load artifact và RSS không lẫn giữa các kích thước. Mỗi command: p50 / p95 / p99 / max độ trễ,
+#     throughput (một thread, gồm cả serialize response như chế độ serve), RSS hiện tại và RSS đỉnh.
+#     Hồ sơ user được chấm điểm bằng đúng đường của production (bundle có tfidf/); "user_scorer" ghi lại đường đã đo
+#     Cache kết quả (response_cache.py) tắt khi đo các command để số đo là đường tính thật; độ trễ khi trúng
+#     cache đo riêng ở response_cache_hits
+#   - compare: so hai file kết quả, báo các chỉ số chậm đi quá ngưỡng (exit code 1 nếu có)
+#
+# Dùng:
+#   python bench_recommender.py run --sizes 3000 30000 300000 --requests 2000 --out bench_results.json
+#   python bench_recommender.py compare bench_baseline.json bench_results.json --threshold 0.2
+#   python bench_recommender.py generate --sizes 300000        # chỉ tạo dữ liệu
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import pathlib
+import platform
+import subprocess
+import tempfile
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from neighbor_index import NeighborIndex, DEFAULT_TOP_K
+from artifact_bundle import (publish_bundle, current_bundle_dir, BUNDLES_DIR_NAME, PRODUCT_DATA_CSV_FILE,
+                             ENRICHED_PRODUCT_MAP_JSON_FILE, PRODUCT_INDICES_MAP_FILE, NEIGHBOR_INDEX_DIR, TFIDF_MATRIX_FILE)
+try:
+    import resource # Chỉ có trên Unix
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = (3000, 30000, 300000)
+DEFAULT_REQUESTS = 2000
+DEFAULT_WARMUP = 50
+DEFAULT_SEED = 42
+DEFAULT_THRESHOLD = 0.2 # compare: chậm hơn 20% (độ trễ) hoặc throughput giảm tương ứng -> hồi quy
+DEFAULT_DATA_DIR = pathlib.Path(tempfile.gettempdir()) / 'recommender_bench'
+SYNTHETIC_FORMAT = 2 # Đổi khi cách sinh dữ liệu thay đổi: dữ liệu đã tạo trước đó sẽ được sinh lại
+MARKER_FILE = 'synthetic.json'
+TOPICS_FILE = 'topics.npz' # product_id + chủ đề của từng sản phẩm (để sinh lịch sử tương tác có nghĩa)
+TOPIC_SIZE_RANGE = (50, 400) # Số sản phẩm mỗi chủ đề (các sản phẩm cùng chủ đề là hàng xóm của nhau)
+TFIDF_TERMS = 5000 # Từ vựng của ma trận TF-IDF tổng hợp (như max_features của feature_pipeline)
+TFIDF_ROW_TERMS = (60, 60) # Term mỗi dòng: từ tập term của chủ đề / từ toàn bộ từ vựng (Zipf); ~120 ô như catalog thật
+USER_POOL_SIZE = 200 # get_user_recommendations_cached: số user lặp lại (hồ sơ đã cache)
+RESPONSE_CACHE_POOL_SIZE = 200 # response_cache_hits: số request khác nhau lặp lại (đã có trong cache sau warmup)
+COMMANDS = ("get_recommendations", "get_user_recommendations", "get_user_recommendations_cached", "get_products",
+            "response_cache_hits")
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+NOUNS = ("mật ong", "trà xanh", "cà phê", "gạo ST25", "nước mắm", "bánh tráng", "kẹo dừa", "mứt gừng", "tỏi cô đơn",
+         "tinh bột nghệ", "tinh dầu sả", "rượu nếp", "hạt điều", "hạt tiêu", "miến dong", "bún khô", "chè shan tuyết",
+         "nấm hương", "yến sào", "dầu dừa", "măng khô", "cá khô", "tôm khô", "chả cá", "giò lụa", "nem chua",
+         "bột sắn dây", "mắc ca", "đông trùng hạ thảo", "sâm", "ca cao", "chuối sấy", "xoài sấy", "mít sấy")
+ADJECTIVES = ("sạch", "hữu cơ", "đặc sản", "cao cấp", "truyền thống", "nguyên chất", "thượng hạng", "loại 1")
+PROVINCES = ("Hà Giang", "Lào Cai", "Sơn La", "Thái Nguyên", "Hà Nội", "Nam Định", "Nghệ An", "Quảng Nam",
+             "Đắk Lắk", "Lâm Đồng", "Bến Tre", "Cần Thơ", "Sóc Trăng", "Cà Mau", "Bình Định", "Khánh Hòa")
+CATEGORIES = ("Thực phẩm", "Đồ uống", "Dược liệu", "Đặc sản khô", "Bánh kẹo", "Gia vị")
+SORT_KEYS = (None, "popular", "newest", "priceAsc", "priceDesc")
+
+
+# --- Sinh dữ liệu ---
+def _topics(n_products, rng):
+    """Chia n_products thành các chủ đề liên tiếp (kích thước ngẫu nhiên trong TOPIC_SIZE_RANGE)."""
+    sizes = []
+    while sum(sizes) < n_products:
+        sizes.append(int(rng.integers(*TOPIC_SIZE_RANGE)))
+    sizes[-1] -= sum(sizes) - n_products
+    if sizes[-1] < 2 and len(sizes) > 1:
+        sizes[-2] += sizes.pop()
+    topic_of = np.repeat(np.arange(len(sizes)), sizes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    return topic_of, starts, np.array(sizes)
+
+
+def synthetic_neighbor_index(topic_of, starts, sizes, top_k, rng):
+    """Top-K hàng xóm tổng hợp: chính nó (điểm 1) + các sản phẩm kế tiếp (vòng) trong cùng chủ đề, điểm giảm dần."""
+    n_items = len(topic_of)
+    k = min(top_k, int(sizes.min()))
+    rows = np.arange(n_items)
+    start, size = starts[topic_of], sizes[topic_of]
+    offsets = (rows - start)[:, None] + np.arange(k)[None, :]
+    indices = (start[:, None] + offsets % size[:, None]).astype(np.int32)
+    scores = np.sort(rng.uniform(0.05, 0.9, size=(n_items, k)).astype(np.float32), axis=1)[:, ::-1]
+    scores[:, 0] = 1.0
+    indptr = np.arange(0, n_items * k + 1, k, dtype=np.int64)
+    return NeighborIndex(indptr, indices.ravel(), np.ascontiguousarray(scores).ravel(), n_items, top_k)
+
+
+def synthetic_tfidf_matrix(topic_of, rng, n_terms=TFIDF_TERMS):
+    """Ma trận TF-IDF tổng hợp (CSR float32, hàng chuẩn hóa L2): term riêng của chủ đề + term phổ biến toàn catalog."""
+    n_items, n_topics = len(topic_of), int(topic_of.max()) + 1
+    topic_terms, global_terms = TFIDF_ROW_TERMS
+    topic_pool = rng.integers(n_terms, size=(n_topics, 2 * topic_terms), dtype=np.int32)
+    cols = np.concatenate([
+        topic_pool[topic_of[:, None], rng.integers(2 * topic_terms, size=(n_items, topic_terms))],
+        ((rng.zipf(1.3, size=(n_items, global_terms)) - 1) % n_terms).astype(np.int32),
+    ], axis=1)
+    weights = rng.uniform(0.05, 1.0, size=cols.shape).astype(np.float32)
+    indptr = np.arange(0, cols.size + 1, cols.shape[1], dtype=np.int64)
+    matrix = scipy.sparse.csr_matrix((weights.ravel(), cols.ravel(), indptr), shape=(n_items, n_terms))
+    matrix.sum_duplicates() # Term trùng trong một dòng cộng dồn
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return (scipy.sparse.diags((1.0 / norms).astype(np.float32)) @ matrix).tocsr()
+
+
+def generate_artifacts(directory, n_products, seed=DEFAULT_SEED, top_k=DEFAULT_TOP_K):
+    """Artifact rời tổng hợp (cùng tên file với python_recommender_artifacts/) trong directory."""
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    topic_of, starts, sizes = _topics(n_products, rng)
+    n_topics = len(sizes)
+    product_ids = 100000 + rng.permutation(n_products * 2)[:n_products] # ID không liên tục như catalog thật
+    topic_noun = rng.integers(len(NOUNS), size=n_topics)
+    topic_province = rng.integers(len(PROVINCES), size=n_topics)
+    topic_category = rng.integers(len(CATEGORIES), size=n_topics)
+    adjectives = rng.integers(len(ADJECTIVES), size=n_products)
+    weights = rng.choice((100, 200, 250, 500, 1000), size=n_products)
+
+    names = [f"{NOUNS[topic_noun[t]]} {ADJECTIVES[a]} {PROVINCES[topic_province[t]]} {w}gr"
+             for t, a, w in zip(topic_of.tolist(), adjectives.tolist(), weights.tolist())]
+    df = pd.DataFrame({
+        "product_id": product_ids,
+        "name": names,
+        "full_name": names,
+        "price": (rng.lognormal(11.5, 0.6, n_products) // 1000 * 1000).astype(np.int64),
+        "ocop_rating": rng.choice((3, 4, 5), size=n_products),
+        "origin": [PROVINCES[topic_province[t]] for t in topic_of.tolist()],
+        "producer": [f"HTX {PROVINCES[topic_province[t]]} {t}" for t in topic_of.tolist()],
+        "short_description": [f"Sản phẩm OCOP {name}" for name in names],
+        "description": [f"{name}. Đặc sản {PROVINCES[topic_province[t]]}, đạt chuẩn OCOP." for name, t in zip(names, topic_of.tolist())],
+        "image_url": [f"https://example.invalid/img/{pid}.jpg" for pid in product_ids.tolist()],
+        "product_url": [f"https://example.invalid/goods/{pid}" for pid in product_ids.tolist()],
+        "category": [CATEGORIES[topic_category[t]] for t in topic_of.tolist()],
+        "sold": rng.zipf(1.8, n_products).clip(max=100000),
+        "num_reviews": rng.poisson(5, n_products),
+        "createdAt": pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, n_products), unit='s'),
+    })
+    df.to_csv(directory / PRODUCT_DATA_CSV_FILE, index=False)
+
+    object_ids = [f"{(seed * 1000003 + i):024x}" for i in range(n_products)]
+    product_map = {str(pid): {"name": name, "price": float(price), "image_url": image, "product_url": url,
+                              "ocop_rating": int(rating), "_id": oid}
+                   for pid, name, price, image, url, rating, oid in zip(
+                       product_ids.tolist(), names, df["price"].tolist(), df["image_url"].tolist(),
+                       df["product_url"].tolist(), df["ocop_rating"].tolist(), object_ids)}
+    with open(directory / ENRICHED_PRODUCT_MAP_JSON_FILE, 'w', encoding='utf-8') as f:
+        json.dump(product_map, f, ensure_ascii=False)
+    with open(directory / PRODUCT_INDICES_MAP_FILE, 'wb') as f:
+        pickle.dump(pd.Series(np.arange(n_products), index=product_ids.astype(str)), f)
+    synthetic_neighbor_index(topic_of, starts, sizes, top_k, rng).save(directory / NEIGHBOR_INDEX_DIR)
+    scipy.sparse.save_npz(directory / TFIDF_MATRIX_FILE, synthetic_tfidf_matrix(topic_of, rng))
+    np.savez(directory / TOPICS_FILE, product_ids=product_ids, topic_of=topic_of)
+
+
+def ensure_dataset(data_dir, n_products, seed=DEFAULT_SEED):
+    """Thư mục dữ liệu của một kích thước, kèm bundle đã publish; chỉ sinh lại khi chưa có hoặc khác seed / format."""
+    directory = pathlib.Path(data_dir) / str(n_products)
+    marker = {"format": SYNTHETIC_FORMAT, "n_products": n_products, "seed": seed}
+    marker_path = directory / MARKER_FILE
+    bundles_dir = directory / BUNDLES_DIR_NAME
+    if marker_path.exists() and current_bundle_dir(bundles_dir) is not None:
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if all(saved.get(key) == value for key, value in marker.items()):
+            return directory, saved
+    started = time.perf_counter()
+    generate_artifacts(directory, n_products, seed=seed)
+    generated = time.perf_counter()
+    publish_bundle(artifacts_dir=directory, bundles_dir=bundles_dir, keep=1)
+    marker.update(generate_seconds=round(generated - started, 3), publish_seconds=round(time.perf_counter() - generated, 3))
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump(marker, f, indent=2)
+    return directory, marker
+
+
+# --- Đo trong process con ---
+def _rss_mb():
+    """(RSS hiện tại, RSS đỉnh) tính bằng MB; None nếu hệ điều hành không hỗ trợ."""
+    current = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024 # macOS: byte, Linux: KB
+    return (round(current, 1) if current is not None else None), (round(peak, 1) if peak is not None else None)
+
+
+def _latency_stats(latencies, elapsed):
+    ms = np.asarray(latencies) * 1000.0
+    p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+    return {"n": len(ms), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3),
+            "throughput_rps": round(len(ms) / elapsed, 1) if elapsed > 0 else None}
+
+
+def _request_generators(product_ids, topic_of, rng):
+    """Hàm sinh tham số ngẫu nhiên (tất định theo rng) cho từng command, kèm pool request của response_cache_hits."""
+    order = np.argsort(topic_of, kind='stable')
+    topic_starts = np.searchsorted(topic_of[order], np.arange(topic_of.max() + 1))
+    topic_ends = np.append(topic_starts[1:], len(order))
+    counter = iter(range(10 ** 9))
+
+    def history():
+        # 5% chưa có lịch sử (sản phẩm phổ biến); còn lại 1-20 sản phẩm, chủ yếu trong 1-2 chủ đề
+        if rng.random() < 0.05:
+            return []
+        picks = []
+        for topic in rng.integers(len(topic_starts), size=int(rng.integers(1, 3))).tolist():
+            members = order[topic_starts[topic]:topic_ends[topic]]
+            picks.extend(rng.choice(members, size=min(len(members), int(rng.integers(1, 11))), replace=False).tolist())
+        return [str(product_ids[i]) for i in picks]
+
+    pool = [(f"bench-pool-{i}", history()) for i in range(USER_POOL_SIZE)]
+    prices = np.percentile(np.asarray(rng.lognormal(11.5, 0.6, 1000)), (25, 75))
+
+    def products_params():
+        params = {"page": int(rng.integers(1, 6)), "per_page": 20}
+        if rng.random() < 0.5: params["category"] = CATEGORIES[int(rng.integers(len(CATEGORIES)))]
+        if rng.random() < 0.3: params["province"] = PROVINCES[int(rng.integers(len(PROVINCES)))]
+        if rng.random() < 0.3: params.update(min_price=float(prices[0]), max_price=float(prices[1]))
+        sort_by = SORT_KEYS[int(rng.integers(len(SORT_KEYS)))]
+        if sort_by: params["sort_by"] = sort_by
+        return params
+
+    def cached_user_params():
+        user_id, interacted = pool[int(rng.integers(len(pool)))]
+        return {"user_id": user_id, "interacted_product_ids": interacted}
+
+    def recommendations_request():
+        return ("get_recommendations", {"product_id": str(product_ids[int(rng.integers(len(product_ids)))]), "top_n": 10})
+
+    # Trộn các command có cache kết quả; warmup chạy hết pool một lượt nên mọi request đo đều trúng cache.
+    # Dựng ở lần gọi đầu: không làm lệch chuỗi ngẫu nhiên của các command đo trước nó
+    cache_pool = []
+
+    def cache_hit_request():
+        if not cache_pool:
+            makers = (recommendations_request, lambda: ("get_user_recommendations", dict(cached_user_params(), top_n=10)),
+                      lambda: ("get_products", products_params()))
+            cache_pool.extend(makers[i % len(makers)]() for i in range(RESPONSE_CACHE_POOL_SIZE))
+        return cache_pool[int(rng.integers(len(cache_pool)))]
+
+    return cache_pool, {
+        "get_recommendations": recommendations_request,
+        # user_id mới mỗi request: luôn tính hồ sơ từ đầu (không trúng cache hồ sơ)
+        "get_user_recommendations": lambda: ("get_user_recommendations", {"user_id": f"bench-user-{next(counter)}", "interacted_product_ids": history(), "top_n": 10}),
+        "get_user_recommendations_cached": lambda: ("get_user_recommendations", dict(cached_user_params(), top_n=10)),
+        "get_products": lambda: ("get_products", products_params()),
+        "response_cache_hits": cache_hit_request,
+    }
+
+
+def measure(n_requests=DEFAULT_REQUESTS, warmup=DEFAULT_WARMUP, seed=DEFAULT_SEED, commands=COMMANDS):
+    """Chạy trong process con (RECOMMENDER_BUNDLES_DIR đã đặt): load artifact rồi đo từng command."""
+    started = time.perf_counter()
+    import recommender_cli as rc
+    from response_cache import ResponseCache
+    imported = time.perf_counter()
+    state = rc.load_artifacts()
+    loaded = time.perf_counter()
+    state.preload()
+    preloaded = time.perf_counter()
+    if state.source is None or pathlib.Path(state.source).parent.resolve() != rc.BUNDLES_DIR.resolve():
+        raise RuntimeError(f"Benchmark state was not loaded from {rc.BUNDLES_DIR} (got {state.source}).")
+    rss, peak = _rss_mb()
+    # Đường chấm điểm hồ sơ user (None: ma trận cosine dày)
+    user_scorer = type(state.user_similarity).__name__ if state.user_similarity is not None else "dense"
+    print(f"   user_scorer={user_scorer}", file=sys.stderr)
+    result = {
+        "artifacts_version": state.version, "n_items": int(state.n_items), "user_scorer": user_scorer,
+        "import_seconds": round(imported - started, 3), "load_seconds": round(loaded - imported, 3),
+        "preload_seconds": round(preloaded - loaded, 3), "rss_after_load_mb": rss, "peak_rss_after_load_mb": peak,
+        "commands": {},
+    }
+
+    with np.load(rc.BUNDLES_DIR.parent / TOPICS_FILE) as topics:
+        product_ids, topic_of = topics["product_ids"], topics["topic_of"]
+
+    rng = np.random.default_rng(seed)
+    cache_pool, generators = _request_generators(product_ids, topic_of, rng)
+    for name in commands:
+        make_request = generators[name]
+        requests = [make_request() for _ in range(warmup + n_requests)]
+        warmup_requests = requests[:warmup]
+        state.response_cache = None
+        if name == "response_cache_hits":
+            state.response_cache = ResponseCache()
+            warmup_requests = cache_pool
+        for command, params in warmup_requests:
+            rc.dispatch_command(command, params, serialize=True)
+        latencies, responses = [], []
+        command_started = time.perf_counter()
+        for command, params in requests[warmup:]:
+            t0 = time.perf_counter()
+            responses.append(rc.dispatch_command(command, params, serialize=True)) # Như handler của chế độ serve
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - command_started
+        errors = sum("error" in json.loads(response.raw) for response in responses)
+        responses.clear()
+        stats = _latency_stats(latencies, elapsed)
+        stats["errors"] = errors
+        stats["rss_mb"], stats["peak_rss_mb"] = _rss_mb()
+        result["commands"][name] = stats
+        print(f"   {name}: p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms "
+              f"{stats['throughput_rps']} req/s", file=sys.stderr)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=pathlib.Path(__file__).resolve().parent,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, n_requests=DEFAULT_REQUESTS, warmup=DEFAULT_WARMUP, seed=DEFAULT_SEED, data_dir=DEFAULT_DATA_DIR,
+        commands=COMMANDS):
+    report = {
+        "meta": {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'), "git_commit": _git_commit(), "seed": seed,
+            "requests_per_command": n_requests, "warmup": warmup, "python": platform.python_version(),
+            "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        },
+        "sizes": {},
+    }
+    for n_products in sizes:
+        print(f"== {n_products} sản phẩm", file=sys.stderr)
+        directory, dataset = ensure_dataset(data_dir, n_products, seed=seed)
+        env = dict(os.environ, RECOMMENDER_BUNDLES_DIR=str(directory / BUNDLES_DIR_NAME), RECOMMENDER_COPURCHASE_WEIGHT='0',
+                   RECOMMENDER_USE_ANN='0', RECOMMENDER_RESPONSE_CACHE_SIZE='0')
+        completed = subprocess.run(
+            [sys.executable, str(pathlib.Path(__file__).resolve()), "measure", "--requests", str(n_requests),
+             "--warmup", str(warmup), "--seed", str(seed), "--commands", *commands],
+            env=env, stdout=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            report["sizes"][str(n_products)] = {"error": f"measure process exited with code {completed.returncode}"}
+            continue
+        size_result = json.loads(completed.stdout)
+        size_result["dataset"] = {key: dataset.get(key) for key in ("generate_seconds", "publish_seconds")}
+        report["sizes"][str(n_products)] = size_result
+    return report
+
+
+# --- So sánh hai lần chạy ---
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Các chỉ số của current so với baseline; regression = độ trễ tăng hoặc throughput giảm quá threshold.
+    Command hồ sơ user không được so khi hai lần chạy đo hai đường chấm điểm khác nhau (user_scorer)."""
+    rows, regressions, skipped = [], [], []
+    for size, base_size in baseline.get("sizes", {}).items():
+        cur_size = current.get("sizes", {}).get(size)
+        if not cur_size or "commands" not in cur_size or "commands" not in base_size:
+            continue
+        metrics = [("load_seconds", base_size.get("load_seconds"), cur_size.get("load_seconds"), False),
+                   ("rss_after_load_mb", base_size.get("rss_after_load_mb"), cur_size.get("rss_after_load_mb"), False)]
+        scorer_changed = base_size.get("user_scorer") != cur_size.get("user_scorer")
+        for command, base in base_size["commands"].items():
+            cur = cur_size["commands"].get(command)
+            if not cur:
+                continue
+            if scorer_changed and command.startswith("get_user_recommendations"):
+                skipped.append({"size": int(size), "command": command, "baseline_user_scorer": base_size.get("user_scorer"),
+                                "current_user_scorer": cur_size.get("user_scorer")})
+                continue
+            metrics += [(f"{command}.{key}", base.get(key), cur.get(key), False) for key in LATENCY_KEYS]
+            metrics.append((f"{command}.throughput_rps", base.get("throughput_rps"), cur.get("throughput_rps"), True))
+        for metric, base_value, cur_value, higher_is_better in metrics:
+            if not base_value or cur_value is None:
+                continue
+            ratio = cur_value / base_value
+            regressed = ratio < 1 / (1 + threshold) if higher_is_better else ratio > 1 + threshold
+            row = {"size": int(size), "metric": metric, "baseline": base_value, "current": cur_value,
+                   "ratio": round(ratio, 3), "regression": regressed}
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return {"threshold": threshold, "rows": rows, "regressions": regressions, "skipped": skipped}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the recommender commands on synthetic catalogs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = subparsers.add_parser("run", help="Generate data (if needed) and benchmark each catalog size")
+    parser_run.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser_run.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Số request đo cho mỗi command")
+    parser_run.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser_run.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser_run.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS))
+    parser_run.add_argument("--data_dir", type=str, default=str(DEFAULT_DATA_DIR))
+    parser_run.add_argument("--out", type=str, help="Ghi kết quả JSON vào file này (mặc định: stdout)")
+
+    parser_generate = subparsers.add_parser("generate", help="Only generate and publish the synthetic catalogs")
+    parser_generate.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser_generate.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser_generate.add_argument("--data_dir", type=str, default=str(DEFAULT_DATA_DIR))
+
+    parser_compare = subparsers.add_parser("compare", help="Compare two result files; exit code 1 on regressions")
+    parser_compare.add_argument("baseline", type=str)
+    parser_compare.add_argument("current", type=str)
+    parser_compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    # Nội bộ: process con của run (RECOMMENDER_BUNDLES_DIR đã trỏ vào bundle tổng hợp)
+    parser_measure = subparsers.add_parser("measure", help=argparse.SUPPRESS)
+    parser_measure.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser_measure.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser_measure.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser_measure.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS))
+
+    args = parser.parse_args()
+    if args.command == "run":
+        report = run(sizes=args.sizes, n_requests=args.requests, warmup=args.warmup, seed=args.seed,
+                     data_dir=args.data_dir, commands=args.commands)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+    elif args.command == "generate":
+        for n_products in args.sizes:
+            directory, dataset = ensure_dataset(args.data_dir, n_products, seed=args.seed)
+            print(json.dumps({"directory": str(directory), **dataset}))
+    elif args.command == "compare":
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        report = compare(baseline, current, threshold=args.threshold)
+        for row in report["rows"]:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['size']:>8} {row['metric']:<48} {row['baseline']:>12} -> {row['current']:<12} x{row['ratio']:<6} {flag}")
+        for row in report["skipped"]:
+            print(f"{row['size']:>8} {row['command']:<48} not compared: user_scorer {row['baseline_user_scorer']} -> {row['current_user_scorer']}")
+        print(f"{len(report['regressions'])} regression(s) above {args.threshold:.0%}")
+        sys.exit(1 if report["regressions"] else 0)
+    elif args.command == "measure":
+        print(json.dumps(measure(n_requests=args.requests, warmup=args.warmup, seed=args.seed, commands=args.commands)))
@@ -0,0 +1,460 @@
+# scripts/build_model.py
+# Dựng lại mô hình gợi ý (TF-IDF -> chỉ mục hàng xóm -> gợi ý tiền tính toán) từ CSV sản phẩm, ngoài notebook.
+#
+#   full:        fit lại TfidfVectorizer trên toàn bộ sản phẩm và dựng lại mọi artifact (chạy định kỳ,
+#                vì vocabulary/IDF chỉ được cập nhật ở chế độ này)
+#   incremental: so hash nội dung (tên + mô tả) từng sản phẩm với lần dựng trước để tìm sản phẩm
+#                thêm / sửa / xóa; chỉ tokenize + transform các dòng đó bằng vectorizer đã lưu, tính lại danh
+#                sách hàng xóm của các hàng bị ảnh hưởng và chèn sản phẩm mới/sửa vào top-K của các hàng còn lại
+# Tokenize chạy song song và có cache token trên đĩa (feature_pipeline.py).
+#
+# Dùng:
+#   python build_model.py full
+#   python build_model.py incremental
+#   python build_model.py incremental --csv other.csv --artifacts_dir /tmp/artifacts
+#   python build_model.py full --ann --n_probe 8     # catalog lớn: dựng hàng xóm qua chỉ mục ANN (ann_index.py)
+# Artifact sinh ra (ma trận TF-IDF, chỉ mục hàng xóm, store nhị phân, bundle...) không nằm trong git (.gitignore):
+# sau khi clone, chạy `full` một lần trước khi phục vụ.
+# Không chế độ nào ghi ma trận cosine dày N×N: recommender_cli.py chấm điểm hồ sơ user chính xác từ ma trận TF-IDF
+# thưa (TfidfSimilarity trong neighbor_index.py). Ma trận dày cũ (notebook) không còn khớp nên bị xóa.
+# Sau khi dựng, artifact được gom thành bundle có phiên bản (artifact_bundle.py) và CURRENT trỏ sang nó;
+# process serve đang chạy tự load bundle mới và đổi sang mà không gián đoạn request (--no_publish để bỏ qua).
+import os
+import sys
+import json
+import pickle
+import shutil
+import argparse
+import pathlib
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+from feature_pipeline import product_documents, product_fields, fields_hash, make_vectorizer, FEATURE_VERSION
+from neighbor_index import (NeighborIndex, build_from_tfidf, quantize_scores, splice_csr_rows, precompute_from_index,
+                            _topk_of_block, DEFAULT_TOP_K)
+from precomputed_store import PrecomputedRecs, build_from_neighbor_index
+from ann_index import IVFIndex, build_neighbor_index as build_neighbor_index_from_ann
+from artifact_bundle import publish_bundle
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+PRODUCT_DATA_CSV_FILE = ARTIFACTS_DIR / 'buudien_ocop_products_detailed_v2_rerun.csv'
+
+# Tên file artifact (tương đối so với artifacts_dir), khớp với notebook và recommender_cli.py
+TFIDF_VECTORIZER_FILE = 'tfidf_vectorizer_v2_adv.pkl'
+TFIDF_MATRIX_FILE = 'tfidf_matrix_v2_adv.npz'
+FEATURE_HASHES_FILE = 'feature_hashes_v2_adv.json'
+PRODUCT_INDICES_MAP_FILE = 'product_indices_map_v2_adv.pkl'
+PRODUCT_MAP_JSON_FILE = 'product_id_name_map_v2_adv.json'
+ENRICHED_PRODUCT_MAP_JSON_FILE = 'product_id_name_map_v2_adv_enriched_with_mongo_id.json'
+PRECOMPUTED_RECS_JSON_FILE = 'precomputed_recommendations_v2_raw_adv.json'
+COSINE_SIM_MATRIX_FILE = 'cosine_similarity_matrix_v2_adv.npy'
+NEIGHBOR_INDEX_DIR = 'neighbors_v2_adv'
+PRECOMPUTED_RECS_DIR = 'precomputed_recs_v2_adv'
+ANN_INDEX_DIR = 'ann_ivf_v2_adv'
+TOKEN_CACHE_FILE = 'token_cache_v2_adv.sqlite'
+
+TOP_N_RAW_RECS = 30
+NOISY_PRODUCT_IDS = [20977, 20978] # ID của Rựa/Cuốc, loại bỏ như Block 3
+# Nếu số hàng phải tính lại vượt tỉ lệ này thì dựng lại cả chỉ mục hàng xóm (vẫn dùng vectorizer đã lưu)
+DEFAULT_MAX_AFFECTED_FRACTION = 0.5
+DEFAULT_CHUNK_SIZE = 512
+
+MAP_TEXT_COLUMNS = ['name', 'origin', 'producer', 'image_url', 'product_url', 'full_name', 'category', 'short_description', 'description']
+MAP_COLUMNS = ['product_id', 'name', 'origin', 'producer', 'image_url', 'price', 'ocop_rating', 'product_url', 'full_name',
+               'category', 'short_description', 'description', 'num_reviews', 'sold']
+
+
+def _safe_int(value):
+    try: return int(float(value))
+    except (ValueError, TypeError, OverflowError): return None
+
+
+def load_products(csv_path=PRODUCT_DATA_CSV_FILE):
+    """Đọc và làm sạch CSV như Block 3 của notebook; product_id trả về dạng string."""
+    df = pd.read_csv(csv_path)
+    if 'product_id' not in df.columns:
+        raise ValueError(f"Missing 'product_id' column in {csv_path}")
+    df['product_id'] = pd.to_numeric(df['product_id'], errors='coerce')
+    df = df.dropna(subset=['product_id']).copy()
+    df['product_id'] = df['product_id'].astype(int)
+    df = df[~df['product_id'].isin(NOISY_PRODUCT_IDS)].copy()
+
+    for col in ['price', 'ocop_rating', 'ocop_rating_from_list']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if 'price' in df.columns:
+        df['price'] = df['price'].fillna(0).astype(int)
+    for col in ['name', 'full_name', 'origin', 'producer', 'short_description', 'description', 'image_url', 'product_url']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).fillna('')
+
+    df = df.drop_duplicates(subset=['product_id'], keep='first').reset_index(drop=True)
+    df['product_id'] = df['product_id'].astype(str)
+    return df
+
+
+def _atomic_write(path, write_fn, mode='w'):
+    """Ghi ra file tạm rồi os.replace: process đang đọc/mmap file cũ không thấy file ghi dở."""
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, mode, **({'encoding': 'utf-8'} if 'b' not in mode else {})) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_dir(directory, save_fn):
+    """Lưu thư mục artifact (các .npy có thể đang được mmap) vào thư mục tạm rồi đổi tên.
+    Không ghi đè file đang mmap tại chỗ (truncate file đang map có thể làm process khác bị SIGBUS)."""
+    directory = pathlib.Path(directory)
+    tmp_dir = directory.with_name(directory.name + '.tmp')
+    old_dir = directory.with_name(directory.name + '.old')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_fn(tmp_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _product_map_entries(df):
+    """Map product_id -> thông tin sản phẩm, chuyển kiểu như Block 5 của notebook."""
+    df_map = df[[col for col in MAP_COLUMNS if col in df.columns]].copy()
+    for col in MAP_TEXT_COLUMNS:
+        if col in df_map.columns:
+            df_map[col] = df_map[col].fillna('').astype(str)
+    for col in ['price', 'ocop_rating', 'num_reviews', 'sold']:
+        if col in df_map.columns:
+            df_map[col] = pd.to_numeric(df_map[col], errors='coerce')
+            if col == 'ocop_rating':
+                df_map[col] = df_map[col].apply(lambda x: _safe_int(x) if pd.notnull(x) else None).astype(object)
+            else:
+                df_map[col] = df_map[col].fillna(0).astype(int)
+    return df_map.set_index('product_id').to_dict('index')
+
+
+def save_product_maps(df, artifacts_dir):
+    """Ghi lại map sản phẩm và bản enriched (giữ _id MongoDB đã gán trước đó; sản phẩm mới có _id = None)."""
+    artifacts_dir = pathlib.Path(artifacts_dir)
+    product_map = _product_map_entries(df)
+    _atomic_write(artifacts_dir / PRODUCT_MAP_JSON_FILE, lambda f: json.dump(product_map, f, ensure_ascii=False, indent=2))
+
+    enriched_path = artifacts_dir / ENRICHED_PRODUCT_MAP_JSON_FILE
+    old_enriched = {}
+    if os.path.exists(enriched_path):
+        with open(enriched_path, 'r', encoding='utf-8') as f:
+            old_enriched = json.load(f)
+    enriched = {pid: {**details, "_id": (old_enriched.get(pid) or {}).get("_id")} for pid, details in product_map.items()}
+    _atomic_write(enriched_path, lambda f: json.dump(enriched, f, ensure_ascii=False, indent=2))
+    return len(product_map)
+
+
+def _save_model_files(artifacts_dir, vectorizer, tfidf_matrix, product_ids, hashes):
+    artifacts_dir = pathlib.Path(artifacts_dir)
+    indices = pd.Series(range(len(product_ids)), index=pd.Index(product_ids, name='product_id'))
+    _atomic_write(artifacts_dir / TFIDF_VECTORIZER_FILE, lambda f: pickle.dump(vectorizer, f), mode='wb')
+    _atomic_write(artifacts_dir / TFIDF_MATRIX_FILE, lambda f: scipy.sparse.save_npz(f, tfidf_matrix), mode='wb')
+    _atomic_write(artifacts_dir / PRODUCT_INDICES_MAP_FILE, lambda f: pickle.dump(indices, f), mode='wb')
+    _atomic_write(artifacts_dir / FEATURE_HASHES_FILE, lambda f: json.dump({"feature_version": FEATURE_VERSION, "hashes": hashes}, f))
+
+
+def _remove_dense_matrix(artifacts_dir):
+    """Xóa ma trận cosine dày cũ (không còn khớp TF-IDF mới; recommender_cli.py dùng TF-IDF). True nếu đã xóa."""
+    path = artifacts_dir / COSINE_SIM_MATRIX_FILE
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    return True
+
+
+def _save_precomputed(artifacts_dir, store, precomputed):
+    """Ghi file JSON rồi store nhị phân (meta của store ghi dấu vết của đúng file JSON vừa ghi)."""
+    json_path = artifacts_dir / PRECOMPUTED_RECS_JSON_FILE
+    _atomic_write(json_path, lambda f: json.dump(precomputed, f, ensure_ascii=False, indent=4))
+    _atomic_save_dir(artifacts_dir / PRECOMPUTED_RECS_DIR, lambda directory: store.save(directory, source_path=json_path))
+
+
+def _idx_to_id(product_ids):
+    return dict(enumerate(product_ids))
+
+
+def full_build(csv_path=PRODUCT_DATA_CSV_FILE, artifacts_dir=ARTIFACTS_DIR, top_k=DEFAULT_TOP_K, quantize=False,
+               precompute_top_n=TOP_N_RAW_RECS, use_ann=False, n_lists=None, n_probe=None, n_jobs=None):
+    """Fit lại toàn bộ: vectorizer, ma trận TF-IDF, chỉ mục hàng xóm, gợi ý tiền tính toán, map sản phẩm.
+    use_ann: dựng chỉ mục IVF và lấy hàng xóm gần đúng qua nó thay vì so từng cặp N×N."""
+    artifacts_dir = pathlib.Path(artifacts_dir)
+    df = load_products(csv_path)
+    product_ids = df['product_id'].tolist()
+    documents = product_documents(df, cache_path=artifacts_dir / TOKEN_CACHE_FILE, n_jobs=n_jobs, retain_cache=True)
+
+    vectorizer = make_vectorizer()
+    tfidf_matrix = vectorizer.fit_transform(documents).tocsr()
+    ann = None
+    if use_ann:
+        ann = IVFIndex.build(tfidf_matrix, n_lists=n_lists)
+        index = build_neighbor_index_from_ann(ann, top_k=top_k, n_probe=n_probe, quantize=quantize)
+    else:
+        index = build_from_tfidf(tfidf_matrix, top_k=top_k, quantize=quantize)
+    idx_to_id = _idx_to_id(product_ids)
+    store = build_from_neighbor_index(index, idx_to_id, top_n=precompute_top_n)
+
+    hashes = {pid: fields_hash(*product_fields(row)) for pid, row in zip(product_ids, df.to_dict('records'))}
+    _save_model_files(artifacts_dir, vectorizer, tfidf_matrix, product_ids, hashes)
+    _atomic_save_dir(artifacts_dir / NEIGHBOR_INDEX_DIR, index.save)
+    if ann is not None:
+        _atomic_save_dir(artifacts_dir / ANN_INDEX_DIR, ann.save)
+    _save_precomputed(artifacts_dir, store, precompute_from_index(index, idx_to_id, top_n=precompute_top_n))
+    dense_removed = _remove_dense_matrix(artifacts_dir)
+    n_mapped = save_product_maps(df, artifacts_dir)
+    return {"mode": "full", "n_items": len(product_ids), "n_terms": len(vectorizer.vocabulary_),
+            "nnz": int(len(index.indices)), "dense_removed": dense_removed, "n_mapped": n_mapped}
+
+
+def _replace_rows(matrix, rows, new_rows_matrix):
+    """matrix với các hàng rows thay bằng new_rows_matrix (CSR, không chuyển sang LIL)."""
+    if len(rows) == 0:
+        return matrix
+    n_rows = matrix.shape[0]
+    keep = np.ones(n_rows, dtype=matrix.dtype)
+    keep[rows] = 0
+    placement = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=matrix.dtype), (rows, np.arange(len(rows)))),
+                                        shape=(n_rows, len(rows)))
+    return (scipy.sparse.diags(keep) @ matrix + placement @ new_rows_matrix).tocsr()
+
+
+def _row_topk(tfidf_matrix, rows, top_k, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Top-K đầy đủ (điểm > 0) cho các hàng rows: {row: (indices int32, scores float32)}."""
+    tfidf_t = tfidf_matrix.T.tocsr()
+    result = {}
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        block = (tfidf_matrix[chunk] @ tfidf_t).toarray().astype(np.float32)
+        block_idx, block_scores = _topk_of_block(block, top_k)
+        for row, cols, scores in zip(chunk.tolist(), block_idx, block_scores):
+            keep = scores > 0
+            result[row] = (cols[keep].astype(np.int32), scores[keep].astype(np.float32))
+    return result
+
+
+def _merge_candidates(index, tfidf_matrix, dirty_rows, skip_mask, old_to_new, source_rows):
+    """Chèn các sản phẩm dirty (mới/sửa) vào top-K của các hàng không phải tính lại.
+    Một sản phẩm d chỉ vào hàng r nếu sim(r, d) lớn hơn điểm thứ K của hàng (hoặc > 0 nếu hàng chưa đủ K)."""
+    n_rows = tfidf_matrix.shape[0]
+    lengths = np.diff(np.asarray(index.indptr, dtype=np.int64))
+    scale = np.float32(index.score_scale)
+
+    thresholds = np.zeros(n_rows, dtype=np.float32)
+    copied = source_rows >= 0
+    src = source_rows[copied]
+    full = lengths[src] >= index.top_k
+    last_scores = np.zeros(len(src), dtype=np.float32)
+    last_scores[full] = np.asarray(index.scores)[index.indptr[src[full] + 1] - 1].astype(np.float32) * scale
+    thresholds[np.flatnonzero(copied)] = last_scores
+
+    sims = (tfidf_matrix @ tfidf_matrix[dirty_rows].T).tocoo()
+    rows, cols, values = sims.row, dirty_rows[sims.col], sims.data.astype(np.float32)
+    hit = ~skip_mask[rows] & (values > thresholds[rows]) & (rows != cols)
+    rows, cols, values = rows[hit], cols[hit], values[hit]
+
+    merged = {}
+    order = np.argsort(rows, kind='stable')
+    rows, cols, values = rows[order], cols[order], values[order]
+    bounds = np.flatnonzero(np.diff(rows)) + 1
+    for row_rows, row_cols, row_values in zip(np.split(rows, bounds), np.split(cols, bounds), np.split(values, bounds)):
+        if len(row_rows) == 0:
+            continue
+        row = int(row_rows[0])
+        old_cols, old_scores = index.row(int(source_rows[row]))
+        all_cols = np.concatenate([old_to_new[old_cols].astype(np.int32), row_cols.astype(np.int32)])
+        all_scores = np.concatenate([old_scores, row_values])
+        best = np.argsort(-all_scores, kind='stable')[:index.top_k]
+        merged[row] = (all_cols[best], all_scores[best])
+    return merged
+
+
+def _update_neighbor_index(index, tfidf_matrix, dirty_rows, recompute_rows, old_to_new, source_rows):
+    n_rows = tfidf_matrix.shape[0]
+    recompute_mask = np.zeros(n_rows, dtype=bool)
+    recompute_mask[recompute_rows] = True
+    new_rows = _row_topk(tfidf_matrix, recompute_rows, index.top_k)
+    new_rows.update(_merge_candidates(index, tfidf_matrix, dirty_rows, recompute_mask, old_to_new, source_rows))
+
+    quantized = index.score_scale != 1.0
+    if quantized:
+        new_rows = {row: (cols, quantize_scores(scores)) for row, (cols, scores) in new_rows.items()}
+    # Các hàng copy nguyên chỉ chứa sản phẩm còn giữ (hàng có hàng xóm bị xóa/sửa đã nằm trong recompute_rows)
+    remapped_indices = old_to_new[np.asarray(index.indices)].astype(np.int32)
+    splice_sources = source_rows.copy()
+    splice_sources[list(new_rows)] = -1
+    indptr, (indices, scores) = splice_csr_rows(index.indptr, [remapped_indices, np.asarray(index.scores)], splice_sources, new_rows)
+    updated = NeighborIndex(indptr, indices, scores, n_rows, index.top_k, score_scale=index.score_scale)
+    return updated, np.asarray(sorted(new_rows), dtype=np.int64)
+
+
+def _precomputed_dict(store, product_ids):
+    """{"product_id": [rec_id, ...]} như precompute_from_index, đọc từ store (không phải lấy lại top-N từ chỉ mục)."""
+    return {pid: [str(rec) for rec in store.get(pid)] for pid in product_ids}
+
+
+def _update_precomputed_store(store, index, product_ids, changed_rows, top_n):
+    """Chỉ sinh lại gợi ý của các sản phẩm có danh sách hàng xóm thay đổi; các sản phẩm khác copy từ store cũ."""
+    int_ids = np.asarray([int(pid) for pid in product_ids], dtype=np.int64)
+    order = np.argsort(int_ids, kind='stable')
+    sorted_ids = int_ids[order]
+    row_of_position = order
+
+    changed_mask = np.zeros(len(product_ids), dtype=bool)
+    changed_mask[changed_rows] = True
+    old_ids = np.asarray(store.product_ids, dtype=np.int64) if store is not None else np.zeros(0, dtype=np.int64)
+    old_pos = np.searchsorted(old_ids, sorted_ids)
+    in_old = old_pos < len(old_ids)
+    in_old[in_old] = old_ids[old_pos[in_old]] == sorted_ids[in_old]
+    source = np.where(in_old & ~changed_mask[row_of_position], old_pos, -1)
+
+    has_scores = store is None or store.scores is not None
+    new_rows = {}
+    for position in np.flatnonzero(source < 0).tolist():
+        cols, scores = index.neighbors(int(row_of_position[position]), top_n=top_n)
+        parts = (int_ids[cols].astype(np.int32),)
+        new_rows[position] = parts + ((scores.astype(np.float32),) if has_scores else ())
+
+    arrays = [np.zeros(0, dtype=np.int32)] + ([np.zeros(0, dtype=np.float32)] if has_scores else [])
+    indptr = np.zeros(1, dtype=np.int64)
+    if store is not None:
+        arrays = [np.asarray(store.neighbors)] + ([np.asarray(store.scores)] if has_scores else [])
+        indptr = store.offsets
+    offsets, outs = splice_csr_rows(indptr, arrays, source, new_rows)
+    return PrecomputedRecs(sorted_ids, offsets, outs[0], outs[1] if has_scores else None), len(new_rows)
+
+
+def incremental_build(csv_path=PRODUCT_DATA_CSV_FILE, artifacts_dir=ARTIFACTS_DIR, precompute_top_n=TOP_N_RAW_RECS,
+                      max_affected_fraction=DEFAULT_MAX_AFFECTED_FRACTION, n_jobs=None):
+    """Cập nhật artifact cho các sản phẩm thêm / sửa / xóa kể từ lần dựng trước, không fit lại vectorizer."""
+    artifacts_dir = pathlib.Path(artifacts_dir)
+    required = [TFIDF_VECTORIZER_FILE, TFIDF_MATRIX_FILE, FEATURE_HASHES_FILE, PRODUCT_INDICES_MAP_FILE]
+    missing = [name for name in required if not os.path.exists(artifacts_dir / name)]
+    if missing:
+        raise FileNotFoundError(f"Missing model artifacts for incremental build: {', '.join(missing)}. Run 'build_model.py full' first.")
+
+    with open(artifacts_dir / TFIDF_VECTORIZER_FILE, 'rb') as f:
+        vectorizer = pickle.load(f)
+    with open(artifacts_dir / PRODUCT_INDICES_MAP_FILE, 'rb') as f:
+        old_indices = pickle.load(f)
+    with open(artifacts_dir / FEATURE_HASHES_FILE, 'r', encoding='utf-8') as f:
+        saved_hashes = json.load(f)
+    if saved_hashes.get("feature_version") != FEATURE_VERSION:
+        raise ValueError(f"Model artifacts were built with feature version {saved_hashes.get('feature_version')} "
+                         f"(current: {FEATURE_VERSION}). Run 'build_model.py full' first.")
+    old_hashes = saved_hashes["hashes"]
+    old_tfidf = scipy.sparse.load_npz(artifacts_dir / TFIDF_MATRIX_FILE).tocsr()
+    index = NeighborIndex.load(artifacts_dir / NEIGHBOR_INDEX_DIR, mmap=False)
+    store = None
+    if os.path.exists(artifacts_dir / PRECOMPUTED_RECS_DIR):
+        store = PrecomputedRecs.load(artifacts_dir / PRECOMPUTED_RECS_DIR, mmap=False)
+
+    n_old = old_tfidf.shape[0]
+    old_ids = np.empty(n_old, dtype=object)
+    old_ids[old_indices.to_numpy(dtype=np.int64)] = old_indices.index.astype(str).tolist()
+
+    df = load_products(csv_path)
+    row_of_pid = {pid: pos for pos, pid in enumerate(df['product_id'].tolist())}
+    hashes = {pid: fields_hash(*product_fields(row)) for pid, row in zip(row_of_pid, df.to_dict('records'))}
+
+    old_id_set = set(old_ids.tolist())
+    removed = [pid for pid in old_ids.tolist() if pid not in hashes]
+    changed = [pid for pid in old_ids.tolist() if pid in hashes and old_hashes.get(pid) != hashes[pid]]
+    added = [pid for pid in hashes if pid not in old_id_set]
+    summary = {"mode": "incremental", "added": len(added), "changed": len(changed), "removed": len(removed)}
+    if not (added or changed or removed):
+        summary.update(n_items=n_old, n_mapped=save_product_maps(df, artifacts_dir))
+        return summary
+
+    # Bố cục hàng mới: các hàng cũ còn giữ (giữ thứ tự) rồi tới sản phẩm mới
+    kept_old_rows = np.asarray([row for row, pid in enumerate(old_ids.tolist()) if pid in hashes], dtype=np.int64)
+    old_to_new = np.full(n_old, -1, dtype=np.int64)
+    old_to_new[kept_old_rows] = np.arange(len(kept_old_rows))
+    product_ids = old_ids[kept_old_rows].tolist() + added
+    n_rows = len(product_ids)
+    row_of = {pid: row for row, pid in enumerate(product_ids)}
+
+    # Chỉ tokenize sản phẩm mới / sửa (token của văn bản đã gặp lấy từ cache)
+    dirty_pids = changed + added
+    dirty_documents = dict(zip(dirty_pids, product_documents(df.iloc[[row_of_pid[pid] for pid in dirty_pids]],
+                                                             cache_path=artifacts_dir / TOKEN_CACHE_FILE, n_jobs=n_jobs)))
+    blocks = [old_tfidf[kept_old_rows]]
+    if added:
+        blocks.append(vectorizer.transform([dirty_documents[pid] for pid in added]).astype(old_tfidf.dtype))
+    tfidf_matrix = scipy.sparse.vstack(blocks).tocsr()
+    changed_rows = np.asarray([row_of[pid] for pid in changed], dtype=np.int64)
+    if changed:
+        tfidf_matrix = _replace_rows(tfidf_matrix, changed_rows, vectorizer.transform([dirty_documents[pid] for pid in changed]).astype(old_tfidf.dtype))
+    dirty_rows = np.asarray(sorted(row_of[pid] for pid in changed + added), dtype=np.int64)
+
+    # Hàng phải tính lại toàn bộ: sản phẩm mới/sửa + hàng đang chứa sản phẩm bị xóa/sửa (điểm cũ không còn đúng)
+    changed_set = set(changed)
+    stale_old_cols = np.asarray([row for row, pid in enumerate(old_ids.tolist()) if pid not in hashes or pid in changed_set], dtype=np.int64)
+    entry_rows = np.repeat(np.arange(n_old), np.diff(np.asarray(index.indptr, dtype=np.int64)))
+    stale_old_rows = np.unique(entry_rows[np.isin(np.asarray(index.indices), stale_old_cols)])
+    stale_rows = old_to_new[stale_old_rows]
+    recompute_rows = np.union1d(dirty_rows, stale_rows[stale_rows >= 0]).astype(np.int64)
+
+    source_rows = np.full(n_rows, -1, dtype=np.int64)
+    source_rows[:len(kept_old_rows)] = kept_old_rows
+    if len(recompute_rows) > max_affected_fraction * n_rows:
+        # Quá nhiều hàng bị ảnh hưởng: dựng lại cả chỉ mục (vẫn giữ vectorizer) và toàn bộ store
+        index = build_from_tfidf(tfidf_matrix, top_k=index.top_k, quantize=index.score_scale != 1.0)
+        updated_rows = np.arange(n_rows)
+        summary["neighbor_rebuild"] = "full"
+    else:
+        index, updated_rows = _update_neighbor_index(index, tfidf_matrix, dirty_rows, recompute_rows, old_to_new, source_rows)
+        summary["neighbor_rebuild"] = "partial"
+    store, n_store_rows = _update_precomputed_store(store, index, product_ids, updated_rows, precompute_top_n)
+    ann = None
+    if os.path.exists(artifacts_dir / ANN_INDEX_DIR):
+        # Giữ tâm cụm, chỉ gán lại sản phẩm (tâm cụm được học lại ở lần full tiếp theo)
+        ann = IVFIndex.load(artifacts_dir / ANN_INDEX_DIR, mmap=False).reassign(tfidf_matrix)
+
+    _save_model_files(artifacts_dir, vectorizer, tfidf_matrix, product_ids, {pid: hashes[pid] for pid in product_ids})
+    _atomic_save_dir(artifacts_dir / NEIGHBOR_INDEX_DIR, index.save)
+    if ann is not None:
+        _atomic_save_dir(artifacts_dir / ANN_INDEX_DIR, ann.save)
+    # JSON cũ vẫn là fallback của load_precomputed_recs và được gom vào bundle: ghi lại để không lệch với store
+    _save_precomputed(artifacts_dir, store, _precomputed_dict(store, product_ids))
+    summary.update(n_items=n_rows, recomputed_rows=int(len(recompute_rows)), updated_rows=int(len(updated_rows)),
+                   updated_precomputed=n_store_rows, dense_removed=_remove_dense_matrix(artifacts_dir),
+                   n_mapped=save_product_maps(df, artifacts_dir))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the recommender model artifacts (full refit or incremental update)")
+    parser.add_argument("mode", choices=["full", "incremental"])
+    parser.add_argument("--csv", type=str, default=str(PRODUCT_DATA_CSV_FILE))
+    parser.add_argument("--artifacts_dir", type=str, default=str(ARTIFACTS_DIR))
+    parser.add_argument("--top_k", type=int, default=DEFAULT_TOP_K, help="Số hàng xóm mỗi sản phẩm (chỉ dùng ở chế độ full)")
+    parser.add_argument("--quantize", action="store_true", help="Lưu điểm hàng xóm dạng uint8 (chỉ dùng ở chế độ full)")
+    parser.add_argument("--top_n", type=int, default=TOP_N_RAW_RECS, help="Số gợi ý tiền tính toán mỗi sản phẩm")
+    parser.add_argument("--max_affected_fraction", type=float, default=DEFAULT_MAX_AFFECTED_FRACTION)
+    parser.add_argument("--ann", action="store_true", help="Dựng hàng xóm qua chỉ mục ANN (chỉ dùng ở chế độ full)")
+    parser.add_argument("--n_lists", type=int, default=None, help="Số cụm IVF (mặc định ~sqrt(N))")
+    parser.add_argument("--n_probe", type=int, default=None, help="Số cụm probe khi dựng hàng xóm qua ANN")
+    parser.add_argument("--n_jobs", type=int, default=None, help="Số process tokenize (mặc định: số CPU)")
+    parser.add_argument("--no_publish", action="store_true", help="Không publish bundle (chỉ ghi artifact rời)")
+    args = parser.parse_args()
+
+    try:
+        if args.mode == "full":
+            result = full_build(args.csv, args.artifacts_dir, top_k=args.top_k, quantize=args.quantize, precompute_top_n=args.top_n,
+                                use_ann=args.ann, n_lists=args.n_lists, n_probe=args.n_probe, n_jobs=args.n_jobs)
+        else:
+            result = incremental_build(args.csv, args.artifacts_dir, precompute_top_n=args.top_n,
+                                       max_affected_fraction=args.max_affected_fraction, n_jobs=args.n_jobs)
+        if not args.no_publish:
+            result["bundle_version"] = publish_bundle(args.artifacts_dir, csv_path=args.csv)["version"]
+        print(json.dumps(result))
+    except Exception as e:
+        print(json.dumps({"error": f"Model build failed: {type(e).__name__} - {e}"}), file=sys.stderr)
+        sys.exit(1)
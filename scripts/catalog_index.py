@@ -0,0 +1,244 @@
+# scripts/catalog_index.py
+# Chỉ mục danh mục sản phẩm cho get_products, dựng một lần khi load artifacts:
+#   - facet category / origin: mỗi dòng mang mã của giá trị phân biệt (codes); lọc "chứa chuỗi"
+#     chỉ phải so khớp trên các giá trị phân biệt rồi tra bảng -> bitmap các dòng khớp
+#   - giá: mảng giá đã sắp xếp, lọc khoảng bằng searchsorted
+#   - sắp xếp: hoán vị dựng sẵn cho popular / newest / priceAsc / priceDesc / mặc định (product_id giảm dần)
+# Mỗi request chỉ còn: giao các bitmap, lọc hoán vị theo bitmap, cắt trang. Không copy DataFrame, không iterrows.
+# Cột tóm tắt lưu dạng mảng numpy / StringColumn chứ không phải list object Python: worker fork từ fork server
+# chỉ đọc chúng nên trang nhớ được dùng chung, không bị copy vì refcount / GC chạm vào từng object.
+import re
+import numpy as np
+import pandas as pd
+
+from artifact_bundle import StringColumn
+
+FACET_COLUMNS = ('category', 'origin')
+DEFAULT_SORT_KEY = 'default'
+UNSORTED_KEY = 'unsorted' # sort_by không hợp lệ: giữ thứ tự gốc của dữ liệu như trước
+# Các cột cần để dựng kết quả tóm tắt (NaN -> None khi đọc)
+SUMMARY_COLUMNS = ('product_id', 'name', 'image_url', 'price', 'category', 'origin', 'ocop_rating', 'num_reviews', 'countInStock')
+POPULAR_COLUMNS = ('sold', 'num_reviews', 'rating') # Theo thứ tự ưu tiên như trước
+PLACEHOLDER_IMAGE = "/images/placeholder-image.png"
+# Mọi cột from_dataframe có thể dùng (để chỉ giải mã các cột này khi dựng từ bảng sản phẩm dạng cột)
+SOURCE_COLUMNS = tuple(dict.fromkeys(('product_id', 'price', 'isActive', 'createdAt') + FACET_COLUMNS + POPULAR_COLUMNS + SUMMARY_COLUMNS))
+
+
+def _numeric(series):
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _order_desc(values):
+    """Hoán vị giảm dần theo values (float), NaN xếp cuối."""
+    valid = ~np.isnan(values)
+    valid_pos = np.flatnonzero(valid)
+    ordered = valid_pos[np.argsort(-values[valid_pos], kind='stable')]
+    return np.concatenate([ordered, np.flatnonzero(~valid)])
+
+
+def _order_asc(values):
+    valid = ~np.isnan(values)
+    valid_pos = np.flatnonzero(valid)
+    ordered = valid_pos[np.argsort(values[valid_pos], kind='stable')]
+    return np.concatenate([ordered, np.flatnonzero(~valid)])
+
+
+def _to_python_list(series):
+    """Cột -> list Python, NaN/NaT -> None (để JSON trả về null thay vì NaN)."""
+    return [None if (isinstance(v, float) and v != v) or v is pd.NaT else v for v in series.astype(object).tolist()]
+
+
+def _summary_column(series):
+    """Cột tóm tắt: số nguyên / bool không trống -> mảng tương ứng, số -> float64 (NaN = trống), còn lại -> StringColumn."""
+    if not series.isna().any():
+        if pd.api.types.is_bool_dtype(series):
+            return series.to_numpy(dtype=bool)
+        if pd.api.types.is_integer_dtype(series):
+            return series.to_numpy(dtype=np.int64)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return StringColumn(*StringColumn.encode(_to_python_list(series)))
+
+
+def _column_value(values, pos):
+    """Giá trị Python của một ô (np.int64 -> int, NaN -> None)."""
+    value = values[pos]
+    if isinstance(value, np.generic):
+        value = value.item()
+        if isinstance(value, float) and value != value:
+            return None
+    return value
+
+
+def _compile_term(term):
+    # Giống str.contains(case=False) trước đây: term là regex; nếu regex không hợp lệ thì so khớp nguyên văn
+    try:
+        return re.compile(str(term), re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(str(term)), re.IGNORECASE)
+
+
+class FacetIndex:
+    """Một cột facet: values (giá trị phân biệt) + codes[row] (mã giá trị của dòng, -1 nếu trống)."""
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+
+    @classmethod
+    def from_series(cls, series):
+        codes, uniques = pd.factorize(series.astype(object).where(series.notna(), None), use_na_sentinel=True)
+        return cls([str(v) for v in uniques], codes.astype(np.int32))
+
+    def match_mask(self, term):
+        """Bitmap các dòng có giá trị chứa term; chỉ chạy regex trên các giá trị phân biệt."""
+        pattern = _compile_term(term)
+        value_match = np.zeros(len(self.values) + 1, dtype=bool) # phần tử cuối cho mã -1 (trống)
+        for code, value in enumerate(self.values):
+            if pattern.search(value):
+                value_match[code] = True
+        return value_match[self.codes]
+
+
+class CatalogIndex:
+    def __init__(self, n_rows, active_mask, facets, price_values, price_order, sort_orders, columns):
+        self.n_rows = n_rows
+        self.active_mask = active_mask # None nếu không có cột isActive
+        self.facets = facets # {column: FacetIndex}; cột không có trong dữ liệu thì không có ở đây
+        self.price_values = price_values
+        self.price_order = price_order # vị trí dòng có giá, tăng dần theo giá
+        self.price_sorted = price_values[price_order]
+        self.sort_orders = sort_orders # {sort_key: hoán vị vị trí dòng (chỉ dòng active)}
+        self.columns = columns # {column: mảng numpy / StringColumn} cho các cột trong SUMMARY_COLUMNS có trong dữ liệu
+        self._id_lookup = None # (product_id string đã sắp xếp, vị trí dòng tương ứng), dựng khi cần
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def from_dataframe(cls, df):
+        n_rows = len(df)
+        active_mask = None
+        if 'isActive' in df.columns:
+            active_mask = (df['isActive'] == True).to_numpy()
+
+        facets = {col: FacetIndex.from_series(df[col]) for col in FACET_COLUMNS if col in df.columns}
+
+        price_values = _numeric(df['price']) if 'price' in df.columns else np.full(n_rows, np.nan)
+        price_order = np.flatnonzero(~np.isnan(price_values))
+        price_order = price_order[np.argsort(price_values[price_order], kind='stable')]
+
+        # Mặc định (và fallback của popular/newest): product_id dạng string, giảm dần như sort_values trước đây
+        product_ids = df['product_id'].astype(str).to_numpy(dtype=object)
+        default_order = np.argsort(product_ids, kind='stable')[::-1].copy()
+
+        popular_order = default_order
+        for col in POPULAR_COLUMNS:
+            if col in df.columns:
+                popular_order = _order_desc(_numeric(df[col]))
+                break
+        newest_order = default_order
+        if 'createdAt' in df.columns:
+            created = pd.to_datetime(df['createdAt'], errors='coerce')
+            newest_order = _order_desc((created - created.min()).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan))
+
+        sort_orders = {
+            DEFAULT_SORT_KEY: default_order,
+            UNSORTED_KEY: np.arange(n_rows),
+            'popular': popular_order,
+            'newest': newest_order,
+            'priceAsc': _order_asc(price_values),
+            'priceDesc': _order_desc(price_values),
+        }
+        if active_mask is not None:
+            sort_orders = {key: order[active_mask[order]] for key, order in sort_orders.items()}
+
+        columns = {col: _summary_column(df[col]) for col in SUMMARY_COLUMNS if col in df.columns}
+        return cls(n_rows, active_mask, facets, price_values, price_order, sort_orders, columns)
+
+    def positions_for(self, product_ids):
+        """Vị trí dòng của các product_id (giữ thứ tự, bỏ ID không có trong danh mục)."""
+        if self._id_lookup is None:
+            ids = self.columns.get('product_id')
+            ids = np.array([str(pid) for pid in ids.tolist()] if ids is not None else [], dtype=str)
+            order = np.argsort(ids, kind='stable') # ID trùng: searchsorted trả về dòng đầu tiên như trước
+            self._id_lookup = (ids[order], order.astype(np.int64))
+        sorted_ids, sorted_positions = self._id_lookup
+        query = np.array([str(pid) for pid in product_ids], dtype=str)
+        if len(query) == 0 or len(sorted_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        found = np.minimum(np.searchsorted(sorted_ids, query), len(sorted_ids) - 1)
+        hit = sorted_ids[found] == query
+        return sorted_positions[found[hit]]
+
+    def product_ids_at(self, positions):
+        """product_id (string) của các dòng positions, giữ thứ tự."""
+        ids = self.columns.get('product_id')
+        if ids is None:
+            return []
+        return [str(_column_value(ids, pos)) for pos in np.asarray(positions, dtype=np.int64).tolist()]
+
+    def _price_mask(self, min_price, max_price):
+        lo = 0 if min_price is None else int(np.searchsorted(self.price_sorted, min_price, side='left'))
+        hi = len(self.price_sorted) if max_price is None else int(np.searchsorted(self.price_sorted, max_price, side='right'))
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.price_order[lo:hi]] = True
+        return mask
+
+    def query(self, page=1, per_page=20, category=None, province=None, min_price=None, max_price=None, sort_by=None,
+              ranked_positions=None):
+        """Trả về (tổng số dòng khớp, mảng vị trí dòng của trang yêu cầu).
+        ranked_positions: kết quả tìm theo từ khóa (đã xếp hạng); chỉ giữ các dòng này, và giữ thứ tự
+        liên quan nếu không có sort_by."""
+        if ranked_positions is not None and not sort_by:
+            order = ranked_positions
+            if self.active_mask is not None:
+                order = order[self.active_mask[order]]
+        elif not sort_by:
+            order = self.sort_orders[DEFAULT_SORT_KEY]
+        else:
+            order = self.sort_orders.get(sort_by, self.sort_orders[UNSORTED_KEY])
+
+        mask = None
+        if ranked_positions is not None and sort_by:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[ranked_positions] = True
+        for column, term in (('category', category), ('origin', province)):
+            if not term:
+                continue
+            facet = self.facets.get(column)
+            # Dữ liệu không có cột này (ví dụ CSV hiện tại không có category) thì không dòng nào khớp
+            term_mask = facet.match_mask(term) if facet is not None else np.zeros(self.n_rows, dtype=bool)
+            mask = term_mask if mask is None else (mask & term_mask)
+        if min_price is not None or max_price is not None:
+            price_mask = self._price_mask(min_price, max_price)
+            mask = price_mask if mask is None else (mask & price_mask)
+
+        if mask is not None:
+            order = order[mask[order]]
+        start = max(page - 1, 0) * per_page
+        return len(order), order[start:start + per_page]
+
+    def _field(self, pos, column, details, key, default=None):
+        values = self.columns.get(column)
+        return _column_value(values, pos) if values is not None else details.get(key, default)
+
+    def summaries(self, positions, product_map, to_float, to_int):
+        """Kết quả tóm tắt cho các dòng positions (cùng định dạng với get_products trước đây)."""
+        products = []
+        for pos in positions.tolist():
+            pid_str = str(self._field(pos, 'product_id', {}, 'product_id'))
+            details = product_map.get(pid_str, {}) if product_map else {}
+            image = self._field(pos, 'image_url', details, 'image_url')
+            products.append({
+                "_id": pid_str, # Frontend dùng _id là string
+                "name": self._field(pos, 'name', details, 'name', "N/A"),
+                "images": [image] if image else [PLACEHOLDER_IMAGE],
+                "price": to_float(self._field(pos, 'price', details, 'price')),
+                "category": self._field(pos, 'category', details, 'category'),
+                "province": self._field(pos, 'origin', details, 'origin'),
+                "rating": to_int(self._field(pos, 'ocop_rating', details, 'ocop_rating')),
+                "numReviews": to_int(self._field(pos, 'num_reviews', details, 'num_reviews', 0)),
+                "countInStock": to_int(self._field(pos, 'countInStock', details, 'countInStock', 1)),
+            })
+        return products
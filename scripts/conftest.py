@@ -0,0 +1,60 @@
+# scripts/conftest.py
+# Fixture dùng chung cho các test pytest trong scripts/: một ArtifactState nhỏ dựng trong bộ nhớ
+# (không cần python_recommender_artifacts/), được gắn làm trạng thái đang phục vụ của recommender_cli.
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+import recommender_cli as rc
+from artifact_bundle import ProductIdMap
+from neighbor_index import TfidfSimilarity, build_from_dense
+
+N_PRODUCTS = 40
+FIRST_PRODUCT_ID = 1000
+
+
+def synthetic_vectors(n_products=N_PRODUCTS, n_features=12, seed=0):
+    """Vector kiểu TF-IDF (thưa, chuẩn hóa L2) của các sản phẩm."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.random((n_products, n_features)).astype(np.float32)
+    vectors[vectors < 0.5] = 0
+    vectors[:, 0] += 0.1 # Không có hàng rỗng
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def synthetic_cosine(n_products=N_PRODUCTS, n_features=12, seed=0):
+    vectors = synthetic_vectors(n_products, n_features, seed=seed)
+    return vectors @ vectors.T
+
+
+def synthetic_tfidf(n_products=N_PRODUCTS, n_features=12, seed=0):
+    return TfidfSimilarity(scipy.sparse.csr_matrix(synthetic_vectors(n_products, n_features, seed=seed)))
+
+
+def synthetic_state(n_products=N_PRODUCTS, top_k=8, seed=0, dense=False, tfidf=False):
+    """dense: kèm ma trận cosine dày; tfidf: kèm TfidfSimilarity (như build_model.py). Có một trong hai thì hồ sơ user
+    được chấm điểm chính xác thay vì trên chỉ mục top_k."""
+    product_ids = [str(FIRST_PRODUCT_ID + i) for i in range(n_products)]
+    product_map = {pid: {"name": f"Sản phẩm {pid}", "price": float(10000 + i), "image_url": None, "product_url": None,
+                         "ocop_rating": 4, "_id": f"{int(pid):024x}"}
+                   for i, pid in enumerate(product_ids)}
+    products_df = pd.DataFrame({"product_id": product_ids, "name": [product_map[pid]["name"] for pid in product_ids],
+                                "price": [product_map[pid]["price"] for pid in product_ids],
+                                "category": ["Thực phẩm", "Đồ uống"] * (n_products // 2) + ["Thực phẩm"] * (n_products % 2),
+                                "origin": "Hà Nội", "sold": np.arange(n_products)})
+    id_map = ProductIdMap.from_series(pd.Series(np.arange(n_products), index=product_ids), n_rows=n_products)
+    cosine_matrix = synthetic_cosine(n_products, seed=seed)
+    neighbor_index = build_from_dense(cosine_matrix, top_k=top_k)
+    return rc.ArtifactState(f"test-{seed}", product_map, products_df, id_map, neighbor_index=neighbor_index,
+                            cosine_matrix=cosine_matrix if dense else None, search_dir=None, ann_dir=None, copurchase_dir=None,
+                            tfidf_similarity=synthetic_tfidf(n_products, seed=seed) if tfidf else None)
+
+
+@pytest.fixture
+def state(monkeypatch):
+    """ArtifactState tổng hợp đang phục vụ (rc.load_artifacts() trả về nó)."""
+    state = synthetic_state()
+    monkeypatch.setattr(rc, "_STATE", state)
+    return state
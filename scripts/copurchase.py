@@ -0,0 +1,398 @@
+# scripts/copurchase.py
+# Chỉ mục mua chung (item-item collaborative filtering) dựng từ file export đơn hàng, dùng để trộn với điểm
+# content-based (TF-IDF) khi gợi ý theo user.
+#   - đếm n(i) = số đơn chứa sản phẩm i và c(i, j) = số đơn chứa cả i và j, theo product_id (không theo hàng
+#     ma trận) nên dùng lại được qua các lần build mô hình / publish bundle
+#   - chỉ lưu các cặp thực sự xuất hiện: kích thước tăng theo số đơn, không theo N². Đơn lớn chỉ lấy
+#     MAX_BASKET_ITEMS sản phẩm đầu; một cặp bị bỏ khi không nằm trong MAX_PAIRS_PER_ITEM cặp đếm nhiều nhất
+#     của cả hai sản phẩm
+#   - điểm = cosine trên vector đơn hàng: c(i, j) / sqrt(n(i) * n(j)); mỗi sản phẩm giữ top-K (CSR giống
+#     neighbor_index.py). Khi serve, chỉ phần top-K được load và chuyển sang hàng của ma trận tương đồng
+#   - cập nhật tăng dần: cộng số đếm của các đơn mới vào số đếm đã lưu rồi tính lại top-K, không đọc lại export cũ
+#
+# File export:
+#   - JSONL: mỗi dòng một document đơn hàng (mongoexport --collection=orders); sản phẩm lấy từ orderItems
+#     (original_id, hoặc product = _id MongoDB tra qua product map enriched). Cũng nhận {"product_ids": [...]}
+#   - CSV: mỗi dòng một sản phẩm của đơn, cột order_id + original_id / product_id / product
+#   Đơn có status 'cancelled' bị bỏ.
+#
+# Dùng:
+#   python copurchase.py build --orders orders.jsonl --top_k 50
+#   python copurchase.py update --orders orders_since_last_build.jsonl   # rồi gửi reload_artifacts (force) cho serve
+#   python copurchase.py neighbors --product_id 26220
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+import pathlib
+
+import numpy as np
+
+from neighbor_index import NeighborIndex
+from record_store import safe_int_convert
+from artifact_bundle import MongoIdMap
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+COPURCHASE_DIR = ARTIFACTS_DIR / 'copurchase_v1'
+PRODUCT_MAP_JSON_FILE = ARTIFACTS_DIR / 'product_id_name_map_v2_adv_enriched_with_mongo_id.json'
+
+DEFAULT_TOP_K = 50
+DEFAULT_MIN_COUNT = 1 # Số đơn chung tối thiểu để một cặp được tính điểm
+MAX_BASKET_ITEMS = 50 # Đơn có nhiều sản phẩm hơn chỉ lấy chừng này (số cặp tăng theo bình phương kích thước đơn)
+MAX_PAIRS_PER_ITEM = 1000 # Số cặp đếm tối đa giữ lại cho mỗi sản phẩm
+PAIR_CHUNK_SIZE = 2 ** 21 # Gộp (cộng dồn) các cặp mới sau mỗi chừng này cặp để giới hạn bộ nhớ khi đọc export lớn
+SKIPPED_STATUSES = ('cancelled',)
+
+META_FILE = 'meta.json'
+PRODUCT_IDS_FILE = 'product_ids.npy'
+ITEM_COUNTS_FILE = 'item_counts.npy'
+PAIR_A_FILE = 'pair_a.npy'
+PAIR_B_FILE = 'pair_b.npy'
+PAIR_COUNTS_FILE = 'pair_counts.npy'
+INDPTR_FILE = 'indptr.npy'
+INDICES_FILE = 'indices.npy'
+SCORES_FILE = 'scores.npy'
+
+
+# --- Đọc file export đơn hàng ---
+def _plain_value(value):
+    """Giá trị kiểu mongoexport ({"$oid": ...}, {"$numberLong": ...}) -> giá trị bên trong."""
+    if isinstance(value, dict) and len(value) == 1:
+        key, inner = next(iter(value.items()))
+        if key.startswith('$'):
+            return inner
+    return value
+
+
+def _item_product_id(value, mongo_id_map):
+    """product_id (int) của một sản phẩm trong đơn: product_id gốc, hoặc _id MongoDB tra qua mongo_id_map."""
+    value = _plain_value(value)
+    if value is None:
+        return None
+    if MongoIdMap.is_object_id(str(value)):
+        product_id = mongo_id_map.product_id_of(str(value)) if mongo_id_map is not None else None
+        return int(product_id) if product_id is not None else None
+    return safe_int_convert(value)
+
+
+def _order_items(order):
+    if 'product_ids' in order:
+        return order.get('product_ids') or []
+    items = []
+    for item in order.get('orderItems') or []:
+        original_id = _plain_value(item.get('original_id'))
+        items.append(original_id if original_id is not None else item.get('product'))
+    return items
+
+
+def _basket(values, mongo_id_map):
+    pids = (_item_product_id(value, mongo_id_map) for value in values)
+    return [pid for pid in dict.fromkeys(pids) if pid is not None]
+
+
+def _read_jsonl_baskets(path, mongo_id_map):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            order = json.loads(line)
+            if order.get('status') in SKIPPED_STATUSES:
+                continue
+            yield _basket(_order_items(order), mongo_id_map)
+
+
+def _read_csv_baskets(path, mongo_id_map):
+    orders = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        item_column = next((col for col in ('original_id', 'product_id', 'product') if col in (reader.fieldnames or [])), None)
+        if 'order_id' not in (reader.fieldnames or []) or item_column is None:
+            raise ValueError(f"CSV order export {path} needs an 'order_id' column and one of original_id / product_id / product.")
+        for row in reader:
+            if row.get('status') in SKIPPED_STATUSES:
+                continue
+            orders.setdefault(row['order_id'], []).append(row[item_column])
+    for values in orders.values():
+        yield _basket(values, mongo_id_map)
+
+
+def read_baskets(path, mongo_id_map=None):
+    """Các đơn hàng (list product_id int, không trùng) trong file export JSONL hoặc CSV."""
+    if str(path).lower().endswith('.csv'):
+        return _read_csv_baskets(path, mongo_id_map)
+    return _read_jsonl_baskets(path, mongo_id_map)
+
+
+def load_mongo_id_map(product_map_file=PRODUCT_MAP_JSON_FILE):
+    """Map _id -> product_id từ product map enriched (None nếu không có file)."""
+    if not os.path.exists(product_map_file):
+        return None
+    with open(product_map_file, 'r', encoding='utf-8') as f:
+        return MongoIdMap.from_product_map(json.load(f))
+
+
+# --- Đếm cặp (mảng NumPy, không dict theo cặp) ---
+def _reduce_pairs(pair_a, pair_b, counts):
+    """Gộp các cặp (a, b) trùng nhau, cộng số đếm; kết quả sắp xếp theo (a, b)."""
+    if len(pair_a) == 0:
+        return pair_a, pair_b, counts
+    order = np.lexsort((pair_b, pair_a))
+    pair_a, pair_b, counts = pair_a[order], pair_b[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, (pair_a[1:] != pair_a[:-1]) | (pair_b[1:] != pair_b[:-1])])
+    return pair_a[starts], pair_b[starts], np.add.reduceat(counts, starts)
+
+
+def _reduce_items(product_ids, counts):
+    if len(product_ids) == 0:
+        return product_ids, counts
+    unique_ids, inverse = np.unique(product_ids, return_inverse=True)
+    return unique_ids, np.bincount(inverse, weights=counts, minlength=len(unique_ids)).astype(np.int64)
+
+
+def _rank_within(rows, values, n_rows):
+    """Thứ hạng (0 = lớn nhất) của từng phần tử theo values trong nhóm cùng rows; kèm thứ tự đã sắp xếp."""
+    order = np.lexsort((-values, rows))
+    sorted_rows = rows[order]
+    row_starts = np.cumsum(np.bincount(sorted_rows, minlength=n_rows)) - np.bincount(sorted_rows, minlength=n_rows)
+    ranks = np.empty(len(rows), dtype=np.int64)
+    ranks[order] = np.arange(len(rows)) - row_starts[sorted_rows]
+    return ranks, order
+
+
+_TRIU_CACHE = {}
+
+def _triu(size):
+    if size not in _TRIU_CACHE:
+        _TRIU_CACHE[size] = np.triu_indices(size, 1)
+    return _TRIU_CACHE[size]
+
+
+class CoPurchaseCounts:
+    """Số đếm mua chung (trạng thái cho cập nhật tăng dần).
+    product_ids: int64 tăng dần, item_counts[i] = số đơn chứa product_ids[i];
+    cặp (pair_a[k] < pair_b[k]) là product_id, pair_counts[k] = số đơn chứa cả hai."""
+
+    def __init__(self, product_ids, item_counts, pair_a, pair_b, pair_counts, n_orders=0):
+        self.product_ids = product_ids
+        self.item_counts = item_counts
+        self.pair_a = pair_a
+        self.pair_b = pair_b
+        self.pair_counts = pair_counts
+        self.n_orders = int(n_orders)
+
+    @classmethod
+    def empty(cls):
+        ids = np.zeros(0, dtype=np.int64)
+        return cls(ids, ids.copy(), ids.copy(), ids.copy(), ids.copy(), 0)
+
+    def __len__(self):
+        return len(self.pair_counts)
+
+    def add_baskets(self, baskets, max_basket_items=MAX_BASKET_ITEMS, max_pairs_per_item=MAX_PAIRS_PER_ITEM):
+        """Số đếm mới = số đếm hiện tại + các đơn trong baskets (iterable list product_id). Không sửa self."""
+        pair_a, pair_b = [np.asarray(self.pair_a, dtype=np.int64)], [np.asarray(self.pair_b, dtype=np.int64)]
+        pair_counts = [np.asarray(self.pair_counts, dtype=np.int64)]
+        items, item_counts = [np.asarray(self.product_ids, dtype=np.int64)], [np.asarray(self.item_counts, dtype=np.int64)]
+        n_orders, pending = self.n_orders, 0
+        for basket in baskets:
+            if not basket:
+                continue
+            n_orders += 1
+            pids = np.unique(np.asarray(basket[:max_basket_items], dtype=np.int64))
+            items.append(pids)
+            item_counts.append(np.ones(len(pids), dtype=np.int64))
+            if len(pids) < 2:
+                continue
+            first, second = _triu(len(pids))
+            pair_a.append(pids[first])
+            pair_b.append(pids[second])
+            pair_counts.append(np.ones(len(first), dtype=np.int64))
+            pending += len(first)
+            if pending >= PAIR_CHUNK_SIZE:
+                reduced = _reduce_pairs(np.concatenate(pair_a), np.concatenate(pair_b), np.concatenate(pair_counts))
+                pair_a, pair_b, pair_counts = [reduced[0]], [reduced[1]], [reduced[2]]
+                reduced_ids, reduced_counts = _reduce_items(np.concatenate(items), np.concatenate(item_counts))
+                items, item_counts = [reduced_ids], [reduced_counts]
+                pending = 0
+
+        product_ids, counts = _reduce_items(np.concatenate(items), np.concatenate(item_counts))
+        pair_a, pair_b, pair_counts = _reduce_pairs(np.concatenate(pair_a), np.concatenate(pair_b), np.concatenate(pair_counts))
+        if max_pairs_per_item and len(pair_counts):
+            # Giữ cặp nằm trong top max_pairs_per_item (theo số đếm) của ít nhất một trong hai sản phẩm
+            pos_a, pos_b = np.searchsorted(product_ids, pair_a), np.searchsorted(product_ids, pair_b)
+            ranks, _ = _rank_within(np.concatenate([pos_a, pos_b]), np.concatenate([pair_counts, pair_counts]), len(product_ids))
+            keep = (ranks[:len(pair_counts)] < max_pairs_per_item) | (ranks[len(pair_counts):] < max_pairs_per_item)
+            pair_a, pair_b, pair_counts = pair_a[keep], pair_b[keep], pair_counts[keep]
+        return CoPurchaseCounts(product_ids, counts, pair_a, pair_b, pair_counts, n_orders)
+
+    def neighbors(self, top_k=DEFAULT_TOP_K, min_count=DEFAULT_MIN_COUNT):
+        """Top-K sản phẩm mua chung của mỗi sản phẩm, điểm cosine c(i, j) / sqrt(n(i) * n(j))."""
+        n_products = len(self.product_ids)
+        keep = self.pair_counts >= min_count
+        pos_a = np.searchsorted(self.product_ids, self.pair_a[keep])
+        pos_b = np.searchsorted(self.product_ids, self.pair_b[keep])
+        item_counts = np.asarray(self.item_counts, dtype=np.float64)
+        pair_scores = self.pair_counts[keep] / np.sqrt(item_counts[pos_a] * item_counts[pos_b])
+
+        rows, cols = np.concatenate([pos_a, pos_b]), np.concatenate([pos_b, pos_a])
+        scores = np.concatenate([pair_scores, pair_scores])
+        ranks, order = _rank_within(rows, scores, n_products)
+        order = order[ranks[order] < top_k] # Thứ tự theo hàng, điểm giảm dần
+        indptr = np.zeros(n_products + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[order], minlength=n_products), out=indptr[1:])
+        return CoPurchaseNeighbors(self.product_ids, indptr, cols[order].astype(np.int32),
+                                   scores[order].astype(np.float32), top_k)
+
+
+class CoPurchaseNeighbors:
+    """Top-K sản phẩm mua chung theo product_id: hàng i (product_ids[i]) = vị trí indices[indptr[i]:indptr[i+1]]
+    trong product_ids, điểm giảm dần."""
+
+    def __init__(self, product_ids, indptr, indices, scores, top_k):
+        self.product_ids = product_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self.top_k = int(top_k)
+
+    def neighbors(self, product_id, top_n=None):
+        """(product_ids int64, scores float32) mua chung với product_id; mảng rỗng nếu chưa có đơn nào."""
+        pos = int(np.searchsorted(self.product_ids, product_id)) if len(self.product_ids) else 0
+        if pos >= len(self.product_ids) or self.product_ids[pos] != product_id:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        start, end = self.indptr[pos], self.indptr[pos + 1]
+        if top_n is not None:
+            end = min(end, start + top_n)
+        return np.asarray(self.product_ids)[self.indices[start:end]], np.asarray(self.scores[start:end], dtype=np.float32)
+
+    def for_rows(self, row_product_ids):
+        """NeighborIndex theo hàng của ma trận tương đồng (row_product_ids[row] = product_id hoặc -1), để cộng
+        thẳng vào vector điểm content-based; sản phẩm không có hàng bị bỏ."""
+        row_product_ids = np.asarray(row_product_ids, dtype=np.int64)
+        n_rows = len(row_product_ids)
+        row_of_pos = np.full(len(self.product_ids), -1, dtype=np.int64)
+        valid_rows = np.flatnonzero(row_product_ids >= 0)
+        if len(self.product_ids) and len(valid_rows):
+            pos = np.minimum(np.searchsorted(self.product_ids, row_product_ids[valid_rows]), len(self.product_ids) - 1)
+            found = np.asarray(self.product_ids)[pos] == row_product_ids[valid_rows]
+            row_of_pos[pos[found]] = valid_rows[found]
+
+        entry_rows = row_of_pos[np.repeat(np.arange(len(self.product_ids)), np.diff(np.asarray(self.indptr)))]
+        entry_cols = row_of_pos[np.asarray(self.indices)]
+        keep = np.flatnonzero((entry_rows >= 0) & (entry_cols >= 0))
+        keep = keep[np.argsort(entry_rows[keep], kind='stable')] # Giữ thứ tự điểm giảm dần trong mỗi hàng
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entry_rows[keep], minlength=n_rows), out=indptr[1:])
+        return NeighborIndex(indptr, entry_cols[keep].astype(np.int32), np.asarray(self.scores)[keep].astype(np.float32),
+                             n_items=n_rows, top_k=self.top_k)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        meta = read_meta(directory)
+        mmap_mode = 'r' if mmap else None
+        return cls(np.load(directory / PRODUCT_IDS_FILE, mmap_mode=mmap_mode), np.load(directory / INDPTR_FILE, mmap_mode=mmap_mode),
+                   np.load(directory / INDICES_FILE, mmap_mode=mmap_mode), np.load(directory / SCORES_FILE, mmap_mode=mmap_mode),
+                   meta["top_k"])
+
+
+# --- Lưu / load ---
+def read_meta(directory):
+    meta_path = pathlib.Path(directory) / META_FILE
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"Co-purchase index not found: {directory}")
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_counts(directory):
+    directory = pathlib.Path(directory)
+    meta = read_meta(directory)
+    return CoPurchaseCounts(np.load(directory / PRODUCT_IDS_FILE), np.load(directory / ITEM_COUNTS_FILE),
+                            np.load(directory / PAIR_A_FILE), np.load(directory / PAIR_B_FILE),
+                            np.load(directory / PAIR_COUNTS_FILE), meta["n_orders"])
+
+
+def save(directory, counts, top_k=DEFAULT_TOP_K, min_count=DEFAULT_MIN_COUNT, max_pairs_per_item=MAX_PAIRS_PER_ITEM):
+    """Ghi số đếm và top-K vào thư mục tạm rồi đổi tên: process serve đang reload không đọc phải bản ghi dở."""
+    directory = pathlib.Path(directory)
+    neighbors = counts.neighbors(top_k=top_k, min_count=min_count)
+    tmp_dir = directory.with_name(directory.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / PRODUCT_IDS_FILE, np.asarray(counts.product_ids, dtype=np.int64))
+    np.save(tmp_dir / ITEM_COUNTS_FILE, np.asarray(counts.item_counts, dtype=np.int64))
+    np.save(tmp_dir / PAIR_A_FILE, np.asarray(counts.pair_a, dtype=np.int64))
+    np.save(tmp_dir / PAIR_B_FILE, np.asarray(counts.pair_b, dtype=np.int64))
+    np.save(tmp_dir / PAIR_COUNTS_FILE, np.asarray(counts.pair_counts, dtype=np.int64))
+    np.save(tmp_dir / INDPTR_FILE, neighbors.indptr)
+    np.save(tmp_dir / INDICES_FILE, neighbors.indices)
+    np.save(tmp_dir / SCORES_FILE, neighbors.scores)
+    meta = {
+        "n_orders": counts.n_orders, "n_products": int(len(counts.product_ids)), "n_pairs": int(len(counts)),
+        "nnz": int(len(neighbors.indices)), "top_k": int(top_k), "min_count": int(min_count),
+        "max_pairs_per_item": int(max_pairs_per_item), "updated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(tmp_dir / META_FILE, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = directory.with_name(directory.name + '.old')
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    if directory.exists():
+        directory.rename(old_dir)
+    tmp_dir.rename(directory)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    return meta
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Co-purchase (item-item) index built from an order export")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="Build the index from a full order export (JSONL or CSV)")
+    parser_build.add_argument("--orders", type=str, required=True)
+    parser_build.add_argument("--top_k", type=int, default=DEFAULT_TOP_K)
+    parser_build.add_argument("--min_count", type=int, default=DEFAULT_MIN_COUNT)
+    parser_build.add_argument("--max_pairs_per_item", type=int, default=MAX_PAIRS_PER_ITEM)
+    parser_build.add_argument("--product_map", type=str, default=str(PRODUCT_MAP_JSON_FILE), help="Product map enriched (tra _id MongoDB)")
+    parser_build.add_argument("--dir", type=str, default=str(COPURCHASE_DIR))
+
+    parser_update = subparsers.add_parser("update", help="Add new orders to an existing index (top_k / min_count giữ như lần build nếu không truyền)")
+    parser_update.add_argument("--orders", type=str, required=True)
+    parser_update.add_argument("--top_k", type=int, default=None)
+    parser_update.add_argument("--min_count", type=int, default=None)
+    parser_update.add_argument("--product_map", type=str, default=str(PRODUCT_MAP_JSON_FILE))
+    parser_update.add_argument("--dir", type=str, default=str(COPURCHASE_DIR))
+
+    parser_neighbors = subparsers.add_parser("neighbors", help="Products most often bought together with a product")
+    parser_neighbors.add_argument("--product_id", type=int, required=True)
+    parser_neighbors.add_argument("--top_n", type=int, default=10)
+    parser_neighbors.add_argument("--dir", type=str, default=str(COPURCHASE_DIR))
+
+    args = parser.parse_args()
+    if args.command in ("build", "update"):
+        start = time.perf_counter()
+        baskets = read_baskets(args.orders, load_mongo_id_map(args.product_map))
+        if args.command == "build":
+            top_k, min_count, max_pairs = args.top_k, args.min_count, args.max_pairs_per_item
+            counts = CoPurchaseCounts.empty().add_baskets(baskets, max_pairs_per_item=max_pairs)
+        else:
+            meta = read_meta(args.dir)
+            top_k = args.top_k or meta["top_k"]
+            min_count = args.min_count or meta["min_count"]
+            max_pairs = meta["max_pairs_per_item"]
+            counts = load_counts(args.dir).add_baskets(baskets, max_pairs_per_item=max_pairs)
+        meta = save(args.dir, counts, top_k=top_k, min_count=min_count, max_pairs_per_item=max_pairs)
+        meta["seconds"] = round(time.perf_counter() - start, 3)
+        print(json.dumps(meta, indent=2))
+    elif args.command == "neighbors":
+        product_ids, scores = CoPurchaseNeighbors.load(args.dir).neighbors(args.product_id, top_n=args.top_n)
+        print(json.dumps({"product_id": args.product_id,
+                          "neighbors": [{"product_id": pid, "score": round(score, 4)} for pid, score in zip(product_ids.tolist(), scores.tolist())]},
+                         indent=2))
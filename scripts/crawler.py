@@ -0,0 +1,482 @@
+# scripts/crawler.py
+# Crawl catalog OCOP của buudien.vn bằng pipeline asyncio (thay run_crawl_v2_parallel trong notebook Block 2).
+#   - một aiohttp.ClientSession dùng chung: pool kết nối giới hạn (MAX_CONNECTIONS, MAX_CONNECTIONS_PER_HOST)
+#   - giới hạn tốc độ theo host (token bucket REQUESTS_PER_SECOND) thay cho sleep ngẫu nhiên trong từng thread
+#   - retry với backoff lũy thừa + jitter cho lỗi mạng, timeout, 429 và 5xx (tôn trọng Retry-After)
+#   - trang danh sách tải song song (tổng số trang lấy từ trang đầu); sản phẩm đi qua hàng đợi có giới hạn
+#     tới DETAIL_WORKERS coroutine tải trang chi tiết, nên hai giai đoạn chạy chồng lên nhau
+#   - incremental (--previous): fingerprint (giá, tên, ảnh) trên trang danh sách không đổi so với CSV trước
+#     -> không tải trang chi tiết, chép nguyên dòng cũ
+#   - ghi CSV theo luồng (sản phẩm xong là ghi, không giữ cả catalog trong bộ nhớ) vào file tạm, đổi tên khi xong.
+#     Thứ tự dòng theo thứ tự hoàn tất, không theo thứ tự trang
+#
+# Dùng:
+#   python crawler.py crawl --out ../python_recommender_artifacts/buudien_ocop_products_detailed_v2_rerun.csv
+#   python crawler.py crawl --out new.csv --previous old.csv                  # incremental
+#   python crawler.py crawl --out new.csv --save_pages pages/                 # lưu HTML đã tải để chạy lại offline
+#   python crawler.py serve --pages pages/ --port 8765 [--fail_rate 0.1]     # server thay thế buudien.vn
+#   python crawler.py crawl --out test.csv --base_url http://127.0.0.1:8765
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import pathlib
+from urllib.parse import urljoin, urlsplit, quote
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+from record_store import safe_int_convert
+
+BASE_HOST = "https://buudien.vn"
+LIST_PATH_TEMPLATE = "/home/Search/index.html?keyword=OCOP&page={page}"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+REQUEST_TIMEOUT = 30
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 1.0 # Giây; lần thử thứ n chờ ~BACKOFF_BASE * 2^n (có jitter), tối đa BACKOFF_MAX
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_CONNECTIONS = 16
+MAX_CONNECTIONS_PER_HOST = 8
+REQUESTS_PER_SECOND = 5.0 # Mỗi host
+REQUEST_BURST = 2
+DETAIL_WORKERS = 8
+DETAIL_QUEUE_SIZE = 64 # Trang danh sách chờ khi hàng đợi đầy: bộ nhớ không tăng theo kích thước catalog
+CRAWL_MAX_PAGES = 250
+CRAWL_EMPTY_STOP = 5 # Không biết tổng số trang: dừng sau chừng này trang trống liên tiếp
+
+CSV_COLUMNS = ["product_id", "name", "full_name", "price", "ocop_rating", "origin", "producer", "short_description",
+               "description", "image_url", "product_url", "ocop_rating_from_list"]
+DETAIL_ERROR_PREFIX = "Lỗi crawl chi tiết" # Dòng lỗi của lần trước luôn được tải lại
+
+
+class FetchError(Exception):
+    pass
+
+
+# --- Phân tích HTML (giữ nguyên selector / quy tắc của notebook) ---
+def clean_price(price_text):
+    """Làm sạch và chuyển đổi giá sang integer."""
+    if not isinstance(price_text, str): return 0
+    price_text = price_text.lower().replace('đ', '').replace('.', '').replace(',', '').strip()
+    price_int = safe_int_convert(re.sub(r'[^\d]', '', price_text))
+    return price_int if price_int is not None else 0
+
+
+def _total_pages(soup):
+    """Tổng số trang: 'Trang X/Y', rồi link 'Cuối', rồi số trang lớn nhất trong các link phân trang."""
+    pagination_el = soup.select_one('ul.pagination')
+    if not pagination_el:
+        return None
+    page_info_element = pagination_el.select_one('li.totalPage span, li.totalPage em')
+    if page_info_element:
+        match = re.search(r'Trang\s*\d+\s*/\s*(\d+)', page_info_element.text.strip(), re.IGNORECASE)
+        if match:
+            return safe_int_convert(match.group(1))
+    cuoi_link = (pagination_el.select_one('li:not(.disabled) a[href*="page="]:-soup-contains("Cuối")')
+                 or pagination_el.select_one('li a[href*="page="]:-soup-contains("Cuối")'))
+    if cuoi_link and cuoi_link.get('href'):
+        match = re.search(r'page=(\d+)', cuoi_link.get('href'))
+        if match:
+            return safe_int_convert(match.group(1))
+    page_numbers = [safe_int_convert(match.group(1)) for link in pagination_el.select('li a[href*="page="]')
+                    for match in [re.search(r'page=(\d+)', link.get('href') or '')] if match]
+    page_numbers = [page for page in page_numbers if page is not None]
+    return max(page_numbers) if page_numbers else None
+
+
+def parse_list_page(html):
+    """(sản phẩm trên trang, tổng số trang hoặc None). Sản phẩm: thông tin cơ bản như crawl_product_list_page_v2."""
+    soup = BeautifulSoup(html, 'lxml')
+    total_pages = _total_pages(soup)
+    products = []
+    for box in soup.select('div.item_product_home'):
+        product = {"product_id": None, "name": "", "full_name": "", "price": 0, "image_url": "", "product_url": "",
+                   "short_description": "", "ocop_rating_from_list": None}
+        link = box.select_one('div.img_product a')
+        href = link.get('href') if link else None
+        if not href:
+            continue
+        product["product_url"] = urljoin(BASE_HOST, href)
+        match_id = re.search(r'goods_id=(\d+)', href)
+        if match_id: product["product_id"] = safe_int_convert(match_id.group(1))
+
+        content_link = box.select_one('div.content_product a')
+        if content_link:
+            product["full_name"] = content_link.text.strip()
+            short_desc = content_link.get('alt') or content_link.get('title') or ""
+            product["short_description"] = short_desc.strip()
+            match_rating = re.search(r'(\d)\s*sao\s*(?:OCOP|$)|OCOP\s*(\d)\s*sao', short_desc, re.IGNORECASE)
+            if match_rating:
+                product["ocop_rating_from_list"] = safe_int_convert(match_rating.group(1) or match_rating.group(2))
+
+        product["name"] = re.sub(r'^✓?\s*OCOP(?:\s*\d?\s*sao)?\s*[:\s-]*', '', product["full_name"], flags=re.IGNORECASE).strip()
+        if not product["name"]: product["name"] = product["full_name"]
+
+        price_el = box.select_one('div.price_product')
+        product["price"] = clean_price(price_el.text) if price_el else 0
+
+        img_el = box.select_one('div.img_product img')
+        img_src = (img_el.get('data-src') or img_el.get('src')) if img_el else None
+        if img_src: product["image_url"] = urljoin(BASE_HOST, img_src)
+
+        if product["product_id"] is not None:
+            products.append(product)
+        else:
+            print(f"   - Cảnh báo: Không lấy được ID cho sản phẩm: {product['full_name']} tại URL: {product['product_url']}", file=sys.stderr)
+    return products, total_pages
+
+
+def _table_value(detail_table, labels):
+    if not detail_table:
+        return ""
+    for row in detail_table.find_all('tr'):
+        cells = row.find_all('td')
+        if len(cells) == 2:
+            label, value = cells[0].text.strip().lower(), cells[1].text.strip()
+            if label and value and label in labels:
+                return value
+    return ""
+
+
+def parse_detail_page(html, ocop_rating_from_list=None):
+    """description, origin, producer, ocop_rating của trang chi tiết (như get_product_details_v2)."""
+    soup = BeautifulSoup(html, 'lxml')
+    details = {}
+    desc_element = soup.select_one('div.wp_content_tab_description_product')
+    details["description"] = ' '.join(desc_element.stripped_strings) if desc_element else ""
+
+    detail_table = soup.select_one('table.tb_parameter_product')
+    origin_gui_tu = soup.select_one('div.kv_store_info div.drop_kv_giaohang')
+    origin_text = ' '.join(origin_gui_tu.stripped_strings) if origin_gui_tu and origin_gui_tu.text.strip() else ""
+    details["origin"] = (origin_text or _table_value(detail_table, ["xuất xứ", "nơi sản xuất", "tỉnh thành"])).strip()
+
+    shop_name_element = soup.select_one('div.info_store h3 a')
+    producer_text = ""
+    if shop_name_element and shop_name_element.text.strip():
+        producer_text = shop_name_element.text.strip()
+    elif shop_name_element is None:
+        shop_name_element = soup.select_one('div.info_store h3')
+        if shop_name_element and shop_name_element.text.strip():
+            producer_text = shop_name_element.text.strip()
+    details["producer"] = (producer_text or _table_value(detail_table, ["thương hiệu", "nhà sản xuất", "gian hàng"])).strip()
+
+    ocop_rating = ocop_rating_from_list
+    if ocop_rating is None and details["description"]:
+        match = re.search(r'(?:OCOP|Hạng)\s*[:\s-]*\s*(\d)\s*sao', details["description"], re.IGNORECASE)
+        if match: ocop_rating = safe_int_convert(match.group(1))
+    if ocop_rating is None:
+        match = re.search(r'(\d)', _table_value(detail_table, ["chứng nhận ocop", "hạng sao ocop", "ocop"]))
+        if match: ocop_rating = safe_int_convert(match.group(1))
+    details["ocop_rating"] = ocop_rating
+    return details
+
+
+# --- Incremental: fingerprint trang danh sách ---
+def list_fingerprint(product):
+    """Hash (giá, tên đầy đủ, ảnh) như hiển thị trên trang danh sách; đổi -> tải lại trang chi tiết."""
+    price = safe_int_convert(product.get("price")) or 0
+    parts = (str(price), str(product.get("full_name") or "").strip(), str(product.get("image_url") or "").strip())
+    return hashlib.sha1("\x00".join(parts).encode('utf-8')).hexdigest()
+
+
+def _read_csv_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def load_fingerprints(path):
+    """product_id -> fingerprint của CSV trước (chỉ giữ hash, không giữ dòng); bỏ dòng lỗi crawl chi tiết."""
+    fingerprints = {}
+    for row in _read_csv_rows(path):
+        pid = safe_int_convert(row.get("product_id"))
+        if pid is not None and pid not in fingerprints and not (row.get("description") or "").startswith(DETAIL_ERROR_PREFIX):
+            fingerprints[pid] = list_fingerprint(row)
+    return fingerprints
+
+
+# --- Tải trang: pool kết nối, giới hạn tốc độ theo host, retry/backoff ---
+class HostRateLimiter:
+    """Token bucket theo host: trung bình rate request/giây, tối đa burst request liền nhau."""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._buckets = {} # host -> [tokens, thời điểm cập nhật, không gửi trước thời điểm này (Retry-After)]
+        self._locks = {}
+
+    async def acquire(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock: # Request cùng host xếp hàng lần lượt qua bucket
+            bucket = self._buckets.setdefault(host, [self.burst, time.monotonic(), 0.0])
+            while True:
+                now = time.monotonic()
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                wait = max(bucket[2] - now, (1.0 - bucket[0]) / self.rate if bucket[0] < 1.0 else 0.0)
+                if wait <= 0:
+                    bucket[0] -= 1.0
+                    return
+                await asyncio.sleep(wait)
+
+    def pause(self, host, seconds):
+        """Không gửi request tới host trong seconds giây (429 / 503 có Retry-After)."""
+        bucket = self._buckets.setdefault(host, [self.burst, time.monotonic(), 0.0])
+        bucket[2] = max(bucket[2], time.monotonic() + seconds)
+
+
+def page_file_name(path_qs):
+    """Tên file lưu trang (dùng chung cho --save_pages và server thay thế): path + query đã quote."""
+    return quote(path_qs, safe='') + '.html'
+
+
+def _path_qs(url):
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class Fetcher:
+    """GET trang HTML qua session dùng chung; retry lỗi tạm thời với backoff lũy thừa + jitter."""
+
+    def __init__(self, session, limiter, retries=RETRY_ATTEMPTS, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, save_dir=None):
+        self.session = session
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.save_dir = pathlib.Path(save_dir) if save_dir else None
+        self.requests = 0
+        self.retried = 0
+
+    async def get_text(self, url):
+        host = urlsplit(url).netloc
+        last_error = None
+        for attempt in range(self.retries):
+            await self.limiter.acquire(host)
+            self.requests += 1
+            retry_after = None
+            try:
+                async with self.session.get(url) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = safe_int_convert(response.headers.get('Retry-After'))
+                        last_error = f"HTTP {response.status}"
+                    elif response.status >= 400:
+                        raise FetchError(f"HTTP {response.status} for {url}") # 4xx khác: thử lại cũng vô ích
+                    else:
+                        text = await response.text()
+                        if self.save_dir is not None:
+                            (self.save_dir / page_file_name(_path_qs(url))).write_text(text, encoding='utf-8')
+                        return text
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = f"{type(e).__name__}: {e}"
+            if attempt == self.retries - 1:
+                break
+            self.retried += 1
+            if retry_after:
+                self.limiter.pause(host, retry_after)
+                delay = retry_after
+            else:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"   - Lỗi khi tải (lần {attempt + 1}/{self.retries}) URL: {url} - {last_error}; thử lại sau {delay:.1f}s", file=sys.stderr)
+            await asyncio.sleep(delay)
+        raise FetchError(f"Giving up on {url} after {self.retries} attempts: {last_error}")
+
+
+def _rebase(url, base_url):
+    """URL trên buudien.vn -> cùng path trên base_url (server thay thế); product_url trong CSV vẫn giữ URL gốc."""
+    return urljoin(base_url, _path_qs(url)) if base_url.rstrip('/') != BASE_HOST else url
+
+
+# --- Pipeline ---
+class _CrawlRun:
+    def __init__(self, fetcher, writer, base_url, fingerprints):
+        self.fetcher = fetcher
+        self.writer = writer
+        self.base_url = base_url
+        self.fingerprints = fingerprints
+        self.queue = asyncio.Queue(maxsize=DETAIL_QUEUE_SIZE)
+        self.seen = set() # product_id đã gặp trên trang danh sách
+        self.written = set() # product_id đã ghi dòng mới
+        self.unchanged = set() # product_id chép dòng cũ
+        self.list_errors = 0
+        self.detail_errors = 0
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.written.add(row["product_id"])
+
+    async def list_page(self, page):
+        """Tải một trang danh sách, đưa sản phẩm mới/đổi vào hàng đợi chi tiết. Trả về (số sản phẩm, tổng số trang)."""
+        url = urljoin(self.base_url, LIST_PATH_TEMPLATE.format(page=page))
+        try:
+            products, total_pages = parse_list_page(await self.fetcher.get_text(url))
+        except Exception as e:
+            self.list_errors += 1
+            print(f"   - Lỗi trang danh sách {page}: {e}", file=sys.stderr)
+            return None, None
+        for product in products:
+            pid = product["product_id"]
+            if pid in self.seen:
+                continue
+            self.seen.add(pid)
+            if self.fingerprints.get(pid) == list_fingerprint(product):
+                self.unchanged.add(pid)
+            else:
+                await self.queue.put(product) # Chờ khi hàng đợi đầy (giới hạn bộ nhớ)
+        return len(products), total_pages
+
+    async def list_pages(self, start_page, max_pages):
+        count, total_pages = await self.list_page(start_page)
+        if total_pages:
+            last_page = min(total_pages, max_pages)
+            print(f"==> Tổng số trang dự kiến: {total_pages} (crawl tới trang {last_page})", file=sys.stderr)
+            await asyncio.gather(*(self.list_page(page) for page in range(start_page + 1, last_page + 1)))
+            return
+        # Không đọc được tổng số trang: tuần tự như notebook, dừng sau CRAWL_EMPTY_STOP trang trống liên tiếp
+        empty_pages = 0 if count else 1
+        page = start_page + 1
+        while page <= max_pages and empty_pages < CRAWL_EMPTY_STOP:
+            count, _ = await self.list_page(page)
+            empty_pages = 0 if count else empty_pages + 1
+            page += 1
+
+    async def detail_worker(self):
+        while True:
+            product = await self.queue.get()
+            try:
+                await self.detail(product)
+            finally:
+                self.queue.task_done()
+
+    async def detail(self, product):
+        pid = product["product_id"]
+        try:
+            html = await self.fetcher.get_text(_rebase(product["product_url"], self.base_url))
+            details = parse_detail_page(html, product.get("ocop_rating_from_list"))
+        except Exception as e:
+            self.detail_errors += 1
+            print(f"   - !!! Bỏ qua chi tiết: {product['product_url']} - {e}", file=sys.stderr)
+            if pid in self.fingerprints:
+                self.unchanged.add(pid) # Giữ dòng cũ thay vì ghi dòng lỗi
+                return
+            details = {"description": f"{DETAIL_ERROR_PREFIX} sau {self.fetcher.retries} lần thử.", "origin": "", "producer": "",
+                       "ocop_rating": product.get("ocop_rating_from_list")}
+        self.write({**product, **details})
+        if len(self.written) % 50 == 0:
+            print(f"   Đã ghi {len(self.written)} sản phẩm (hàng đợi: {self.queue.qsize()})...", file=sys.stderr)
+
+
+async def crawl_catalog(out_path, previous_csv=None, base_url=BASE_HOST, start_page=1, max_pages=CRAWL_MAX_PAGES,
+                        detail_workers=DETAIL_WORKERS, rate=REQUESTS_PER_SECOND, save_pages=None):
+    """Crawl catalog vào out_path (CSV cột CSV_COLUMNS). previous_csv: chế độ incremental. Trả về dict thống kê."""
+    started = time.perf_counter()
+    fingerprints = load_fingerprints(previous_csv) if previous_csv and os.path.exists(previous_csv) else {}
+    if save_pages:
+        pathlib.Path(save_pages).mkdir(parents=True, exist_ok=True)
+    out_path = pathlib.Path(out_path)
+    tmp_path = out_path.with_name(out_path.name + '.tmp')
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=MAX_CONNECTIONS_PER_HOST, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'User-Agent': USER_AGENT}) as session:
+            fetcher = Fetcher(session, HostRateLimiter(rate), save_dir=save_pages)
+            run = _CrawlRun(fetcher, writer, base_url, fingerprints)
+            workers = [asyncio.create_task(run.detail_worker()) for _ in range(detail_workers)]
+            try:
+                await run.list_pages(start_page, max_pages)
+                await run.queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        # Dòng cũ: sản phẩm không đổi; nếu có trang danh sách lỗi thì giữ cả sản phẩm không thấy lần này
+        carried = set(run.unchanged)
+        if run.list_errors:
+            carried |= set(fingerprints) - run.seen
+        copied = 0
+        if carried:
+            for row in _read_csv_rows(previous_csv):
+                pid = safe_int_convert(row.get("product_id"))
+                if pid in carried and pid not in run.written:
+                    writer.writerow(row)
+                    run.written.add(pid)
+                    copied += 1
+    os.replace(tmp_path, out_path)
+    return {
+        "out": str(out_path), "products": len(run.written), "seen_on_list_pages": len(run.seen),
+        "detail_fetched": len(run.written) - copied, "unchanged_copied": copied, "requests": fetcher.requests,
+        "retries": fetcher.retried, "list_page_errors": run.list_errors, "detail_errors": run.detail_errors,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def crawl_to_csv(out_path, **kwargs):
+    """crawl_catalog chạy đồng bộ; dùng được cả khi đã có event loop (notebook Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(crawl_catalog(out_path, **kwargs))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, crawl_catalog(out_path, **kwargs)).result()
+
+
+# --- Server thay thế buudien.vn (các trang đã lưu bằng --save_pages) ---
+def make_standin_app(pages_dir, fail_rate=0.0, retry_after=1):
+    """aiohttp app trả về trang đã lưu theo path + query; fail_rate: tỉ lệ trả 503 để thử retry/backoff.
+    retry_after: giây trong header Retry-After của 503 (None: không gửi, client dùng backoff của nó)."""
+    pages_dir = pathlib.Path(pages_dir)
+    fail_headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+
+    async def handle(request):
+        if fail_rate and random.random() < fail_rate:
+            return web.Response(status=503, headers=fail_headers)
+        path = pages_dir / page_file_name(request.path_qs)
+        if not path.exists():
+            return web.Response(status=404)
+        return web.Response(body=path.read_bytes(), content_type='text/html', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Asyncio crawler for the buudien.vn OCOP catalog")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_crawl = subparsers.add_parser("crawl", help="Crawl the catalog into a CSV")
+    parser_crawl.add_argument("--out", type=str, required=True)
+    parser_crawl.add_argument("--previous", type=str, help="CSV lần crawl trước (incremental: bỏ qua sản phẩm không đổi)")
+    parser_crawl.add_argument("--base_url", type=str, default=BASE_HOST)
+    parser_crawl.add_argument("--start_page", type=int, default=1)
+    parser_crawl.add_argument("--max_pages", type=int, default=CRAWL_MAX_PAGES)
+    parser_crawl.add_argument("--workers", type=int, default=DETAIL_WORKERS, help="Số coroutine tải trang chi tiết")
+    parser_crawl.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="Request/giây tối đa mỗi host")
+    parser_crawl.add_argument("--save_pages", type=str, help="Lưu HTML đã tải vào thư mục này (cho server thay thế)")
+
+    parser_serve = subparsers.add_parser("serve", help="Serve saved pages as a local stand-in for buudien.vn")
+    parser_serve.add_argument("--pages", type=str, required=True)
+    parser_serve.add_argument("--host", type=str, default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8765)
+    parser_serve.add_argument("--fail_rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == "crawl":
+        summary = crawl_to_csv(args.out, previous_csv=args.previous, base_url=args.base_url, start_page=args.start_page,
+                               max_pages=args.max_pages, detail_workers=args.workers, rate=args.rate, save_pages=args.save_pages)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    elif args.command == "serve":
+        web.run_app(make_standin_app(args.pages, fail_rate=args.fail_rate), host=args.host, port=args.port)
@@ -0,0 +1,201 @@
+# scripts/feature_pipeline.py
+# Bước feature / tokenize của mô hình TF-IDF, dùng chung cho notebook (Block 4) và build_model.py.
+#   - mỗi sản phẩm tách thành 2 đoạn: tên và phần còn lại (origin, producer, short_description, description)
+#   - tokenize bằng advanced_tokenizer trong process pool theo từng lô; kết quả lưu vào cache SQLite trên đĩa,
+#     khóa = hash(chữ ký tokenizer + đoạn văn bản) -> sản phẩm không đổi không bao giờ phải tokenize lại
+#   - trọng số tên áp dụng sau khi tokenize (lặp lại các term của tên NAME_WEIGHT lần) thay vì nhân chuỗi
+#   - n-gram được dựng ở đây; TfidfVectorizer nhận document đã là list term (analyzer=analyze_document)
+import os
+import json
+import sqlite3
+import hashlib
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import text_processing
+from text_processing import (advanced_tokenizer, SYNONYM_DICT, NAME_WEIGHT, TOKEN_MIN_LEN, TOKEN_MAX_LEN,
+                             word_tokenize)
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+TOKEN_CACHE_FILE = ARTIFACTS_DIR / 'token_cache_v2_adv.sqlite'
+
+# Đổi khi cách dựng document thay đổi: artifact dựng bằng phiên bản khác phải build full lại
+FEATURE_VERSION = 2
+NAME_FIELD = 'name'
+OTHER_FIELDS = ('origin', 'producer', 'short_description', 'description')
+DEFAULT_CHUNK_SIZE = 256 # Số đoạn văn bản mỗi lô gửi sang process con
+
+# Tham số TF-IDF Tối ưu (giống notebook)
+TFIDF_NGRAM_RANGE = (1, 2)
+TFIDF_MIN_DF = 2
+TFIDF_MAX_DF = 0.8
+TFIDF_MAX_FEATURES = 5000
+TFIDF_SUBLINEAR_TF = True
+TFIDF_NORM = 'l2'
+
+
+def _clean_part(value):
+    if value is None:
+        return ""
+    part = str(value).strip()
+    return "" if part.lower() == 'nan' else part
+
+
+def product_fields(row):
+    """(tên, phần còn lại) của một sản phẩm; bỏ giá trị rỗng / 'nan' như combine_features_v2 trước đây."""
+    name = _clean_part(row.get(NAME_FIELD, ''))
+    rest = " ".join(part for part in (_clean_part(row.get(col, '')) for col in OTHER_FIELDS) if part)
+    return name, rest
+
+
+def fields_hash(name, rest):
+    """Hash nội dung dùng để phát hiện sản phẩm thêm / sửa giữa hai lần dựng mô hình."""
+    return hashlib.sha1(f"{FEATURE_VERSION}\x00{name}\x00{rest}".encode('utf-8')).hexdigest()
+
+
+def tokenizer_signature(stop_words=None):
+    """Chữ ký cấu hình tokenizer: đổi stop words / từ đồng nghĩa / underthesea thì cache cũ tự mất hiệu lực."""
+    if stop_words is None: stop_words = text_processing.VIETNAMESE_STOP_WORDS
+    config = {
+        "underthesea": word_tokenize is not None,
+        "stop_words": sorted(stop_words),
+        "synonyms": sorted(SYNONYM_DICT.items()),
+        "token_len": [TOKEN_MIN_LEN, TOKEN_MAX_LEN],
+    }
+    return hashlib.sha1(json.dumps(config, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """Cache token trên đĩa (SQLite): khóa = sha1(chữ ký tokenizer + văn bản), giá trị = token nối bằng khoảng trắng."""
+
+    def __init__(self, path=TOKEN_CACHE_FILE):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_many(self, keys, batch_size=500):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            rows = self._conn.execute(f"SELECT key, tokens FROM tokens WHERE key IN ({','.join('?' * len(batch))})", batch)
+            found.update((key, tokens.split()) for key, tokens in rows)
+        return found
+
+    def put_many(self, items):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)",
+                                   ((key, " ".join(tokens)) for key, tokens in items.items()))
+
+    def retain(self, keys):
+        """Chỉ giữ các khóa trong keys (dọn mục của sản phẩm đã xóa/sửa, gọi sau khi build full)."""
+        with self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (key TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep (key) VALUES (?)", ((key,) for key in keys))
+            self._conn.execute("DELETE FROM tokens WHERE key NOT IN (SELECT key FROM keep)")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+
+# --- Process con: stop words truyền qua initializer (không phụ thuộc fork hay spawn) ---
+_WORKER_STOP_WORDS = None
+
+def _init_worker(stop_words):
+    global _WORKER_STOP_WORDS
+    _WORKER_STOP_WORDS = stop_words
+
+def _tokenize_chunk(texts):
+    return [advanced_tokenizer(text, _WORKER_STOP_WORDS) for text in texts]
+
+
+def text_key(signature, text):
+    return hashlib.sha1(f"{signature}\x00{text}".encode('utf-8')).hexdigest()
+
+
+def tokenize_texts(texts, stop_words=None, cache=None, n_jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Token của từng văn bản trong texts (cùng thứ tự). Chỉ tokenize văn bản chưa có trong cache,
+    chia lô chạy song song trên n_jobs process (mặc định: số CPU)."""
+    if stop_words is None: stop_words = text_processing.VIETNAMESE_STOP_WORDS
+    signature = tokenizer_signature(stop_words)
+    key_of = {text: text_key(signature, text) for text in set(texts)}
+    tokens_of = {}
+    if cache is not None:
+        cached = cache.get_many(key_of.values())
+        tokens_of = {text: cached[key] for text, key in key_of.items() if key in cached}
+
+    missing = [text for text in key_of if text not in tokens_of]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunks = [missing[start:start + chunk_size] for start in range(0, len(missing), chunk_size)]
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks)), initializer=_init_worker, initargs=(stop_words,)) as pool:
+            results = list(pool.map(_tokenize_chunk, chunks))
+    else:
+        _init_worker(stop_words)
+        results = [_tokenize_chunk(chunk) for chunk in chunks]
+    new_tokens = {text: tokens for chunk, chunk_tokens in zip(chunks, results) for text, tokens in zip(chunk, chunk_tokens)}
+    tokens_of.update(new_tokens)
+    if cache is not None and new_tokens:
+        cache.put_many({key_of[text]: tokens for text, tokens in new_tokens.items()})
+    return [tokens_of[text] for text in texts]
+
+
+def ngrams(tokens, ngram_range=TFIDF_NGRAM_RANGE):
+    """Các n-gram (nối bằng khoảng trắng như sklearn) của một dãy token."""
+    low, high = ngram_range
+    terms = []
+    for n in range(low, high + 1):
+        terms.extend(tokens if n == 1 else [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)])
+    return terms
+
+
+def product_documents(df, name_weight=NAME_WEIGHT, ngram_range=TFIDF_NGRAM_RANGE, cache_path=TOKEN_CACHE_FILE,
+                      n_jobs=None, stop_words=None, retain_cache=False):
+    """Document (list term) cho từng dòng df: n-gram của tên lặp name_weight lần + n-gram của phần còn lại.
+    retain_cache: dọn các mục cache không còn dùng (dùng khi df là toàn bộ catalog)."""
+    fields = [product_fields(row) for row in df.to_dict('records')]
+    texts = [name for name, _ in fields] + [rest for _, rest in fields]
+    cache = TokenCache(cache_path) if cache_path else None
+    try:
+        tokens = tokenize_texts(texts, stop_words=stop_words, cache=cache, n_jobs=n_jobs)
+        if cache is not None and retain_cache:
+            signature = tokenizer_signature(stop_words)
+            cache.retain(text_key(signature, text) for text in set(texts))
+    finally:
+        if cache is not None:
+            cache.close()
+    n_docs = len(fields)
+    return [ngrams(tokens[i], ngram_range) * name_weight + ngrams(tokens[n_docs + i], ngram_range) for i in range(n_docs)]
+
+
+def analyze_document(document):
+    """Analyzer cho TfidfVectorizer: document đã là list term (hàm cấp module để vectorizer pickle được)."""
+    return document
+
+
+def make_vectorizer(min_df=TFIDF_MIN_DF, max_df=TFIDF_MAX_DF, max_features=TFIDF_MAX_FEATURES,
+                    sublinear_tf=TFIDF_SUBLINEAR_TF, norm=TFIDF_NORM):
+    return TfidfVectorizer(
+        analyzer=analyze_document,
+        min_df=min_df,
+        max_df=max_df,
+        max_features=max_features,
+        sublinear_tf=sublinear_tf,
+        norm=norm
+    )
@@ -0,0 +1,429 @@
+# scripts/neighbor_index.py
+# Chỉ mục hàng xóm thưa (top-K neighbours) thay cho ma trận cosine dày N×N.
+# Mỗi sản phẩm chỉ giữ K sản phẩm giống nhất (kể cả chính nó) và điểm tương ứng,
+# lưu dạng CSR (indptr / indices / scores) trong các file .npy để có thể memory-map.
+#
+# Dùng:
+#   python neighbor_index.py build --from-dense cosine_similarity_matrix_v2_adv.npy
+#   python neighbor_index.py build --from-tfidf tfidf_matrix_v2_adv.npz --top_k 100 --quantize
+#   python neighbor_index.py parity --dense cosine_similarity_matrix_v2_adv.npy --tfidf tfidf_matrix_v2_adv.npz
+#
+# parity thoát với mã 1 nếu top-N lệch khỏi ma trận dày quá ngưỡng PARITY_THRESHOLDS: gợi ý theo sản phẩm đo trên
+# chỉ mục, hồ sơ user đo trên đúng nguồn điểm recommender_cli.py dùng. Hồ sơ user cộng nhiều hàng nên top-K bị cắt
+# không đạt ngưỡng (catalog thật: ~1660 / 1849 ô khác 0 mỗi hàng); recommender_cli.py chấm điểm hồ sơ user bằng
+# TfidfSimilarity: cosine chính xác tính từ ma trận TF-IDF thưa, không cần ma trận N×N.
+import os
+import sys
+import json
+import argparse
+import pathlib
+import numpy as np
+try:
+    import scipy.sparse as sp # Cần cho TfidfSimilarity và NeighborIndex.to_csr
+except ImportError:
+    sp = None
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+NEIGHBOR_INDEX_DIR = ARTIFACTS_DIR / 'neighbors_v2_adv'
+
+DEFAULT_TOP_K = 100
+DEFAULT_CHUNK_SIZE = 512
+# Ngưỡng tối thiểu của parity_check (tỉ lệ trùng top-N với ma trận dày)
+PARITY_THRESHOLDS = {"product_overlap_mean": 0.95, "user_overlap_mean": 0.95, "user_overlap_min": 0.7}
+QUANTIZED_MAX = 255 # uint8: điểm cosine (0..1) được lưu thành 0..255
+
+META_FILE = 'meta.json'
+INDPTR_FILE = 'indptr.npy'
+INDICES_FILE = 'indices.npy'
+SCORES_FILE = 'scores.npy'
+# TfidfSimilarity: ma trận TF-IDF dạng CSR (cùng tên file với vec_*.npy của ann_index.py)
+VEC_DATA_FILE = 'vec_data.npy'
+VEC_INDICES_FILE = 'vec_indices.npy'
+VEC_INDPTR_FILE = 'vec_indptr.npy'
+
+
+class NeighborIndex:
+    """Top-K hàng xóm của mỗi sản phẩm dạng CSR; hàng i = các cột indices[indptr[i]:indptr[i+1]]."""
+
+    def __init__(self, indptr, indices, scores, n_items, top_k, score_scale=1.0):
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self.n_items = int(n_items)
+        self.top_k = int(top_k)
+        self.score_scale = float(score_scale) # != 1.0 khi scores được lượng tử hóa
+        self._csr = None # to_csr(), dựng lần đầu cần
+
+    @property
+    def shape(self):
+        return (self.n_items, self.n_items)
+
+    def row(self, idx):
+        """Trả về (indices, scores float32) của hàng idx, đã sắp xếp giảm dần theo điểm."""
+        start, end = self.indptr[idx], self.indptr[idx + 1]
+        scores = self.scores[start:end]
+        if self.score_scale != 1.0:
+            scores = scores.astype(np.float32) * np.float32(self.score_scale)
+        return self.indices[start:end], np.asarray(scores, dtype=np.float32)
+
+    def row_dense(self, idx):
+        out = np.zeros(self.n_items, dtype=np.float32)
+        cols, scores = self.row(idx)
+        out[cols] = scores
+        return out
+
+    def add_row_to(self, idx, out):
+        """Cộng hàng idx vào vector dày out (tương đương out += dense_matrix[idx])."""
+        cols, scores = self.row(idx)
+        out[cols] += scores # cols trong một hàng không trùng nhau nên += an toàn
+
+    def to_csr(self):
+        """scipy CSR float32 dùng chung indptr / indices (không copy; điểm lượng tử hóa được giải về float32)."""
+        if self._csr is None:
+            data = self.scores if self.score_scale == 1.0 else self.scores.astype(np.float32) * np.float32(self.score_scale)
+            self._csr = sp.csr_matrix((data, self.indices, self.indptr), shape=self.shape)
+        return self._csr
+
+    def scores_for(self, user_item):
+        """user_item (scipy sparse users×items) @ ma trận top-K -> mảng float32 users×items."""
+        return (user_item @ self.to_csr()).toarray().astype(np.float32, copy=False)
+
+    def preload(self):
+        """Dựng trước phần lazy (gọi trước khi fork worker để các worker dùng chung)."""
+        if sp is not None:
+            self.to_csr()
+        return self
+
+    def neighbors(self, idx, top_n=None, exclude_self=True):
+        """Danh sách (indices, scores) hàng xóm của idx, bỏ chính nó nếu exclude_self."""
+        cols, scores = self.row(idx)
+        if exclude_self:
+            keep = cols != idx
+            cols, scores = cols[keep], scores[keep]
+        if top_n is not None:
+            cols, scores = cols[:top_n], scores[:top_n]
+        return cols, scores
+
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / INDPTR_FILE, np.asarray(self.indptr, dtype=np.int64))
+        np.save(directory / INDICES_FILE, np.asarray(self.indices, dtype=np.int32))
+        np.save(directory / SCORES_FILE, np.asarray(self.scores))
+        meta = {
+            "n_items": self.n_items, "top_k": self.top_k, "nnz": int(len(self.indices)),
+            "score_dtype": str(np.asarray(self.scores).dtype), "score_scale": self.score_scale,
+        }
+        with open(directory / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        meta_path = directory / META_FILE
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Neighbor index not found: {directory}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            np.load(directory / INDPTR_FILE, mmap_mode=mmap_mode),
+            np.load(directory / INDICES_FILE, mmap_mode=mmap_mode),
+            np.load(directory / SCORES_FILE, mmap_mode=mmap_mode),
+            n_items=meta["n_items"], top_k=meta["top_k"], score_scale=meta.get("score_scale", 1.0),
+        )
+
+
+class TfidfSimilarity:
+    """Cosine chính xác giữa các sản phẩm từ ma trận TF-IDF thưa V (hàng đã chuẩn hóa L2): S = V @ V.T.
+    Cùng điểm với ma trận cosine dày nhưng chỉ lưu V; hồ sơ của nhiều user = (U @ V) @ V.T. Cùng giao diện
+    row / add_row_to / neighbors / scores_for với NeighborIndex."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors # scipy CSR float32 [n_items, dim]
+        self.n_items = int(vectors.shape[0])
+        self.top_k = self.n_items # Không cắt hàng xóm (báo trong parity_check)
+        self._vectors_t = None # V.T dạng CSR, dựng lần đầu cần
+
+    @property
+    def shape(self):
+        return (self.n_items, self.n_items)
+
+    def vectors_t(self):
+        if self._vectors_t is None:
+            self._vectors_t = self.vectors.T.tocsr()
+        return self._vectors_t
+
+    def row(self, idx):
+        """(indices, scores float32) các ô khác 0 của hàng idx, không sắp xếp."""
+        row = (self.vectors[idx] @ self.vectors_t()).tocsr()
+        return row.indices, np.asarray(row.data, dtype=np.float32)
+
+    def row_dense(self, idx):
+        out = np.zeros(self.n_items, dtype=np.float32)
+        cols, scores = self.row(idx)
+        out[cols] = scores
+        return out
+
+    def add_row_to(self, idx, out):
+        cols, scores = self.row(idx)
+        out[cols] += scores
+
+    def neighbors(self, idx, top_n=None, exclude_self=True):
+        """Như NeighborIndex.neighbors nhưng trên cả hàng (giảm dần theo điểm, đồng điểm thì theo chỉ số)."""
+        cols, scores = self.row(idx)
+        keep = scores > 0
+        if exclude_self:
+            keep &= cols != idx
+        cols, scores = cols[keep], scores[keep]
+        order = np.lexsort((cols, -scores))[:top_n]
+        return cols[order], scores[order]
+
+    def scores_for(self, user_item):
+        """user_item (scipy sparse users×items) @ S -> mảng float32 users×items, không tạo ma trận items×items.
+        Hồ sơ U @ V (users×dim) được chuyển sang mảng dày: nhân dày × thưa nhanh hơn nhiều so với thưa × thưa
+        khi kết quả gần như dày."""
+        profiles = (user_item @ self.vectors).toarray()
+        return np.asarray(profiles @ self.vectors_t(), dtype=np.float32)
+
+    def preload(self):
+        self.vectors_t()
+        return self
+
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / VEC_DATA_FILE, np.asarray(self.vectors.data, dtype=np.float32))
+        np.save(directory / VEC_INDICES_FILE, np.asarray(self.vectors.indices, dtype=np.int32))
+        np.save(directory / VEC_INDPTR_FILE, np.asarray(self.vectors.indptr, dtype=np.int64))
+        meta = {"n_items": self.n_items, "dim": int(self.vectors.shape[1]), "nnz": int(self.vectors.nnz)}
+        with open(directory / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        meta_path = directory / META_FILE
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"TF-IDF similarity not found: {directory}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        return cls(sp.csr_matrix((np.load(directory / VEC_DATA_FILE, mmap_mode=mmap_mode),
+                                  np.load(directory / VEC_INDICES_FILE, mmap_mode=mmap_mode),
+                                  np.load(directory / VEC_INDPTR_FILE, mmap_mode=mmap_mode)),
+                                 shape=(meta["n_items"], meta["dim"]), copy=False))
+
+    @classmethod
+    def from_npz(cls, path):
+        """Từ tfidf_matrix_v2_adv.npz của build_model.py (scipy.sparse.save_npz)."""
+        return cls(sp.load_npz(path).tocsr().astype(np.float32))
+
+
+def quantize_scores(scores):
+    """Điểm cosine float (0..1) -> uint8 (0..255), dùng với score_scale = 1 / QUANTIZED_MAX."""
+    return np.clip(np.rint(np.asarray(scores) * QUANTIZED_MAX), 0, QUANTIZED_MAX).astype(np.uint8)
+
+
+def _topk_of_block(block, top_k):
+    """Với mỗi hàng của block dày, trả về (indices, scores) top_k sắp xếp giảm dần."""
+    n_cols = block.shape[1]
+    k = min(top_k, n_cols)
+    if k < n_cols:
+        part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(n_cols), (block.shape[0], 1))
+    part_scores = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def _build_from_blocks(n_items, block_iter, top_k, quantize, min_score):
+    all_indices, all_scores, counts = [], [], []
+    for block in block_iter:
+        block_idx, block_scores = _topk_of_block(np.asarray(block, dtype=np.float32), top_k)
+        for cols, scores in zip(block_idx, block_scores):
+            keep = scores > min_score # Bỏ các hàng xóm điểm 0 (không có từ chung)
+            all_indices.append(cols[keep].astype(np.int32))
+            all_scores.append(scores[keep].astype(np.float32))
+            counts.append(int(keep.sum()))
+
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.concatenate(all_indices) if all_indices else np.zeros(0, dtype=np.int32)
+    scores = np.concatenate(all_scores) if all_scores else np.zeros(0, dtype=np.float32)
+
+    score_scale = 1.0
+    if quantize:
+        scores = quantize_scores(scores)
+        score_scale = 1.0 / QUANTIZED_MAX
+    return NeighborIndex(indptr, indices, scores, n_items, top_k, score_scale=score_scale)
+
+
+def build_from_tfidf(tfidf_matrix, top_k=DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE, quantize=False, min_score=0.0):
+    """Xây chỉ mục từ ma trận TF-IDF (scipy sparse, đã chuẩn hóa L2) theo từng khối hàng, không tạo ma trận N×N."""
+    n_items = tfidf_matrix.shape[0]
+    tfidf_t = tfidf_matrix.T.tocsr() if hasattr(tfidf_matrix, 'tocsr') else tfidf_matrix.T
+
+    def blocks():
+        for start in range(0, n_items, chunk_size):
+            block = tfidf_matrix[start:start + chunk_size] @ tfidf_t
+            yield block.toarray() if hasattr(block, 'toarray') else block
+
+    return _build_from_blocks(n_items, blocks(), top_k, quantize, min_score)
+
+
+def build_from_dense(cosine_matrix, top_k=DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE, quantize=False, min_score=0.0):
+    """Xây chỉ mục từ ma trận cosine dày có sẵn (chuyển đổi artifact cũ)."""
+    n_items = cosine_matrix.shape[0]
+    blocks = (cosine_matrix[start:start + chunk_size] for start in range(0, n_items, chunk_size))
+    return _build_from_blocks(n_items, blocks, top_k, quantize, min_score)
+
+
+def parity_check(reference, index, top_n=10, n_samples=200, basket_size=3, seed=42, thresholds=PARITY_THRESHOLDS,
+                 user_scorer=None):
+    """So sánh top-N với điểm chính xác của reference (ma trận cosine dày hoặc TfidfSimilarity): theo sản phẩm
+    trên chỉ mục index, theo hồ sơ user ngẫu nhiên trên user_scorer (mặc định index; recommender_cli.py dùng
+    TfidfSimilarity khi có). "passed" là False nếu một chỉ số trong thresholds thấp hơn ngưỡng (liệt kê trong "failed")."""
+    user_scorer = index if user_scorer is None else user_scorer
+    if hasattr(reference, 'row_dense'):
+        reference_row = reference.row_dense
+    else:
+        reference_row = lambda idx: np.asarray(reference[idx], dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    n_items = reference.shape[0]
+    sample = rng.choice(n_items, size=min(n_samples, n_items), replace=False)
+
+    product_overlaps = []
+    for idx in sample:
+        dense_row = reference_row(idx).copy()
+        dense_row[idx] = -np.inf
+        dense_top = set(np.argsort(-dense_row, kind='stable')[:top_n].tolist())
+        sparse_top = set(index.neighbors(idx, top_n=top_n)[0].tolist())
+        product_overlaps.append(len(dense_top & sparse_top) / max(len(dense_top), 1))
+
+    user_overlaps, user_score_ratios = [], []
+    for _ in range(len(sample)):
+        basket = rng.choice(n_items, size=min(basket_size, n_items), replace=False)
+        dense_profile = np.sum([reference_row(idx) for idx in basket], axis=0, dtype=np.float32)
+        sparse_profile = np.zeros(n_items, dtype=np.float32)
+        for idx in basket:
+            user_scorer.add_row_to(idx, sparse_profile)
+        dense_profile[basket] = -np.inf
+        sparse_profile[basket] = -np.inf
+        dense_top = np.argsort(-dense_profile, kind='stable')[:top_n]
+        sparse_top = np.argsort(-sparse_profile, kind='stable')[:top_n]
+        user_overlaps.append(len(set(dense_top.tolist()) & set(sparse_top.tolist())) / max(len(dense_top), 1))
+        # Tỉ lệ tổng điểm (theo ma trận dày) của top-N thưa so với top-N dày: ít nhạy với các điểm gần bằng nhau
+        dense_best = float(dense_profile[dense_top].sum())
+        user_score_ratios.append(float(dense_profile[sparse_top].sum()) / dense_best if dense_best > 0 else 1.0)
+
+    report = {
+        "top_n": top_n, "samples": int(len(sample)), "top_k": index.top_k, "user_scorer": type(user_scorer).__name__,
+        "product_overlap_mean": float(np.mean(product_overlaps)),
+        "product_overlap_min": float(np.min(product_overlaps)),
+        "user_overlap_mean": float(np.mean(user_overlaps)),
+        "user_overlap_min": float(np.min(user_overlaps)),
+        "user_score_ratio_mean": float(np.mean(user_score_ratios)),
+    }
+    failed = [name for name, minimum in (thresholds or {}).items() if report[name] < minimum]
+    report.update(thresholds=dict(thresholds or {}), failed=failed, passed=not failed)
+    return report
+
+
+def splice_csr_rows(indptr, arrays, source_rows, new_rows):
+    """Dựng CSR mới mà không lặp qua từng phần tử: hàng i copy hàng source_rows[i] của CSR cũ (indptr, arrays),
+    hoặc lấy new_rows[i] (tuple mảng cùng thứ tự với arrays) nếu source_rows[i] < 0.
+    Trả về (indptr mới, list mảng mới)."""
+    source_rows = np.asarray(source_rows, dtype=np.int64)
+    n_rows = len(source_rows)
+    copied = source_rows >= 0
+    old_lengths = np.diff(np.asarray(indptr, dtype=np.int64))
+    lengths = np.zeros(n_rows, dtype=np.int64)
+    lengths[copied] = old_lengths[source_rows[copied]]
+    for row, parts in new_rows.items():
+        lengths[row] = len(parts[0])
+
+    out_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(lengths, out=out_indptr[1:])
+    nnz = int(out_indptr[-1])
+    outs = [np.empty(nnz, dtype=np.asarray(arr).dtype) for arr in arrays]
+
+    # Vị trí nguồn của mọi phần tử trong các hàng copy: start cũ của hàng + thứ tự trong hàng
+    copy_lengths = np.where(copied, lengths, 0)
+    entry_rows = np.repeat(np.arange(n_rows), copy_lengths)
+    within = np.arange(len(entry_rows)) - np.repeat(np.cumsum(copy_lengths) - copy_lengths, copy_lengths)
+    dest = out_indptr[entry_rows] + within
+    src = np.asarray(indptr, dtype=np.int64)[source_rows[entry_rows]] + within
+    for out, arr in zip(outs, arrays):
+        out[dest] = np.asarray(arr)[src]
+    for row, parts in new_rows.items():
+        start, end = out_indptr[row], out_indptr[row + 1]
+        for out, part in zip(outs, parts):
+            out[start:end] = part
+    return out_indptr, outs
+
+
+def precompute_from_index(index, idx_to_id, top_n=30):
+    """Sinh dict {"product_id": [rec_id, ...]} như precomputed_recommendations_v2_raw_adv.json từ chỉ mục."""
+    precomputed = {}
+    for idx in range(index.n_items):
+        pid = idx_to_id.get(idx)
+        if pid is None:
+            continue
+        cols, _ = index.neighbors(idx, top_n=top_n)
+        precomputed[str(pid)] = [idx_to_id[c] for c in cols.tolist() if c in idx_to_id]
+    return precomputed
+
+
+def _load_dense(path):
+    return np.load(path, mmap_mode='r')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build / check the sparse top-K neighbour index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="Build neighbour index from TF-IDF (.npz) or dense cosine (.npy)")
+    source = parser_build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-tfidf", type=str, help="scipy.sparse .npz TF-IDF matrix (rows theo product_indices_map)")
+    source.add_argument("--from-dense", type=str, help="Dense cosine similarity .npy")
+    parser_build.add_argument("--top_k", type=int, default=DEFAULT_TOP_K)
+    parser_build.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser_build.add_argument("--quantize", action="store_true", help="Lưu điểm dạng uint8 thay vì float32")
+    parser_build.add_argument("--out", type=str, default=str(NEIGHBOR_INDEX_DIR))
+
+    parser_parity = subparsers.add_parser("parity", help="Compare top-N against exact cosine scores")
+    parser_parity.add_argument("--dense", type=str, help="Ma trận cosine dày làm chuẩn (mặc định: tính từ --tfidf)")
+    parser_parity.add_argument("--tfidf", type=str, help="Ma trận TF-IDF .npz: chấm điểm hồ sơ user như recommender_cli.py")
+    parser_parity.add_argument("--index", type=str, default=str(NEIGHBOR_INDEX_DIR))
+    parser_parity.add_argument("--top_n", type=int, default=10)
+    parser_parity.add_argument("--samples", type=int, default=200)
+    for name, minimum in PARITY_THRESHOLDS.items():
+        parser_parity.add_argument(f"--min_{name}", type=float, default=minimum, help=f"Ngưỡng tối thiểu của {name}")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.from_tfidf:
+            import scipy.sparse
+            index = build_from_tfidf(scipy.sparse.load_npz(args.from_tfidf).tocsr(), top_k=args.top_k,
+                                     chunk_size=args.chunk_size, quantize=args.quantize)
+        else:
+            index = build_from_dense(_load_dense(args.from_dense), top_k=args.top_k,
+                                     chunk_size=args.chunk_size, quantize=args.quantize)
+        index.save(args.out)
+        print(f"Saved neighbour index ({index.n_items} items, nnz={len(index.indices)}) to {args.out}", file=sys.stderr)
+    elif args.command == "parity":
+        thresholds = {name: getattr(args, f"min_{name}") for name in PARITY_THRESHOLDS}
+        if not args.dense and not args.tfidf:
+            parser.error("parity needs --dense and/or --tfidf")
+        tfidf = TfidfSimilarity.from_npz(args.tfidf) if args.tfidf else None
+        reference = _load_dense(args.dense) if args.dense else tfidf
+        report = parity_check(reference, NeighborIndex.load(args.index), top_n=args.top_n, n_samples=args.samples,
+                              thresholds=thresholds, user_scorer=tfidf)
+        print(json.dumps(report, indent=2))
+        if not report["passed"]:
+            print(f"Parity check failed (top_k={report['top_k']}): {', '.join(report['failed'])} below threshold.", file=sys.stderr)
+            sys.exit(1)
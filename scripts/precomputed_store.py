@@ -0,0 +1,275 @@
+# scripts/precomputed_store.py
+# Định dạng nhị phân cho gợi ý tiền tính toán (thay cho việc json.load cả file
+# precomputed_recommendations_v2_raw_adv.json ở mỗi lần gọi).
+#
+#   product_ids.npy  int64  [N]    product_id đã sắp xếp tăng dần (tra cứu bằng searchsorted, O(log N))
+#   offsets.npy      int64  [N+1]  gợi ý của product_ids[i] nằm ở neighbors[offsets[i]:offsets[i+1]]
+#   neighbors.npy    int32  [nnz]  product_id được gợi ý, theo thứ tự giảm dần độ tương đồng
+#   scores.npy       float32[nnz]  (tùy chọn) điểm tương đồng tương ứng
+#   meta.json        kèm "source": kích thước / mtime / sha256 của file JSON lúc ghi store. JSON đổi sau đó
+#                    (notebook, sửa tay) thì store bị coi là cũ và load_precomputed_recs đọc JSON thay vì store.
+#
+# Dùng:
+#   python precomputed_store.py convert                       # từ file JSON mặc định
+#   python precomputed_store.py convert --json other.json --out other_dir
+import os
+import sys
+import json
+import hashlib
+import argparse
+import pathlib
+import threading
+import numpy as np
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+PRECOMPUTED_RECS_JSON_FILE = ARTIFACTS_DIR / 'precomputed_recommendations_v2_raw_adv.json'
+PRECOMPUTED_RECS_DIR = ARTIFACTS_DIR / 'precomputed_recs_v2_adv'
+
+META_FILE = 'meta.json'
+PRODUCT_IDS_FILE = 'product_ids.npy'
+OFFSETS_FILE = 'offsets.npy'
+NEIGHBORS_FILE = 'neighbors.npy'
+SCORES_FILE = 'scores.npy'
+
+
+def _to_int_id(value):
+    try: return int(value)
+    except (ValueError, TypeError, OverflowError): return None
+
+
+def _sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path):
+    """Dấu vết của file JSON nguồn, lưu trong meta.json của store."""
+    stat = os.stat(path)
+    return {"file": pathlib.Path(path).name, "bytes": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _sha256(path)}
+
+
+def _matches_source(source, path):
+    """File path còn đúng là nguồn đã ghi trong meta: cùng kích thước và (cùng mtime hoặc cùng sha256)."""
+    if not source:
+        return False
+    stat = os.stat(path)
+    if stat.st_size != source.get("bytes"):
+        return False
+    return stat.st_mtime_ns == source.get("mtime_ns") or _sha256(path) == source.get("sha256")
+
+
+def read_meta(directory):
+    with open(pathlib.Path(directory) / META_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def store_is_current(store_dir, json_path):
+    """Store nhị phân tồn tại và khớp file JSON (không có JSON thì store là nguồn duy nhất).
+    Store không ghi nguồn (convert từ phiên bản cũ) thì không kiểm tra được: coi như cũ."""
+    if not os.path.exists(pathlib.Path(store_dir) / META_FILE):
+        return False
+    if json_path is None or not os.path.exists(json_path):
+        return True
+    return _matches_source(read_meta(store_dir).get("source"), json_path)
+
+
+class PrecomputedRecs:
+    """Gợi ý tiền tính toán dạng mảng (memory-map được), tra cứu theo product_id."""
+
+    def __init__(self, product_ids, offsets, neighbors, scores=None):
+        self.product_ids = product_ids
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def _position(self, product_id):
+        pid = _to_int_id(product_id)
+        if pid is None or len(self.product_ids) == 0:
+            return None
+        pos = int(np.searchsorted(self.product_ids, pid))
+        if pos < len(self.product_ids) and self.product_ids[pos] == pid:
+            return pos
+        return None
+
+    def __contains__(self, product_id):
+        return self._position(product_id) is not None
+
+    def get(self, product_id, top_n=None):
+        """List product_id (int) được gợi ý, hoặc None nếu product_id không có trong store."""
+        pos = self._position(product_id)
+        if pos is None:
+            return None
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        if top_n is not None:
+            end = min(end, start + top_n)
+        return self.neighbors[start:end].tolist()
+
+    def get_with_scores(self, product_id, top_n=None):
+        """Như get() nhưng trả về list (product_id, score); score là None nếu store không lưu điểm."""
+        pos = self._position(product_id)
+        if pos is None:
+            return None
+        start, end = int(self.offsets[pos]), int(self.offsets[pos + 1])
+        if top_n is not None:
+            end = min(end, start + top_n)
+        ids = self.neighbors[start:end].tolist()
+        if self.scores is None:
+            return [(pid, None) for pid in ids]
+        return list(zip(ids, self.scores[start:end].tolist()))
+
+    def save(self, directory, source_path=None):
+        """source_path: file JSON cùng nội dung với store (ghi dấu vết vào meta để phát hiện store cũ)."""
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / PRODUCT_IDS_FILE, np.asarray(self.product_ids, dtype=np.int64))
+        np.save(directory / OFFSETS_FILE, np.asarray(self.offsets, dtype=np.int64))
+        np.save(directory / NEIGHBORS_FILE, np.asarray(self.neighbors, dtype=np.int32))
+        if self.scores is not None:
+            np.save(directory / SCORES_FILE, np.asarray(self.scores, dtype=np.float32))
+        elif os.path.exists(directory / SCORES_FILE):
+            os.remove(directory / SCORES_FILE)
+        meta = {"n_products": int(len(self.product_ids)), "nnz": int(len(self.neighbors)), "has_scores": self.scores is not None}
+        if source_path is not None:
+            meta["source"] = source_fingerprint(source_path)
+        with open(directory / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        if not os.path.exists(directory / META_FILE):
+            raise FileNotFoundError(f"Precomputed recommendations store not found: {directory}")
+        mmap_mode = 'r' if mmap else None
+        scores = None
+        if os.path.exists(directory / SCORES_FILE):
+            scores = np.load(directory / SCORES_FILE, mmap_mode=mmap_mode)
+        return cls(
+            np.load(directory / PRODUCT_IDS_FILE, mmap_mode=mmap_mode),
+            np.load(directory / OFFSETS_FILE, mmap_mode=mmap_mode),
+            np.load(directory / NEIGHBORS_FILE, mmap_mode=mmap_mode),
+            scores,
+        )
+
+    @classmethod
+    def from_dict(cls, recs_dict, scores_dict=None):
+        """Tạo store từ dict {"product_id": [rec_id, ...]} (định dạng JSON cũ)."""
+        rows = []
+        for key, rec_ids in recs_dict.items():
+            pid = _to_int_id(key)
+            if pid is None:
+                continue
+            ids = [i for i in (_to_int_id(r) for r in (rec_ids or [])) if i is not None]
+            row_scores = None
+            if scores_dict is not None:
+                row_scores = list(scores_dict.get(key, []))[:len(ids)]
+                row_scores += [0.0] * (len(ids) - len(row_scores))
+            rows.append((pid, ids, row_scores))
+        rows.sort(key=lambda r: r[0])
+
+        product_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(r[1]) for r in rows], out=offsets[1:])
+        neighbors = np.array([i for r in rows for i in r[1]], dtype=np.int32)
+        scores = None
+        if scores_dict is not None:
+            scores = np.array([s for r in rows for s in r[2]], dtype=np.float32)
+        return cls(product_ids, offsets, neighbors, scores)
+
+
+def build_from_neighbor_index(index, idx_to_id, top_n=30):
+    """Tạo store (kèm điểm) trực tiếp từ NeighborIndex; idx_to_id: {matrix_idx: product_id}."""
+    recs_dict, scores_dict = {}, {}
+    for idx in range(index.n_items):
+        pid = idx_to_id.get(idx)
+        if pid is None:
+            continue
+        cols, scores = index.neighbors(idx, top_n=top_n)
+        pairs = [(idx_to_id[c], s) for c, s in zip(cols.tolist(), scores.tolist()) if c in idx_to_id]
+        recs_dict[str(pid)] = [p for p, _ in pairs]
+        scores_dict[str(pid)] = [s for _, s in pairs]
+    return PrecomputedRecs.from_dict(recs_dict, scores_dict)
+
+
+class JsonPrecomputedRecs:
+    """Fallback: đọc file JSON cũ, nhưng chỉ parse một lần cho cả process."""
+
+    def __init__(self, recs_dict):
+        self._recs = recs_dict
+
+    def __len__(self):
+        return len(self._recs)
+
+    def __contains__(self, product_id):
+        return str(product_id) in self._recs
+
+    def get(self, product_id, top_n=None):
+        rec_ids = self._recs.get(str(product_id))
+        if rec_ids is None:
+            return None
+        ids = [i for i in (_to_int_id(r) for r in rec_ids) if i is not None]
+        return ids[:top_n] if top_n is not None else ids
+
+    def get_with_scores(self, product_id, top_n=None):
+        ids = self.get(product_id, top_n)
+        return None if ids is None else [(pid, None) for pid in ids]
+
+    @classmethod
+    def load(cls, json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+_JSON_CACHE = {}
+_JSON_CACHE_LOCK = threading.Lock()
+
+def load_precomputed_recs(store_dir=PRECOMPUTED_RECS_DIR, json_path=PRECOMPUTED_RECS_JSON_FILE):
+    """Ưu tiên store nhị phân (mmap) nếu còn khớp JSON; chưa convert hoặc store cũ hơn JSON thì dùng JSON
+    (cache theo đường dẫn + kích thước + mtime). None nếu không có gì."""
+    if store_is_current(store_dir, json_path):
+        return PrecomputedRecs.load(store_dir, mmap=True)
+    if os.path.exists(json_path):
+        if os.path.exists(pathlib.Path(store_dir) / META_FILE):
+            print(f"Warning: Precomputed store {store_dir} does not match {json_path}; reading the JSON instead "
+                  f"(re-run: python precomputed_store.py convert).", file=sys.stderr)
+        stat = os.stat(json_path)
+        key = (str(json_path), stat.st_size, stat.st_mtime_ns)
+        with _JSON_CACHE_LOCK:
+            if key not in _JSON_CACHE:
+                _JSON_CACHE[key] = JsonPrecomputedRecs.load(json_path)
+            return _JSON_CACHE[key]
+    return None
+
+
+def convert_json(json_path=PRECOMPUTED_RECS_JSON_FILE, out_dir=PRECOMPUTED_RECS_DIR):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        recs_dict = json.load(f)
+    store = PrecomputedRecs.from_dict(recs_dict)
+    store.save(out_dir, source_path=json_path)
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precomputed recommendations binary store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_convert = subparsers.add_parser("convert", help="Convert precomputed JSON to the binary store")
+    parser_convert.add_argument("--json", type=str, default=str(PRECOMPUTED_RECS_JSON_FILE))
+    parser_convert.add_argument("--out", type=str, default=str(PRECOMPUTED_RECS_DIR))
+
+    parser_get = subparsers.add_parser("get", help="Look up one product (debug)")
+    parser_get.add_argument("--product_id", type=str, required=True)
+    parser_get.add_argument("--store", type=str, default=str(PRECOMPUTED_RECS_DIR))
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        store = convert_json(args.json, args.out)
+        print(f"Saved {len(store)} products ({len(store.neighbors)} recommendations) to {args.out}", file=sys.stderr)
+    elif args.command == "get":
+        print(json.dumps(PrecomputedRecs.load(args.store).get(args.product_id)))
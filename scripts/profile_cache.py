@@ -0,0 +1,73 @@
+# scripts/profile_cache.py
+# Cache LRU có giới hạn cho hồ sơ user (tổng các hàng tương đồng + số sản phẩm đã tương tác),
+# để request cá nhân hóa chỉ phải cộng thêm các sản phẩm mới thay vì tính lại toàn bộ lịch sử.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024 # Tổng dung lượng tối đa của các vector tổng
+
+
+class UserProfile:
+    """Bộ cộng dồn hồ sơ của một user: sum_vector / count là vector điểm trung bình."""
+    __slots__ = ("sum_vector", "count", "item_idxs")
+
+    def __init__(self, n_items):
+        self.sum_vector = np.zeros(n_items, dtype=np.float32)
+        self.count = 0
+        self.item_idxs = set()
+
+    def copy(self):
+        # Hồ sơ trong cache không bị sửa tại chỗ (nhiều thread có thể đang đọc), luôn cập nhật trên bản sao
+        clone = UserProfile.__new__(UserProfile)
+        clone.sum_vector = self.sum_vector.copy()
+        clone.count = self.count
+        clone.item_idxs = set(self.item_idxs)
+        return clone
+
+    def profile_vector(self):
+        return self.sum_vector / self.count if self.count else self.sum_vector
+
+
+class UserProfileCache:
+    """LRU theo user_id; số phần tử tối đa suy ra từ max_bytes và kích thước vector (n_items)."""
+
+    def __init__(self, n_items, max_bytes=DEFAULT_MAX_BYTES):
+        self.n_items = int(n_items)
+        self.capacity = max(1, int(max_bytes) // max(self.n_items * 4, 1))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        with self._lock:
+            profile = self._entries.get(user_id)
+            if profile is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return profile
+
+    def put(self, user_id, profile):
+        with self._lock:
+            self._entries[user_id] = profile
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Xóa hồ sơ của một user (hoặc toàn bộ cache nếu user_id là None)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                return True
+            return self._entries.pop(user_id, None) is not None
+
+    def stats(self):
+        return {"entries": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
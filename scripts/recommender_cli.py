@@ -8,6 +8,27 @@ import pandas as pd
 import numpy as np
 import pickle
 import sys # Quan trọng để print ra stderr
+import time
+import threading
+try:
+    import scipy.sparse as sp # Tùy chọn: dùng cho chấm điểm batch bằng một phép nhân ma trận
+except ImportError:
+    sp = None
+from neighbor_index import NeighborIndex, TfidfSimilarity, NEIGHBOR_INDEX_DIR
+from precomputed_store import load_precomputed_recs, PRECOMPUTED_RECS_DIR
+from catalog_index import CatalogIndex, SOURCE_COLUMNS as CATALOG_SOURCE_COLUMNS
+from search_index import load_or_build as load_search_index, SEARCH_INDEX_DIR, DEFAULT_SUGGEST_LIMIT
+from record_store import ProductRecordStore, JSONFragment, safe_int_convert, safe_float_convert, dumps as dumps_json
+from profile_cache import UserProfile, UserProfileCache, DEFAULT_MAX_BYTES as PROFILE_CACHE_DEFAULT_MAX_BYTES
+from response_cache import ResponseCache, DEFAULT_MAX_ENTRIES as RESPONSE_CACHE_DEFAULT_MAX_ENTRIES
+from artifact_bundle import (ArtifactBundle, ProductDetails, ProductIdMap, MongoIdMap, BUNDLES_DIR as DEFAULT_BUNDLES_DIR, current_bundle_dir,
+                             SEARCH_DIR as BUNDLE_SEARCH_DIR, ANN_DIR as BUNDLE_ANN_DIR)
+from copurchase import CoPurchaseNeighbors, COPURCHASE_DIR as DEFAULT_COPURCHASE_DIR
+import request_metrics
+try:
+    from ann_index import IVFIndex, ANN_INDEX_DIR # Cần scipy
+except ImportError:
+    IVFIndex, ANN_INDEX_DIR = None, None
 
 # --- ĐỊNH NGHĨA ĐƯỜNG DẪN ---
 PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
@@ -17,325 +38,914 @@ PRODUCT_DATA_CSV_FILE = ARTIFACTS_DIR / 'buudien_ocop_products_detailed_v2_rerun
 PRODUCT_MAP_JSON_FILE = ARTIFACTS_DIR / 'product_id_name_map_v2_adv_enriched_with_mongo_id.json'
 PRECOMPUTED_PRODUCT_RECS_JSON_FILE = ARTIFACTS_DIR / 'precomputed_recommendations_v2_raw_adv.json'
 COSINE_SIM_MATRIX_FILE = ARTIFACTS_DIR / 'cosine_similarity_matrix_v2_adv.npy'
+TFIDF_MATRIX_FILE = ARTIFACTS_DIR / 'tfidf_matrix_v2_adv.npz'
 PRODUCT_INDICES_MAP_FILE = ARTIFACTS_DIR / 'product_indices_map_v2_adv.pkl'
 
 TOP_N_FINAL_RECS = 10
+# Dung lượng tối đa (byte) cho cache hồ sơ user trong chế độ serve
+PROFILE_CACHE_MAX_BYTES = int(os.environ.get('RECOMMENDER_PROFILE_CACHE_BYTES', PROFILE_CACHE_DEFAULT_MAX_BYTES))
+# Cache kết quả (response_cache.py) của get_recommendations / get_user_recommendations / get_products:
+# số mục tối đa (0 = tắt) và TTL tính bằng giây (0 = chỉ hết hạn khi đổi phiên bản artifact)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RECOMMENDER_RESPONSE_CACHE_SIZE', RESPONSE_CACHE_DEFAULT_MAX_ENTRIES))
+RESPONSE_CACHE_TTL = float(os.environ.get('RECOMMENDER_RESPONSE_CACHE_TTL', '0')) or None
+# Gợi ý theo user qua chỉ mục ANN (ann_index.py, IVF) thay vì cộng các hàng của chỉ mục hàng xóm (catalog rất lớn)
+USE_ANN_FOR_USER_RECS = os.environ.get('RECOMMENDER_USE_ANN', '0').lower() in ('1', 'true', 'yes')
+ANN_N_PROBE = int(os.environ.get('RECOMMENDER_ANN_N_PROBE', '0')) or None # 0: dùng n_probe lưu trong meta của chỉ mục
+# Chỉ mục mua chung (copurchase.py) trộn vào điểm gợi ý theo user: điểm = (1 - w) * content + w * mua chung.
+# 0 = tắt; không có thư mục chỉ mục thì chỉ dùng content. Không áp dụng cho đường ANN.
+COPURCHASE_DIR = pathlib.Path(os.environ.get('RECOMMENDER_COPURCHASE_DIR') or DEFAULT_COPURCHASE_DIR)
+COPURCHASE_WEIGHT = float(os.environ.get('RECOMMENDER_COPURCHASE_WEIGHT', '0.3'))
+# Bundle (artifact_bundle.py): thư mục chứa các phiên bản + con trỏ CURRENT
+BUNDLES_DIR = pathlib.Path(os.environ.get('RECOMMENDER_BUNDLES_DIR') or DEFAULT_BUNDLES_DIR)
+# Kiểm tra sha256 mọi file khi load (0: chỉ so kích thước, load nhanh hơn với catalog lớn)
+VERIFY_BUNDLE_CHECKSUMS = os.environ.get('RECOMMENDER_VERIFY_CHECKSUMS', '1').lower() in ('1', 'true', 'yes')
+# Chế độ serve: chu kỳ (giây) kiểm tra bundles/CURRENT để hot-swap; 0 = tắt (vẫn gọi được command reload_artifacts)
+BUNDLE_WATCH_INTERVAL = float(os.environ.get('RECOMMENDER_RELOAD_INTERVAL', '5'))
+LOOSE_FILES_VERSION = 'loose-files' # Phiên bản báo cáo khi chạy từ artifact rời (chưa publish bundle)
 
-# --- Biến toàn cục để cache các file đã load ---
-LOADED_PRODUCT_MAP = None
-LOADED_COSINE_SIM_MATRIX = None
-LOADED_PRODUCT_INDICES_MAP = None # Đây sẽ là Pandas Series
-LOADED_ALL_PRODUCTS_DF = None
-# Thêm biến global cho map ngược đã xử lý
-CACHED_ID_TO_IDX_MAP = None
-CACHED_IDX_TO_ID_MAP = None
+# --- Trạng thái artifact (một phiên bản mô hình) ---
+# Mọi thứ load từ artifact nằm trong MỘT đối tượng ArtifactState. Request lấy tham chiếu một lần qua
+# load_artifacts() rồi dùng nó đến hết, nên đổi sang bundle mới (hot-swap) chỉ là gán lại _STATE:
+# request đang chạy vẫn thấy trạng thái cũ nhất quán, request mới thấy trạng thái mới.
+class ArtifactState:
+    def __init__(self, version, product_map, all_products_df, id_map, neighbor_index=None, cosine_matrix=None,
+                 precomputed_recs=None, products_table=None, search_dir=SEARCH_INDEX_DIR, ann_dir=ANN_INDEX_DIR, source=None,
+                 records=None, mongo_id_map=None, copurchase_dir=COPURCHASE_DIR, tfidf_similarity=None):
+        self.version = version
+        self.source = source # Thư mục bundle (None: artifact rời)
+        self.load_seconds = None # Thời gian load phiên bản này (_load_state), báo qua command metrics
+        self.product_map = product_map # dict từ JSON hoặc ProductDetails (bundle)
+        self.all_products_df = all_products_df
+        self.products_table = products_table # ProductTable của bundle (None: artifact rời)
+        self.id_map = id_map # ProductIdMap: hàng ma trận <-> product_id
+        # MongoIdMap: _id MongoDB -> product_id (Node gửi thẳng ObjectId của đơn hàng, không cần tra bảng Product)
+        self.mongo_id_map = mongo_id_map if mongo_id_map is not None else MongoIdMap.from_product_map(product_map)
+        self.neighbor_index = neighbor_index # Top-K hàng xóm thưa (gợi ý theo sản phẩm)
+        self.cosine_matrix = cosine_matrix # Ma trận dày (mmap) của artifact cũ, nếu có
+        self.tfidf_similarity = tfidf_similarity # TfidfSimilarity: cosine chính xác từ ma trận TF-IDF thưa
+        # Nguồn điểm cho hồ sơ user (row / add_row_to / scores_for); None: cộng hàng của ma trận dày. Ưu tiên TF-IDF
+        # (chính xác, không N×N), rồi ma trận dày của artifact cũ; top-K của chỉ mục chỉ khi không có cả hai
+        # (lệch khỏi điểm chính xác, xem `neighbor_index.py parity`)
+        if tfidf_similarity is not None:
+            self.user_similarity = tfidf_similarity
+        else:
+            self.user_similarity = neighbor_index if cosine_matrix is None else None
+        self.precomputed_recs = precomputed_recs # PrecomputedRecs (mmap) hoặc JsonPrecomputedRecs (fallback)
+        self.search_dir = search_dir
+        self._search_index = None # SearchIndex (BM25), load lần đầu có truy vấn từ khóa
+        self._search_lock = threading.Lock()
+
+        similarity_source = self.similarity_source
+        self.n_items = similarity_source.shape[0] if similarity_source is not None else 0
+        # Bản ghi JSON dựng sẵn của mọi sản phẩm (record_store.py); hàng ma trận -> vị trí bản ghi (-1: không có)
+        self.records = records if records is not None else ProductRecordStore.build(product_map)
+        row_product_ids = np.full(self.n_items, -1, dtype=np.int64)
+        n_rows = min(self.n_items, id_map.n_rows)
+        row_product_ids[:n_rows] = id_map.row_product_ids[:n_rows]
+        self.row_record_positions = self.records.positions_of(row_product_ids)
+        # bool[n_items]: hàng có product_id và có bản ghi (được phép xuất hiện trong gợi ý)
+        self.valid_rec_mask = self.row_record_positions >= 0
+
+        # NeighborIndex mua chung theo hàng ma trận (đơn hàng dùng chung cho mọi phiên bản mô hình, không nằm trong bundle)
+        self.copurchase_index = None
+        self.copurchase_weight = COPURCHASE_WEIGHT
+        if COPURCHASE_WEIGHT > 0 and copurchase_dir is not None and os.path.exists(copurchase_dir) and self.n_items:
+            self.copurchase_index = CoPurchaseNeighbors.load(copurchase_dir).for_rows(row_product_ids)
+
+        # Dựng một lần: mọi request get_products sau đó chỉ giao bitmap và cắt trang
+        source_df = _catalog_source_dataframe(self)
+        self.catalog_index = CatalogIndex.from_dataframe(source_df) if source_df is not None else None
+
+        # UserProfileCache: user_id -> tổng các hàng tương đồng đã tương tác (index hàng chỉ đúng với phiên bản này)
+        self.profile_cache = None
+        if similarity_source is not None:
+            self.profile_cache = UserProfileCache(similarity_source.shape[1], max_bytes=PROFILE_CACHE_MAX_BYTES)
+        # Kết quả đã tính của phiên bản này; hot-swap sang bundle mới là có cache rỗng mới
+        self.response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL) if RESPONSE_CACHE_MAX_ENTRIES > 0 else None
+
+        # IVFIndex, chỉ load khi RECOMMENDER_USE_ANN bật
+        self.ann_index = None
+        if USE_ANN_FOR_USER_RECS and IVFIndex is not None and ann_dir is not None and os.path.exists(ann_dir):
+            ann_index = IVFIndex.load(ann_dir, mmap=True, n_probe=ANN_N_PROBE)
+            if ann_index.n_items == self.n_items:
+                self.ann_index = ann_index
+            else:
+                print(f"Warning: ANN index at {ann_dir} does not match the product indices map; ignoring it.", file=sys.stderr)
+
+    @property
+    def similarity_source(self):
+        return self.neighbor_index if self.neighbor_index is not None else self.cosine_matrix
+
+    def content_scores(self, user_item):
+        """Điểm content (mảng float32 users×items) của ma trận user×item thưa: U @ S, với S là nguồn điểm hồ sơ user."""
+        if self.user_similarity is not None:
+            return self.user_similarity.scores_for(user_item)
+        return np.asarray(user_item @ self.cosine_matrix, dtype=np.float32)
 
+    def preload(self):
+        """Dựng trước mọi phần lazy (chỉ mục tìm kiếm, các CSR thưa, map vị trí danh mục).
+        Gọi trong fork server trước khi fork worker: phần dựng ở đây được mọi worker dùng chung (copy-on-write)."""
+        self.search_index()
+        if sp is not None:
+            for similarity in (self.user_similarity, self.copurchase_index):
+                if similarity is not None:
+                    similarity.preload()
+        if self.catalog_index is not None:
+            self.catalog_index.positions_for([])
+        # Chỉ mục tìm kiếm và danh mục đã dựng xong, không còn gì đọc DataFrame: bỏ nó (hàng triệu object Python
+        # mà worker chỉ cần chạm refcount là trang nhớ bị copy)
+        self.all_products_df = None
+        return self
 
-def safe_int_convert(value):
-    try: return int(float(value))
-    except (ValueError, TypeError, OverflowError): return None
+    def search_index(self):
+        """Chỉ mục tìm kiếm đã lưu (trong bundle hoặc search_index_v2_adv/), hoặc dựng trong bộ nhớ nếu chưa build."""
+        if self._search_index is None:
+            with self._search_lock:
+                if self._search_index is None:
+                    df = self.products_table.to_dataframe() if self.products_table is not None else _catalog_source_dataframe(self)
+                    self._search_index = load_search_index(self.search_dir or SEARCH_INDEX_DIR, df)
+        return self._search_index
+
+
+def _state_from_bundle(bundle_dir):
+    bundle = ArtifactBundle.load(bundle_dir, verify=VERIFY_BUNDLE_CHECKSUMS)
+    return ArtifactState(
+        bundle.version, ProductDetails(bundle.products), bundle.products.to_dataframe(CATALOG_SOURCE_COLUMNS), bundle.id_map,
+        neighbor_index=bundle.neighbor_index, cosine_matrix=bundle.cosine_matrix, precomputed_recs=bundle.precomputed, products_table=bundle.products, records=bundle.records,
+        mongo_id_map=bundle.mongo_id_map, tfidf_similarity=bundle.tfidf_similarity,
+        search_dir=bundle.component_dir(BUNDLE_SEARCH_DIR), ann_dir=bundle.component_dir(BUNDLE_ANN_DIR), source=pathlib.Path(bundle_dir),
+    )
+
+def _state_from_loose_files():
+    """Artifact rời trong python_recommender_artifacts/ (khi chưa publish bundle nào)."""
+    if not os.path.exists(PRODUCT_MAP_JSON_FILE):
+        raise FileNotFoundError(f"Product map file not found: {PRODUCT_MAP_JSON_FILE}")
+    with open(PRODUCT_MAP_JSON_FILE, 'r', encoding='utf-8') as f:
+        product_map = json.load(f)
+
+    # Store nhị phân precomputed_recs_v2_adv/ nếu đã convert, ngược lại parse JSON một lần
+    precomputed_recs = load_precomputed_recs(PRECOMPUTED_RECS_DIR, PRECOMPUTED_PRODUCT_RECS_JSON_FILE)
+
+    # Chỉ mục hàng xóm cho gợi ý theo sản phẩm; ma trận TF-IDF của build_model.py cho hồ sơ user, hoặc ma trận dày
+    # (mmap) của artifact cũ nếu chưa có TF-IDF
+    neighbor_index, cosine_matrix, tfidf_similarity = None, None, None
+    if os.path.exists(NEIGHBOR_INDEX_DIR):
+        neighbor_index = NeighborIndex.load(NEIGHBOR_INDEX_DIR, mmap=True)
+    if os.path.exists(TFIDF_MATRIX_FILE) and neighbor_index is not None and sp is not None:
+        tfidf_similarity = TfidfSimilarity.from_npz(TFIDF_MATRIX_FILE)
+        if tfidf_similarity.shape != neighbor_index.shape:
+            print(f"Warning: TF-IDF matrix ({tfidf_similarity.n_items} rows) does not match the neighbour index {neighbor_index.shape}; ignoring it.", file=sys.stderr)
+            tfidf_similarity = None
+    if tfidf_similarity is None and os.path.exists(COSINE_SIM_MATRIX_FILE):
+        cosine_matrix = np.load(COSINE_SIM_MATRIX_FILE, mmap_mode='r')
+        if neighbor_index is not None and cosine_matrix.shape != neighbor_index.shape:
+            print(f"Warning: Cosine similarity matrix {cosine_matrix.shape} does not match the neighbour index {neighbor_index.shape}; ignoring it.", file=sys.stderr)
+            cosine_matrix = None
+    if neighbor_index is None and cosine_matrix is None:
+        raise FileNotFoundError(f"Neither neighbour index ({NEIGHBOR_INDEX_DIR}) nor cosine similarity matrix file found: {COSINE_SIM_MATRIX_FILE}. "
+                                f"Generate the model artifacts with: python scripts/build_model.py full")
+    n_items = (neighbor_index if neighbor_index is not None else cosine_matrix).shape[0]
+
+    if not os.path.exists(PRODUCT_INDICES_MAP_FILE):
+        raise FileNotFoundError(f"Product indices map file not found: {PRODUCT_INDICES_MAP_FILE}")
+    with open(PRODUCT_INDICES_MAP_FILE, 'rb') as f:
+        product_indices_map = pickle.load(f) # Pandas Series product_id -> index
+    if isinstance(product_indices_map, pd.Series) and not product_indices_map.empty:
+        id_map = ProductIdMap.from_series(product_indices_map, n_rows=n_items)
+        request_metrics.current().debug(f"Product id map: {len(id_map)} ids over {n_items} rows.")
+    else:
+        id_map = ProductIdMap(np.zeros(0, dtype=np.int64))
+        print(f"Warning: Product indices map is not a valid Pandas Series or is empty. Type: {type(product_indices_map)}", file=sys.stderr)
+
+    if not os.path.exists(PRODUCT_DATA_CSV_FILE):
+        print(f"Warning: Product CSV data file not found: {PRODUCT_DATA_CSV_FILE}. Popular/Product list fallback may not work well.", file=sys.stderr)
+        all_products_df = pd.DataFrame() # Khởi tạo DataFrame rỗng
+    else:
+        try:
+            all_products_df = pd.read_csv(PRODUCT_DATA_CSV_FILE, dtype={'product_id': str})
+            for col in ['price', 'ocop_rating', 'num_reviews', 'sold']: # 'total_sales' đã bị đổi thành 'sold'
+                if col in all_products_df.columns:
+                    all_products_df[col] = pd.to_numeric(all_products_df[col], errors='coerce')
+        except Exception as e:
+            print(f"Warning: Could not load or process product CSV {PRODUCT_DATA_CSV_FILE}: {e}", file=sys.stderr)
+            all_products_df = pd.DataFrame() # Khởi tạo DataFrame rỗng khi lỗi
+
+    return ArtifactState(LOOSE_FILES_VERSION, product_map, all_products_df, id_map, neighbor_index=neighbor_index,
+                         cosine_matrix=cosine_matrix, precomputed_recs=precomputed_recs, tfidf_similarity=tfidf_similarity)
+
+def _load_state():
+    started = time.perf_counter()
+    bundle_dir = current_bundle_dir(BUNDLES_DIR)
+    state = _state_from_bundle(bundle_dir) if bundle_dir is not None else _state_from_loose_files()
+    state.load_seconds = time.perf_counter() - started
+    return state
+
+_STATE = None
+# Chỉ một lần load / reload tại một thời điểm; request đã có _STATE không phải chờ lock này
+_ARTIFACTS_LOCK = threading.Lock()
 
-def safe_float_convert(value):
-    try: return float(value)
-    except (ValueError, TypeError, OverflowError): return None
 
 def load_artifacts():
-    global LOADED_PRODUCT_MAP, LOADED_COSINE_SIM_MATRIX, LOADED_PRODUCT_INDICES_MAP
-    global LOADED_ALL_PRODUCTS_DF, CACHED_ID_TO_IDX_MAP, CACHED_IDX_TO_ID_MAP
-
-    if LOADED_PRODUCT_MAP is None:
-        if not os.path.exists(PRODUCT_MAP_JSON_FILE):
-            raise FileNotFoundError(f"Product map file not found: {PRODUCT_MAP_JSON_FILE}")
-        with open(PRODUCT_MAP_JSON_FILE, 'r', encoding='utf-8') as f:
-            LOADED_PRODUCT_MAP = json.load(f)
-
-    if LOADED_COSINE_SIM_MATRIX is None:
-        if not os.path.exists(COSINE_SIM_MATRIX_FILE):
-            raise FileNotFoundError(f"Cosine similarity matrix file not found: {COSINE_SIM_MATRIX_FILE}")
-        LOADED_COSINE_SIM_MATRIX = np.load(COSINE_SIM_MATRIX_FILE)
-
-    if LOADED_PRODUCT_INDICES_MAP is None: # LOADED_PRODUCT_INDICES_MAP sẽ là Pandas Series
-        if not os.path.exists(PRODUCT_INDICES_MAP_FILE):
-            raise FileNotFoundError(f"Product indices map file not found: {PRODUCT_INDICES_MAP_FILE}")
-        with open(PRODUCT_INDICES_MAP_FILE, 'rb') as f:
-            LOADED_PRODUCT_INDICES_MAP = pickle.load(f)
-        
-        # Xử lý và cache các map sau khi LOADED_PRODUCT_INDICES_MAP được load
-        if isinstance(LOADED_PRODUCT_INDICES_MAP, pd.Series) and not LOADED_PRODUCT_INDICES_MAP.empty:
-            # Đảm bảo index của Series (là product_id) cũng là string
-            LOADED_PRODUCT_INDICES_MAP.index = LOADED_PRODUCT_INDICES_MAP.index.astype(str) # QUAN TRỌNG
-            
-            CACHED_ID_TO_IDX_MAP = LOADED_PRODUCT_INDICES_MAP 
-            temp_idx_to_id_map = {}
-            for pid_str_from_series_index, df_idx in CACHED_ID_TO_IDX_MAP.items():
-                temp_idx_to_id_map[df_idx] = pid_str_from_series_index # df_idx là int, pid_str là string
-            CACHED_IDX_TO_ID_MAP = temp_idx_to_id_map
-            print(f"[PYTHON ARTIFACTS] CACHED_ID_TO_IDX_MAP (Series) index type: {CACHED_ID_TO_IDX_MAP.index.dtype}, sample: {CACHED_ID_TO_IDX_MAP.index[:3]}", file=sys.stderr)
-            print(f"[PYTHON ARTIFACTS] CACHED_IDX_TO_ID_MAP (dict) sample (first 3): {list(CACHED_IDX_TO_ID_MAP.items())[:3]}", file=sys.stderr)
-        else:
-            # Nếu LOADED_PRODUCT_INDICES_MAP không phải là Series hoặc rỗng, đặt các map cache là None hoặc dict rỗng
-            CACHED_ID_TO_IDX_MAP = pd.Series(dtype='int64')
-            CACHED_IDX_TO_ID_MAP = {}
-            print(f"Warning: LOADED_PRODUCT_INDICES_MAP is not a valid Pandas Series or is empty. Type: {type(LOADED_PRODUCT_INDICES_MAP)}", file=sys.stderr)
+    """Trạng thái artifact đang phục vụ (load lần đầu nếu cần)."""
+    global _STATE
+    state = _STATE
+    if state is None:
+        with _ARTIFACTS_LOCK:
+            if _STATE is None:
+                _STATE = _load_state()
+            state = _STATE
+    return state
 
+def reload_artifacts(force=False):
+    """Load bundle CURRENT (nếu khác bản đang phục vụ), chuẩn bị xong mới thay _STATE bằng một phép gán.
+    Request đang chạy giữ trạng thái cũ nên không bị gián đoạn; load lỗi thì bản cũ vẫn phục vụ."""
+    global _STATE
+    with _ARTIFACTS_LOCK:
+        old_state = _STATE
+        if not force and old_state is not None and old_state.source == current_bundle_dir(BUNDLES_DIR):
+            return {"reloaded": False, "version": old_state.version}
+        new_state = _load_state()
+        new_state.search_index() # Load / dựng trước khi nhận request
+        _STATE = new_state
+    print(f"[PYTHON SERVER] Artifacts switched to version {new_state.version}", file=sys.stderr)
+    return {"reloaded": True, "version": new_state.version, "previous_version": old_state.version if old_state else None}
 
-    if LOADED_ALL_PRODUCTS_DF is None:
-        if not os.path.exists(PRODUCT_DATA_CSV_FILE):
-            print(f"Warning: Product CSV data file not found: {PRODUCT_DATA_CSV_FILE}. Popular/Product list fallback may not work well.", file=sys.stderr)
-            LOADED_ALL_PRODUCTS_DF = pd.DataFrame() # Khởi tạo DataFrame rỗng
-        else:
-            try:
-                LOADED_ALL_PRODUCTS_DF = pd.read_csv(PRODUCT_DATA_CSV_FILE, dtype={'product_id': str})
-                for col in ['price', 'ocop_rating', 'num_reviews', 'sold']: # 'total_sales' đã bị đổi thành 'sold'
-                    if col in LOADED_ALL_PRODUCTS_DF.columns:
-                        LOADED_ALL_PRODUCTS_DF[col] = pd.to_numeric(LOADED_ALL_PRODUCTS_DF[col], errors='coerce')
-            except Exception as e:
-                print(f"Warning: Could not load or process product CSV {PRODUCT_DATA_CSV_FILE}: {e}", file=sys.stderr)
-                LOADED_ALL_PRODUCTS_DF = pd.DataFrame() # Khởi tạo DataFrame rỗng khi lỗi
+_FAILED_BUNDLE = None # Bundle load lỗi gần nhất: không thử lại cho tới khi CURRENT đổi
 
-# --- HÀM LẤY GỢI Ý SẢN PHẨM (THEO PRODUCT_ID - PRECOMPUTED) ---
-def get_recommendations_from_precomputed(product_id_input, top_n=TOP_N_FINAL_RECS):
-    load_artifacts() 
-    
-    precomputed_recs_data = None
-    if not os.path.exists(PRECOMPUTED_PRODUCT_RECS_JSON_FILE):
-        return {"error": f"Precomputed product recommendations file not found: {PRECOMPUTED_PRODUCT_RECS_JSON_FILE}"}
+def check_bundles():
+    """Con trỏ CURRENT trỏ tới phiên bản mới thì reload_artifacts(); trả về {"reloaded": bool, ...}."""
+    global _FAILED_BUNDLE
+    state = _STATE
+    target = current_bundle_dir(BUNDLES_DIR)
+    if target is None or (state is not None and state.source == target) or target == _FAILED_BUNDLE:
+        return {"reloaded": False}
     try:
-        with open(PRECOMPUTED_PRODUCT_RECS_JSON_FILE, 'r', encoding='utf-8') as f:
-            precomputed_recs_data = json.load(f)
+        result = reload_artifacts()
+        _FAILED_BUNDLE = None
+        return result
     except Exception as e:
-        return {"error": f"Failed to load JSON files for product recommendations: {str(e)}", "trace": traceback.format_exc()}
+        _FAILED_BUNDLE = target
+        print(f"[PYTHON SERVER] Failed to load bundle {target}: {type(e).__name__} - {e}", file=sys.stderr)
+        return {"reloaded": False, "error": f"Failed to load bundle {target}: {type(e).__name__} - {e}"}
+
+def watch_bundles(interval, check=check_bundles, on_switch=None):
+    """Thread nền của chế độ serve: gọi check() mỗi interval giây.
+    serve --workers: check chạy check_bundles trong fork server, on_switch fork lại worker từ trạng thái mới."""
+    while True:
+        time.sleep(interval)
+        if check().get("reloaded") and on_switch is not None:
+            on_switch()
+
+def get_neighbor_ids_from_index(state, product_id_str, top_n):
+    """Top-N product_id (string) giống nhất theo state.neighbor_index; None nếu không tra được."""
+    if state.neighbor_index is None:
+        return None
+    idx = state.id_map.index_of(product_id_str)
+    if idx is None or idx >= state.neighbor_index.n_items:
+        return None
+    neighbor_idxs, _ = state.neighbor_index.neighbors(idx, top_n=top_n)
+    neighbor_ids = (state.id_map.id_of(i) for i in neighbor_idxs.tolist())
+    return [pid for pid in neighbor_ids if pid is not None]
+
+def resolve_product_ids(state, product_ids_str_list):
+    """_id MongoDB (ObjectId) -> product_id (mọi sản phẩm gắn với _id đó); ObjectId không biết bị bỏ,
+    giá trị khác (product_id gốc) giữ nguyên."""
+    trace = request_metrics.current()
+    resolved = []
+    with trace.stage("resolve_ids"):
+        for pid_str in product_ids_str_list:
+            if MongoIdMap.is_object_id(pid_str):
+                pids = state.mongo_id_map.product_ids_of(pid_str)
+                if len(pids) == 0:
+                    trace.count("unknown_object_ids")
+                resolved.extend(str(pid) for pid in pids)
+            else:
+                resolved.append(pid_str)
+    return resolved
+
+# --- CACHE KẾT QUẢ (khóa đã chuẩn hóa, gắn với phiên bản artifact của state) ---
+def _cached_response(state, key, top_n=None, list_field=None):
+    if state.response_cache is None:
+        return None
+    response = state.response_cache.get(key, top_n=top_n, list_field=list_field)
+    request_metrics.current().count("response_cache_hits" if response is not None else "response_cache_misses")
+    return response
+
+def _cache_response(state, key, response, top_n=None):
+    if state.response_cache is not None and "error" not in response:
+        state.response_cache.put(key, response, top_n=top_n)
+    return response
 
+# --- HÀM LẤY GỢI Ý SẢN PHẨM (THEO PRODUCT_ID - PRECOMPUTED) ---
+def get_recommendations_from_precomputed(product_id_input, top_n=TOP_N_FINAL_RECS):
+    state = load_artifacts()
+
+    if state.precomputed_recs is None and state.neighbor_index is None:
+        return {"error": f"Precomputed product recommendations not found: {PRECOMPUTED_RECS_DIR} / {PRECOMPUTED_PRODUCT_RECS_JSON_FILE}"}
+
+    trace = request_metrics.current()
     product_id_str_input = str(product_id_input)
-    recommended_ids_int_list = precomputed_recs_data.get(product_id_str_input)
+    if MongoIdMap.is_object_id(product_id_str_input):
+        with trace.stage("resolve_ids"):
+            product_id_str = state.mongo_id_map.product_id_of(product_id_str_input)
+        if product_id_str is None:
+            trace.count("unknown_object_ids")
+            return {"error": f"Product ID '{product_id_str_input}' not found in product data."}
+    else:
+        product_id_str = product_id_str_input
+
+    # Khóa theo product_id gốc: _id MongoDB và product_id của cùng sản phẩm dùng chung một mục
+    cache_key = ("get_recommendations", product_id_str)
+    cached = _cached_response(state, cache_key, top_n, "recommendations")
+    if cached is not None:
+        return dict(cached, product_id_input=product_id_str_input)
+    response = _product_recommendations(state, product_id_str, product_id_str_input, top_n)
+    if "message" in response: # Thông báo nhắc lại ID đã nhập: không dùng lại cho dạng ID khác
+        return response
+    return _cache_response(state, cache_key, response, top_n)
+
+def _product_recommendations(state, product_id_str, product_id_str_input, top_n):
+    trace = request_metrics.current()
+    recommended_ids_int_list = None
+    with trace.stage("lookup"):
+        if state.precomputed_recs is not None:
+            recommended_ids_int_list = state.precomputed_recs.get(product_id_str)
+        if recommended_ids_int_list is None:
+            # Sản phẩm chưa có trong file precomputed -> lấy trực tiếp từ chỉ mục hàng xóm
+            recommended_ids_int_list = get_neighbor_ids_from_index(state, product_id_str, top_n)
+            trace.count("neighbor_index_lookups" if recommended_ids_int_list is not None else "unknown_ids")
+        else:
+            trace.count("precomputed_hits")
 
+    product_map = state.product_map
     if recommended_ids_int_list is None:
-        if LOADED_PRODUCT_MAP and product_id_str_input not in LOADED_PRODUCT_MAP:
+        if product_map and product_id_str not in product_map:
             return {"error": f"Product ID '{product_id_str_input}' not found in product data."}
         else:
             return {"product_id_input": product_id_str_input, "recommendations": [], "message": f"No precomputed recommendations for Product ID '{product_id_str_input}'."}
-    
+
     if not recommended_ids_int_list:
         return {"product_id_input": product_id_str_input, "recommendations": []}
 
-    recommendations = []
-    count = 0
-    for rec_id_int in recommended_ids_int_list:
-        if count >= top_n: break
-        rec_id_str = str(rec_id_int)
-        rec_details = LOADED_PRODUCT_MAP.get(rec_id_str) if LOADED_PRODUCT_MAP else None
-        if rec_details:
-            recommendations.append({
-                "product_id": rec_id_int, "name": rec_details.get("name", "N/A"),
-                "_id": rec_details.get("_id"),
-                "price": safe_float_convert(rec_details.get("price")),
-                "image_url": rec_details.get("image_url", ""),
-                "product_url": rec_details.get("product_url", ""),
-                "ocop_rating": safe_int_convert(rec_details.get("ocop_rating")),
-            })
-            count += 1
+    with trace.stage("hydrate"):
+        # product_id dạng chuỗi như trước khi có bản ghi dựng sẵn (gợi ý theo user / phổ biến vẫn là số)
+        recommendations = state.records.records(recommended_ids_int_list, limit=top_n, string_ids=True)
     return {"product_id_input": product_id_str_input, "recommendations": recommendations}
 
 
+# --- CÁC HÀM DÙNG CHUNG CHO GỢI Ý THEO USER (ĐƠN LẺ VÀ BATCH) ---
+def _recommendations_for_indices(state, idxs):
+    """Bản ghi dựng sẵn của các hàng ma trận idxs (giữ thứ tự, bỏ hàng không có thông tin sản phẩm)."""
+    with request_metrics.current().stage("hydrate"):
+        return state.records.fragments_at(state.row_record_positions[np.asarray(idxs, dtype=np.int64)])
+
+def _get_popular_recommendations(state, top_n):
+    """Cold start: sản phẩm bán chạy nhất theo hoán vị 'popular' dựng sẵn của chỉ mục danh mục (sold, rồi
+    num_reviews / rating; chỉ sản phẩm active), không sắp xếp lại danh mục mỗi request. None nếu không có dữ liệu."""
+    catalog = state.catalog_index
+    if catalog is None or len(catalog) == 0:
+        return None
+    trace = request_metrics.current()
+    trace.count("popular_fallbacks")
+    popular_ids_str = catalog.product_ids_at(catalog.sort_orders['popular'][:top_n])
+    with trace.stage("hydrate"):
+        return state.records.records(popular_ids_str)
+
+def _interacted_indices(state, pid_str_list):
+    """Chuyển list product_id sang mảng index (duy nhất) trong ma trận tương đồng, bỏ ID không biết."""
+    idxs = set()
+    for pid_str in pid_str_list:
+        idx = state.id_map.index_of(pid_str)
+        if idx is not None and idx < state.n_items:
+            idxs.add(idx)
+    return np.fromiter(sorted(idxs), dtype=np.int64, count=len(idxs))
+
+def _top_n_indices(scores, top_n):
+    """Top-N theo từng hàng của scores (1D hoặc 2D) bằng argpartition; bỏ các mục -inf (đã bị loại)."""
+    scores_2d = np.atleast_2d(scores)
+    n_cols = scores_2d.shape[1]
+    k = min(top_n, n_cols)
+    if k <= 0:
+        return [np.zeros(0, dtype=np.int64) for _ in range(scores_2d.shape[0])]
+    candidates = np.argpartition(-scores_2d, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores_2d, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+    return [row[np.isfinite(row_scores)] for row, row_scores in zip(candidates, candidate_scores)]
+
+def _recommendations_from_profile(state, profile_vector, exclude_idxs, top_n):
+    """Chọn top-N từ vector điểm của user, loại sản phẩm đã tương tác và sản phẩm không có thông tin."""
+    with request_metrics.current().stage("top_k"):
+        scores = np.array(profile_vector, dtype=np.float32) # copy: không sửa vector gốc
+        scores[~state.valid_rec_mask] = -np.inf
+        scores[exclude_idxs] = -np.inf
+        top_idxs = _top_n_indices(scores, top_n)[0]
+    return _recommendations_for_indices(state, top_idxs.tolist())
+
+# --- CACHE HỒ SƠ USER (cộng dồn tăng dần theo sản phẩm mới) ---
+def _is_cacheable_user(user_id):
+    return user_id not in (None, "", "None", "undefined", "null")
+
+def _add_score_row(state, idx, out):
+    """out += hàng idx của ma trận điểm (tương đồng content, trộn với mua chung nếu có; như _score_user_chunk)."""
+    if state.copurchase_index is None:
+        if state.user_similarity is not None:
+            state.user_similarity.add_row_to(idx, out)
+        else:
+            out += state.cosine_matrix[idx]
+        return
+    weight = np.float32(state.copurchase_weight)
+    if state.user_similarity is not None:
+        cols, scores = state.user_similarity.row(idx)
+        out[cols] += scores * (np.float32(1.0) - weight)
+    else:
+        out += np.asarray(state.cosine_matrix[idx], dtype=np.float32) * (np.float32(1.0) - weight)
+    cols, scores = state.copurchase_index.row(idx)
+    out[cols] += scores * weight
+
+def _add_rows_to_profile(state, profile, idxs):
+    """Cộng các hàng điểm của idxs vào profile (profile phải là bản sao riêng của thread này)."""
+    for idx in idxs:
+        _add_score_row(state, idx, profile.sum_vector)
+        profile.count += 1
+        profile.item_idxs.add(idx)
+
+def _user_profile_for(state, user_id, interacted_pid_str_list):
+    """Hồ sơ của user cho lịch sử hiện tại: chỉ cộng các sản phẩm chưa có trong bản cache.
+    Nếu lịch sử không còn chứa hết sản phẩm đã cache (đơn bị xóa/hủy) thì tính lại từ đầu."""
+    trace = request_metrics.current()
+    with trace.stage("resolve_ids"):
+        idxs = set(_interacted_indices(state, interacted_pid_str_list).tolist())
+    unknown_count = len(set(interacted_pid_str_list)) - len(idxs)
+    if unknown_count:
+        trace.count("unknown_ids", unknown_count)
+        trace.debug(f"{unknown_count} interacted product id(s) not found in the product id map for user '{user_id}'.")
+
+    profile_cache = state.profile_cache
+    cacheable = profile_cache is not None and _is_cacheable_user(user_id)
+    cached = profile_cache.get(user_id) if cacheable else None
+    if cached is not None and cached.item_idxs <= idxs:
+        if cached.item_idxs == idxs:
+            trace.count("profile_cache_hits")
+            return cached
+        trace.count("profile_cache_partial_hits")
+        profile = cached.copy()
+    else:
+        if cacheable:
+            trace.count("profile_cache_misses")
+        profile = UserProfile(state.similarity_source.shape[1])
+
+    new_idxs = sorted(idxs - profile.item_idxs)
+    trace.count("scored_rows", len(new_idxs))
+    with trace.stage("score"):
+        _add_rows_to_profile(state, profile, new_idxs)
+    if cacheable and profile.count:
+        profile_cache.put(user_id, profile)
+    return profile
+
+def update_user_profile(user_id, new_product_ids_str_list):
+    """Gọi khi user vừa đặt đơn mới: cộng thêm sản phẩm mới vào hồ sơ đã cache.
+    User chưa có trong cache thì bỏ qua (request tiếp theo sẽ tính từ lịch sử đầy đủ)."""
+    state = load_artifacts()
+    if state.profile_cache is None or not _is_cacheable_user(user_id):
+        return {"user_id": user_id, "updated": False, "added": 0}
+    cached = state.profile_cache.get(user_id)
+    if cached is None:
+        return {"user_id": user_id, "updated": False, "added": 0}
+    new_pids = resolve_product_ids(state, new_product_ids_str_list)
+    new_idxs = sorted(set(_interacted_indices(state, new_pids).tolist()) - cached.item_idxs)
+    if new_idxs:
+        profile = cached.copy()
+        _add_rows_to_profile(state, profile, new_idxs)
+        state.profile_cache.put(user_id, profile)
+    return {"user_id": user_id, "updated": True, "added": len(new_idxs)}
+
+def invalidate_user_profile(user_id=None):
+    """Xóa hồ sơ đã cache của user (hoặc toàn bộ cache nếu không truyền user_id)."""
+    state = load_artifacts()
+    if state.profile_cache is None:
+        return {"user_id": user_id, "invalidated": False}
+    return {"user_id": user_id, "invalidated": state.profile_cache.invalidate(user_id), "cache": state.profile_cache.stats()}
+
+def _ann_user_recommendations(state, user_id_input, interacted_pid_str_list, top_n):
+    """Hồ sơ = trung bình vector TF-IDF đã tương tác; chỉ chấm điểm sản phẩm trong n_probe cụm gần hồ sơ nhất."""
+    trace = request_metrics.current()
+    with trace.stage("resolve_ids"):
+        idxs = _interacted_indices(state, interacted_pid_str_list)
+    trace.count("unknown_ids", len(set(interacted_pid_str_list)) - len(idxs))
+    if len(idxs) == 0:
+        return {"user_id_input": user_id_input, "recommendations": [], "message": "None of the interacted products found in similarity matrix."}
+    ann_index = state.ann_index
+    with trace.stage("score"):
+        top_idxs, _ = ann_index.search(ann_index.profile_vector(idxs), top_n, exclude=idxs, valid_mask=state.valid_rec_mask)
+    return {"user_id_input": user_id_input, "recommendations": _recommendations_for_indices(state, top_idxs.tolist())}
+
 # --- HÀM LẤY GỢI Ý CHO USER DỰA TRÊN CONTENT-BASED (ĐỘNG) ---
 def get_user_content_based_recommendations_dynamic(user_id_input, interacted_product_ids_str_list, top_n=TOP_N_FINAL_RECS):
-    load_artifacts()
+    state = load_artifacts()
 
-    if LOADED_COSINE_SIM_MATRIX is None or CACHED_ID_TO_IDX_MAP is None or CACHED_IDX_TO_ID_MAP is None or LOADED_PRODUCT_MAP is None :
+    if state.similarity_source is None or state.product_map is None:
          return {"error": "Required artifacts (similarity matrix, indices map, or product map) not properly loaded or cached."}
-    
-    # Kiểm tra CACHED_ID_TO_IDX_MAP có phải là Series và không rỗng
-    if not isinstance(CACHED_ID_TO_IDX_MAP, pd.Series) or CACHED_ID_TO_IDX_MAP.empty:
-        return {"error": "Product ID to index map (CACHED_ID_TO_IDX_MAP) is invalid or empty."}
-    if not CACHED_IDX_TO_ID_MAP: # Kiểm tra map ngược
-        return {"error": "Index to Product ID map (CACHED_IDX_TO_ID_MAP) is invalid or empty."}
+    if len(state.id_map) == 0:
+        return {"error": "Product ID to index map is invalid or empty."}
 
+    # ObjectId không có trong map bị bỏ: lịch sử chỉ gồm sản phẩm không biết -> sản phẩm phổ biến như chưa có lịch sử
+    interacted_product_ids_str_list = resolve_product_ids(state, interacted_product_ids_str_list)
 
+    # Kết quả chỉ phụ thuộc tập sản phẩm đã tương tác (không phụ thuộc user_id hay thứ tự / trùng lặp)
+    cache_key = ("get_user_recommendations", tuple(sorted(set(interacted_product_ids_str_list))))
+    cached = _cached_response(state, cache_key, top_n, "recommendations")
+    if cached is not None:
+        return dict(cached, user_id_input=user_id_input)
+    response = _user_recommendations(state, user_id_input, interacted_product_ids_str_list, top_n)
+    return _cache_response(state, cache_key, response, top_n)
+
+def _user_recommendations(state, user_id_input, interacted_product_ids_str_list, top_n):
     if not interacted_product_ids_str_list:
-        if LOADED_ALL_PRODUCTS_DF is not None and not LOADED_ALL_PRODUCTS_DF.empty:
-            sort_col = None
-            if 'sold' in LOADED_ALL_PRODUCTS_DF.columns: sort_col = 'sold'
-            elif 'num_reviews' in LOADED_ALL_PRODUCTS_DF.columns: sort_col = 'num_reviews'
-            
-            popular_df = LOADED_ALL_PRODUCTS_DF.copy()
-            if sort_col:
-                popular_df = popular_df.sort_values(by=sort_col, ascending=False, na_position='last')
-            
-            popular_ids_str = popular_df['product_id'].astype(str).head(top_n).tolist()
-            
-            recommendations = []
-            for pid_str in popular_ids_str:
-                details = LOADED_PRODUCT_MAP.get(pid_str) if LOADED_PRODUCT_MAP else None
-                if details:
-                    recommendations.append({
-                        "product_id": safe_int_convert(pid_str), "name": details.get("name", "N/A"),
-                        "_id": details.get("_id"),
-                        "price": safe_float_convert(details.get("price")),
-                        "image_url": details.get("image_url", ""),
-                        "ocop_rating": safe_int_convert(details.get("ocop_rating")),
-                    })
+        recommendations = _get_popular_recommendations(state, top_n)
+        if recommendations is not None:
             return {"user_id_input": user_id_input, "recommendations": recommendations, "message": "Showing popular products due to no interaction history."}
         else:
             return {"user_id_input": user_id_input, "recommendations": [], "message": "No interaction history and no popular products data available."}
 
-    user_profile_accumulator = np.zeros(LOADED_COSINE_SIM_MATRIX.shape[1])
-    valid_interacted_count = 0
-
-    for pid_str in interacted_product_ids_str_list: # pid_str từ Node.js đã là string
-        print(f"[PYTHON DEBUG] Processing interacted_pid_str: '{pid_str}' (type: {type(pid_str)})", file=sys.stderr)
-        # Kiểm tra sự tồn tại của pid_str trong index của Series CACHED_ID_TO_IDX_MAP
-        if pid_str in CACHED_ID_TO_IDX_MAP.index: 
-            idx = CACHED_ID_TO_IDX_MAP[pid_str] # Lấy giá trị (df_model_idx)
-            print(f"[PYTHON DEBUG] Found df_model_idx {idx} for pid '{pid_str}'", file=sys.stderr)
-            if idx < LOADED_COSINE_SIM_MATRIX.shape[0]:
-                user_profile_accumulator += LOADED_COSINE_SIM_MATRIX[idx]
-                valid_interacted_count += 1
-            else:
-                print(f"[PYTHON DEBUG] Index {idx} for pid '{pid_str}' is out of bounds for sim matrix.", file=sys.stderr)
-        else:
-            print(f"[PYTHON DEBUG] PID '{pid_str}' NOT FOUND in CACHED_ID_TO_IDX_MAP's index.", file=sys.stderr)
-            # Có thể print một vài key mẫu từ CACHED_ID_TO_IDX_MAP.index để so sánh
-            # print(f"[PYTHON DEBUG] Sample keys from CACHED_ID_TO_IDX_MAP.index: {list(CACHED_ID_TO_IDX_MAP.index[:5])}", file=sys.stderr)
+    if state.ann_index is not None:
+        return _ann_user_recommendations(state, user_id_input, interacted_product_ids_str_list, top_n)
 
-    
-    if valid_interacted_count == 0:
+    profile = _user_profile_for(state, user_id_input, interacted_product_ids_str_list)
+    if profile.count == 0:
         return {"user_id_input": user_id_input, "recommendations": [], "message": "None of the interacted products found in similarity matrix."}
 
-    user_profile_vector = user_profile_accumulator / valid_interacted_count
-    sorted_product_indices_by_score = np.argsort(user_profile_vector)[::-1]
-
-    recommendations = []
-    count = 0
-    for product_df_model_idx in sorted_product_indices_by_score:
-        if count >= top_n: break
-        recommended_pid_str = CACHED_IDX_TO_ID_MAP.get(product_df_model_idx)
-        if recommended_pid_str and recommended_pid_str not in interacted_product_ids_str_list:
-            details = LOADED_PRODUCT_MAP.get(recommended_pid_str) if LOADED_PRODUCT_MAP else None
-            if details:
-                recommendations.append({
-                    "product_id": safe_int_convert(recommended_pid_str),
-                    "_id": details.get("_id"),
-                    "name": details.get("name", "N/A"), "price": safe_float_convert(details.get("price")),
-                    "image_url": details.get("image_url", ""), "product_url": details.get("product_url", ""),
-                    "ocop_rating": safe_int_convert(details.get("ocop_rating")),
-                })
-                count += 1
+    exclude_idxs = np.fromiter(sorted(profile.item_idxs), dtype=np.int64, count=len(profile.item_idxs))
+    recommendations = _recommendations_from_profile(state, profile.profile_vector(), exclude_idxs, top_n)
     return {"user_id_input": user_id_input, "recommendations": recommendations}
 
-# --- HÀM LẤY DANH SÁCH SẢN PHẨM (CẬP NHẬT VỚI LỌC VÀ SẮP XẾP) ---
-def get_products_from_files(page=1, per_page=20, category=None, province=None, min_price=None, max_price=None, sort_by=None):
-    load_artifacts()
-    
-    current_df_source = None
-    if LOADED_ALL_PRODUCTS_DF is not None and not LOADED_ALL_PRODUCTS_DF.empty:
-        current_df_source = LOADED_ALL_PRODUCTS_DF.copy()
-        current_df_source['product_id'] = current_df_source['product_id'].astype(str) # Đảm bảo ID là string
-    elif LOADED_PRODUCT_MAP:
-        temp_list = []
-        for id_str, details in LOADED_PRODUCT_MAP.items():
-            item = {"product_id": id_str}
-            item.update(details)
-            item["price"] = safe_float_convert(details.get("price"))
-            item["ocop_rating"] = safe_int_convert(details.get("ocop_rating"))
-            item["num_reviews"] = safe_int_convert(details.get("num_reviews"))
-            # Thêm các trường khác từ details nếu cần cho lọc/sort
-            item["category"] = details.get("category", "")
-            item["origin"] = details.get("origin", "") # Giả sử có trường origin trong product_map
-            item["sold"] = safe_int_convert(details.get("sold"))
-
-            temp_list.append(item)
-        current_df_source = pd.DataFrame(temp_list)
-        if current_df_source.empty:
-             return {"products": [], "count": 0, "page": page, "pages": 0, "status": "success", "message":"No product data available from JSON map."}
+# --- GỢI Ý CHO NHIỀU USER CÙNG LÚC (BATCH, VECTOR HÓA) ---
+BATCH_SCORE_BUFFER_CELLS = 2 ** 25 # Số ô float32 tối đa của một khối điểm users×items (~128MB)
+
+def _normalize_batch_input(users_interactions):
+    """Chấp nhận {user_id: [pid, ...]} hoặc [{"user_id": ..., "interacted_product_ids": [...]}, ...]."""
+    if isinstance(users_interactions, dict):
+        items = users_interactions.items()
+    elif isinstance(users_interactions, list):
+        items = []
+        for entry in users_interactions:
+            if not isinstance(entry, dict) or entry.get("user_id") is None:
+                raise ValueError("Each batch entry must be an object with 'user_id' and 'interacted_product_ids'.")
+            items.append((entry["user_id"], entry.get("interacted_product_ids") or []))
     else:
+        raise ValueError("users must be a JSON object or list.")
+    return [(str(user_id), parse_interacted_ids(pids or [])) for user_id, pids in items]
+
+def _score_user_chunk(state, user_idx_lists):
+    """Điểm (mean profile) của một khối user: ma trận user×item thưa nhân với ma trận tương đồng, trộn
+    (1 - w) * (U @ S) + w * (U @ C) với chỉ mục mua chung C nếu có. Chỉ tạo mảng users×items của khối."""
+    n_items = state.n_items
+    if sp is None:
+        # Không có scipy: cộng từng hàng như đường xử lý một user
+        scores = np.zeros((len(user_idx_lists), n_items), dtype=np.float32)
+        for row, idxs in enumerate(user_idx_lists):
+            for idx in idxs.tolist():
+                _add_score_row(state, idx, scores[row])
+            scores[row] /= len(idxs)
+        return scores
+
+    counts = np.array([len(idxs) for idxs in user_idx_lists], dtype=np.int64)
+    indptr = np.zeros(len(user_idx_lists) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    cols = np.concatenate(user_idx_lists)
+    weights = np.repeat(1.0 / counts, counts).astype(np.float32)
+    user_item = sp.csr_matrix((weights, cols, indptr), shape=(len(user_idx_lists), n_items))
+    scores = state.content_scores(user_item)
+    if state.copurchase_index is not None:
+        weight = np.float32(state.copurchase_weight)
+        scores *= np.float32(1.0) - weight
+        scores += state.copurchase_index.scores_for(user_item) * weight
+    return scores
+
+def get_user_recommendations_batch(users_interactions, top_n=TOP_N_FINAL_RECS):
+    """Gợi ý cho nhiều user: một phép nhân ma trận cho mỗi khối user, chọn top-N bằng argpartition."""
+    state = load_artifacts()
+    if state.similarity_source is None or len(state.id_map) == 0:
+        return {"error": "Required artifacts (similarity matrix, indices map, or product map) not properly loaded or cached."}
+    try:
+        entries = _normalize_batch_input(users_interactions)
+    except Exception as e:
+        return {"error": f"Invalid batch input: {e}"}
+
+    trace = request_metrics.current()
+    results = [None] * len(entries)
+    popular_recs = None
+    to_score = [] # (vị trí trong results, user_id, mảng index đã tương tác)
+    for pos, (user_id, pids) in enumerate(entries):
+        pids = resolve_product_ids(state, pids)
+        if not pids:
+            if popular_recs is None:
+                popular_recs = _get_popular_recommendations(state, top_n) or []
+            results[pos] = {"user_id_input": user_id, "recommendations": popular_recs, "message": "Showing popular products due to no interaction history."}
+            continue
+        with trace.stage("resolve_ids"):
+            idxs = _interacted_indices(state, pids)
+        trace.count("unknown_ids", len(set(pids)) - len(idxs))
+        if len(idxs) == 0:
+            results[pos] = {"user_id_input": user_id, "recommendations": [], "message": "None of the interacted products found in similarity matrix."}
+            continue
+        to_score.append((pos, user_id, idxs))
+
+    n_items = state.n_items
+    chunk_size = max(1, min(len(to_score), BATCH_SCORE_BUFFER_CELLS // max(n_items, 1)))
+    for start in range(0, len(to_score), chunk_size):
+        chunk = to_score[start:start + chunk_size]
+        idx_lists = [idxs for _, _, idxs in chunk]
+        with trace.stage("score"):
+            scores = _score_user_chunk(state, idx_lists)
+
+        with trace.stage("top_k"):
+            # Mặt nạ loại trừ: sản phẩm không có thông tin + sản phẩm user đã tương tác
+            scores[:, ~state.valid_rec_mask] = -np.inf
+            rows = np.repeat(np.arange(len(chunk)), [len(idxs) for idxs in idx_lists])
+            scores[rows, np.concatenate(idx_lists)] = -np.inf
+            chunk_top_idxs = _top_n_indices(scores, top_n)
+
+        for (pos, user_id, _), top_idxs in zip(chunk, chunk_top_idxs):
+            results[pos] = {"user_id_input": user_id, "recommendations": _recommendations_for_indices(state, top_idxs.tolist())}
+
+    return {"results": results, "count": len(results)}
+
+# --- HÀM LẤY DANH SÁCH SẢN PHẨM (CẬP NHẬT VỚI LỌC VÀ SẮP XẾP) ---
+def _catalog_source_dataframe(state):
+    """DataFrame nguồn để dựng chỉ mục danh mục: CSV / bảng sản phẩm, hoặc dựng từ product map nếu không có."""
+    if state.all_products_df is not None and not state.all_products_df.empty:
+        return state.all_products_df
+    if not state.product_map:
+        return None
+    temp_list = []
+    for id_str, details in state.product_map.items():
+        item = {"product_id": id_str}
+        item.update(details)
+        item["price"] = safe_float_convert(details.get("price"))
+        item["ocop_rating"] = safe_int_convert(details.get("ocop_rating"))
+        item["num_reviews"] = safe_int_convert(details.get("num_reviews"))
+        # Thêm các trường khác từ details nếu cần cho lọc/sort
+        item["category"] = details.get("category", "")
+        item["origin"] = details.get("origin", "") # Giả sử có trường origin trong product_map
+        item["sold"] = safe_int_convert(details.get("sold"))
+        temp_list.append(item)
+    return pd.DataFrame(temp_list)
+
+# --- TÌM KIẾM THEO TỪ KHÓA (BM25) VÀ GỢI Ý TỰ ĐỘNG ---
+def search_products(keyword, top_n=20, ids_only=False):
+    """ids_only: chỉ trả về product_id đã xếp hạng ("product_ids"; top_n=None: mọi kết quả), không hydrate bản ghi.
+    Node dùng để lọc và phân trang trên Mongo bằng một lần gọi."""
+    state = load_artifacts()
+    search_index = state.search_index()
+    if search_index is None:
+        return {"error": "Search index not available (no product data to build it from)."}
+    if not keyword or not str(keyword).strip():
+        return {"keyword": keyword, "product_ids": [], "count": 0} if ids_only else {"keyword": keyword, "results": [], "count": 0}
+
+    trace = request_metrics.current()
+    with trace.stage("search"):
+        hits = search_index.search(str(keyword), top_n=None)
+    if ids_only:
+        return {"keyword": keyword, "product_ids": [safe_int_convert(pid) for pid, _ in hits[:top_n]], "count": len(hits)}
+    results = []
+    top_hits = hits[:top_n]
+    with trace.stage("hydrate"):
+        records = state.records.fragments_at(state.records.lookup(pid for pid, _ in top_hits), keep_missing=True)
+    for (pid_str, score), record in zip(top_hits, records):
+        if record is not None:
+            results.append(record.with_fields(score=round(score, 4)))
+        else: # Sản phẩm chỉ có trong CSV, không có trong product map
+            results.append({"product_id": safe_int_convert(pid_str), "_id": None, "name": None, "score": round(score, 4)})
+    return {"keyword": keyword, "results": results, "count": len(hits)}
+
+def suggest_products(query, limit=DEFAULT_SUGGEST_LIMIT):
+    state = load_artifacts()
+    search_index = state.search_index()
+    if search_index is None:
+        return {"error": "Search index not available (no product data to build it from)."}
+    return {"query": query, "suggestions": search_index.suggest(str(query or ""), limit=limit)}
+
+def get_products_from_files(page=1, per_page=20, category=None, province=None, min_price=None, max_price=None, sort_by=None, keyword=None):
+    state = load_artifacts()
+
+    catalog = state.catalog_index
+    if catalog is None:
         return {"error": "No product data available (CSV and JSON map failed to load or are empty)."}
+    if len(catalog) == 0:
+        return {"products": [], "count": 0, "page": page, "pages": 0, "status": "success", "message":"No product data available from JSON map."}
 
-    df_to_filter = current_df_source
-    
-    # Lọc isActive nếu cột tồn tại (từ CSV)
-    if 'isActive' in df_to_filter.columns:
-        df_to_filter = df_to_filter[df_to_filter['isActive'] == True]
-
-
-    if category:
-        df_to_filter = df_to_filter[df_to_filter['category'].astype(str).str.contains(category, case=False, na=False)]
-    if province: # Giả định lọc theo trường 'origin'
-        df_to_filter = df_to_filter[df_to_filter['origin'].astype(str).str.contains(province, case=False, na=False)]
-    if min_price is not None:
-        min_p = safe_float_convert(min_price)
-        if min_p is not None: df_to_filter = df_to_filter[df_to_filter['price'].notna() & (df_to_filter['price'] >= min_p)]
-    if max_price is not None:
-        max_p = safe_float_convert(max_price)
-        if max_p is not None: df_to_filter = df_to_filter[df_to_filter['price'].notna() & (df_to_filter['price'] <= max_p)]
-    
-    if sort_by:
-        if sort_by == 'popular':
-            sort_col_popular = None
-            if 'sold' in df_to_filter.columns: sort_col_popular = 'sold'
-            elif 'num_reviews' in df_to_filter.columns: sort_col_popular = 'num_reviews'
-            elif 'rating' in df_to_filter.columns: sort_col_popular = 'rating' # Thêm rating làm lựa chọn
-            if sort_col_popular: df_to_filter = df_to_filter.sort_values(by=sort_col_popular, ascending=False, na_position='last')
-            else: df_to_filter = df_to_filter.sort_values(by='product_id', ascending=False, na_position='last') # Fallback
-        elif sort_by == 'newest':
-            # Cần cột 'createdAt' thực sự. Nếu không, dùng product_id (nếu số và tăng dần)
-            if 'createdAt' in df_to_filter.columns: # Giả sử cột này tồn tại và là datetime hoặc string có thể sort
-                 try: # Cố gắng chuyển sang datetime nếu là string
-                     df_to_filter['createdAt_dt'] = pd.to_datetime(df_to_filter['createdAt'], errors='coerce')
-                     df_to_filter = df_to_filter.sort_values(by='createdAt_dt', ascending=False, na_position='last').drop(columns=['createdAt_dt'])
-                 except: # Nếu lỗi, fallback
-                     df_to_filter = df_to_filter.sort_values(by='product_id', ascending=False, na_position='last')
-            else:
-                df_to_filter = df_to_filter.sort_values(by='product_id', ascending=False, na_position='last')
-        elif sort_by == 'priceAsc':
-            df_to_filter = df_to_filter.sort_values(by='price', ascending=True, na_position='last')
-        elif sort_by == 'priceDesc':
-            df_to_filter = df_to_filter.sort_values(by='price', ascending=False, na_position='last')
-    else: # Mặc định sort
-        df_to_filter = df_to_filter.sort_values(by='product_id', ascending=False, na_position='last')
-
-
-    total_products = len(df_to_filter)
-    start_index = (page - 1) * per_page
-    end_index = start_index + per_page
-    paginated_df = df_to_filter.iloc[start_index:end_index]
-    
-    products_summary = []
-    for _, row in paginated_df.iterrows():
-        pid_str_from_df = str(row.get("product_id"))
-        details_from_map = LOADED_PRODUCT_MAP.get(pid_str_from_df, {}) if LOADED_PRODUCT_MAP else {}
-
-        products_summary.append({
-            "_id": pid_str_from_df, # Frontend dùng _id là string
-            "name": row.get("name", details_from_map.get("name", "N/A")),
-            "images": [row.get("image_url", details_from_map.get("image_url"))] if row.get("image_url", details_from_map.get("image_url")) else ["/images/placeholder-image.png"],
-            "price": safe_float_convert(row.get("price", details_from_map.get("price"))),
-            "category": row.get("category", details_from_map.get("category")),
-            "province": row.get("origin", details_from_map.get("origin")), # Lấy từ origin
-            "rating": safe_int_convert(row.get("ocop_rating", details_from_map.get("ocop_rating"))),
-            "numReviews": safe_int_convert(row.get("num_reviews", details_from_map.get("num_reviews",0))),
-            "countInStock": safe_int_convert(row.get("countInStock", details_from_map.get("countInStock",1))) # Giả sử CSV có countInStock
-        })
-
-    return {
+    min_p = safe_float_convert(min_price) if min_price is not None else None
+    max_p = safe_float_convert(max_price) if max_price is not None else None
+    keyword = " ".join(str(keyword).lower().split()) if keyword is not None else None # Tìm kiếm không phân biệt hoa thường
+    cache_key = ("get_products", page, per_page, category or None, province or None, min_p, max_p, sort_by or None, keyword or None)
+    cached = _cached_response(state, cache_key)
+    if cached is not None:
+        return cached
+
+    trace = request_metrics.current()
+    ranked_positions = None
+    if keyword:
+        search_index = state.search_index()
+        if search_index is not None:
+            with trace.stage("search"):
+                ranked_positions = catalog.positions_for(pid for pid, _ in search_index.search(keyword, top_n=None))
+
+    with trace.stage("filter"):
+        total_products, page_positions = catalog.query(
+            page=page, per_page=per_page, category=category, province=province,
+            min_price=min_p, max_price=max_p, sort_by=sort_by, ranked_positions=ranked_positions
+        )
+    with trace.stage("hydrate"):
+        products_summary = catalog.summaries(page_positions, state.product_map, safe_float_convert, safe_int_convert)
+
+    return _cache_response(state, cache_key, {
         "products": products_summary, "count": total_products,
         "page": page, "pages": (total_products + per_page - 1) // per_page if per_page > 0 else 0,
         "status": "success"
-    }
+    })
+
+# --- ĐIỀU PHỐI COMMAND (dùng chung cho CLI một lần và chế độ serve) ---
+def parse_interacted_ids(value):
+    """Nhận list hoặc JSON string list, trả về list product_id dạng string."""
+    interacted_ids = json.loads(value) if isinstance(value, str) else value
+    if not isinstance(interacted_ids, list): raise ValueError("interacted_product_ids must be a JSON list.")
+    return [str(pid) for pid in interacted_ids]
+
+def _read_batch_users_file(path):
+    """Đọc file JSON ({user_id: [...]} hoặc list) hoặc JSONL (mỗi dòng một object user)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def _debug_requested(params):
+    return params.get("debug") in (True, 1, "1", "true", "True")
+
+def metrics_snapshot(reset=False):
+    """Command metrics: thời gian theo giai đoạn / bộ đếm gộp của mọi request process này đã xử lý."""
+    state = _STATE
+    snapshot = request_metrics.REGISTRY.snapshot()
+    snapshot.update(pid=os.getpid(), artifacts_version=state.version if state else None,
+                    artifacts_load_seconds=round(state.load_seconds, 3) if state and state.load_seconds is not None else None,
+                    profile_cache=state.profile_cache.stats() if state and state.profile_cache is not None else None,
+                    response_cache=state.response_cache.stats() if state and state.response_cache is not None else None)
+    if reset:
+        request_metrics.REGISTRY.reset()
+    return snapshot
+
+def dispatch_command(command, params, serialize=False):
+    """Thực thi một command với dict tham số (cùng tên với tham số CLI). Trả về dict kết quả;
+    serialize=True: JSONFragment (đo cả bước serialize) để server / CLI chèn nguyên văn.
+    Thời gian từng giai đoạn và bộ đếm của request được ghi vào request_metrics.REGISTRY.
+    Request có "debug": thêm trường "_debug" (thời gian từng giai đoạn, bộ đếm, ghi chú) vào cuối kết quả."""
+    with request_metrics.traced_request(command, debug=_debug_requested(params)) as trace:
+        result = _dispatch(command, params)
+        trace.error = not isinstance(result, dict) or "error" in result
+        if serialize:
+            with trace.stage("serialize"):
+                result = JSONFragment(dumps_json(result))
+    if trace.debug_enabled:
+        if serialize:
+            result = result.with_fields(_debug=trace.to_dict())
+        elif isinstance(result, dict):
+            result = dict(result, _debug=trace.to_dict())
+    return result
+
+def run_command(command, params):
+    """Handler của serve: dispatch_command(command, params, serialize=True)."""
+    return dispatch_command(command, params, serialize=True)
+
+def _dispatch(command, params):
+    try:
+        with request_metrics.current().stage("load"):
+            load_artifacts()
+
+        if command == "get_recommendations":
+            if params.get("product_id") is None:
+                return {"error": "product_id is required."}
+            return get_recommendations_from_precomputed(params["product_id"], int(params.get("top_n") or TOP_N_FINAL_RECS))
+        elif command == "get_user_recommendations":
+            try:
+                interacted_ids = parse_interacted_ids(params.get("interacted_product_ids", []))
+            except Exception as e:
+                return {"error": f"Invalid interacted_product_ids: {e}"}
+            return get_user_content_based_recommendations_dynamic(
+                str(params.get("user_id")), interacted_ids, int(params.get("top_n") or TOP_N_FINAL_RECS)
+            )
+        elif command == "update_user_profile":
+            if not params.get("user_id"):
+                return {"error": "user_id is required."}
+            try:
+                new_ids = parse_interacted_ids(params.get("product_ids", []))
+            except Exception as e:
+                return {"error": f"Invalid product_ids: {e}"}
+            return update_user_profile(str(params["user_id"]), new_ids)
+        elif command == "invalidate_user_profile":
+            user_id = params.get("user_id")
+            return invalidate_user_profile(str(user_id) if user_id else None)
+        elif command == "get_user_recommendations_batch":
+            users = params.get("users")
+            if users is None and params.get("users_file"):
+                users = _read_batch_users_file(params["users_file"])
+            elif isinstance(users, str):
+                users = json.loads(users)
+            if users is None:
+                return {"error": "users or users_file is required."}
+            return get_user_recommendations_batch(users, int(params.get("top_n") or TOP_N_FINAL_RECS))
+        elif command == "get_products":
+            return get_products_from_files(
+                page=int(params.get("page") or 1), per_page=int(params.get("per_page") or 20),
+                category=params.get("category"), province=params.get("province"),
+                min_price=params.get("min_price"), max_price=params.get("max_price"),
+                sort_by=params.get("sort_by"), keyword=params.get("keyword")
+            )
+        elif command == "search_products":
+            ids_only = bool(params.get("ids_only"))
+            top_n = int(params["top_n"]) if params.get("top_n") else (None if ids_only else 20)
+            return search_products(params.get("keyword"), top_n, ids_only=ids_only)
+        elif command == "suggest":
+            return suggest_products(params.get("query"), int(params.get("limit") or DEFAULT_SUGGEST_LIMIT))
+        elif command == "reload_artifacts":
+            return reload_artifacts(force=bool(params.get("force")))
+        elif command == "ping":
+            return {"status": "ok", "artifacts_version": load_artifacts().version, "pid": os.getpid()}
+        elif command == "metrics":
+            return metrics_snapshot(reset=bool(params.get("reset")))
+        return {"error": f"Unknown command: {command}"}
+    except FileNotFoundError as fnf_error:
+        return {"error": str(fnf_error), "trace": traceback.format_exc()}
+    except Exception as e:
+        return {"error": f"CLI Main Error: {type(e).__name__} - {e}", "trace": traceback.format_exc()}
+
+# Chế độ serve --workers N: command có hồ sơ user đi theo user_id về cố định một worker (cache hồ sơ nằm
+# trong từng worker nên không bị tính N lần, update/invalidate luôn tới đúng bản cache); xóa toàn bộ cache
+# gửi tới mọi worker; còn lại chia cho worker rảnh nhất.
+USER_ROUTED_COMMANDS = ("get_user_recommendations", "update_user_profile", "invalidate_user_profile")
+
+def serve_route(command, params):
+    import recommender_server
+    if command == "metrics":
+        return recommender_server.ROUTE_ALL # Mỗi worker có registry riêng
+    if command in USER_ROUTED_COMMANDS:
+        user_id = params.get("user_id")
+        if user_id:
+            return str(user_id)
+        return recommender_server.ROUTE_ALL if command == "invalidate_user_profile" else recommender_server.ROUTE_ANY
+    return recommender_server.ROUTE_ANY
+
+def _merge_worker_metrics(results):
+    """Command metrics với serve --workers: registry của từng worker, không gộp (phân vị không cộng được)."""
+    for result in results:
+        if not isinstance(result, dict) or "error" in result:
+            return result
+    return {"workers": len(results), "worker_metrics": results}
+
+def _preload_current_state():
+    """before_fork của serve --workers (chạy trong fork server): load artifact nếu chưa, dựng sẵn mọi phần lazy."""
+    try:
+        load_artifacts().preload()
+    except Exception as e:
+        print(f"[PYTHON SERVER] Failed to preload artifacts: {type(e).__name__} - {e}", file=sys.stderr)
+
+_SERVER_COMMANDS = { # serve --workers: chạy trong fork server, nơi giữ trạng thái mà worker được fork ra
+    "reload_artifacts": lambda params: reload_artifacts(force=bool(params.get("force"))),
+    "check_bundles": lambda params: check_bundles(),
+}
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Recommender CLI")
     subparsers = parser.add_subparsers(dest="command", required=True, help="Available commands")
+    # Mọi command: --debug thêm trường "_debug" (thời gian từng giai đoạn, bộ đếm, ghi chú) vào kết quả
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--debug", action="store_true", help="Append per-stage timings and counters to the result")
 
-    parser_get_rec = subparsers.add_parser("get_recommendations", help="Get product-based recommendations")
-    parser_get_rec.add_argument("--product_id", type=str, required=True)
+    parser_get_rec = subparsers.add_parser("get_recommendations", help="Get product-based recommendations", parents=[common])
+    parser_get_rec.add_argument("--product_id", type=str, required=True, help="product_id gốc hoặc _id MongoDB của sản phẩm")
     parser_get_rec.add_argument("--top_n", type=int, default=TOP_N_FINAL_RECS)
 
-    parser_get_user_rec = subparsers.add_parser("get_user_recommendations", help="Get user-based content recommendations")
+    parser_get_user_rec = subparsers.add_parser("get_user_recommendations", help="Get user-based content recommendations", parents=[common])
     parser_get_user_rec.add_argument("--user_id", type=str, required=True)
     parser_get_user_rec.add_argument("--top_n", type=int, default=TOP_N_FINAL_RECS)
-    parser_get_user_rec.add_argument("--interacted_product_ids", type=str, required=True, help='JSON string list of product IDs user interacted with')
+    parser_get_user_rec.add_argument("--interacted_product_ids", type=str, required=True, help='JSON string list of product IDs (product_id gốc hoặc _id MongoDB) user interacted with')
+
+    parser_update_profile = subparsers.add_parser("update_user_profile", help="Add newly ordered products to a cached user profile", parents=[common])
+    parser_update_profile.add_argument("--user_id", type=str, required=True)
+    parser_update_profile.add_argument("--product_ids", type=str, required=True, help='JSON string list of newly ordered product IDs')
 
-    parser_get_prod = subparsers.add_parser("get_products", help="List products with filters")
+    parser_invalidate_profile = subparsers.add_parser("invalidate_user_profile", help="Drop a cached user profile (all users if --user_id is omitted)", parents=[common])
+    parser_invalidate_profile.add_argument("--user_id", type=str)
+
+    parser_get_user_batch = subparsers.add_parser("get_user_recommendations_batch", help="Content recommendations for many users at once", parents=[common])
+    parser_get_user_batch.add_argument("--users", type=str, help='JSON {"user_id": [product_id, ...]} hoặc list object')
+    parser_get_user_batch.add_argument("--users_file", type=str, help="File JSON/JSONL chứa lịch sử tương tác của các user")
+    parser_get_user_batch.add_argument("--top_n", type=int, default=TOP_N_FINAL_RECS)
+    parser_get_user_batch.add_argument("--output", type=str, help="Ghi kết quả dạng JSONL (mỗi dòng một user) vào file này")
+
+    parser_get_prod = subparsers.add_parser("get_products", help="List products with filters", parents=[common])
     parser_get_prod.add_argument("--page", type=int, default=1)
     parser_get_prod.add_argument("--per_page", type=int, default=20)
     parser_get_prod.add_argument("--category", type=str)
@@ -344,33 +954,71 @@ if __name__ == '__main__':
     parser_get_prod.add_argument("--max_price", type=float)
     parser_get_prod.add_argument("--sort_by", type=str, choices=['popular', 'newest', 'priceAsc', 'priceDesc'])
     parser_get_prod.add_argument("--keyword", type=str) # Thêm keyword cho get_products
-    
+
+    parser_search = subparsers.add_parser("search_products", help="Keyword search (BM25) over product text", parents=[common])
+    parser_search.add_argument("--keyword", type=str, required=True)
+    parser_search.add_argument("--top_n", type=int, help="Mặc định 20; với --ids_only: mọi kết quả")
+    parser_search.add_argument("--ids_only", action="store_true", help="Chỉ trả về product_id đã xếp hạng")
+
+    parser_suggest = subparsers.add_parser("suggest", help="Autocomplete product names by prefix", parents=[common])
+    parser_suggest.add_argument("--query", type=str, required=True)
+    parser_suggest.add_argument("--limit", type=int, default=DEFAULT_SUGGEST_LIMIT)
+
+    parser_reload = subparsers.add_parser("reload_artifacts", help="Load the CURRENT bundle (only useful against a running server)", parents=[common])
+    parser_reload.add_argument("--force", action="store_true")
+
+    parser_metrics = subparsers.add_parser("metrics", help="Per-stage timings and counters of handled requests (only useful against a running server)", parents=[common])
+    parser_metrics.add_argument("--reset", action="store_true")
+
+    parser_serve = subparsers.add_parser("serve", help="Long-lived mode: load artifacts once, answer NDJSON requests")
+    parser_serve.add_argument("--socket", type=str, help="Unix socket path (mặc định: stdin/stdout)")
+    parser_serve.add_argument("--max_workers", type=int, default=4, help="Số thread xử lý request song song (mỗi process)")
+    parser_serve.add_argument("--workers", type=int, default=1, help="Số process worker pre-fork dùng chung artifact (1: một process nhiều thread)")
+
     args = parser.parse_args()
-    result = {}
-    try:
-        load_artifacts() 
 
-        if args.command == "get_recommendations":
-            result = get_recommendations_from_precomputed(args.product_id, args.top_n)
-        elif args.command == "get_user_recommendations":
+    if args.command == "serve":
+        import recommender_server
+        pool = None
+        if args.workers > 1:
+            def reload_and_restart(params):
+                result = pool.call_server("reload_artifacts", params)
+                if result.get("reloaded"):
+                    pool.restart()
+                return result
+            # Start trước khi có thread nào: artifact load trong fork server (before_fork), process này chỉ định tuyến
+            pool = recommender_server.WorkerPool(run_command, args.workers, threads_per_worker=args.max_workers,
+                                                 route=serve_route, master_commands={"reload_artifacts": reload_and_restart},
+                                                 server_commands=_SERVER_COMMANDS, merge_commands={"metrics": _merge_worker_metrics},
+                                                 before_fork=_preload_current_state).start()
+        else:
             try:
-                interacted_ids = json.loads(args.interacted_product_ids)
-                if not isinstance(interacted_ids, list): raise ValueError("interacted_product_ids must be a JSON list.")
-                interacted_ids = [str(pid) for pid in interacted_ids]
+                state = load_artifacts() # Load trước để request đầu tiên không phải chờ
+                # Chỉ mục tìm kiếm có thể phải dựng từ CSV (chậm) nên load ở thread nền, không chặn các request khác
+                threading.Thread(target=state.search_index, name="search-index-preload", daemon=True).start()
             except Exception as e:
-                result = {"error": f"Invalid interacted_product_ids: {e}"}
+                print(f"[PYTHON SERVER] Failed to preload artifacts: {type(e).__name__} - {e}", file=sys.stderr)
+        if BUNDLE_WATCH_INTERVAL > 0:
+            if pool is None:
+                check, on_switch = check_bundles, None
             else:
-                result = get_user_content_based_recommendations_dynamic(args.user_id, interacted_ids, args.top_n)
-        elif args.command == "get_products":
-            result = get_products_from_files(
-                page=args.page, per_page=args.per_page, category=args.category,
-                province=args.province, min_price=args.min_price, max_price=args.max_price,
-                sort_by=args.sort_by #  keyword=args.keyword # Cần truyền keyword vào hàm nếu get_products xử lý nó
-            )
-    except FileNotFoundError as fnf_error:
-        result = {"error": str(fnf_error), "trace": traceback.format_exc()}
-    except Exception as e:
-        result = {"error": f"CLI Main Error: {type(e).__name__} - {e}", "trace": traceback.format_exc()}
-    
-    print(json.dumps(result, ensure_ascii=False)) # Bỏ indent để output trên 1 dòng cho Node.js
-    sys.stdout.flush()
\ No newline at end of file
+                check, on_switch = (lambda: pool.call_server("check_bundles")), pool.restart
+            threading.Thread(target=watch_bundles, args=(BUNDLE_WATCH_INTERVAL, check, on_switch),
+                             name="bundle-watch", daemon=True).start()
+        if args.socket:
+            recommender_server.serve_unix_socket(run_command, args.socket, max_workers=args.max_workers, pool=pool)
+        else:
+            recommender_server.serve_stdio(run_command, max_workers=args.max_workers, pool=pool)
+        sys.exit(0)
+
+    params = {k: v for k, v in vars(args).items() if k != "command"}
+    to_file = args.command == "get_user_recommendations_batch" and args.output
+    result = dispatch_command(args.command, params, serialize=not to_file)
+    if to_file and "results" in result:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for user_result in result["results"]:
+                f.write(dumps_json(user_result) + "\n")
+        result = {"count": result["count"], "output": args.output}
+
+    print(dumps_json(result)) # Bỏ indent để output trên 1 dòng cho Node.js
+    sys.stdout.flush()
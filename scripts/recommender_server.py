@@ -0,0 +1,511 @@
+# scripts/recommender_server.py
+# Chế độ phục vụ lâu dài (long-lived) cho recommender_cli.py:
+# load artifacts một lần, nhận request dạng newline-delimited JSON (NDJSON)
+# qua stdin/stdout hoặc Unix socket, xử lý song song theo request id.
+#
+# Request:  {"id": 1, "command": "get_recommendations", "args": {"product_id": "26220", "top_n": 10}}
+# Response: {"id": 1, "result": {...}}
+# args có "debug": true -> result có thêm "_debug" (thời gian từng giai đoạn, bộ đếm; xem request_metrics.py).
+#
+# Mặc định request chạy trên thread pool của chính process này (bị GIL giới hạn ở ~1 core).
+# WorkerPool (serve --workers N): N process worker fork từ một fork server đã load artifact; các mảng numpy
+# (mmap từ file bundle hoặc kế thừa qua fork, không bao giờ bị ghi) nằm chung trang nhớ vật lý, nên
+# RSS tổng chỉ khoảng một bản mô hình. Process chính chỉ định tuyến request sang worker qua socketpair.
+import os
+import sys
+import gc
+import json
+import time
+import zlib
+import signal
+import socket
+import itertools
+import threading
+import traceback
+import socketserver
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from record_store import dumps as dumps_json # Chèn nguyên văn bản ghi sản phẩm đã serialize sẵn
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def _process_line(handler, line):
+    """Parse một dòng request, gọi handler và trả về dict response (luôn có 'id')."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "result": {"error": f"Invalid JSON request: {e}"}}
+    if not isinstance(request, dict):
+        return {"id": None, "result": {"error": "Request must be a JSON object."}}
+
+    request_id = request.get("id")
+    command = request.get("command")
+    args = request.get("args") or {}
+    if not command:
+        return {"id": request_id, "result": {"error": "Missing 'command' in request."}}
+    if not isinstance(args, dict):
+        return {"id": request_id, "result": {"error": "'args' must be a JSON object."}}
+
+    try:
+        result = handler(command, args)
+    except Exception as e:
+        result = {"error": f"Server Error: {type(e).__name__} - {e}", "trace": traceback.format_exc()}
+    return {"id": request_id, "result": result}
+
+
+class _LineWriter:
+    """Ghi response từng dòng, có lock để các thread không ghi chồng lên nhau."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        data = data + "\n"
+        with self._lock:
+            self._stream.write(data)
+            self._stream.flush()
+
+
+class _ThreadDispatcher:
+    """Xử lý request ngay trong process này trên thread pool; respond nhận response đã serialize."""
+
+    def __init__(self, handler, max_workers=DEFAULT_MAX_WORKERS):
+        self._handler = handler
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recommender")
+
+    def submit(self, line, respond):
+        return self._executor.submit(lambda: respond(dumps_json(_process_line(self._handler, line))))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def serve_stdio(handler, max_workers=DEFAULT_MAX_WORKERS, stdin=None, stdout=None, pool=None):
+    """Đọc request từ stdin cho đến EOF, ghi response ra stdout (không theo thứ tự, khớp bằng id).
+    pool: WorkerPool đã start() (chia request cho các process worker thay vì thread của process này)."""
+    stdin = stdin or sys.stdin
+    writer = _LineWriter(stdout or sys.stdout)
+    dispatcher = pool or _ThreadDispatcher(handler, max_workers)
+    try:
+        for line in stdin:
+            line = line.strip()
+            if line:
+                dispatcher.submit(line, writer.write)
+    finally:
+        dispatcher.shutdown(wait=True)
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_unix_socket(handler, socket_path, max_workers=DEFAULT_MAX_WORKERS, pool=None):
+    """Phục vụ cùng giao thức NDJSON qua Unix socket; mỗi kết nối có thể gửi nhiều request song song."""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    dispatcher = pool or _ThreadDispatcher(handler, max_workers)
+
+    class _ConnectionHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            stream = self.wfile
+            lock = threading.Lock()
+
+            def respond(response):
+                data = (response + "\n").encode("utf-8")
+                with lock:
+                    try:
+                        stream.write(data)
+                        stream.flush()
+                    except (BrokenPipeError, ConnectionResetError, ValueError):
+                        pass  # Client đã đóng kết nối
+
+            pending = []
+            for raw_line in self.rfile:
+                line = raw_line.decode("utf-8").strip()
+                if line:
+                    pending.append(dispatcher.submit(line, respond))
+            for future in pending:
+                future.result()
+
+    server = _ThreadingUnixServer(socket_path, _ConnectionHandler)
+    print(f"[PYTHON SERVER] Listening on unix socket {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        dispatcher.shutdown(wait=False)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+# --- Pre-fork worker pool ---
+# Giao thức process chính <-> worker (socketpair): mỗi dòng "<tag>\t<json>"; tag do process chính cấp
+# cho từng request, response của worker mang lại đúng tag đó (id của client nằm nguyên trong json).
+#
+# Process chính không bao giờ fork: nó có thread (đọc response của worker, executor, theo dõi bundle, server
+# socket) và fork trong process nhiều thread chỉ nhân bản thread đang gọi, lock do thread khác đang giữ bị kẹt
+# vĩnh viễn ở process con. start() fork một fork server khi process chính còn một thread; fork server load
+# artifact (before_fork), không tạo thread nào và fork worker theo yêu cầu qua kênh điều khiển: socketpair
+# SOCK_SEQPACKET, mỗi message một object JSON, socket của worker mới gửi về process chính bằng SCM_RIGHTS.
+ROUTE_ANY = None # Worker đang rảnh nhất
+ROUTE_ALL = "__all__" # Gửi tới mọi worker, gộp kết quả (vd. xóa toàn bộ cache hồ sơ)
+WORKER_RESPAWN_DELAY = 1.0 # Giây chờ trước khi thay worker chết bất thường (tránh fork liên tục nếu worker lỗi ngay khi chạy)
+CONTROL_MESSAGE_MAX = 1 << 16 # Kích thước tối đa một message trên kênh điều khiển với fork server
+
+
+def _worker_main(handler, sock, max_workers):
+    """Vòng lặp của process worker: nhận request có tag từ process chính đến khi EOF, xử lý trên thread pool."""
+    rfile = sock.makefile("rb")
+    lock = threading.Lock()
+
+    def run(tag, line):
+        data = (tag + "\t" + dumps_json(_process_line(handler, line)) + "\n").encode("utf-8")
+        with lock:
+            sock.sendall(data)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recommender-worker") as executor:
+        for raw_line in rfile:
+            tag, _, line = raw_line.decode("utf-8").rstrip("\n").partition("\t")
+            executor.submit(run, tag, line)
+
+
+def _merge_broadcast(results):
+    """Gộp kết quả của cùng một request trên mọi worker: lỗi đầu tiên nếu có; trường bool -> any(); còn lại lấy của worker đầu."""
+    for result in results:
+        if not isinstance(result, dict) or "error" in result:
+            return result
+    merged = dict(results[0])
+    for key, value in merged.items():
+        if isinstance(value, bool):
+            merged[key] = any(result.get(key) for result in results)
+    merged["workers"] = len(results)
+    return merged
+
+
+class _Worker:
+    def __init__(self, pid, sock):
+        self.pid = pid
+        self.sock = sock # Đầu socketpair phía process chính
+        self.rfile = sock.makefile("rb")
+        self.inflight = 0
+        self.closing = False
+        self._write_lock = threading.Lock()
+        self.reader = None
+
+    def send(self, data):
+        with self._write_lock:
+            self.sock.sendall(data)
+
+    def close(self):
+        """Báo EOF cho worker: nó trả lời nốt các request đang xử lý rồi tự thoát."""
+        self.closing = True
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class _Gather:
+    """Chờ đủ response của một request broadcast rồi trả một response gộp cho client."""
+
+    def __init__(self, n, client_id, respond, future, merge=None):
+        self._n, self._client_id, self._respond, self._future = n, client_id, respond, future
+        self._merge = merge or _merge_broadcast
+        self._results = []
+        self._lock = threading.Lock()
+
+    def add(self, response):
+        with self._lock:
+            self._results.append(json.loads(response).get("result"))
+            done = len(self._results) == self._n
+        if done:
+            self._respond(json.dumps({"id": self._client_id, "result": self._merge(self._results)}, ensure_ascii=False))
+            self._future.set_result(None)
+
+
+class WorkerPool:
+    """N process worker fork từ một fork server, chia request NDJSON giữa chúng.
+
+    handler: hàm (command, args) -> dict chạy trong worker (vd. dispatch_command).
+    route(command, args): ROUTE_ANY, ROUTE_ALL hoặc một khóa (vd. user_id) -> request cùng khóa luôn về cùng worker.
+    master_commands: {command: fn(args) -> dict} chạy ở process chính (vd. reload_artifacts: gọi fork server rồi restart).
+    server_commands: {command: fn(args) -> dict} chạy trong fork server qua call_server() (vd. load bundle mới).
+    merge_commands: {command: fn(results) -> dict} gộp kết quả broadcast (ROUTE_ALL) thay cho _merge_broadcast.
+    before_fork: gọi trong fork server trước mỗi lần fork worker để load và dựng sẵn mọi phần lazy của artifact.
+    start() phải được gọi trước khi process tạo thread nào."""
+
+    def __init__(self, handler, n_workers, threads_per_worker=DEFAULT_MAX_WORKERS, route=None, master_commands=None,
+                 server_commands=None, merge_commands=None, before_fork=None):
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1.")
+        self.n_workers = n_workers
+        self._handler = handler
+        self._threads_per_worker = threads_per_worker
+        self._route = route
+        self._master_commands = master_commands or {}
+        self._server_commands = server_commands or {}
+        self._merge_commands = merge_commands or {}
+        self._before_fork = before_fork
+        self._workers = []
+        self._retired = [] # Thế hệ worker cũ đang trả lời nốt request
+        self._pending = {} # tag -> (respond, future, client_id, worker)
+        self._tags = itertools.count(1)
+        self._lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+        self._control = None # Kênh điều khiển tới fork server
+        self._control_lock = threading.Lock() # Một yêu cầu tới fork server tại một thời điểm
+        self.fork_server_pid = None
+        self._stopping = False
+        self._master_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recommender-master") # Thread tạo khi cần
+
+    # --- Fork server (chỉ chạy trong process fork server) ---
+    def _prepare_fork(self):
+        if self._before_fork is not None:
+            self._before_fork()
+        # Đưa mọi object hiện có vào thế hệ "permanent" của GC: GC trong worker không chạm (và không làm
+        # copy-on-write) các trang chứa object của artifact. unfreeze trước để trạng thái cũ được thu hồi.
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def _fork_workers(self, control, count):
+        """Fork count worker; trả về (đầu socket phía process chính của từng worker, pid)."""
+        parent_socks, pids = [], []
+        for _ in range(count):
+            parent_sock, child_sock = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                exit_code = 0
+                try:
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    # Giữ đầu socket của worker khác thì chúng không nhận được EOF khi process chính thoát
+                    for sock in [control, parent_sock] + parent_socks:
+                        sock.close()
+                    _worker_main(self._handler, child_sock, self._threads_per_worker)
+                except BaseException:
+                    traceback.print_exc()
+                    exit_code = 1
+                finally:
+                    os._exit(exit_code)
+            child_sock.close()
+            parent_socks.append(parent_sock)
+            pids.append(pid)
+        return parent_socks, pids
+
+    def _call_server_command(self, command, args):
+        handler = self._server_commands.get(command)
+        if handler is None:
+            return {"error": f"Unknown fork server command: {command}"}
+        try:
+            return handler(args)
+        except Exception as e:
+            return {"error": f"Fork server error: {type(e).__name__} - {e}", "trace": traceback.format_exc()}
+
+    def _fork_server_main(self, control):
+        """Vòng lặp của fork server: phục vụ yêu cầu của process chính cho đến khi kênh điều khiển đóng."""
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN) # Kernel tự dọn worker đã thoát (fork server là process cha của chúng)
+        while True:
+            message = control.recv(CONTROL_MESSAGE_MAX)
+            if not message:
+                return # Process chính đã thoát hoặc shutdown()
+            request = json.loads(message)
+            if request.get("op") == "spawn":
+                self._prepare_fork()
+                parent_socks, pids = self._fork_workers(control, int(request.get("count", 1)))
+                socket.send_fds(control, [json.dumps({"pids": pids}).encode("utf-8")], [sock.fileno() for sock in parent_socks])
+                for sock in parent_socks:
+                    sock.close()
+            else:
+                result = self._call_server_command(request.get("command"), request.get("args") or {})
+                control.send(dumps_json(result).encode("utf-8"))
+
+    def _start_fork_server(self):
+        if threading.active_count() > 1:
+            print("[PYTHON SERVER] Warning: starting the fork server while other threads are running.", file=sys.stderr)
+        control, server_control = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                control.close()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                os.dup2(devnull, 0) # Fork server / worker không đọc stdin / ghi stdout của process chính (giao thức với Node.js)
+                os.dup2(devnull, 1)
+                self._fork_server_main(server_control)
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code) # Không chạy atexit / finally của process chính (vd. xóa file socket)
+        server_control.close()
+        self._control, self.fork_server_pid = control, pid
+
+    # --- Phía process chính ---
+    def call_server(self, command, args=None):
+        """Chạy server_commands[command](args) trong fork server, trả về dict kết quả."""
+        with self._control_lock:
+            try:
+                self._control.send(json.dumps({"op": "call", "command": command, "args": args or {}}).encode("utf-8"))
+                message = self._control.recv(CONTROL_MESSAGE_MAX)
+            except OSError as e:
+                return {"error": f"Recommender fork server unavailable: {e}"}
+        if not message:
+            return {"error": "Recommender fork server exited."}
+        return json.loads(message)
+
+    def _spawn(self, count):
+        """Nhờ fork server fork count worker; trả về các _Worker đã có thread đọc response."""
+        with self._control_lock:
+            self._control.send(json.dumps({"op": "spawn", "count": count}).encode("utf-8"))
+            message, fds, _, _ = socket.recv_fds(self._control, CONTROL_MESSAGE_MAX, count)
+        if not message or len(fds) != count:
+            for fd in fds:
+                os.close(fd)
+            raise RuntimeError("Recommender fork server exited.")
+        workers = []
+        for pid, fd in zip(json.loads(message)["pids"], fds):
+            worker = _Worker(pid, socket.socket(fileno=fd))
+            worker.reader = threading.Thread(target=self._read_responses, args=(worker,), name=f"worker-{pid}-reader", daemon=True)
+            worker.reader.start()
+            workers.append(worker)
+        return workers
+
+    def start(self):
+        with self._spawn_lock:
+            self._start_fork_server()
+            self._workers = self._spawn(self.n_workers)
+        print(f"[PYTHON SERVER] Started {self.n_workers} worker processes: {[w.pid for w in self._workers]} "
+              f"(fork server {self.fork_server_pid})", file=sys.stderr)
+        return self
+
+    def restart(self):
+        """Fork thế hệ worker mới từ trạng thái hiện tại của fork server (sau reload artifact) và cho
+        thế hệ cũ trả lời nốt request đang xử lý rồi thoát. Request mới đi ngay sang worker mới."""
+        with self._spawn_lock:
+            if self._stopping:
+                return
+            new_workers = self._spawn(self.n_workers)
+            old_workers, self._workers = self._workers, new_workers
+            self._retired.extend(old_workers)
+            for worker in old_workers:
+                worker.close()
+        print(f"[PYTHON SERVER] Restarted worker processes: {[w.pid for w in new_workers]}", file=sys.stderr)
+
+    def shutdown(self, wait=True):
+        self._stopping = True
+        self._master_executor.shutdown(wait=wait)
+        workers = self._workers + self._retired
+        for worker in workers:
+            worker.close()
+        if wait:
+            for worker in workers:
+                worker.reader.join()
+        with self._control_lock:
+            if self._control is not None:
+                self._control.close() # Fork server nhận EOF và thoát
+        if wait and self.fork_server_pid is not None:
+            os.waitpid(self.fork_server_pid, 0)
+
+    def _read_responses(self, worker):
+        try:
+            for raw_line in worker.rfile:
+                tag, _, response = raw_line.decode("utf-8").rstrip("\n").partition("\t")
+                with self._lock:
+                    entry = self._pending.pop(int(tag), None)
+                    worker.inflight -= 1
+                if entry is not None:
+                    self._finish(entry, response)
+        except (OSError, ValueError) as e:
+            print(f"[PYTHON SERVER] Lost connection to worker {worker.pid}: {e}", file=sys.stderr)
+        finally:
+            self._on_worker_exit(worker)
+
+    def _on_worker_exit(self, worker):
+        worker.rfile.close()
+        worker.sock.close()
+        with self._lock:
+            lost = [tag for tag, entry in self._pending.items() if entry[3] is worker]
+            lost_entries = [self._pending.pop(tag) for tag in lost]
+        for entry in lost_entries:
+            error = {"error": f"Recommender worker {worker.pid} exited before answering."}
+            self._finish(entry, json.dumps({"id": entry[2], "result": error}, ensure_ascii=False))
+        if worker in self._retired:
+            self._retired.remove(worker)
+        if worker.closing or self._stopping:
+            return
+        print(f"[PYTHON SERVER] Worker {worker.pid} exited unexpectedly; starting a replacement.", file=sys.stderr)
+        time.sleep(WORKER_RESPAWN_DELAY)
+        with self._spawn_lock:
+            if self._stopping or worker not in self._workers:
+                return
+            try:
+                replacement = self._spawn(1)[0]
+            except (OSError, RuntimeError) as e:
+                print(f"[PYTHON SERVER] Could not replace worker {worker.pid}: {e}", file=sys.stderr)
+                return
+            self._workers = [replacement if w is worker else w for w in self._workers]
+
+    # --- Định tuyến request ---
+    @staticmethod
+    def _finish(entry, response):
+        respond, future = entry[0], entry[1]
+        try:
+            respond(response)
+        finally:
+            if future is not None:
+                future.set_result(None)
+
+    def _send(self, worker, line, client_id, respond, future):
+        """Gửi một dòng request cho worker; False nếu worker đã đóng (đang restart) để chọn worker khác."""
+        tag = next(self._tags)
+        with self._lock:
+            self._pending[tag] = (respond, future, client_id, worker)
+            worker.inflight += 1
+        try:
+            worker.send(f"{tag}\t{line}\n".encode("utf-8"))
+            return True
+        except OSError:
+            with self._lock:
+                entry = self._pending.pop(tag, None)
+                worker.inflight -= 1
+            return entry is None # Đã được _on_worker_exit trả lỗi thì coi như xong
+
+    def _pick(self, workers, key):
+        if key is ROUTE_ANY:
+            return min(workers, key=lambda w: w.inflight)
+        return workers[zlib.crc32(str(key).encode("utf-8")) % len(workers)]
+
+    def submit(self, line, respond):
+        """Chuyển một dòng request cho worker phù hợp; respond(response_json) được gọi khi có kết quả."""
+        future = Future()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None # Worker sẽ trả lỗi "Invalid JSON request"
+        command, args, client_id = None, {}, None
+        if isinstance(request, dict):
+            command, client_id = request.get("command"), request.get("id")
+            args = request.get("args") if isinstance(request.get("args"), dict) else {}
+
+        if command in self._master_commands:
+            handler = self._master_commands[command]
+            self._master_executor.submit(lambda: self._finish(
+                (respond, future), dumps_json(_process_line(lambda _command, _args: handler(_args), line))))
+            return future
+
+        key = self._route(command, args) if (self._route is not None and command) else ROUTE_ANY
+        for _ in range(3): # Worker vừa bị restart giữa chừng: thử lại trên thế hệ mới
+            workers = self._workers
+            if key == ROUTE_ALL:
+                gather = _Gather(len(workers), client_id, respond, future, merge=self._merge_commands.get(command))
+                for worker in workers:
+                    if not self._send(worker, line, client_id, gather.add, None):
+                        gather.add(json.dumps({"id": client_id, "result": {"error": "Recommender worker is restarting."}}))
+                return future
+            if self._send(self._pick(workers, key), line, client_id, respond, future):
+                return future
+        self._finish((respond, future), json.dumps({"id": client_id, "result": {"error": "No recommender worker available."}}))
+        return future
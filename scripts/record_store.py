@@ -0,0 +1,212 @@
+# scripts/record_store.py
+# Bản ghi sản phẩm dựng sẵn cho response gợi ý / tìm kiếm.
+#   - mỗi sản phẩm trong product map -> MỘT bản ghi cố định (RECORD_FIELDS), đã chuyển kiểu (giá float,
+#     ocop_rating int) và đã serialize thành đoạn JSON một lần lúc dựng
+#   - lưu dạng mảng (product_id int64 tăng dần + offsets + bytes UTF-8); khi load, mọi đoạn nằm trong MỘT
+#     chuỗi Python: không có dict nào cho từng sản phẩm, và worker pre-fork dùng chung chuỗi đó (copy-on-write
+#     chỉ chạm trang chứa header của object)
+#   - request chỉ tra vị trí và cắt chuỗi; dumps() ghép nguyên văn các đoạn vào response
+#
+# Mọi command trả sản phẩm (get_recommendations, gợi ý theo user, batch, sản phẩm phổ biến, tìm kiếm)
+# dùng cùng bản ghi này nên cùng một định dạng (get_recommendations chỉ khác ở product_id dạng chuỗi, như trước đây).
+import os
+import json
+import pathlib
+from collections.abc import Mapping
+
+import numpy as np
+
+RECORD_FIELDS = ("product_id", "_id", "name", "price", "image_url", "product_url", "ocop_rating")
+IDS_FILE = 'product_ids.npy'
+OFFSETS_FILE = 'fragments.offsets.npy' # Offset theo ký tự (không phải byte) trong chuỗi đã giải mã
+DATA_FILE = 'fragments.utf8.npy'
+
+
+def safe_int_convert(value):
+    try: return int(float(value))
+    except (ValueError, TypeError, OverflowError): return None
+
+def safe_float_convert(value):
+    try: return float(value)
+    except (ValueError, TypeError, OverflowError): return None
+
+
+def _int_id(value):
+    """product_id -> int; None nếu không phải số nguyên viết chuẩn (như artifact_bundle: '026' không khớp 26)."""
+    if type(value) is int:
+        return value
+    try:
+        pid = int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return pid if str(pid) == str(value) else None
+
+
+def product_record(product_id, details):
+    """Bản ghi của một sản phẩm từ mục product map (cùng quy tắc chuyển kiểu với các response trước đây)."""
+    return {
+        "product_id": safe_int_convert(product_id),
+        "_id": details.get("_id"),
+        "name": details.get("name", "N/A"),
+        "price": safe_float_convert(details.get("price")),
+        "image_url": details.get("image_url", ""),
+        "product_url": details.get("product_url", ""),
+        "ocop_rating": safe_int_convert(details.get("ocop_rating")),
+    }
+
+
+class JSONFragment(Mapping):
+    """Đoạn JSON đã serialize sẵn. dumps() chèn nguyên văn; code Python vẫn đọc được như dict (parse khi cần)."""
+    __slots__ = ('raw', '_value')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._value = None
+
+    def _data(self):
+        if self._value is None:
+            self._value = json.loads(self.raw)
+        return self._value
+
+    def __getitem__(self, key):
+        return self._data()[key]
+
+    def __iter__(self):
+        return iter(self._data())
+
+    def __len__(self):
+        return len(self._data())
+
+    def __repr__(self):
+        return f"JSONFragment({self.raw})"
+
+    def with_fields(self, **fields):
+        """Đoạn mới có thêm các trường (vd. score của kết quả tìm kiếm), không parse lại đoạn gốc."""
+        extra = "".join(f", {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}" for key, value in fields.items())
+        return JSONFragment(self.raw[:-1] + extra + "}")
+
+
+# Chuỗi giữ chỗ cho JSONFragment khi json.dumps (C) serialize phần còn lại của response
+_PLACEHOLDER = "\x00json-fragment\x00"
+_ENCODED_PLACEHOLDER = json.dumps(_PLACEHOLDER)
+
+def _plain(value):
+    if isinstance(value, JSONFragment):
+        return value._data()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """json.dumps(obj, ensure_ascii=False) nhưng chèn nguyên văn các JSONFragment thay vì serialize lại."""
+    fragments = []
+
+    def default(value):
+        if isinstance(value, JSONFragment):
+            fragments.append(value.raw)
+            return _PLACEHOLDER
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    text = json.dumps(obj, ensure_ascii=False, default=default)
+    if not fragments:
+        return text
+    parts = text.split(_ENCODED_PLACEHOLDER)
+    if len(parts) != len(fragments) + 1: # Dữ liệu tình cờ chứa đúng chuỗi giữ chỗ: serialize thường
+        return json.dumps(obj, ensure_ascii=False, default=_plain)
+    pieces = [parts[0]]
+    for fragment, part in zip(fragments, parts[1:]):
+        pieces.append(fragment)
+        pieces.append(part)
+    return "".join(pieces)
+
+
+def _with_string_id(fragment, product_id):
+    """Đoạn bản ghi với "product_id" dạng chuỗi; trường đầu của mọi bản ghi là "product_id": <int>."""
+    prefix = f'{{"product_id": {product_id}'
+    return JSONFragment(f'{{"product_id": "{product_id}"' + fragment.raw[len(prefix):])
+
+
+class ProductRecordStore:
+    """product_id -> bản ghi JSON dựng sẵn. product_ids: int64 tăng dần; đoạn i = text[offsets[i]:offsets[i+1]]."""
+
+    def __init__(self, product_ids, offsets, text):
+        self.product_ids = product_ids
+        self.offsets = offsets
+        self.text = text
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    @classmethod
+    def build(cls, product_map):
+        """Từ product map (dict JSON hoặc ProductDetails); bỏ sản phẩm không có thông tin hoặc ID không phải số."""
+        fragments = {}
+        for pid_str in (product_map or {}):
+            pid = _int_id(pid_str)
+            details = product_map[pid_str]
+            if pid is None or not details or pid in fragments:
+                continue
+            fragments[pid] = json.dumps(product_record(pid_str, details), ensure_ascii=False)
+        product_ids = np.array(sorted(fragments), dtype=np.int64)
+        ordered = [fragments[pid] for pid in product_ids.tolist()]
+        offsets = np.zeros(len(ordered) + 1, dtype=np.int64)
+        np.cumsum([len(fragment) for fragment in ordered], out=offsets[1:])
+        return cls(product_ids, offsets, "".join(ordered))
+
+    def save(self, directory):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(directory / IDS_FILE, self.product_ids)
+        np.save(directory / OFFSETS_FILE, self.offsets)
+        np.save(directory / DATA_FILE, np.frombuffer(self.text.encode('utf-8'), dtype=np.uint8))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = pathlib.Path(directory)
+        mmap_mode = 'r' if mmap else None
+        text = np.load(directory / DATA_FILE, mmap_mode=mmap_mode).tobytes().decode('utf-8')
+        offsets = np.load(directory / OFFSETS_FILE, mmap_mode=mmap_mode)
+        if len(offsets) == 0 or offsets[-1] != len(text):
+            raise ValueError(f"Record store at {directory} is inconsistent: offsets end at {offsets[-1] if len(offsets) else None}, text has {len(text)} characters.")
+        return cls(np.load(directory / IDS_FILE, mmap_mode=mmap_mode), offsets, text)
+
+    @classmethod
+    def load_or_build(cls, directory, product_map):
+        if directory is not None and os.path.exists(pathlib.Path(directory) / IDS_FILE):
+            return cls.load(directory)
+        return cls.build(product_map)
+
+    def positions_of(self, product_ids):
+        """Vị trí bản ghi của mảng product_id int (-1: không có bản ghi)."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if len(self.product_ids) == 0:
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.product_ids, product_ids), len(self.product_ids) - 1)
+        return np.where(self.product_ids[pos] == product_ids, pos, -1)
+
+    def lookup(self, product_ids):
+        """Như positions_of nhưng nhận product_id dạng string / int bất kỳ (ID không hợp lệ -> -1)."""
+        pids = [_int_id(pid) for pid in product_ids]
+        return self.positions_of([-1 if pid is None else pid for pid in pids])
+
+    def fragments_at(self, positions, keep_missing=False):
+        """Bản ghi tại các vị trí, giữ thứ tự; vị trí -1 bị bỏ (keep_missing: thay bằng None)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        found = positions >= 0
+        text = self.text
+        starts, ends = self.offsets[positions[found]].tolist(), self.offsets[positions[found] + 1].tolist()
+        fragments = [JSONFragment(text[start:end]) for start, end in zip(starts, ends)]
+        if not keep_missing:
+            return fragments
+        fragments = iter(fragments)
+        return [next(fragments) if is_found else None for is_found in found.tolist()]
+
+    def records(self, product_ids, limit=None, string_ids=False):
+        """Bản ghi của các product_id có trong store (giữ thứ tự, tối đa limit).
+        string_ids: product_id dạng chuỗi như response get_recommendations trước đây (đọc thẳng từ file precomputed JSON)."""
+        positions = self.lookup(product_ids)
+        positions = positions[positions >= 0]
+        if limit is not None:
+            positions = positions[:limit]
+        fragments = self.fragments_at(positions)
+        if string_ids:
+            fragments = [_with_string_id(fragment, pid) for fragment, pid in zip(fragments, self.product_ids[positions].tolist())]
+        return fragments
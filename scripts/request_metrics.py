@@ -0,0 +1,194 @@
+# scripts/request_metrics.py
+# Đo thời gian theo giai đoạn và bộ đếm cho từng request của recommender (thay cho print debug ra stderr).
+#   - RequestTrace: một request. stage(name) cộng dồn thời gian của giai đoạn (load, resolve_ids, score, top_k,
+#     hydrate, serialize, ...), count(name) tăng bộ đếm (cache hit, ID không biết, ...), debug(msg) ghi chú
+#     chi tiết - chỉ giữ lại khi request bật debug.
+#   - Trace của request đang chạy nằm trong thread-local: code bên trong gọi current() mà không phải truyền
+#     tham số qua mọi hàm. Ngoài request (preload, script khác import hàm) current() là trace rỗng, không tốn gì.
+#   - MetricsRegistry: gộp mọi request đã xong của process (số lượng, lỗi, thời gian mỗi giai đoạn, bộ đếm,
+#     p50 / p95 / p99 trên các request gần nhất); recommender_cli.py trả về qua command "metrics".
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+DEFAULT_LATENCY_WINDOW = 2048 # Số request gần nhất (mỗi command) dùng để tính phân vị độ trễ
+TOTAL_STAGE = "total"
+
+
+class _StageTimer:
+    __slots__ = ('_trace', '_name', '_started')
+
+    def __init__(self, trace, name):
+        self._trace, self._name = trace, name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._trace.add_time(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class RequestTrace:
+    """Thời gian (giây) theo giai đoạn + bộ đếm + ghi chú debug của một request."""
+
+    def __init__(self, command, debug=False):
+        self.command = command
+        self.debug_enabled = bool(debug)
+        self.started = time.perf_counter()
+        self.elapsed = None # Đặt khi request kết thúc (finish)
+        self.error = False
+        self.timings = {}
+        self.counters = {}
+        self.messages = []
+
+    def stage(self, name):
+        """with trace.stage("score"): ... - cộng dồn nếu giai đoạn lặp lại trong cùng request."""
+        return _StageTimer(self, name)
+
+    def add_time(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        if n:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def debug(self, message):
+        if self.debug_enabled:
+            self.messages.append(message)
+
+    def finish(self):
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self):
+        """Trailer "_debug" trả kèm kết quả khi request bật debug."""
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        timings_ms = {name: round(seconds * 1000.0, 3) for name, seconds in self.timings.items()}
+        timings_ms[TOTAL_STAGE] = round(elapsed * 1000.0, 3)
+        return {"command": self.command, "timings_ms": timings_ms, "counters": dict(self.counters), "messages": list(self.messages)}
+
+
+class _NullTrace:
+    """current() khi không có request nào đang chạy trên thread: mọi thao tác đều bỏ qua."""
+    debug_enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def debug(self, message):
+        pass
+
+NULL_TRACE = _NullTrace()
+_local = threading.local()
+
+
+def current():
+    """Trace của request đang chạy trên thread này (NULL_TRACE nếu không có)."""
+    return getattr(_local, 'trace', None) or NULL_TRACE
+
+
+class _CommandStats:
+    __slots__ = ('count', 'errors', 'latencies', 'stage_totals', 'stage_max', 'counters')
+
+    def __init__(self, window):
+        self.count = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.stage_totals = {}
+        self.stage_max = {}
+        self.counters = {}
+
+
+class MetricsRegistry:
+    """Tổng hợp các RequestTrace đã xong theo command (thread-safe)."""
+
+    def __init__(self, latency_window=DEFAULT_LATENCY_WINDOW):
+        self._latency_window = latency_window
+        self._lock = threading.Lock()
+        self._commands = {}
+        self.started_at = time.time()
+
+    def record(self, trace):
+        with self._lock:
+            stats = self._commands.get(trace.command)
+            if stats is None:
+                stats = self._commands[trace.command] = _CommandStats(self._latency_window)
+            stats.count += 1
+            stats.errors += trace.error
+            stats.latencies.append(trace.elapsed)
+            for name, seconds in trace.timings.items():
+                stats.stage_totals[name] = stats.stage_totals.get(name, 0.0) + seconds
+                if seconds > stats.stage_max.get(name, 0.0):
+                    stats.stage_max[name] = seconds
+            for name, n in trace.counters.items():
+                stats.counters[name] = stats.counters.get(name, 0) + n
+
+    def snapshot(self):
+        """{"uptime_seconds", "commands": {command: {count, errors, latency_ms, stages_ms, counters}}}."""
+        with self._lock:
+            commands = {}
+            for command, stats in self._commands.items():
+                latencies = np.fromiter(stats.latencies, dtype=np.float64, count=len(stats.latencies)) * 1000.0
+                latency_ms = {"window": len(latencies)}
+                if len(latencies):
+                    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+                    latency_ms.update(mean=round(float(latencies.mean()), 3), p50=round(float(p50), 3), p95=round(float(p95), 3),
+                                      p99=round(float(p99), 3), max=round(float(latencies.max()), 3))
+                stages_ms = {name: {"total": round(total * 1000.0, 3), "mean": round(total * 1000.0 / stats.count, 3),
+                                    "max": round(stats.stage_max[name] * 1000.0, 3)}
+                             for name, total in stats.stage_totals.items()}
+                commands[command] = {"count": stats.count, "errors": stats.errors, "latency_ms": latency_ms,
+                                     "stages_ms": stages_ms, "counters": dict(stats.counters)}
+        return {"uptime_seconds": round(time.time() - self.started_at, 1), "commands": commands}
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+            self.started_at = time.time()
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def traced_request(command, debug=False, registry=REGISTRY):
+    """with traced_request(command, debug) as trace: ... - đặt trace làm current() của thread, xong thì ghi vào
+    registry. Request lồng nhau (command gọi lại dispatch) dùng chung trace của request ngoài cùng."""
+    outer = getattr(_local, 'trace', None)
+    if outer is not None:
+        yield outer
+        return
+    trace = _local.trace = RequestTrace(command, debug=debug)
+    try:
+        yield trace
+    except BaseException:
+        trace.error = True
+        raise
+    finally:
+        _local.trace = None
+        trace.finish()
+        if registry is not None:
+            registry.record(trace)
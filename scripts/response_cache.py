@@ -0,0 +1,76 @@
+# scripts/response_cache.py
+# Cache LRU (TTL tùy chọn) cho kết quả các command đọc-nhiều: gợi ý theo sản phẩm, gợi ý theo tập sản phẩm
+# đã tương tác, các trang get_products. Khóa do nơi gọi chuẩn hóa (tuple). Cache gắn với một ArtifactState
+# nên đổi phiên bản artifact là có cache rỗng mới - không cần xóa thủ công.
+# Kết quả dạng danh sách top-N lưu kèm N: request N nhỏ hơn được cắt từ bản N lớn hơn đã cache.
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096
+
+
+class ResponseCache:
+    """LRU theo khóa; mỗi mục là (top_n, hạn dùng, response). Response trả ra được dùng chung, không sửa tại chỗ."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=None):
+        self.capacity = max(1, int(max_entries))
+        self.ttl = float(ttl) if ttl else None # Giây; None: chỉ hết hạn khi đổi phiên bản artifact hoặc bị đẩy ra
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0 # Trong số hits: cắt từ bản top-N lớn hơn
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, top_n=None, list_field=None):
+        """Response đã cache cho key, None nếu không có / hết hạn / chỉ có bản top-N nhỏ hơn top_n.
+        list_field: trường danh sách được cắt còn top_n phần tử khi bản cache lớn hơn."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_top_n, expires_at, response = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            if top_n is not None and cached_top_n is not None and cached_top_n < top_n:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if top_n is None or list_field is None or cached_top_n == top_n:
+                return response
+            self.prefix_hits += 1
+        trimmed = dict(response)
+        trimmed[list_field] = response[list_field][:top_n]
+        return trimmed
+
+    def put(self, key, response, top_n=None):
+        """Lưu response; giữ bản top-N lớn hơn nếu đã có (phục vụ được cả các request nhỏ hơn)."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and top_n is not None and entry[0] is not None and entry[0] > top_n:
+                if entry[1] is None or time.monotonic() < entry[1]:
+                    return
+            self._entries[key] = (top_n, expires_at, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "capacity": self.capacity, "ttl_seconds": self.ttl, "hits": self.hits,
+                "prefix_hits": self.prefix_hits, "misses": self.misses, "expired": self.expired, "evictions": self.evictions}
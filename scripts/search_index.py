@@ -0,0 +1,331 @@
+# scripts/search_index.py
+# Chỉ mục đảo (inverted index) cho tìm kiếm sản phẩm theo từ khóa, xếp hạng BM25.
+# Mỗi term có hai bộ postings: có dấu (NFC, lowercase) và bỏ dấu (khóa tìm kiếm không dấu).
+# Truy vấn có dấu tra bộ có dấu, truy vấn gõ không dấu tra bộ bỏ dấu.
+# Tokenize dùng chung advanced_tokenizer với notebook (text_processing.py).
+#
+#   meta.json                          n_docs, avgdl, k1, b, trọng số field, tokenizer đã dùng
+#   product_ids.json / names.json      product_id (string) và tên của từng document
+#   {exact,folded}_terms.json          từ vựng đã sắp xếp (term_id = vị trí; prefix = một khoảng liên tiếp)
+#   {exact,folded}_indptr.npy  int64   postings của term_id t nằm ở [indptr[t], indptr[t+1])
+#   {exact,folded}_docs.npy    int32   document chứa term
+#   {exact,folded}_tf.npy      float32 tần suất term (đã nhân trọng số field)
+#   doc_len.npy                float32 độ dài document (đã nhân trọng số field)
+#   name_keys.json / name_key_docs.npy tên sản phẩm bỏ dấu đã sắp xếp, cho gợi ý "bắt đầu bằng"
+#
+# Dùng:
+#   python search_index.py build                      # từ CSV sản phẩm mặc định
+#   python search_index.py search --query "nuoc mam phu quoc"
+#   python search_index.py suggest --query "tra"
+import os
+import sys
+import json
+import bisect
+import argparse
+import pathlib
+import unicodedata
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+from text_processing import (advanced_tokenizer, apply_folded_synonyms, fold_diacritics, has_diacritics,
+                             normalize_text, word_tokenize, TOKEN_MIN_LEN)
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+PRODUCT_DATA_CSV_FILE = ARTIFACTS_DIR / 'buudien_ocop_products_detailed_v2_rerun.csv'
+SEARCH_INDEX_DIR = ARTIFACTS_DIR / 'search_index_v2_adv'
+
+# Tên sản phẩm quan trọng hơn mô tả (tương tự NAME_WEIGHT khi dựng TF-IDF)
+FIELD_WEIGHTS = {'name': 3.0, 'category': 1.5, 'origin': 1.0, 'producer': 1.0, 'short_description': 1.0, 'description': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 50 # Số term tối đa được mở rộng từ tiền tố khi gợi ý
+DEFAULT_SUGGEST_LIMIT = 10
+
+META_FILE = 'meta.json'
+PRODUCT_IDS_FILE = 'product_ids.json'
+NAMES_FILE = 'names.json'
+DOC_LEN_FILE = 'doc_len.npy'
+NAME_KEYS_FILE = 'name_keys.json'
+NAME_KEY_DOCS_FILE = 'name_key_docs.npy'
+
+
+def tokenizer_name():
+    return "underthesea" if word_tokenize is not None else "whitespace"
+
+
+def _document_terms(text):
+    """Token của một field; từ ghép underthesea ('nước_mắm') được index thêm từng âm tiết."""
+    for token in advanced_tokenizer(normalize_text(text)):
+        yield token
+        if '_' in token:
+            for part in token.split('_'):
+                if len(part) >= TOKEN_MIN_LEN:
+                    yield part
+
+
+class Postings:
+    """Một bộ từ vựng (đã sắp xếp) + postings dạng CSR."""
+
+    def __init__(self, terms, indptr, docs, tfs):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+
+    @classmethod
+    def from_counters(cls, counters):
+        """counters: list Counter {term: tf} theo từng document."""
+        terms = sorted(set().union(*counters)) if counters else []
+        term_ids = {term: i for i, term in enumerate(terms)}
+        rows, docs, tfs = [], [], []
+        for doc, counter in enumerate(counters):
+            for term, tf in counter.items():
+                rows.append(term_ids[term])
+                docs.append(doc)
+                tfs.append(tf)
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.lexsort((np.asarray(docs, dtype=np.int64), rows))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(terms)), out=indptr[1:])
+        return cls(terms, indptr, np.asarray(docs, dtype=np.int32)[order], np.asarray(tfs, dtype=np.float32)[order])
+
+    def postings(self, term_id):
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def prefix_range(self, prefix):
+        """Khoảng term_id [lo, hi) của các term bắt đầu bằng prefix (từ vựng đã sắp xếp)."""
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix + '\U0010ffff')
+        return lo, hi
+
+    def save(self, directory, prefix):
+        with open(directory / f'{prefix}_terms.json', 'w', encoding='utf-8') as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        np.save(directory / f'{prefix}_indptr.npy', self.indptr)
+        np.save(directory / f'{prefix}_docs.npy', self.docs)
+        np.save(directory / f'{prefix}_tf.npy', self.tfs)
+
+    @classmethod
+    def load(cls, directory, prefix, mmap_mode='r'):
+        with open(directory / f'{prefix}_terms.json', 'r', encoding='utf-8') as f:
+            terms = json.load(f)
+        return cls(terms,
+                   np.load(directory / f'{prefix}_indptr.npy', mmap_mode=mmap_mode),
+                   np.load(directory / f'{prefix}_docs.npy', mmap_mode=mmap_mode),
+                   np.load(directory / f'{prefix}_tf.npy', mmap_mode=mmap_mode))
+
+
+class SearchIndex:
+    def __init__(self, product_ids, names, exact, folded, doc_len, name_keys, name_key_docs,
+                 k1=BM25_K1, b=BM25_B, tokenizer=None):
+        self.product_ids = product_ids
+        self.names = names
+        self.exact = exact
+        self.folded = folded
+        self.doc_len = doc_len
+        self.name_keys = name_keys
+        self.name_key_docs = name_key_docs
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.tokenizer = tokenizer or tokenizer_name()
+        self.n_docs = len(product_ids)
+        avgdl = float(np.mean(doc_len)) if self.n_docs else 0.0
+        self.avgdl = avgdl
+        # Phần mẫu số BM25 không phụ thuộc term, tính một lần
+        self._length_norm = (self.k1 * (1.0 - self.b + self.b * np.asarray(doc_len, dtype=np.float32) / avgdl)).astype(np.float32) \
+            if avgdl > 0 else np.full(self.n_docs, self.k1, dtype=np.float32)
+
+    def __len__(self):
+        return self.n_docs
+
+    # --- Dựng / lưu / load ---
+    @classmethod
+    def build_from_dataframe(cls, df, field_weights=FIELD_WEIGHTS):
+        df = df.dropna(subset=['product_id'])
+        fields = [col for col in field_weights if col in df.columns]
+        product_ids = df['product_id'].astype(str).tolist()
+        raw_names = df['name'].tolist() if 'name' in df.columns else [""] * len(df)
+        names = [unicodedata.normalize('NFC', n).strip() if isinstance(n, str) else "" for n in raw_names]
+
+        exact_counters, folded_counters = [], []
+        doc_len = np.zeros(len(df), dtype=np.float32)
+        columns = {col: df[col].tolist() for col in fields}
+        for doc in range(len(df)):
+            exact, folded = Counter(), Counter()
+            for col in fields:
+                value = columns[col][doc]
+                if not isinstance(value, str) or not value.strip():
+                    continue
+                weight = field_weights[col]
+                for term in _document_terms(value):
+                    exact[term] += weight
+                    folded[fold_diacritics(term)] += weight
+            exact_counters.append(exact)
+            folded_counters.append(folded)
+            doc_len[doc] = sum(exact.values())
+
+        name_pairs = sorted((fold_diacritics(normalize_text(name)), doc) for doc, name in enumerate(names) if name)
+        return cls(product_ids, names,
+                   Postings.from_counters(exact_counters), Postings.from_counters(folded_counters), doc_len,
+                   [key for key, _ in name_pairs], np.asarray([doc for _, doc in name_pairs], dtype=np.int32))
+
+    def save(self, directory=SEARCH_INDEX_DIR):
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.exact.save(directory, 'exact')
+        self.folded.save(directory, 'folded')
+        np.save(directory / DOC_LEN_FILE, np.asarray(self.doc_len, dtype=np.float32))
+        np.save(directory / NAME_KEY_DOCS_FILE, np.asarray(self.name_key_docs, dtype=np.int32))
+        for filename, value in ((PRODUCT_IDS_FILE, self.product_ids), (NAMES_FILE, self.names), (NAME_KEYS_FILE, self.name_keys)):
+            with open(directory / filename, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+        meta = {"n_docs": self.n_docs, "avgdl": self.avgdl, "k1": self.k1, "b": self.b,
+                "field_weights": FIELD_WEIGHTS, "tokenizer": self.tokenizer,
+                "n_exact_terms": len(self.exact.terms), "n_folded_terms": len(self.folded.terms)}
+        with open(directory / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory=SEARCH_INDEX_DIR, mmap=True):
+        directory = pathlib.Path(directory)
+        if not os.path.exists(directory / META_FILE):
+            raise FileNotFoundError(f"Search index not found: {directory}")
+        with open(directory / META_FILE, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("tokenizer") != tokenizer_name():
+            print(f"Warning: search index was built with tokenizer '{meta.get('tokenizer')}' but '{tokenizer_name()}' is active; "
+                  "compound words may match less precisely.", file=sys.stderr)
+        mmap_mode = 'r' if mmap else None
+        loaded = {}
+        for filename in (PRODUCT_IDS_FILE, NAMES_FILE, NAME_KEYS_FILE):
+            with open(directory / filename, 'r', encoding='utf-8') as f:
+                loaded[filename] = json.load(f)
+        return cls(loaded[PRODUCT_IDS_FILE], loaded[NAMES_FILE],
+                   Postings.load(directory, 'exact', mmap_mode), Postings.load(directory, 'folded', mmap_mode),
+                   np.load(directory / DOC_LEN_FILE, mmap_mode=mmap_mode),
+                   loaded[NAME_KEYS_FILE], np.load(directory / NAME_KEY_DOCS_FILE, mmap_mode=mmap_mode),
+                   k1=meta.get("k1", BM25_K1), b=meta.get("b", BM25_B), tokenizer=meta.get("tokenizer"))
+
+    # --- Truy vấn ---
+    def _query_term_ids(self, query):
+        """(Postings, [term_id]) cho truy vấn: có dấu -> bộ có dấu, không dấu -> bộ bỏ dấu."""
+        text = normalize_text(query)
+        folded_query = not has_diacritics(text)
+        postings = self.folded if folded_query else self.exact
+        if folded_query:
+            text = apply_folded_synonyms(text)
+        tokens = advanced_tokenizer(text) or [t for t in text.split() if len(t) >= TOKEN_MIN_LEN]
+
+        term_ids = []
+        for token in tokens:
+            key = fold_diacritics(token) if folded_query else token
+            term_id = postings.term_ids.get(key)
+            if term_id is not None:
+                term_ids.append(term_id)
+            elif '_' in key: # Từ ghép chưa có trong từ vựng: tra từng âm tiết
+                term_ids.extend(postings.term_ids[p] for p in key.split('_') if p in postings.term_ids)
+        return postings, term_ids
+
+    def _bm25(self, postings, term_ids, scores=None, matched=None):
+        """Cộng điểm BM25 của các term vào scores; matched (nếu có) đếm số term khớp của mỗi document."""
+        if scores is None:
+            scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term_id in term_ids:
+            docs, tfs = postings.postings(term_id)
+            df = len(docs)
+            if df == 0:
+                continue
+            idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += np.float32(idf) * tfs * np.float32(self.k1 + 1.0) / (tfs + self._length_norm[docs])
+            if matched is not None:
+                matched[docs] += 1
+        return scores
+
+    def _ranked(self, scores, top_n=None):
+        hits = np.flatnonzero(scores > 0)
+        if top_n is not None and len(hits) > top_n:
+            hits = hits[np.argpartition(-scores[hits], top_n - 1)[:top_n]]
+        return hits[np.argsort(-scores[hits], kind='stable')]
+
+    def search(self, query, top_n=20, match_all=True):
+        """List (product_id, score) xếp theo BM25 giảm dần; top_n=None trả về mọi document khớp.
+        match_all: chỉ giữ document chứa đủ các term của truy vấn (nếu không có thì nới thành khớp bất kỳ term nào)."""
+        postings, term_ids = self._query_term_ids(query)
+        term_ids = list(dict.fromkeys(term_ids))
+        if not term_ids:
+            return []
+        matched = np.zeros(self.n_docs, dtype=np.int32) if match_all and len(term_ids) > 1 else None
+        scores = self._bm25(postings, term_ids, matched=matched)
+        if matched is not None and np.any(matched == len(term_ids)):
+            scores[matched < len(term_ids)] = 0
+        return [(self.product_ids[doc], float(scores[doc])) for doc in self._ranked(scores, top_n).tolist()]
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGEST_LIMIT):
+        """Gợi ý tên sản phẩm: trước hết các tên bắt đầu bằng prefix (không dấu),
+        sau đó các sản phẩm khớp các từ đã gõ đủ + từ cuối như một tiền tố."""
+        key = fold_diacritics(normalize_text(prefix))
+        if not key:
+            return []
+        docs = []
+        start = bisect.bisect_left(self.name_keys, key)
+        for pos in range(start, len(self.name_keys)):
+            if len(docs) >= limit or not self.name_keys[pos].startswith(key):
+                break
+            docs.append(int(self.name_key_docs[pos]))
+
+        if len(docs) < limit:
+            words = key.split()
+            complete = [self.folded.term_ids[w] for w in words[:-1] if w in self.folded.term_ids]
+            lo, hi = self.folded.prefix_range(words[-1])
+            expansions = np.arange(lo, hi)
+            if len(expansions) > MAX_PREFIX_EXPANSIONS: # Giữ các term phổ biến nhất
+                doc_freq = np.diff(np.asarray(self.folded.indptr[lo:hi + 1]))
+                expansions = expansions[np.argsort(-doc_freq, kind='stable')[:MAX_PREFIX_EXPANSIONS]]
+            if len(expansions):
+                scores = self._bm25(self.folded, complete + expansions.tolist())
+                seen = set(docs)
+                for doc in self._ranked(scores, limit + len(docs)).tolist():
+                    if len(docs) >= limit: break
+                    if doc not in seen:
+                        docs.append(doc)
+                        seen.add(doc)
+        return [self.names[doc] for doc in docs]
+
+
+def load_or_build(directory=SEARCH_INDEX_DIR, df=None):
+    """Load chỉ mục đã lưu; nếu chưa có thì dựng trong bộ nhớ từ df (None nếu không có df)."""
+    if os.path.exists(pathlib.Path(directory) / META_FILE):
+        return SearchIndex.load(directory, mmap=True)
+    if df is None or df.empty:
+        return None
+    print(f"Warning: search index not found at {directory}; building it in memory (run search_index.py build to persist).", file=sys.stderr)
+    return SearchIndex.build_from_dataframe(df)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="BM25 keyword search index for products")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="Build the search index from the product CSV")
+    parser_build.add_argument("--csv", type=str, default=str(PRODUCT_DATA_CSV_FILE))
+    parser_build.add_argument("--out", type=str, default=str(SEARCH_INDEX_DIR))
+
+    for name in ("search", "suggest"):
+        sub = subparsers.add_parser(name, help=f"{name.capitalize()} (debug)")
+        sub.add_argument("--query", type=str, required=True)
+        sub.add_argument("--top_n", type=int, default=10)
+        sub.add_argument("--index", type=str, default=str(SEARCH_INDEX_DIR))
+
+    args = parser.parse_args()
+    if args.command == "build":
+        index = SearchIndex.build_from_dataframe(pd.read_csv(args.csv, dtype={'product_id': str}))
+        index.save(args.out)
+        print(f"Saved search index ({index.n_docs} docs, {len(index.exact.terms)} terms, tokenizer={index.tokenizer}) to {args.out}", file=sys.stderr)
+    elif args.command == "search":
+        print(json.dumps(SearchIndex.load(args.index).search(args.query, args.top_n), ensure_ascii=False))
+    elif args.command == "suggest":
+        print(json.dumps(SearchIndex.load(args.index).suggest(args.query, args.top_n), ensure_ascii=False))
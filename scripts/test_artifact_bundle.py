@@ -0,0 +1,133 @@
+# scripts/test_artifact_bundle.py
+# Bundle artifact (artifact_bundle.py): manifest + checksum chặn bundle hỏng, CURRENT đổi nguyên tử,
+# serve chỉ chuyển sang bundle mới khi load xong và giữ bản cũ nếu bundle mới lỗi; MongoIdMap: _id MongoDB -> product_id.
+import os
+
+import pandas as pd
+import pytest
+
+import artifact_bundle as ab
+import recommender_cli as rc
+from bench_recommender import generate_artifacts
+
+N_PRODUCTS = 300
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    generate_artifacts(tmp_path, N_PRODUCTS, seed=3)
+    return tmp_path
+
+
+@pytest.fixture
+def serving(artifacts, monkeypatch):
+    """recommender_cli phục vụ từ bundles/ của artifacts (chưa load)."""
+    monkeypatch.setattr(rc, "BUNDLES_DIR", artifacts / ab.BUNDLES_DIR_NAME)
+    monkeypatch.setattr(rc, "_STATE", None)
+    monkeypatch.setattr(rc, "_FAILED_BUNDLE", None)
+    return artifacts / ab.BUNDLES_DIR_NAME
+
+
+def _publish(artifacts, activate=True, rename_first=None):
+    if rename_first is not None: # Nội dung khác -> phiên bản khác
+        csv_path = artifacts / ab.PRODUCT_DATA_CSV_FILE
+        df = pd.read_csv(csv_path)
+        df.loc[0, "name"] = rename_first
+        df.to_csv(csv_path, index=False)
+    return ab.publish_bundle(artifacts_dir=artifacts, bundles_dir=artifacts / ab.BUNDLES_DIR_NAME, activate_bundle=activate)
+
+
+def _corrupt(bundle_dir, manifest, component):
+    """Đảo một byte (giữ kích thước) của file đầu tiên thuộc component; trả về đường dẫn tương đối."""
+    rel = next(rel for rel in manifest["files"] if rel.startswith(component + "/"))
+    path = bundle_dir / rel
+    data = bytearray(path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    path.write_bytes(bytes(data))
+    return rel
+
+
+def test_checksum_mismatch_is_rejected(artifacts):
+    manifest = _publish(artifacts)
+    bundle_dir = ab.current_bundle_dir(artifacts / ab.BUNDLES_DIR_NAME)
+    assert ab.ArtifactBundle.load(bundle_dir).version == manifest["version"]
+
+    rel = _corrupt(bundle_dir, manifest, ab.NEIGHBORS_DIR)
+    assert ab.verify_bundle(bundle_dir) == [f"checksum mismatch for {rel}"]
+    with pytest.raises(ValueError, match="failed verification"):
+        ab.ArtifactBundle.load(bundle_dir)
+    assert ab.verify_bundle(bundle_dir, checksums=False) == [] # Chỉ so kích thước: không thấy byte bị đảo
+
+    with open(bundle_dir / rel, 'ab') as f:
+        f.write(b"\0")
+    assert ab.verify_bundle(bundle_dir, checksums=False) == [f"size mismatch for {rel}"]
+
+
+def test_activate_swaps_current_atomically(artifacts):
+    bundles_dir = artifacts / ab.BUNDLES_DIR_NAME
+    first = _publish(artifacts)["version"]
+    second = _publish(artifacts, activate=False, rename_first="mật ong bản mới")["version"]
+    assert second != first and ab.current_version(bundles_dir) == first # Dựng xong chưa đổi CURRENT
+
+    os.makedirs(bundles_dir / "half-published")
+    with pytest.raises(FileNotFoundError):
+        ab.activate("half-published", bundles_dir) # Không có manifest: không trỏ tới
+    assert ab.current_version(bundles_dir) == first
+
+    ab.activate(second, bundles_dir)
+    assert ab.current_version(bundles_dir) == second
+    assert not (bundles_dir / (ab.CURRENT_FILE + '.tmp')).exists()
+    assert not [p for p in bundles_dir.iterdir() if p.name.startswith(".tmp-")] # Thư mục tạm của publish đã được dọn
+
+
+def test_serving_switches_only_to_a_verified_bundle(artifacts, serving):
+    first = _publish(artifacts)
+    old_state = rc.load_artifacts()
+    assert old_state.version == first["version"]
+    product_id = old_state.id_map.id_of(0)
+
+    # Bundle mới bị hỏng: vẫn phục vụ bản cũ, không thử lại cho tới khi CURRENT đổi
+    broken = _publish(artifacts, rename_first="bản hỏng")
+    _corrupt(serving / broken["version"], broken, ab.PRECOMPUTED_DIR)
+    result = rc.check_bundles()
+    assert not result["reloaded"] and "failed verification" in result["error"]
+    assert rc.load_artifacts() is old_state
+    assert rc.check_bundles() == {"reloaded": False}
+
+    fixed = _publish(artifacts, rename_first="bản sửa")
+    result = rc.check_bundles()
+    assert result == {"reloaded": True, "version": fixed["version"], "previous_version": first["version"]}
+    new_state = rc.load_artifacts()
+    assert new_state is not old_state and new_state.version == fixed["version"]
+    assert rc.dispatch_command("get_recommendations", {"product_id": product_id, "top_n": 3})["recommendations"]
+
+
+def test_mongo_id_map_resolves_object_ids(tmp_path):
+    shared = "64f1c0a2b3d4e5f601234567"
+    product_map = {
+        "120": {"_id": shared}, "35": {"_id": shared.upper()}, # Cùng sản phẩm crawl hai lần
+        "7": {"_id": "0123456789abcdef01234567"},
+        "8": {"_id": "0123456789abcdef0123456"}, "9": {"_id": None}, "10": {}, # _id không hợp lệ / thiếu
+        "abc": {"_id": "fedcba9876543210fedcba98"}, # product_id không phải số
+    }
+    mongo_ids = ab.MongoIdMap.from_product_map(product_map)
+    mongo_ids.save(tmp_path)
+    for id_map in (mongo_ids, ab.MongoIdMap.load(tmp_path, mmap=True)):
+        assert len(id_map) == 3
+        assert sorted(id_map.product_ids_of(shared)) == [35, 120]
+        assert id_map.product_ids_of(shared.upper()) == id_map.product_ids_of(shared)
+        assert id_map.product_id_of(shared) == "35" # Nhiều product_id: lấy nhỏ nhất
+        assert id_map.product_id_of("0123456789ABCDEF01234567") == "7"
+        assert id_map.product_ids_of("fedcba9876543210fedcba98") == []
+        assert id_map.product_ids_of("26220") == [] and id_map.product_id_of("not-an-object-id") is None
+
+
+def test_user_history_accepts_object_ids(state):
+    history = ["1003", "1010", "1021"]
+    object_ids = [state.product_map[pid]["_id"] for pid in history]
+    assert rc.resolve_product_ids(state, object_ids + ["ffffffffffffffffffffffff", "1030"]) == history + ["1030"]
+
+    by_pid = rc.dispatch_command("get_user_recommendations", {"user_id": "a", "interacted_product_ids": history, "top_n": 5})
+    by_object_id = rc.dispatch_command("get_user_recommendations", {"user_id": "b", "interacted_product_ids": object_ids, "top_n": 5})
+    assert len(by_pid["recommendations"]) == 5
+    assert [r["product_id"] for r in by_object_id["recommendations"]] == [r["product_id"] for r in by_pid["recommendations"]]
@@ -0,0 +1,104 @@
+# scripts/test_build_model.py
+# build_model.py incremental phải cho cùng kết quả với dựng lại toàn bộ hàng xóm (cùng vectorizer) trên CSV đã sửa.
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse
+
+import build_model
+from neighbor_index import NeighborIndex, TfidfSimilarity, build_from_tfidf
+from precomputed_store import PrecomputedRecs, load_precomputed_recs, store_is_current
+
+TOP_K = 6
+TOP_N = 5
+WORDS = ["mật ong", "rừng", "trà", "xanh", "cà phê", "rang", "xay", "gạo", "tám", "thơm", "nước mắm", "cá cơm",
+         "miến", "dong", "bánh", "đậu", "xanh", "nấm", "hương", "khô", "tiêu", "đen", "hạt", "điều"]
+
+
+def _products(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        words = rng.choice(WORDS, size=6, replace=False)
+        rows.append({"product_id": 100 + i, "name": " ".join(words[:3]), "origin": rng.choice(["Hà Nội", "Sơn La", "Cà Mau"]),
+                     "producer": "HTX " + words[3], "short_description": " ".join(words[3:]), "description": " ".join(words),
+                     "price": 10000 + i, "ocop_rating": 4, "sold": i})
+    return pd.DataFrame(rows)
+
+
+def _modify(df):
+    df = df.drop(index=[3, 17]).copy() # Xóa
+    df.loc[df["product_id"] == 105, "description"] = "trà xanh thơm hương nấm khô" # Sửa
+    df.loc[df["product_id"] == 130, "name"] = "cà phê rang xay nguyên chất"
+    added = _products(4, seed=1)
+    added["product_id"] = [900, 901, 902, 903] # Thêm
+    return pd.concat([df, added], ignore_index=True)
+
+
+@pytest.fixture
+def built(tmp_path):
+    csv_path = tmp_path / "products.csv"
+    df = _products(60)
+    df.to_csv(csv_path, index=False)
+    build_model.full_build(csv_path, tmp_path, top_k=TOP_K, precompute_top_n=TOP_N, n_jobs=1)
+    _modify(df).to_csv(csv_path, index=False)
+    summary = build_model.incremental_build(csv_path, tmp_path, precompute_top_n=TOP_N, max_affected_fraction=1.0, n_jobs=1)
+    return tmp_path, summary
+
+
+def _assert_same_neighbors(index, expected, top_n):
+    """Cùng điểm theo thứ tự; cùng tập hàng xóm trừ các sản phẩm đồng điểm với hàng xóm cuối cùng."""
+    assert index.n_items == expected.n_items
+    for row in range(index.n_items):
+        cols, scores = index.neighbors(row, top_n=top_n)
+        expected_cols, expected_scores = expected.neighbors(row, top_n=top_n)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+        if len(scores):
+            above_ties = expected_scores > expected_scores[-1] + 1e-6
+            assert set(expected_cols[above_ties].tolist()) <= set(cols.tolist())
+
+
+def test_incremental_matches_full_neighbor_rebuild(built):
+    artifacts_dir, summary = built
+    assert (summary["added"], summary["changed"], summary["removed"]) == (4, 2, 2)
+    assert summary["neighbor_rebuild"] == "partial"
+
+    tfidf_matrix = scipy.sparse.load_npz(artifacts_dir / build_model.TFIDF_MATRIX_FILE).tocsr()
+    index = NeighborIndex.load(artifacts_dir / build_model.NEIGHBOR_INDEX_DIR, mmap=False)
+    _assert_same_neighbors(index, build_from_tfidf(tfidf_matrix, top_k=TOP_K), TOP_K)
+    # Không ghi ma trận dày N×N
+    assert not summary["dense_removed"]
+    assert not (artifacts_dir / build_model.COSINE_SIM_MATRIX_FILE).exists()
+
+
+def test_full_build_keeps_tfidf_instead_of_dense(built):
+    artifacts_dir, _ = built
+    np.save(artifacts_dir / build_model.COSINE_SIM_MATRIX_FILE, np.eye(3, dtype=np.float32)) # Ma trận dày cũ của notebook
+    summary = build_model.full_build(artifacts_dir / "products.csv", artifacts_dir, top_k=TOP_K, precompute_top_n=TOP_N, n_jobs=1)
+    assert summary["dense_removed"]
+    assert not (artifacts_dir / build_model.COSINE_SIM_MATRIX_FILE).exists()
+
+    tfidf_matrix = scipy.sparse.load_npz(artifacts_dir / build_model.TFIDF_MATRIX_FILE).tocsr()
+    exact = (tfidf_matrix @ tfidf_matrix.T).toarray()
+    similarity = TfidfSimilarity.from_npz(artifacts_dir / build_model.TFIDF_MATRIX_FILE)
+    for row in range(similarity.n_items):
+        np.testing.assert_allclose(similarity.row_dense(row), exact[row], rtol=1e-5, atol=1e-6)
+
+
+def test_incremental_rewrites_precomputed_json(built):
+    artifacts_dir, _ = built
+    store = PrecomputedRecs.load(artifacts_dir / build_model.PRECOMPUTED_RECS_DIR, mmap=False)
+    with open(artifacts_dir / build_model.PRECOMPUTED_RECS_JSON_FILE, 'r', encoding='utf-8') as f:
+        precomputed = json.load(f)
+
+    product_ids = set(build_model.load_products(artifacts_dir / "products.csv")["product_id"])
+    assert set(precomputed) == product_ids == {str(pid) for pid in store.product_ids.tolist()}
+    for pid, rec_ids in precomputed.items():
+        assert rec_ids == [str(rec) for rec in store.get(pid)]
+        assert set(rec_ids) <= product_ids
+    # Store ghi dấu vết của đúng file JSON vừa ghi; fallback JSON và store nhị phân trả cùng gợi ý
+    assert store_is_current(artifacts_dir / build_model.PRECOMPUTED_RECS_DIR, artifacts_dir / build_model.PRECOMPUTED_RECS_JSON_FILE)
+    json_recs = load_precomputed_recs(artifacts_dir / "missing_store", artifacts_dir / build_model.PRECOMPUTED_RECS_JSON_FILE)
+    assert [str(rec) for rec in json_recs.get("105")] == [str(rec) for rec in store.get("105")]
@@ -0,0 +1,26 @@
+# scripts/test_catalog_index.py
+# Chỉ mục danh mục (catalog_index.py): hoán vị dựng sẵn dùng cho get_products và gợi ý phổ biến (cold start).
+import json
+
+import pandas as pd
+
+import recommender_cli as rc
+from conftest import FIRST_PRODUCT_ID, N_PRODUCTS
+
+
+def test_popular_fallback_uses_prebuilt_order(state, monkeypatch):
+    def no_sort(*args, **kwargs):
+        raise AssertionError("popular recommendations must not sort the catalog per request")
+    monkeypatch.setattr(pd.DataFrame, "sort_values", no_sort)
+
+    response = json.loads(rc.run_command("get_user_recommendations", {"user_id": "u", "interacted_product_ids": [], "top_n": 3}).raw)
+    # sold = vị trí dòng: bán chạy nhất là sản phẩm cuối
+    assert [r["product_id"] for r in response["recommendations"]] == [FIRST_PRODUCT_ID + N_PRODUCTS - offset for offset in (1, 2, 3)]
+    assert response["message"].startswith("Showing popular products")
+
+
+def test_product_ids_at_keeps_order(state):
+    catalog = state.catalog_index
+    positions = catalog.sort_orders['popular'][:2]
+    assert catalog.product_ids_at(positions) == [str(FIRST_PRODUCT_ID + N_PRODUCTS - 1), str(FIRST_PRODUCT_ID + N_PRODUCTS - 2)]
+    assert catalog.product_ids_at([]) == []
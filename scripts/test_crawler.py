@@ -0,0 +1,82 @@
+# scripts/test_crawler.py
+# crawler.py chạy với server thay thế (make_standin_app) trả 503 ngẫu nhiên: retry/backoff phải lấy đủ mọi
+# trang, CSV có mỗi sản phẩm đúng một dòng với chi tiết đầy đủ; lần crawl incremental không tải lại trang chi tiết.
+import asyncio
+import csv
+import functools
+
+from aiohttp import web
+
+import crawler
+
+N_PAGES = 3
+PER_PAGE = 5
+
+
+def _product_ids(page):
+    return [5000 + (page - 1) * PER_PAGE + i for i in range(PER_PAGE)]
+
+
+def _write_pages(pages_dir):
+    """Trang danh sách / chi tiết tổng hợp theo đúng selector của buudien.vn, lưu như --save_pages."""
+    pages_dir.mkdir()
+    for page in range(1, N_PAGES + 1):
+        boxes = "".join(
+            f'<div class="item_product_home"><div class="img_product"><a href="/home/goods/detail.html?goods_id={pid}">'
+            f'<img data-src="/img/{pid}.jpg"></a></div><div class="content_product">'
+            f'<a title="Mật ong {pid} đạt OCOP 4 sao">OCOP 4 sao - Mật ong {pid}</a></div>'
+            f'<div class="price_product">{pid * 10:,}đ</div></div>'
+            for pid in _product_ids(page))
+        html = f'<html><body>{boxes}<ul class="pagination"><li class="totalPage"><span>Trang {page}/{N_PAGES}</span></li></ul></body></html>'
+        (pages_dir / crawler.page_file_name(crawler.LIST_PATH_TEMPLATE.format(page=page))).write_text(html, encoding='utf-8')
+        for pid in _product_ids(page):
+            detail = (f'<html><body><div class="wp_content_tab_description_product"><p>Mô tả sản phẩm {pid}</p></div>'
+                      f'<div class="kv_store_info"><div class="drop_kv_giaohang">Hà Giang</div></div>'
+                      f'<div class="info_store"><h3><a>HTX {pid}</a></h3></div></body></html>')
+            (pages_dir / crawler.page_file_name(f"/home/goods/detail.html?goods_id={pid}")).write_text(detail, encoding='utf-8')
+
+
+async def _crawl_against_standin(pages_dir, out_path, fail_rate, **kwargs):
+    # Không gửi Retry-After (mặc định 1 giây, tạm dừng cả host): client tự backoff, test chạy nhanh
+    runner = web.AppRunner(crawler.make_standin_app(pages_dir, fail_rate=fail_rate, retry_after=None))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        return await crawler.crawl_catalog(out_path, base_url=f"http://127.0.0.1:{port}", rate=200, **kwargs)
+    finally:
+        await runner.cleanup()
+
+
+def _read_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_crawl_retries_through_standin_failures(tmp_path, monkeypatch):
+    # Đủ lần thử để xác suất bỏ cuộc với fail_rate 0.3 không đáng kể; backoff ngắn
+    monkeypatch.setattr(crawler, "Fetcher", functools.partial(crawler.Fetcher, retries=10, backoff_base=0.01, backoff_max=0.05))
+    _write_pages(tmp_path / "pages")
+    out_path = tmp_path / "products.csv"
+
+    summary = asyncio.run(_crawl_against_standin(tmp_path / "pages", out_path, fail_rate=0.3))
+    expected_ids = sorted(pid for page in range(1, N_PAGES + 1) for pid in _product_ids(page))
+    assert summary["retries"] > 0 and summary["requests"] == N_PAGES + len(expected_ids) + summary["retries"]
+    assert (summary["list_page_errors"], summary["detail_errors"]) == (0, 0)
+    assert summary["products"] == summary["detail_fetched"] == len(expected_ids)
+
+    rows = _read_rows(out_path)
+    assert sorted(int(row["product_id"]) for row in rows) == expected_ids # Mỗi sản phẩm đúng một dòng
+    for row in rows:
+        pid = row["product_id"]
+        assert row["name"] == f"Mật ong {pid}" and row["price"] == str(int(pid) * 10)
+        assert row["description"] == f"Mô tả sản phẩm {pid}" and row["producer"] == f"HTX {pid}" and row["origin"] == "Hà Giang"
+        assert row["ocop_rating"] == "4" and row["product_url"] == f"{crawler.BASE_HOST}/home/goods/detail.html?goods_id={pid}"
+    assert not (tmp_path / "products.csv.tmp").exists()
+
+    # Incremental: trang danh sách không đổi -> chép dòng cũ, không tải trang chi tiết nào
+    again = asyncio.run(_crawl_against_standin(tmp_path / "pages", tmp_path / "again.csv", fail_rate=0.0, previous_csv=out_path))
+    assert (again["detail_fetched"], again["unchanged_copied"], again["requests"]) == (0, len(expected_ids), N_PAGES)
+    by_id = lambda row: int(row["product_id"])
+    assert sorted(_read_rows(tmp_path / "again.csv"), key=by_id) == sorted(rows, key=by_id)
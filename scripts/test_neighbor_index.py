@@ -0,0 +1,76 @@
+# scripts/test_neighbor_index.py
+# neighbor_index.py (chỉ mục top-K, TfidfSimilarity): ngưỡng parity và cách recommender_cli.py chấm điểm hồ sơ user.
+import json
+
+import numpy as np
+
+import recommender_cli as rc
+from conftest import synthetic_cosine, synthetic_state, synthetic_tfidf, FIRST_PRODUCT_ID, N_PRODUCTS
+from neighbor_index import build_from_dense, parity_check
+
+HISTORY = [str(FIRST_PRODUCT_ID + offset) for offset in (2, 11, 25)]
+
+
+def test_parity_passes_only_when_index_matches_dense():
+    cosine_matrix = synthetic_cosine()
+    exact = parity_check(cosine_matrix, build_from_dense(cosine_matrix, top_k=N_PRODUCTS), n_samples=N_PRODUCTS)
+    assert exact["passed"] and exact["failed"] == []
+    assert exact["user_overlap_min"] == 1.0
+
+    truncated = parity_check(cosine_matrix, build_from_dense(cosine_matrix, top_k=4), n_samples=N_PRODUCTS)
+    assert not truncated["passed"]
+    assert "user_overlap_mean" in truncated["failed"]
+    assert parity_check(cosine_matrix, build_from_dense(cosine_matrix, top_k=4), n_samples=N_PRODUCTS, thresholds={})["passed"]
+
+
+def test_tfidf_similarity_matches_dense():
+    cosine_matrix, tfidf = synthetic_cosine(), synthetic_tfidf()
+    for idx in range(N_PRODUCTS):
+        np.testing.assert_allclose(tfidf.row_dense(idx), cosine_matrix[idx], rtol=1e-5, atol=1e-6)
+    # Hồ sơ user chấm bằng TF-IDF đạt parity dù chỉ mục hàng xóm bị cắt ở top-4
+    report = parity_check(cosine_matrix, build_from_dense(cosine_matrix, top_k=N_PRODUCTS), n_samples=N_PRODUCTS, user_scorer=tfidf)
+    assert report["passed"] and report["user_scorer"] == "TfidfSimilarity"
+    truncated = parity_check(cosine_matrix, build_from_dense(cosine_matrix, top_k=4), n_samples=N_PRODUCTS, user_scorer=tfidf)
+    assert truncated["user_overlap_min"] == 1.0
+
+
+def _profile(state):
+    return rc._user_profile_for(state, None, HISTORY).profile_vector()
+
+
+def _dense_profile(state):
+    rows = [state.id_map.index_of(pid) for pid in HISTORY]
+    return np.asarray(state.cosine_matrix)[rows].mean(axis=0)
+
+
+def _assert_exact_user_scores(monkeypatch, state, reference):
+    monkeypatch.setattr(rc, "_STATE", state)
+    np.testing.assert_allclose(_profile(state), _dense_profile(reference), rtol=1e-5, atol=1e-6)
+    # Batch: cùng điểm với đường một user
+    batch = rc.get_user_recommendations_batch({"u": HISTORY}, top_n=5)["results"][0]
+    single = rc.get_user_content_based_recommendations_dynamic("u", HISTORY, top_n=5)
+    assert [r["product_id"] for r in batch["recommendations"]] == [r["product_id"] for r in single["recommendations"]]
+
+
+def test_user_profiles_use_tfidf_by_default(monkeypatch):
+    state = synthetic_state(top_k=4, tfidf=True, dense=True)
+    assert state.user_similarity is state.tfidf_similarity
+    _assert_exact_user_scores(monkeypatch, state, state)
+
+
+def test_user_profiles_fall_back_to_dense_then_index(monkeypatch):
+    dense_state = synthetic_state(top_k=4, dense=True)
+    assert dense_state.user_similarity is None
+    _assert_exact_user_scores(monkeypatch, dense_state, dense_state)
+    # Không có TF-IDF lẫn ma trận dày: top-K của chỉ mục (xấp xỉ)
+    index_state = synthetic_state(top_k=4)
+    assert index_state.user_similarity is index_state.neighbor_index
+    assert not np.allclose(_profile(index_state), _dense_profile(dense_state))
+
+
+def test_product_recommendations_keep_string_ids(state):
+    response = json.loads(rc.run_command("get_recommendations", {"product_id": HISTORY[0], "top_n": 5}).raw)
+    assert response["recommendations"]
+    assert all(isinstance(r["product_id"], str) for r in response["recommendations"])
+    user_response = json.loads(rc.run_command("get_user_recommendations", {"user_id": "u", "interacted_product_ids": HISTORY, "top_n": 5}).raw)
+    assert all(isinstance(r["product_id"], int) for r in user_response["recommendations"])
@@ -0,0 +1,59 @@
+# scripts/test_precomputed_store.py
+# Store nhị phân (precomputed_store.py) chỉ được ưu tiên khi còn khớp file JSON nó được convert từ đó.
+import json
+import os
+
+from precomputed_store import (PrecomputedRecs, JsonPrecomputedRecs, convert_json, load_precomputed_recs, store_is_current,
+                               read_meta)
+
+RECS = {"101": [102, 103], "102": [101], "103": ["101", "102"]}
+
+
+def _write_json(path, recs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recs, f)
+
+
+def test_store_is_used_while_it_matches_the_json(tmp_path):
+    json_path, store_dir = tmp_path / "recs.json", tmp_path / "store"
+    _write_json(json_path, RECS)
+    convert_json(json_path, store_dir)
+
+    recs = load_precomputed_recs(store_dir, json_path)
+    assert isinstance(recs, PrecomputedRecs)
+    assert recs.get("103") == [101, 102]
+    assert read_meta(store_dir)["source"]["file"] == "recs.json"
+
+
+def test_touched_json_with_same_content_keeps_the_store(tmp_path):
+    json_path, store_dir = tmp_path / "recs.json", tmp_path / "store"
+    _write_json(json_path, RECS)
+    convert_json(json_path, store_dir)
+    stat = os.stat(json_path)
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9)) # vd. git checkout: mtime đổi, nội dung giữ nguyên
+    assert store_is_current(store_dir, json_path)
+
+
+def test_changed_json_falls_back_to_the_json(tmp_path):
+    json_path, store_dir = tmp_path / "recs.json", tmp_path / "store"
+    _write_json(json_path, RECS)
+    convert_json(json_path, store_dir)
+    _write_json(json_path, dict(RECS, **{"101": [103, 102]})) # Notebook chạy lại, chưa convert
+
+    recs = load_precomputed_recs(store_dir, json_path)
+    assert isinstance(recs, JsonPrecomputedRecs)
+    assert recs.get("101") == [103, 102]
+
+    convert_json(json_path, store_dir)
+    recs = load_precomputed_recs(store_dir, json_path)
+    assert isinstance(recs, PrecomputedRecs)
+    assert recs.get("101") == [103, 102]
+
+
+def test_store_without_source_is_not_trusted(tmp_path):
+    json_path, store_dir = tmp_path / "recs.json", tmp_path / "store"
+    _write_json(json_path, RECS)
+    PrecomputedRecs.from_dict(RECS).save(store_dir) # Store convert từ phiên bản cũ: meta không có "source"
+    assert isinstance(load_precomputed_recs(store_dir, json_path), JsonPrecomputedRecs)
+    # Không có JSON thì store là nguồn duy nhất
+    assert isinstance(load_precomputed_recs(store_dir, tmp_path / "missing.json"), PrecomputedRecs)
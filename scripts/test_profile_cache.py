@@ -0,0 +1,55 @@
+# scripts/test_profile_cache.py
+# Hồ sơ user cộng dồn (profile_cache.py + _user_profile_for / update_user_profile trong recommender_cli.py)
+# phải trùng với hồ sơ tính lại từ đầu cho cùng lịch sử.
+import numpy as np
+
+import recommender_cli as rc
+from conftest import FIRST_PRODUCT_ID
+
+USER_ID = "user-1"
+
+
+def _pids(*offsets):
+    return [str(FIRST_PRODUCT_ID + offset) for offset in offsets]
+
+
+def _from_scratch(state, pids):
+    return rc._user_profile_for(state, None, pids) # user_id None: không đọc / ghi cache
+
+
+def _assert_same_profile(profile, expected):
+    assert profile.item_idxs == expected.item_idxs
+    assert profile.count == expected.count
+    np.testing.assert_allclose(profile.profile_vector(), expected.profile_vector(), rtol=1e-5, atol=1e-6)
+
+
+def test_incremental_profile_matches_from_scratch_after_update(state):
+    history = _pids(1, 4, 9)
+    rc._user_profile_for(state, USER_ID, history)
+
+    result = rc.update_user_profile(USER_ID, _pids(4, 12, 20)) # 4 đã có trong hồ sơ
+    assert result == {"user_id": USER_ID, "updated": True, "added": 2}
+    history += _pids(12, 20)
+    _assert_same_profile(state.profile_cache.get(USER_ID), _from_scratch(state, history))
+
+    # Request tiếp theo với lịch sử đầy đủ dùng thẳng bản cache
+    assert rc._user_profile_for(state, USER_ID, history) is state.profile_cache.get(USER_ID)
+
+
+def test_partial_hit_adds_only_new_items(state):
+    rc._user_profile_for(state, USER_ID, _pids(1, 4))
+    history = _pids(1, 4, 7, 30)
+    _assert_same_profile(rc._user_profile_for(state, USER_ID, history), _from_scratch(state, history))
+
+
+def test_history_shrink_recomputes_profile(state):
+    rc._user_profile_for(state, USER_ID, _pids(1, 4, 9, 12))
+    shrunk = _pids(1, 9) # Đơn chứa 4 và 12 đã bị xóa / hủy
+    profile = rc._user_profile_for(state, USER_ID, shrunk)
+    _assert_same_profile(profile, _from_scratch(state, shrunk))
+    _assert_same_profile(state.profile_cache.get(USER_ID), _from_scratch(state, shrunk))
+
+
+def test_update_for_uncached_user_is_ignored(state):
+    assert rc.update_user_profile("someone-else", _pids(1)) == {"user_id": "someone-else", "updated": False, "added": 0}
+    assert len(state.profile_cache) == 0
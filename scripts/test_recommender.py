@@ -5,6 +5,7 @@ from recommender_cli import (
     get_user_content_based_recommendations_dynamic,
     load_artifacts 
 )
+from record_store import dumps as dumps_json # Kết quả chứa bản ghi JSON dựng sẵn (record_store.py)
 # Thêm import traceback nếu bạn muốn in chi tiết lỗi
 import traceback
 
@@ -31,7 +32,7 @@ if __name__ == "__main__":
         print("--- Result from get_user_content_based_recommendations_dynamic ---", file=sys.stderr)
         # In kết quả ra stdout để có thể dùng cho các mục đích khác nếu cần
         # Và cũng in ra stderr để debug
-        result_str = json.dumps(recommendations_result, ensure_ascii=False, indent=2)
+        result_str = json.dumps(json.loads(dumps_json(recommendations_result)), ensure_ascii=False, indent=2)
         print(result_str) # Ra stdout
         print(f"Raw result object: {recommendations_result}", file=sys.stderr) # Ra stderr
 
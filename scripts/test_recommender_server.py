@@ -0,0 +1,50 @@
+# scripts/test_recommender_server.py
+# WorkerPool: worker được fork từ fork server (process chính không fork khi đã có thread), reload chạy trong fork server.
+import json
+import os
+import threading
+
+from recommender_server import WorkerPool
+
+_STATE = {"version": 1}
+
+
+def _handler(command, args):
+    return {"command": command, "pid": os.getpid(), "parent": os.getppid(), "version": _STATE["version"]}
+
+
+def _set_version(args):
+    _STATE["version"] = args["version"]
+    return {"reloaded": True, "version": _STATE["version"]}
+
+
+def _ask(pool, command, args=None):
+    done, responses = threading.Event(), []
+    pool.submit(json.dumps({"id": 7, "command": command, "args": args or {}}),
+                lambda response: (responses.append(json.loads(response)), done.set()))
+    assert done.wait(10)
+    assert responses[0]["id"] == 7
+    return responses[0]["result"]
+
+
+def test_workers_fork_from_fork_server_and_restart_with_new_state():
+    pool = WorkerPool(_handler, 2, threads_per_worker=2, server_commands={"set_version": _set_version}).start()
+    try:
+        result = _ask(pool, "ping")
+        assert result["parent"] == pool.fork_server_pid != os.getpid()
+        assert result["version"] == 1
+
+        assert pool.call_server("set_version", {"version": 2}) == {"reloaded": True, "version": 2}
+        assert "error" in pool.call_server("missing")
+        old_pids = {w.pid for w in pool._workers}
+        pool.restart()
+        result = _ask(pool, "ping")
+        assert result["pid"] not in old_pids and result["version"] == 2
+        assert _STATE["version"] == 1 # Chỉ fork server đổi trạng thái
+    finally:
+        pool.shutdown()
+    try:
+        os.kill(pool.fork_server_pid, 0)
+        raise AssertionError("fork server still running after shutdown")
+    except ProcessLookupError:
+        pass
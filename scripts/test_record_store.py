@@ -0,0 +1,72 @@
+# scripts/test_record_store.py
+# ProductRecordStore (record_store.py): đoạn JSON dựng sẵn phải đúng từng byte với json.dumps của dict
+# mà các response trước đây dựng cho từng sản phẩm, kể cả sau khi lưu / mmap lại và khi ghép vào response.
+import json
+
+import pytest
+
+from record_store import ProductRecordStore, JSONFragment, dumps, product_record, safe_float_convert, safe_int_convert
+
+PRODUCT_MAP = {
+    "26220": {"_id": "64f1c0a2b3d4e5f601234567", "name": "Mật ong rừng \"U Minh\" <500ml>", "price": 185000,
+              "image_url": "https://example.invalid/a.jpg", "product_url": "https://example.invalid/a", "ocop_rating": 4},
+    "17": {"name": "Trà shan tuyết – Hà Giang 🍵", "price": "12.5", "ocop_rating": "5.0"}, # Giá / hạng dạng chuỗi
+    "9": {"_id": None, "name": "Nước mắm\nPhú Quốc\\nhãn\tcũ", "price": None, "image_url": None, "ocop_rating": None},
+    "300": {"name": "\x00json-fragment\x00", "price": "liên hệ"}, # Trùng chuỗi giữ chỗ của dumps()
+    "026": {"name": "ID không chuẩn"}, # Bị bỏ: không khớp 26
+    "abc": {"name": "ID không phải số"},
+    "41": {}, # Không có thông tin
+}
+EXPECTED_IDS = ["9", "17", "300", "26220"]
+
+
+def _baseline(pid_str, string_id=False):
+    """Dict của một sản phẩm như get_recommendations / gợi ý theo user dựng trước khi có record store."""
+    details = PRODUCT_MAP[pid_str]
+    return {
+        "product_id": pid_str if string_id else safe_int_convert(pid_str), "name": details.get("name", "N/A"),
+        "_id": details.get("_id"),
+        "price": safe_float_convert(details.get("price")),
+        "image_url": details.get("image_url", ""),
+        "product_url": details.get("product_url", ""),
+        "ocop_rating": safe_int_convert(details.get("ocop_rating")),
+    }
+
+
+@pytest.fixture(params=["built", "loaded"])
+def store(request, tmp_path):
+    built = ProductRecordStore.build(PRODUCT_MAP)
+    if request.param == "built":
+        return built
+    built.save(tmp_path / "records")
+    return ProductRecordStore.load(tmp_path / "records", mmap=True)
+
+
+def test_fragments_are_json_dumps_of_the_record(store):
+    assert [str(pid) for pid in store.product_ids.tolist()] == sorted(EXPECTED_IDS, key=int)
+    for pid_str, fragment in zip(EXPECTED_IDS, store.records(EXPECTED_IDS)):
+        assert fragment.raw == json.dumps(product_record(pid_str, PRODUCT_MAP[pid_str]), ensure_ascii=False)
+        assert dict(fragment) == _baseline(pid_str)
+
+
+def test_responses_match_baseline_serialization(store):
+    response = {"product_id_input": "26220", "recommendations": store.records(EXPECTED_IDS[::-1], limit=3)}
+    baseline = {"product_id_input": "26220", "recommendations": [product_record(pid, PRODUCT_MAP[pid]) for pid in EXPECTED_IDS[::-1][:3]]}
+    assert dumps(response) == json.dumps(baseline, ensure_ascii=False)
+
+    # get_recommendations: product_id dạng chuỗi
+    string_ids = store.records(["17", "missing", "26220"], string_ids=True)
+    assert [dict(fragment) for fragment in string_ids] == [_baseline("17", string_id=True), _baseline("26220", string_id=True)]
+    assert dumps({"recommendations": string_ids}) == json.dumps(
+        {"recommendations": [dict(product_record(pid, PRODUCT_MAP[pid]), product_id=pid) for pid in ("17", "26220")]}, ensure_ascii=False)
+
+    # Kết quả tìm kiếm: thêm score vào cuối bản ghi
+    scored = store.records(["26220"])[0].with_fields(score=0.1234)
+    assert scored.raw == json.dumps(dict(product_record("26220", PRODUCT_MAP["26220"]), score=0.1234), ensure_ascii=False)
+
+
+def test_dumps_falls_back_when_data_contains_the_placeholder(store):
+    response = {"note": "\x00json-fragment\x00", "recommendations": store.records(["300", "9"])}
+    assert json.loads(dumps(response)) == {"note": "\x00json-fragment\x00",
+                                           "recommendations": [_baseline("300"), _baseline("9")]}
+    assert dumps({"plain": [1, "hai"], "nested": JSONFragment('{"a": 1}')}) == '{"plain": [1, "hai"], "nested": {"a": 1}}'
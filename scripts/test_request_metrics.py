@@ -0,0 +1,95 @@
+# scripts/test_request_metrics.py
+# request_metrics.py: thời gian theo giai đoạn / bộ đếm của từng request, gộp theo command trong registry;
+# recommender_cli.dispatch_command ghi mọi request vào REGISTRY, trả "_debug" khi bật debug và command "metrics".
+import json
+
+import pytest
+
+import recommender_cli as rc
+import request_metrics
+from request_metrics import MetricsRegistry, NULL_TRACE, TOTAL_STAGE, current, traced_request
+
+
+@pytest.fixture
+def registry():
+    """REGISTRY của process, rỗng trước và sau test."""
+    request_metrics.REGISTRY.reset()
+    yield request_metrics.REGISTRY
+    request_metrics.REGISTRY.reset()
+
+
+def test_traced_request_records_stages_counters_and_errors():
+    registry = MetricsRegistry()
+    assert current() is NULL_TRACE
+    with traced_request("get_recommendations", registry=registry) as trace:
+        assert current() is trace
+        for _ in range(2): # Giai đoạn lặp lại: cộng dồn
+            with current().stage("score"):
+                pass
+        current().count("cache_hits")
+        current().count("cache_hits", 2)
+        current().count("unknown_ids", 0) # n = 0: không tạo bộ đếm
+        current().debug("bỏ qua khi không bật debug")
+        with traced_request("nested") as inner: # Request lồng nhau dùng chung trace ngoài cùng
+            assert inner is trace
+    assert current() is NULL_TRACE
+    assert trace.elapsed is not None and trace.timings["score"] <= trace.elapsed
+    assert trace.counters == {"cache_hits": 3} and trace.messages == []
+
+    with pytest.raises(RuntimeError):
+        with traced_request("get_recommendations", registry=registry):
+            raise RuntimeError("lỗi giữa request")
+    assert current() is NULL_TRACE
+
+    stats = registry.snapshot()["commands"]
+    assert list(stats) == ["get_recommendations"] # Request lồng nhau không ghi riêng
+    assert (stats["get_recommendations"]["count"], stats["get_recommendations"]["errors"]) == (2, 1)
+    assert stats["get_recommendations"]["latency_ms"]["window"] == 2
+    assert set(stats["get_recommendations"]["stages_ms"]) == {"score"}
+    assert stats["get_recommendations"]["counters"] == {"cache_hits": 3}
+
+    registry.reset()
+    assert registry.snapshot()["commands"] == {}
+
+
+def test_debug_trace_keeps_messages_and_total():
+    with traced_request("search_products", debug=True, registry=None) as trace:
+        with trace.stage("score"):
+            pass
+        current().debug("ghi chú")
+    trailer = trace.to_dict()
+    assert trailer["command"] == "search_products" and trailer["messages"] == ["ghi chú"]
+    assert set(trailer["timings_ms"]) == {"score", TOTAL_STAGE}
+    assert trailer["timings_ms"]["score"] <= trailer["timings_ms"][TOTAL_STAGE]
+
+
+def test_dispatch_command_records_requests_and_debug_trailer(state, registry):
+    params = {"product_id": "1003", "top_n": 5}
+    plain = rc.dispatch_command("get_recommendations", params)
+    assert "_debug" not in plain and len(plain["recommendations"]) == 5
+
+    # debug: cùng kết quả, thêm "_debug" ở cuối - dict hay JSONFragment (serve) như nhau
+    debugged = rc.dispatch_command("get_recommendations", dict(params, debug=True))
+    serialized = json.loads(rc.dispatch_command("get_recommendations", dict(params, debug="1"), serialize=True).raw)
+    for result in (debugged, serialized):
+        assert list(result)[-1] == "_debug"
+        assert json.loads(rc.dumps_json({k: v for k, v in result.items() if k != "_debug"})) == json.loads(rc.dumps_json(plain))
+        assert result["_debug"]["command"] == "get_recommendations"
+        assert {"load", TOTAL_STAGE} <= set(result["_debug"]["timings_ms"])
+    assert "serialize" in serialized["_debug"]["timings_ms"] and "serialize" not in debugged["_debug"]["timings_ms"]
+
+    assert "error" in rc.dispatch_command("no_such_command", {})
+    snapshot = rc.dispatch_command("metrics", {"reset": True})
+    assert snapshot["artifacts_version"] == state.version
+    assert (snapshot["commands"]["get_recommendations"]["count"], snapshot["commands"]["get_recommendations"]["errors"]) == (3, 0)
+    assert (snapshot["commands"]["no_such_command"]["count"], snapshot["commands"]["no_such_command"]["errors"]) == (1, 1)
+    assert "load" in snapshot["commands"]["get_recommendations"]["stages_ms"]
+
+    # reset xóa sau khi chụp: lần sau chỉ còn chính request metrics vừa rồi
+    assert list(rc.dispatch_command("metrics", {})["commands"]) == ["metrics"]
+
+
+def test_merge_worker_metrics_keeps_each_worker():
+    workers = [{"pid": 11, "commands": {}}, {"pid": 12, "commands": {}}]
+    assert rc._merge_worker_metrics(workers) == {"workers": 2, "worker_metrics": workers}
+    assert rc._merge_worker_metrics([workers[0], {"error": "worker died"}]) == {"error": "worker died"}
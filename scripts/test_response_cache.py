@@ -0,0 +1,84 @@
+# scripts/test_response_cache.py
+# Cache kết quả (response_cache.py + _cached_response / _cache_response trong recommender_cli.py).
+import recommender_cli as rc
+from conftest import synthetic_state, FIRST_PRODUCT_ID
+from response_cache import ResponseCache
+
+PRODUCT_ID = str(FIRST_PRODUCT_ID + 3)
+
+
+def _ids(response):
+    return [record["product_id"] for record in response["recommendations"]]
+
+
+def test_smaller_top_n_is_trimmed_from_cached_entry(state):
+    full = rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 20})
+    trimmed = rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 5})
+    assert _ids(trimmed) == _ids(full)[:5]
+    assert state.response_cache.stats()["prefix_hits"] == 1
+
+    state.response_cache.clear()
+    fresh = rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 5})
+    assert _ids(fresh) == _ids(trimmed)
+
+
+def test_larger_top_n_is_not_served_from_smaller_entry():
+    cache = ResponseCache()
+    cache.put("key", {"recommendations": [1, 2, 3]}, top_n=3)
+    assert cache.get("key", top_n=5, list_field="recommendations") is None
+    cache.put("key", {"recommendations": [1, 2, 3, 4, 5]}, top_n=5)
+    cache.put("key", {"recommendations": [1]}, top_n=1) # Không thay bản lớn hơn
+    assert cache.get("key", top_n=4, list_field="recommendations") == {"recommendations": [1, 2, 3, 4]}
+
+
+def test_not_found_responses_are_not_cached(state):
+    for _ in range(2):
+        result = rc.dispatch_command("get_recommendations", {"product_id": "424242", "top_n": 5})
+        assert "error" in result
+    unknown_object_id = "f" * 24
+    for _ in range(2):
+        assert "error" in rc.dispatch_command("get_recommendations", {"product_id": unknown_object_id, "top_n": 5})
+    assert len(state.response_cache) == 0
+    assert state.response_cache.stats()["hits"] == 0
+
+
+def test_object_id_and_original_id_share_entry_and_echo_own_input(state):
+    object_id = state.product_map[PRODUCT_ID]["_id"]
+    by_pid = rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 5})
+    by_object_id = rc.dispatch_command("get_recommendations", {"product_id": object_id, "top_n": 5})
+    assert by_pid["product_id_input"] == PRODUCT_ID
+    assert by_object_id["product_id_input"] == object_id
+    assert _ids(by_object_id) == _ids(by_pid)
+    assert len(state.response_cache) == 1
+
+
+def test_user_id_input_is_restored_per_caller(state):
+    history = [str(FIRST_PRODUCT_ID + 1), str(FIRST_PRODUCT_ID + 7)]
+    first = rc.dispatch_command("get_user_recommendations", {"user_id": "alice", "interacted_product_ids": history, "top_n": 5})
+    # Cùng tập sản phẩm (khác thứ tự, trùng lặp, một mục dạng _id MongoDB) -> cùng một mục cache
+    reordered = [state.product_map[history[1]]["_id"], history[0], history[0]]
+    second = rc.dispatch_command("get_user_recommendations", {"user_id": "bob", "interacted_product_ids": reordered, "top_n": 5})
+    assert first["user_id_input"] == "alice"
+    assert second["user_id_input"] == "bob"
+    assert _ids(second) == _ids(first)
+    assert state.response_cache.stats()["hits"] == 1
+    # Bản trả cho người gọi trước không bị sửa
+    assert first["user_id_input"] == "alice"
+
+
+def test_new_artifact_state_starts_with_empty_cache(state, monkeypatch):
+    rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 5})
+    rc.dispatch_command("get_products", {"page": 1, "per_page": 5, "sort_by": "popular"})
+    assert len(state.response_cache) == 2
+
+    new_state = synthetic_state(seed=1)
+    monkeypatch.setattr(rc, "_STATE", new_state)
+    rc.dispatch_command("get_recommendations", {"product_id": PRODUCT_ID, "top_n": 5})
+    assert new_state.response_cache.stats()["hits"] == 0
+    assert len(new_state.response_cache) == 1
+
+
+def test_get_products_key_normalizes_keyword_and_prices(state):
+    rc.dispatch_command("get_products", {"page": 1, "per_page": 5, "min_price": "10005", "keyword": None})
+    rc.dispatch_command("get_products", {"page": 1, "per_page": 5, "min_price": 10005.0})
+    assert state.response_cache.stats()["hits"] == 1
@@ -0,0 +1,156 @@
+# scripts/text_processing.py
+# Xử lý văn bản tiếng Việt dùng chung cho notebook huấn luyện (TF-IDF) và recommender (tìm kiếm):
+# từ đồng nghĩa, advanced_tokenizer (underthesea nếu có), chuẩn hóa NFC và khóa bỏ dấu (đ -> d).
+import re
+import pathlib
+import unicodedata
+
+try:
+    from underthesea import word_tokenize # Tùy chọn: tách từ ghép tiếng Việt
+except ImportError:
+    word_tokenize = None
+
+PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
+ARTIFACTS_DIR = PROJECT_ROOT_DIR / "python_recommender_artifacts"
+STOP_WORDS_FILE = ARTIFACTS_DIR / 'vietnamese_stopwords.txt'
+
+# Từ điển Đồng nghĩa (Giữ nguyên ví dụ của bạn)
+SYNONYM_DICT = {
+    # Tên Thương hiệu / Nhà sản xuất (Ví dụ)
+    'huongfarm': 'huongfarm', 'lạc lạc plus': 'laclacplus', 'phủ quỳ': 'phuquy',
+    'xuân anh': 'xuananh', 'đất ngọc': 'datngoc', 'gieo...đặc sản đà lạt': 'gieodacsandl',
+    'dương anh 568': 'duonganh568', 'viện nông nghiệp thanh hoá': 'viennnthanhhoa',
+    'hải đăng': 'haidang', 'bà ba': 'baba', 'quý thu': 'quythu', 'bà hùng': 'bahung',
+    'kim huệ': 'kimhue', 'hữu châu': 'huuchau', 'minh vạn': 'minhvan',
+    # ... (Thêm các từ đồng nghĩa khác nếu cần) ...
+    'ngũ cốc dinh dưỡng': 'ngucocdinhduong', 'ngũ cốc siêu dinh dưỡng': 'ngucocdinhduong',
+    'mì chùm ngây': 'michumngay', 'mì cà rốt': 'micarot', 'mì củ dền': 'micuden',
+    'bột sắn dây': 'botsanday', 'tinh bột sắn dây': 'botsanday', 'trà túi lọc': 'tratuiloc',
+    'trà xạ đen': 'traxaden', 'chè xanh': 'chexanh', 'trà sơn mật': 'trasonmat',
+    'hồng sâm': 'hongsam', 'trà hoa vàng': 'trahoavang', 'chè hảo đạt': 'chehaodat',
+    'tôm nõn': 'tomnon', 'trà hoàng thảo mộc': 'trahoangthaomoc', 'cà phê hòa tan': 'caphehoatan',
+    'mộng dừa': 'mongdua', 'đẳng sâm': 'dangsam', 'ngọc linh': 'ngoclinh', 'cà phê đăk hà': 'caphedakha',
+    'trà giải độc gan': 'tragiaidocgan', 'cà gai leo': 'cagaileo', 'xạ đen': 'xaden',
+    'tinh bột nghệ': 'tinhbotnghe', 'viên nghệ mật ong': 'viennghematong', 'nem chua': 'nemchua',
+    'nem nướng': 'nemnuong', 'mắm ruốc': 'mamruoc', 'mắm tôm': 'mamtom', 'mắm tép': 'mamtep',
+    'nước mắm': 'nuocmam', 'cá cơm': 'cacom', 'khô cá': 'khoca', 'cá lóc': 'caloc',
+    'cá sặc rằn': 'casacran', 'cá kèo': 'cakeo', 'cá bống': 'cabong', 'cá thu': 'cathu',
+    'cá mòi': 'camoi', 'cá nhệch': 'canhech', 'cá trắm': 'catram', 'bún gạo khô': 'bungaokho',
+    'bún khô': 'bunkho', 'hủ tiếu khô': 'hutieukho', 'miến gạo': 'miengao', 'miến dong': 'miendong',
+    'gạo lứt': 'gaolut', 'gạo tím than': 'gaotimthan', 'nếp cẩm': 'nepcam',
+    'đông trùng hạ thảo': 'dongtrunghathao', 'hạt mắc ca': 'macca', 'hạt macca': 'macca',
+    'macadamia': 'macca', 'hạt điều': 'hatdieu', 'rang muối': 'rangmuoi', 'bánh đa nem': 'banhdanem',
+    'bánh đa vừng': 'banhdavung', 'bánh tráng': 'banhtrang', 'cơm cháy': 'comchay',
+    'chà bông': 'chabong', 'sữa chua': 'suachua', 'yến sào': 'yensao', 'tổ yến': 'toyen',
+    'tinh dầu': 'tinhdau', 'sả chanh': 'sachanh', 'húng chanh': 'hungchanh', 'tía tô': 'tiato',
+    'sấy dẻo': 'saydeo', 'sấy khô': 'saykho', 'sấy giòn': 'saygion', 'sấy thăng hoa': 'saythanghoa',
+    'sấy truyền thống': 'saytruyenthong', 'ngâm muối': 'ngammuoi', 'muối chua': 'muoichua',
+    'hút chân không': 'hutchankhong', 'nguyên chất': 'nguyenchat', 'cao cấp': 'caocap',
+    'thượng hạng': 'thuonghang', 'hữu cơ': 'huuco', 'organic': 'huuco', 'túi lọc': 'tuiloc',
+    'dạng bột': 'dangbot', 'dạng viên': 'dangvien',
+    'lâm đồng': 'lamdong', 'đà lạt': 'dalat', 'bến tre': 'bentre', 'tiền giang': 'tiengiang',
+    'hà giang': 'hagiang', 'cao bằng': 'caobang', 'bắc kạn': 'backan', 'thái nguyên': 'thainguyen',
+    'ninh bình': 'ninhbinh', 'thanh hóa': 'thanhhoa', 'nghệ an': 'nghean', 'hà tĩnh': 'hatinh',
+    'quảng bình': 'quangbinh', 'quảng trị': 'quangtri', 'thừa thiên huế': 'hue',
+    'quảng nam': 'quangnam', 'quảng ngãi': 'quangngai', 'bình định': 'binhdinh', 'phú yên': 'phuyen',
+    'khánh hòa': 'khanhhoa', 'ninh thuận': 'ninhthuan', 'bình thuận': 'binhthuan', 'kon tum': 'kontum',
+    'gia lai': 'gialai', 'đắk lắk': 'daklak', 'đắc lắc': 'daklak', 'đắk nông': 'daknong',
+    'đắc nông': 'daknong', 'bình phước': 'binhphuoc', 'bình dương': 'binhduong', 'tây ninh': 'tayninh',
+    'đồng nai': 'dongnai', 'bà rịa vũng tàu': 'vungtau', 'long an': 'longan', 'đồng tháp': 'dongthap',
+    'an giang': 'angiang', 'cần thơ': 'cantho', 'vĩnh long': 'vinhlong', 'hậu giang': 'haugiang',
+    'sóc trăng': 'soctrang', 'bạc liêu': 'baclieu', 'cà mau': 'camau', 'kiên giang': 'kiengiang',
+    'phú quốc': 'phuquoc',
+}
+
+TOKEN_MIN_LEN = 2
+TOKEN_MAX_LEN = 20
+
+# Trọng số Feature
+NAME_WEIGHT = 7
+
+
+def load_stop_words(path=STOP_WORDS_FILE):
+    """Đọc file stop words (mỗi dòng một từ); trả về set rỗng nếu không có file."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return set(line.strip() for line in f if line.strip())
+    except OSError:
+        return set()
+
+VIETNAMESE_STOP_WORDS = load_stop_words()
+
+# Biên dịch sẵn một lần (trước đây mỗi lần gọi apply_synonyms phải dựng lại ~200 regex)
+# Kèm khóa (lowercase) để bỏ qua nhanh các regex mà chuỗi không chứa khóa (phần lớn trong ~200 mẫu)
+_SYNONYM_PATTERNS = [(k.lower(), re.compile(r'\b{}\b'.format(re.escape(k)), flags=re.IGNORECASE), v) for k, v in SYNONYM_DICT.items()]
+
+
+def normalize_text(text):
+    """Chuẩn hóa NFC (dạng dựng sẵn, như normalize_csv.py), lowercase, gộp khoảng trắng."""
+    if not isinstance(text, str): return ""
+    return " ".join(unicodedata.normalize('NFC', text).lower().split())
+
+
+def fold_diacritics(text):
+    """Bỏ dấu tiếng Việt: 'Đắk Lắk' -> 'dak lak' (dùng làm khóa tìm kiếm không dấu)."""
+    if not isinstance(text, str): return ""
+    decomposed = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return unicodedata.normalize('NFC', ''.join(ch for ch in decomposed if not unicodedata.combining(ch)))
+
+
+def has_diacritics(text):
+    return fold_diacritics(text) != text
+
+
+def apply_synonyms(text):
+    """Áp dụng thay thế từ đồng nghĩa."""
+    if not isinstance(text, str): return ""
+    processed_text = text.lower() # Chuyển lowercase trước khi thay thế
+    for key, pattern, replacement in _SYNONYM_PATTERNS:
+        if key not in processed_text: continue
+        # Thay thế bằng regex để đảm bảo là từ riêng biệt (\b)
+        processed_text = pattern.sub(replacement, processed_text)
+    return processed_text
+
+
+# Bản bỏ dấu của từ điển đồng nghĩa, cho truy vấn gõ không dấu ("nuoc mam" -> "nuocmam")
+_FOLDED_SYNONYM_PATTERNS = [(fold_diacritics(k).lower(), re.compile(r'\b{}\b'.format(re.escape(fold_diacritics(k))), flags=re.IGNORECASE), v)
+                            for k, v in SYNONYM_DICT.items()]
+
+def apply_folded_synonyms(text):
+    if not isinstance(text, str): return ""
+    processed_text = text.lower()
+    for key, pattern, replacement in _FOLDED_SYNONYM_PATTERNS:
+        if key not in processed_text: continue
+        processed_text = pattern.sub(replacement, processed_text)
+    return processed_text
+
+
+def advanced_tokenizer(text, stop_words=None):
+    """Tokenizer nâng cao: synonyms, word_tokenize, stop words, length filter."""
+    if not isinstance(text, str): return []
+    if stop_words is None: stop_words = VIETNAMESE_STOP_WORDS
+
+    # 1. Áp dụng synonyms (đã chuyển lowercase trong apply_synonyms)
+    text = apply_synonyms(text)
+
+    # 2. Chuẩn hóa cơ bản (bỏ ký tự đặc biệt, số) - Giữ lại khoảng trắng và dấu gạch dưới (do underthesea)
+    text = re.sub(r'[^\w\s_]', '', text, flags=re.UNICODE) # Giữ gạch dưới cho từ ghép underthesea
+    text = re.sub(r'\d+', '', text)
+
+    # 3. Tokenize bằng underthesea (không cài thì tách theo khoảng trắng)
+    tokens = None
+    if word_tokenize is not None:
+        try:
+            # Đặt trong try-except vì underthesea có thể lỗi với input lạ
+            tokens = word_tokenize(text, format="text").split()
+        except Exception:
+            tokens = None
+    if tokens is None:
+        tokens = text.split() # Fallback về split theo khoảng trắng
+
+    # 4. Lọc Stop words và giới hạn độ dài
+    return [
+        token for token in tokens
+        if token not in stop_words and TOKEN_MIN_LEN <= len(token) <= TOKEN_MAX_LEN
+    ]
+
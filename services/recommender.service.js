@@ -1,129 +1,286 @@
 // services/recommender.service.js
 const { spawn } = require('child_process');
+const readline = require('readline');
 const path = require('path');
 
 const PYTHON_INTERPRETER = process.env.PYTHON_PATH || 'python3';
 const SCRIPT_PATH = path.join(__dirname, '..', 'scripts', 'recommender_cli.py');
+// 'serve' (mặc định): một process Python chạy lâu dài, load artifacts một lần.
+// 'spawn': chạy lại script cho mỗi request như trước (dùng khi debug).
+const RECOMMENDER_MODE = process.env.RECOMMENDER_MODE || 'serve';
+const REQUEST_TIMEOUT_MS = parseInt(process.env.RECOMMENDER_TIMEOUT_MS || '30000', 10);
+const SERVER_MAX_WORKERS = process.env.RECOMMENDER_MAX_WORKERS || '4';
+// Số process worker Python (pre-fork, dùng chung artifact đã load): đặt bằng số core để tận dụng hết CPU
+const SERVER_WORKERS = process.env.RECOMMENDER_WORKERS || '1';
+// Bật debug cho mọi request: Python trả kèm "_debug" (thời gian từng giai đoạn, bộ đếm), service log ra rồi bỏ đi;
+// chế độ spawn cũng chỉ log stderr của Python khi bật cờ này (hoặc khi script lỗi).
+const RECOMMENDER_DEBUG = ['1', 'true', 'yes'].includes((process.env.RECOMMENDER_DEBUG || '').toLowerCase());
 
-function runPythonScript(args) {
+// Kết quả mặc định khi Python không trả gì (giữ hành vi cũ của runPythonScript)
+function emptyResultFor(command) {
+    if (command === 'get_recommendations' || command === 'get_user_recommendations') {
+        return { recommendations: [] };
+    }
+    if (command === 'get_products') {
+        return { products: [], count: 0, page: 1, pages: 0, status: "success" };
+    }
+    if (command === 'search_products') {
+        return { results: [], count: 0 };
+    }
+    if (command === 'suggest') {
+        return { suggestions: [] };
+    }
+    return {};
+}
+
+// Chuyển dict tham số thành argv cho chế độ spawn (ví dụ { top_n: 5 } -> ['--top_n', '5'])
+function paramsToArgs(command, params) {
+    const args = [command];
+    Object.entries(params).forEach(([key, value]) => {
+        if (value === undefined || value === null || value === false) return;
+        if (value === true) return args.push(`--${key}`); // Cờ store_true của argparse
+        args.push(`--${key}`, typeof value === 'object' ? JSON.stringify(value) : String(value));
+    });
+    return args;
+}
+
+function spawnPythonScript(command, params) {
+    const args = paramsToArgs(command, params);
     return new Promise((resolve, reject) => {
         const options = {
             env: { ...process.env, PYTHONIOENCODING: 'UTF-8' },
         };
 
-        // console.log(`[Service runPythonScript] Executing: ${PYTHON_INTERPRETER} "${SCRIPT_PATH}" ${args.join(' ')}`);
         const pyProcess = spawn(PYTHON_INTERPRETER, [SCRIPT_PATH, ...args], options);
 
         let resultJson = '';
         let errorOutput = '';
 
         pyProcess.stdout.on('data', (data) => {
-            // console.log(`[Service runPythonScript STDOUT for ${args[0]}]: RAW CHUNK ->`, data); // Log raw buffer
             resultJson += data.toString('utf8');
-            // console.log(`[Service runPythonScript STDOUT for ${args[0]}]: ACCUMULATED ->`, resultJson);
         });
         pyProcess.stderr.on('data', (data) => {
-            // console.log(`[Service runPythonScript STDERR for ${args[0]}]: RAW CHUNK ->`, data);
             errorOutput += data.toString('utf8');
-            // console.log(`[Service runPythonScript STDERR for ${args[0]}]: ACCUMULATED ->`, errorOutput);
         });
 
         pyProcess.on('close', (code) => {
-            // console.log(`[Service runPythonScript CLOSE for ${args[0]}] Exit code: ${code}`);
-            // console.log(`[Service runPythonScript CLOSE for ${args[0]}] Final accumulated stdout (resultJson):`, resultJson);
-            // console.log(`[Service runPythonScript CLOSE for ${args[0]}] Final accumulated stderr (errorOutput):`, errorOutput);
-
-            if (errorOutput.trim()) {
-                console.warn(`[Service] Python script stderr (${args[0]}): ${errorOutput.substring(0, 1000)}`);
+            if (errorOutput.trim() && (RECOMMENDER_DEBUG || code !== 0)) {
+                console.warn(`[Service] Python script stderr (${command}): ${errorOutput.substring(0, 1000)}`);
             }
             if (code !== 0) {
-                console.error(`[Service] Python script execution failed with code ${code} for command ${args[0]}.`);
+                console.error(`[Service] Python script execution failed with code ${code} for command ${command}.`);
                 try {
                     const pyError = JSON.parse(errorOutput.trim());
                     return reject(pyError);
                 } catch (e) {
-                    return reject({ error: `Python script failed (code ${code}) for ${args[0]}. Stderr: ${errorOutput.substring(0, 500)}` });
+                    return reject({ error: `Python script failed (code ${code}) for ${command}. Stderr: ${errorOutput.substring(0, 500)}` });
                 }
             }
             try {
                 if (!resultJson.trim()) {
-                    console.warn(`[Service] Python script for command ${args[0]} returned empty stdout.`);
-                    if (args[0] === 'get_recommendations' || args[0] === 'get_user_recommendations') {
-                        return resolve({ recommendations: [] });
-                    }
-                    if (args[0] === 'get_products') {
-                        return resolve({ products: [], count: 0, page: 1, pages: 0, status: "success" });
-                    }
-                    return resolve({});
+                    console.warn(`[Service] Python script for command ${command} returned empty stdout.`);
+                    return resolve(emptyResultFor(command));
                 }
-                // console.log(`[Service runPythonScript Before Parse for ${args[0]}] Attempting to parse stdout:`, resultJson);
-                const jsonData = JSON.parse(resultJson);
-                // console.log(`[Service runPythonScript After Parse for ${args[0]}] Parsed JSON:`, jsonData);
-                resolve(jsonData);
+                resolve(JSON.parse(resultJson));
             } catch (parseError) {
-                console.error(`[Service] Error parsing JSON from Python (${args[0]}):`, parseError.message, '\nRaw output was:', resultJson.substring(0, 1000));
-                reject({ error: `Failed to parse JSON from Python script for ${args[0]}.`, details: resultJson.substring(0,200) });
+                console.error(`[Service] Error parsing JSON from Python (${command}):`, parseError.message, '\nRaw output was:', resultJson.substring(0, 1000));
+                reject({ error: `Failed to parse JSON from Python script for ${command}.`, details: resultJson.substring(0,200) });
             }
         });
         pyProcess.on('error', (err) => {
-            console.error(`[Service] Failed to start Python subprocess for ${args[0]}:`, err);
-            reject({ error: `Failed to start Python subprocess for ${args[0]}: ${err.message}` });
+            console.error(`[Service] Failed to start Python subprocess for ${command}:`, err);
+            reject({ error: `Failed to start Python subprocess for ${command}: ${err.message}` });
         });
     });
 }
 
+// --- Process Python "ấm" (serve mode): một process, nhiều request song song, khớp bằng id ---
+class RecommenderProcess {
+    constructor() {
+        this.proc = null;
+        this.nextId = 1;
+        this.pending = new Map(); // id -> { resolve, reject, timer, command }
+    }
+
+    start() {
+        const options = {
+            env: { ...process.env, PYTHONIOENCODING: 'UTF-8' },
+        };
+        const proc = spawn(PYTHON_INTERPRETER, [SCRIPT_PATH, 'serve', '--max_workers', SERVER_MAX_WORKERS, '--workers', SERVER_WORKERS], options);
+        this.proc = proc;
+
+        readline.createInterface({ input: proc.stdout }).on('line', (line) => this.handleLine(line));
+        readline.createInterface({ input: proc.stderr }).on('line', (line) => {
+            if (line.trim()) console.warn(`[Service] Python server stderr: ${line.substring(0, 1000)}`);
+        });
+
+        proc.on('exit', (code, signal) => {
+            console.error(`[Service] Python recommender server exited (code ${code}, signal ${signal}).`);
+            if (this.proc === proc) this.proc = null;
+            this.failAll({ error: `Python recommender server exited (code ${code}).` });
+        });
+        proc.on('error', (err) => {
+            console.error('[Service] Failed to start Python recommender server:', err);
+            if (this.proc === proc) this.proc = null;
+            this.failAll({ error: `Failed to start Python recommender server: ${err.message}` });
+        });
+        proc.stdin.on('error', (err) => {
+            console.error('[Service] Python recommender server stdin error:', err.message);
+        });
+    }
+
+    handleLine(line) {
+        if (!line.trim()) return;
+        let message;
+        try {
+            message = JSON.parse(line);
+        } catch (parseError) {
+            console.error('[Service] Error parsing JSON from Python server:', parseError.message, '\nRaw output was:', line.substring(0, 1000));
+            return;
+        }
+        const entry = this.pending.get(message.id);
+        if (!entry) return; // Request đã timeout hoặc id lạ
+        this.pending.delete(message.id);
+        clearTimeout(entry.timer);
+
+        const result = message.result;
+        if (result === undefined || result === null) {
+            console.warn(`[Service] Python server returned empty result for command ${entry.command}.`);
+            return entry.resolve(emptyResultFor(entry.command));
+        }
+        entry.resolve(result);
+    }
+
+    failAll(error) {
+        this.pending.forEach((entry) => {
+            clearTimeout(entry.timer);
+            entry.reject(error);
+        });
+        this.pending.clear();
+    }
+
+    request(command, params) {
+        if (!this.proc) this.start();
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.pending.delete(id);
+                reject({ error: `Python recommender server timed out after ${REQUEST_TIMEOUT_MS}ms for ${command}.` });
+            }, REQUEST_TIMEOUT_MS);
+            this.pending.set(id, { resolve, reject, timer, command });
+            this.proc.stdin.write(JSON.stringify({ id, command, args: params }) + '\n');
+        });
+    }
+}
+
+const recommenderProcess = new RecommenderProcess();
+
+// Trailer "_debug" của Python: log một dòng rồi bỏ khỏi kết quả trả cho controller
+function takeDebugTrailer(command, result) {
+    if (result && typeof result === 'object' && result._debug) {
+        console.debug(`[Service] Python ${command} debug: ${JSON.stringify(result._debug)}`);
+        delete result._debug;
+    }
+    return result;
+}
+
+function runPythonScript(command, params = {}) {
+    if (!RECOMMENDER_DEBUG) {
+        if (RECOMMENDER_MODE === 'spawn') return spawnPythonScript(command, params);
+        return recommenderProcess.request(command, params);
+    }
+    const debugParams = { ...params, debug: true };
+    const request = RECOMMENDER_MODE === 'spawn' ? spawnPythonScript(command, debugParams) : recommenderProcess.request(command, debugParams);
+    return request.then((result) => takeDebugTrailer(command, result));
+}
+
 class RecommenderService {
     async getRecommendations(productId, topN = 10) {
         if (!productId) return Promise.reject({ error: 'Product ID is required for getRecommendations.' });
-        const args = ['get_recommendations', '--product_id', String(productId), '--top_n', String(topN)];
-        return runPythonScript(args);
+        return runPythonScript('get_recommendations', { product_id: String(productId), top_n: topN });
     }
 
+    // productId / interactedProductIds: product_id gốc (original_id) hoặc _id MongoDB, Python tự tra
     async getUserRecommendations(userId, topN = 10, interactedProductIds = []) {
-        // ***** LỖI ĐÃ ĐƯỢC XÓA Ở ĐÂY *****
-        // pyProcess.stdout.on('data', (data) => { ... }); // Dòng này và dòng stderr dưới đã bị xóa
-        // pyProcess.stderr.on('data', (data) => { ... });
-        // ***** KẾT THÚC PHẦN XÓA *****
-
         if (!userId) return Promise.reject({ error: 'User ID is required for getUserRecommendations.' });
-        
-        console.log(`[NODE SERVICE getUserRecommendations] Received interactedProductIds (array):`, interactedProductIds);
-        const interactedProductIdsJson = JSON.stringify(interactedProductIds || []);
-        console.log(`[NODE SERVICE getUserRecommendations] Sending --interacted_product_ids (JSON string): ${interactedProductIdsJson}`);
 
-        const args = [
-            'get_user_recommendations', 
-            '--user_id', String(userId), 
-            '--top_n', String(topN),
-            '--interacted_product_ids', interactedProductIdsJson 
-        ];
-        return runPythonScript(args);
+        return runPythonScript('get_user_recommendations', {
+            user_id: String(userId),
+            top_n: topN,
+            interacted_product_ids: interactedProductIds || [],
+        });
+    }
+
+    // Gọi sau khi user đặt đơn: Python cộng thêm sản phẩm mới vào hồ sơ user đang cache
+    // (không phải tính lại toàn bộ lịch sử ở request gợi ý tiếp theo).
+    async updateUserProfile(userId, productIds = []) {
+        if (!userId) return Promise.reject({ error: 'User ID is required for updateUserProfile.' });
+        return runPythonScript('update_user_profile', {
+            user_id: String(userId),
+            product_ids: (productIds || []).map(String),
+        });
+    }
+
+    // Xóa hồ sơ đã cache (ví dụ khi đơn bị hủy); không truyền userId sẽ xóa toàn bộ cache.
+    async invalidateUserProfile(userId) {
+        const params = userId ? { user_id: String(userId) } : {};
+        return runPythonScript('invalidate_user_profile', params);
+    }
+
+    // users: { userId: [productId, ...] } hoặc [{ user_id, interacted_product_ids }]
+    // Dùng cho các job sinh gợi ý hàng loạt (email, trang chủ) thay vì gọi từng user.
+    async getUserRecommendationsBatch(users, topN = 10) {
+        if (!users) return Promise.reject({ error: 'Users are required for getUserRecommendationsBatch.' });
+        return runPythonScript('get_user_recommendations_batch', { users, top_n: topN });
+    }
+
+    // Tìm kiếm từ khóa (BM25, có/không dấu) -> { results: [{ product_id, _id, name, score }], count }
+    async searchProducts(keyword, topN = 20) {
+        if (!keyword) return Promise.reject({ error: 'Keyword is required for searchProducts.' });
+        return runPythonScript('search_products', { keyword: String(keyword), top_n: topN });
+    }
+
+    // Mọi kết quả tìm kiếm, chỉ original_id đã xếp hạng (không kèm bản ghi) -> { product_ids: [id, ...], count }
+    async searchProductIds(keyword) {
+        if (!keyword) return Promise.reject({ error: 'Keyword is required for searchProductIds.' });
+        return runPythonScript('search_products', { keyword: String(keyword), ids_only: true });
+    }
+
+    // Gợi ý tên sản phẩm theo tiền tố (autocomplete) -> { suggestions: [name, ...] }
+    async suggest(query, limit = 10) {
+        if (!query) return Promise.reject({ error: 'Query is required for suggest.' });
+        return runPythonScript('suggest', { query: String(query), limit });
+    }
+
+    // Đổi sang bundle artifact mới nhất (bundles/CURRENT) ngay, không chờ chu kỳ kiểm tra của process Python.
+    // -> { reloaded, version, previous_version }
+    async reloadArtifacts(force = false) {
+        return runPythonScript('reload_artifacts', force ? { force: true } : {});
+    }
+
+    // Thời gian theo giai đoạn (load, resolve_ids, score, top_k, hydrate, serialize), bộ đếm (cache hit, ID không biết)
+    // và p50/p95/p99 của các request process Python đã xử lý, kèm thống kê cache hồ sơ / cache kết quả (hit, miss);
+    // serve --workers N: { workers, worker_metrics: [...] }.
+    // Chỉ có ý nghĩa ở chế độ serve (chế độ spawn mỗi request là một process mới).
+    async getMetrics(reset = false) {
+        return runPythonScript('metrics', reset ? { reset: true } : {});
     }
 
     async getProducts(options = {}) {
-        const { /* ... params ... */ } = options;
-        // ... (logic tạo args như cũ)
-        const args = [ /* ... */ ]; // Giữ nguyên logic tạo args của bạn
-        // (Logic tạo args đầy đủ đã có ở các câu trả lời trước)
         const page = options.page || 1;
         const perPage = options.perPage || 12; // Sửa từ per_page ở đây để khớp với controller
         const { category, province, minPrice, maxPrice, sortBy, keyword } = options;
 
-        const finalArgs = [
-            'get_products',
-            '--page', String(page),
-            '--per_page', String(perPage)
-        ];
-        
-        if (category) finalArgs.push('--category', category);
-        if (province) finalArgs.push('--province', province);
-        if (minPrice !== undefined && minPrice !== null) finalArgs.push('--min_price', String(minPrice));
-        if (maxPrice !== undefined && maxPrice !== null) finalArgs.push('--max_price', String(maxPrice));
-        if (sortBy) finalArgs.push('--sort_by', sortBy);
-        if (keyword) finalArgs.push('--keyword', keyword); // Thêm keyword nếu controller gửi
-
-        return runPythonScript(finalArgs);
+        const params = { page, per_page: perPage };
+        if (category) params.category = category;
+        if (province) params.province = province;
+        if (minPrice !== undefined && minPrice !== null) params.min_price = minPrice;
+        if (maxPrice !== undefined && maxPrice !== null) params.max_price = maxPrice;
+        if (sortBy) params.sort_by = sortBy;
+        if (keyword) params.keyword = keyword; // Thêm keyword nếu controller gửi
+
+        return runPythonScript('get_products', params);
     }
 }
 
-module.exports = new RecommenderService();
\ No newline at end of file
+module.exports = new RecommenderService();